@@ -20,14 +20,19 @@ import shutil
 import sys
 
 from abinitio import AbinitioEnsembler
-from ample.ensembler.constants import SPICKER_TM
+from ample.ensembler.constants import (
+    ENSEMBLE_SIMILARITY_THRESHOLD, REDUNDANT_DEPRIORITISE, REDUNDANT_DROP, REDUNDANT_KEEP, SPICKER_TM, SPICKER_NUMPY_TM
+)
 from homologs import HomologEnsembler
 from single_model import SingleModelEnsembler
+from truncation_util import sweet_spot_bin
 from ample.util import ample_util
 from ample.util import argparse_util
+from ample.util import cache_util
 from ample.util import exit_util
 from ample.util import pdb_edit
 from ample.util import printTable
+from ample.util import theseus
 
 logger = logging.getLogger(__name__)
 
@@ -61,13 +66,18 @@ def cluster_script(amoptd, python_path="ccp4-python"):
     return script_path
 
 
-def create_ensembles(amoptd):
+def create_ensembles(amoptd, ensemble_callback=None, cancel=None):
     """Create the ensembles using the values in the amoptd dictionary
 
     Parameters
     ----------
     amoptd : dict
        An AMPLE option dictionary
+    ensemble_callback : callable, optional
+       Called with the data dictionaries of each list of ensembles as soon as they have been created.
+       They are the dictionaries that are stored in amoptd['ensembles_data'], so any data added to them is kept.
+    cancel : :obj:`threading.Event`, optional
+       Stop creating ensembles once this is set
 
     """
     # Create instance of the ensembler
@@ -87,13 +97,30 @@ def create_ensembles(amoptd):
 
     models = list([amoptd['single_model']]) if amoptd['single_model_mode'] else amoptd['models']
 
-    # Run ensemble creation
-    ensembles = ensembler.generate_ensembles_from_amoptd(models, amoptd)
+    # The data of each batch of ensembles, which are kept so that the data added by the callback isn't lost
+    data_by_name = {}
+
+    def add_ensembles(ensembles):
+        data = ensembles_data(ensembles, amoptd)
+        data_by_name.update((d['name'], d) for d in data)
+        ensemble_callback(data)
+
+    # Run ensemble creation - only the ab initio ensembler creates the ensembles in batches
+    if isinstance(ensembler, AbinitioEnsembler):
+        ensembles = ensembler.generate_ensembles_from_amoptd(models, amoptd,
+                                                             ensemble_callback=add_ensembles if ensemble_callback else None,
+                                                             cancel=cancel)
+    else:
+        ensembles = ensembler.generate_ensembles_from_amoptd(models, amoptd)
+        if ensemble_callback:
+            add_ensembles(ensembles)
 
     ############################################################################
     # Hack to pull out the data - need to update code to work with ensemble objects rather than dictionaries
     amoptd['ensembles'] = [e.pdb for e in ensembles]
-    amoptd['ensembles_data'] = [e.__dict__ for e in ensembles]
+    missing = [e for e in ensembles if e.name not in data_by_name]
+    data_by_name.update((d['name'], d) for d in ensembles_data(missing, amoptd))
+    amoptd['ensembles_data'] = [data_by_name[e.name] for e in ensembles]
     amoptd['ensembles_workdir'] = ensembler.work_dir
 
     # We need to let the main process know that we have succeeded as this module could be run on a cluster node with no link
@@ -103,6 +130,64 @@ def create_ensembles(amoptd):
     return
 
 
+def ensembles_data(ensembles, amoptd):
+    """Return a list of the data dictionaries of a list of ensembles
+
+    The residues of each truncation are stored once in amoptd['truncation_residues'], rather than
+    in the data of every ensemble made from the truncation, and each ensemble's data records the index
+    of its residues as 'truncation_residues_id'.
+
+    Parameters
+    ----------
+    ensembles : list, tuple
+       A list of :obj:`Ensemble <ample.ensembler._ensembler.Ensemble>` objects
+    amoptd : dict
+       An AMPLE option dictionary
+
+    Returns
+    -------
+    list
+       A list of the ensembles' data dictionaries
+
+    """
+    if not amoptd.get('truncation_residues'):
+        amoptd['truncation_residues'] = []
+    table = amoptd['truncation_residues']
+    index = {tuple(residues): i for i, residues in enumerate(table)}
+    data = []
+    for ensemble in ensembles:
+        d = ensemble._asdict()
+        residues = d.pop('truncation_residues')
+        d['truncation_residues_id'] = None
+        if residues is not None:
+            key = tuple(residues)
+            if key not in index:
+                index[key] = len(table)
+                table.append(list(residues))
+            d['truncation_residues_id'] = index[key]
+        data.append(d)
+    return data
+
+
+def truncation_residues(ensemble_data, residues_table=None):
+    """Return the truncation residues of an ensemble from its data dictionary
+
+    Parameters
+    ----------
+    ensemble_data : dict
+       An ensemble's data dictionary
+    residues_table : list, optional
+       The residues of each truncation, amoptd['truncation_residues']
+
+    """
+    if ensemble_data.get('truncation_residues') is not None:
+        return ensemble_data['truncation_residues']
+    residues_id = ensemble_data.get('truncation_residues_id')
+    if residues_id is None or not residues_table:
+        return None
+    return residues_table[residues_id]
+
+
 def ensembler_factory(amoptd):
     """Return an ensembler object for the required ensembles
 
@@ -142,6 +227,9 @@ def ensembler_factory(amoptd):
         scwrl_exe=amoptd['scwrl_exe'],
         spicker_exe=amoptd['spicker_exe'],
         theseus_exe=amoptd['theseus_exe'],
+        cache_dir=amoptd['cache_dir'],
+        cache_max_size=amoptd['cache_max_size'],
+        lazy=amoptd['lazy_ensembles'],
     )
 
 
@@ -296,10 +384,35 @@ def ensemble_summary(ensembles_data):
     return rstr
 
 
+def ensemble_priority(ensemble_data):
+    """Return a key that orders ensembles the same way as :func:`sort_ensembles`
+
+    Ensembles are ordered by cluster, then with the truncation levels in the 20-50% sweet spot
+    first, then by truncation level, subcluster radius and side chain treatment. Ensembles
+    marked as redundant by :func:`prune_redundant_ensembles` come after all the others.
+
+    Parameters
+    ----------
+    ensemble_data : dict
+       An ensemble's data dictionary
+
+    Returns
+    -------
+    tuple
+
+    """
+    return (ensemble_data.get('redundancy') is not None,
+            ensemble_data.get('cluster_num'),
+            sweet_spot_bin(ensemble_data.get('truncation_level') or 0),
+            ensemble_data.get('truncation_level'),
+            ensemble_data.get('subcluster_radius_threshold'),
+            ensemble_data.get('side_chain_treatment'))
+
+
 def get_ensembler_timeout(optd, tm_timeout=3600*8):
     """Set how long the ensembling should run based on the type of job being run"""
     timeout = optd['ensembler_timeout']
-    if optd['cluster_method'] == SPICKER_TM:
+    if optd['cluster_method'] in [SPICKER_TM, SPICKER_NUMPY_TM]:
         if int(timeout) < tm_timeout:
             timeout = tm_timeout
     return timeout
@@ -348,6 +461,166 @@ def import_ensembles(amoptd):
     return ensembles
 
 
+def materialise_ensemble(ensemble_data):
+    """Create the pdb file of an ensemble that was only recorded as a recipe
+
+    The truncated models are written if required and superposed with theseus, and the
+    ensemble's side chain treatment is applied. The superposed models are kept so that
+    they are only created once for all the side chain treatments.
+
+    Parameters
+    ----------
+    ensemble_data : dict
+       An ensemble's data dictionary - the number of atoms in the ensemble is added to it
+
+    Returns
+    -------
+    str
+       The path to the ensemble pdb file
+
+    Raises
+    ------
+    RuntimeError
+       The models could not be superposed
+
+    """
+    recipe = ensemble_data.get('recipe')
+    if recipe is None:
+        return ensemble_data.get('pdb') or ensemble_data.get('ensemble_pdb')
+    pdb = ensemble_data['pdb']
+    if os.path.isfile(pdb):
+        return pdb
+    superposed_pdb = recipe['superposed_pdb']
+    if not os.path.isfile(superposed_pdb):
+        logger.debug("Creating ensemble %s from its recipe", ensemble_data['name'])
+        for model, source_model in zip(recipe['models'], recipe['source_models']):
+            if not os.path.isfile(model):
+                pdb_edit.select_residues(pdbin=source_model, pdbout=model, tokeep_idx=recipe['residues_idxs'])
+        cache = None
+        if recipe['cache_dir']:
+            cache = cache_util.ResultCache(recipe['cache_dir'], max_size=recipe['cache_max_size'])
+        run_theseus = theseus.Theseus(work_dir=recipe['work_dir'], theseus_exe=recipe['theseus_exe'], cache=cache)
+        try:
+            run_theseus.superpose_models(recipe['models'])
+        except Exception as e:
+            raise RuntimeError("Error running theseus on ensemble {0}: {1}".format(ensemble_data['name'], e))
+        shutil.move(run_theseus.superposed_models, superposed_pdb)
+    side_chain_treatment = ensemble_data['side_chain_treatment']
+    counts = pdb_edit.side_chain_treatments(superposed_pdb, {side_chain_treatment: pdb})
+    ensemble_data['ensemble_num_atoms'] = counts[side_chain_treatment][0]
+    return pdb
+
+
+class EnsembleIndex(object):
+    """The ensembles kept by :func:`prune_redundant_ensembles`, indexed to check later ensembles against
+
+    Passing the same index to each call prunes ensembles in batches as they are created,
+    without checking (or hashing the coordinates of) the ensembles of the earlier batches again.
+    """
+
+    def __init__(self):
+        self.by_hash = {}
+        self.by_treatment = collections.defaultdict(list)
+
+
+def prune_redundant_ensembles(ensemble_pdbs,
+                              ensembles_data=None,
+                              similarity_threshold=ENSEMBLE_SIMILARITY_THRESHOLD,
+                              redundant=REDUNDANT_DEPRIORITISE,
+                              residues_table=None,
+                              index=None):
+    """Drop or deprioritise ensembles that duplicate an ensemble earlier in the list
+
+    An ensemble is identical to an earlier one if the coordinates of its pdb file are the same (or, for an
+    ensemble from a recipe, if it is made from the same residues of the same models). It is
+    similar if it has the same side chain treatment and both the overlap of the subcluster models and
+    the overlap of the truncation residues (the size of the intersection over the size of the union)
+    are at least similarity_threshold. The redundancy ('identical' or 'similar') and the name of the
+    ensemble it duplicates are recorded in the ensemble's data.
+
+    Parameters
+    ----------
+    ensemble_pdbs : list, tuple
+       A list of ensemble file paths in order of priority
+    ensembles_data : list, tuple, optional
+       A list of ensembles' data dictionaries
+    similarity_threshold : float, optional
+       The minimum model and residue overlap of similar ensembles - None to only remove identical ensembles
+    redundant : str, optional
+       'drop' to remove identical and similar ensembles, 'deprioritise' to remove identical ensembles and
+       move similar ones to the end of the list or 'keep' to only record them
+    residues_table : list, optional
+       The residues of each truncation referenced by the ensembles' data, amoptd['truncation_residues']
+    index : :obj:`EnsembleIndex`, optional
+       The ensembles kept by earlier calls - the ensembles are also checked against these and those kept are added
+
+    Returns
+    -------
+    list
+       The ensemble file paths with the redundant ensembles removed or moved to the end
+
+    """
+    if redundant not in [REDUNDANT_DROP, REDUNDANT_DEPRIORITISE, REDUNDANT_KEEP]:
+        raise RuntimeError("Unrecognised option for redundant ensembles: {0}".format(redundant))
+    data_by_pdb = {}
+    for d in ensembles_data or []:
+        data_by_pdb[d.get('pdb') or d.get('ensemble_pdb')] = d
+
+    if index is None:
+        index = EnsembleIndex()
+    by_hash, by_treatment = index.by_hash, index.by_treatment
+    kept, similar = [], []
+    for pdb in ensemble_pdbs:
+        data = data_by_pdb.get(pdb, {})
+        name = data.get('name', os.path.basename(pdb))
+        models = data.get('subcluster_models')
+        residues = truncation_residues(data, residues_table)
+        duplicate, redundancy = None, None
+        if data.get('recipe'):
+            # Ensembles made from recipes are identical if they are made from the same truncated models
+            recipe = data['recipe']
+            coordinates_hash = cache_util.ResultCache.key(sorted(recipe['source_models']), recipe['residues_idxs'],
+                                                          data.get('side_chain_treatment'))
+        else:
+            coordinates_hash = cache_util.pdb_coordinates_hash(pdb)
+        if coordinates_hash in by_hash:
+            duplicate, redundancy = by_hash[coordinates_hash], 'identical'
+        elif similarity_threshold is not None and models and residues:
+            models, residues = set(models), set(residues)
+            for other_name, other_models, other_residues in by_treatment[data.get('side_chain_treatment')]:
+                if _overlap(models, other_models) >= similarity_threshold and \
+                   _overlap(residues, other_residues) >= similarity_threshold:
+                    duplicate, redundancy = other_name, 'similar'
+                    break
+        if data:
+            data['redundant_with'] = duplicate
+            data['redundancy'] = redundancy
+        if duplicate is None:
+            by_hash[coordinates_hash] = name
+            if models and residues:
+                by_treatment[data.get('side_chain_treatment')].append((name, models, residues))
+            kept.append(pdb)
+            continue
+        logger.debug("Ensemble %s is %s to %s", name, redundancy, duplicate)
+        if redundant == REDUNDANT_KEEP:
+            kept.append(pdb)
+        elif redundancy == 'similar' and redundant == REDUNDANT_DEPRIORITISE:
+            similar.append(pdb)
+
+    nredundant = len(ensemble_pdbs) - len(kept)
+    if redundant == REDUNDANT_DEPRIORITISE:
+        logger.info("Removed %d identical ensembles and deprioritised %d similar ensembles",
+                    nredundant - len(similar), len(similar))
+    elif redundant == REDUNDANT_DROP:
+        logger.info("Removed %d identical or similar ensembles", nredundant)
+    return kept + similar
+
+
+def _overlap(set1, set2):
+    """Return the size of the intersection over the size of the union of two sets"""
+    return float(len(set1 & set2)) / len(set1 | set2)
+
+
 def reorder_models(models, ordered_list_file):
     """Reorder the list of models from a list of models (possibly in a different directory)
 
@@ -376,11 +649,13 @@ def reorder_models(models, ordered_list_file):
     return reordered_models
 
 
-def set_phaser_rms_from_subcluster_score(optd):
-    """Set the phaser_rms for each ensemble based on its score"""
+def set_phaser_rms_from_subcluster_score(optd, ensembles_data=None):
+    """Set the phaser_rms for each ensemble (all those in optd if ensembles_data is None) based on its score"""
     if optd['ensemble_options'] is None:
         optd['ensemble_options'] = {}
-    for ensemble_data in optd['ensembles_data']:
+    if ensembles_data is None:
+        ensembles_data = optd['ensembles_data']
+    for ensemble_data in ensembles_data:
         name = ensemble_data['name']
         if name not in optd['ensemble_options']:
             optd['ensemble_options'][name] = {}
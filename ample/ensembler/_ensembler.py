@@ -8,10 +8,10 @@ import copy
 import logging
 import os
 import re
-import shutil
 
 from constants import ENSEMBLE_MAX_MODELS, ALLATOM, POLYALA, RELIABLE, UNMODIFIED
 from ample.util import ample_util
+from ample.util import cache_util
 from ample.util import pdb_edit
 from ample.util import sequence_util
 from ample.util import theseus
@@ -169,6 +169,12 @@ class Cluster(object):
     
 class Ensemble(object):
     """Class to hold data relating to an ensemble of one or more molecular models"""
+    __slots__ = ('name', 'pdb', 'side_chain_treatment', 'ensemble_num_atoms', 'recipe', 'cluster_method',
+                 'cluster_score_type', 'num_clusters', 'cluster_num', 'cluster_centroid', 'cluster_num_models',
+                 'truncation_dir', 'truncation_level', 'truncation_method', 'truncation_percent',
+                 'truncation_residues', 'truncation_score_key', 'truncation_variance', 'num_residues',
+                 'subcluster_centroid_model', 'subcluster_num_models', 'subcluster_radius_threshold',
+                 'subcluster_score', 'subcluster_models', 'redundancy', 'redundant_with')
     
     def __init__(self, pdb=None):
         
@@ -177,6 +183,7 @@ class Ensemble(object):
         self.pdb = None
         self.side_chain_treatment = None
         self.ensemble_num_atoms = None
+        self.recipe = None  # How to build the pdb if it is only created just before it is used
         
         # cluster info
         self.cluster_method = None
@@ -201,19 +208,37 @@ class Ensemble(object):
         self.subcluster_num_models = None
         self.subcluster_radius_threshold = None
         self.subcluster_score = None
+        self.subcluster_models = None
+
+        # redundancy info
+        self.redundancy = None
+        self.redundant_with = None
     
         if pdb: self.from_pdb(pdb)
         return
 
     def copy(self):
-        return copy.deepcopy(self)
+        """Return a copy of the ensemble that shares its lists of models and residues"""
+        return copy.copy(self)
+
+    def _asdict(self):
+        """Convert the object to a dictionary"""
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __getstate__(self):
+        """Return the attributes for pickling, as objects with __slots__ have no __dict__"""
+        return self._asdict()
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
     
     def __str__(self):
         """Return a string representation of this object."""
         _str = super(Ensemble, self).__str__() + "\n"
         # Iterate through all attributes in order
-        for k in sorted(self.__dict__.keys()):
-            _str += "{0} : {1}\n".format(k, self.__dict__[k])
+        for k in sorted(self.__slots__):
+            _str += "{0} : {1}\n".format(k, getattr(self, k))
         return _str
 
 
@@ -249,6 +274,8 @@ class Ensembler(object):
         Path to an executable
     theseus_exe : str
         Path to an executable
+    lazy : bool
+        Only record a recipe for each ensemble rather than creating its pdb file
         
     """
     def __init__(self,
@@ -265,6 +292,9 @@ class Ensembler(object):
                  scwrl_exe=None,
                  spicker_exe=None,
                  theseus_exe=None,
+                 cache_dir=None,
+                 cache_max_size=cache_util.DEFAULT_MAX_SIZE,
+                 lazy=False,
                  **kwargs
                  ):
         """Set the variables required by all Ensemblers.
@@ -301,6 +331,13 @@ class Ensembler(object):
             Path to an executable
         theseus_exe : str
             Path to an executable
+        cache_dir : str
+            Path to a directory to cache distance matrices and theseus superpositions in
+        cache_max_size : float
+            The maximum size of the cache in MB
+        lazy : bool
+            Only record a recipe for each ensemble rather than creating its pdb file. The pdb
+            is built by :func:`ample.ensembler.materialise_ensemble` when it is needed.
         **kwargs
             Arbitrary keyword arguments.
         """
@@ -311,8 +348,7 @@ class Ensembler(object):
         if not os.path.isdir(ensembles_directory): os.mkdir(ensembles_directory)
         self.ensembles_directory = ensembles_directory
         if not os.path.isdir(work_dir): os.mkdir(work_dir)
-        self.work_dir = work_dir
-        os.chdir(work_dir)
+        self.work_dir = os.path.abspath(work_dir)
         
         # executables
         self.gesamt_exe = gesamt_exe
@@ -323,6 +359,12 @@ class Ensembler(object):
         self.scwrl_exe = scwrl_exe
         self.spicker_exe = spicker_exe
         self.theseus_exe = theseus_exe     
+
+        # cache of results that can be reused by later runs
+        self.cache = cache_util.ResultCache(cache_dir, max_size=cache_max_size) if cache_dir else None
+        self.cache_dir = cache_dir
+        self.cache_max_size = cache_max_size
+        self.lazy = lazy
            
         # truncation
         self.percent_truncation = 5
@@ -366,7 +408,10 @@ class Ensembler(object):
         """
         ensembles = []
         if side_chain_treatments is None: side_chain_treatments=[UNMODIFIED]
+        pdbouts = {}
         for sct in side_chain_treatments:
+            if sct not in [ALLATOM, UNMODIFIED, RELIABLE, POLYALA]:
+                raise RuntimeError, "Unrecognised side_chain_treatment: {0}".format(sct)
             ensemble = raw_ensemble.copy()
             ensemble.side_chain_treatment = sct
             if homologs:
@@ -382,29 +427,23 @@ class Ensembler(object):
                                                             sct)
             # create filename based on name and side chain treatment
             # fpath = ample_util.filename_append(raw_ensemble,astr=sct, directory=ensembles_directory)
-            fpath = os.path.join(self.ensembles_directory, "{0}.pdb".format(ensemble.name))
-            
-            # Create the files
-            if sct == ALLATOM or sct == UNMODIFIED:
-                # For all atom just copy the file
-                shutil.copy2(raw_ensemble.pdb, fpath)
-            elif sct == RELIABLE:
-                pdb_edit.reliable_sidechains(raw_ensemble.pdb, fpath)
-            elif sct == POLYALA:
-                pdb_edit.backbone(raw_ensemble.pdb, fpath)
-            else:
-                raise RuntimeError, "Unrecognised side_chain_treatment: {0}".format(sct)
-            
-            # Count the number of atoms in the ensemble-only required for benchmark mode
-            natoms, nresidues = pdb_edit.num_atoms_and_residues(fpath, first=True)
-            
-            # Process ensemble data
-            ensemble.pdb = fpath
+            ensemble.pdb = os.path.join(self.ensembles_directory, "{0}.pdb".format(ensemble.name))
+            pdbouts[sct] = ensemble.pdb
+            ensembles.append(ensemble)
+
+        if raw_ensemble.recipe is not None:
+            # The treated ensembles are created from the recipe when they are needed
+            return ensembles
+
+        # Create the files for all the treatments from a single parse of the raw ensemble. The number of atoms
+        # in the ensemble is only required for benchmark mode
+        counts = pdb_edit.side_chain_treatments(raw_ensemble.pdb, pdbouts)
+        for ensemble in ensembles:
+            natoms, nresidues = counts[ensemble.side_chain_treatment]
             ensemble.ensemble_num_atoms = natoms
             # check
             assert ensemble.num_residues == nresidues, "Unmatching number of residues: {0} : {1}".format(ensemble.num_residues,
                                                                                                          nresidues)
-            ensembles.append(ensemble)
                 
         return ensembles
 
@@ -450,7 +489,8 @@ class Ensembler(object):
         raise NotImplementedError
 
     def superpose_models(self, models, basename='theseus', work_dir=None, homologs=False):
-        run_theseus = theseus.Theseus(work_dir=work_dir, theseus_exe=self.theseus_exe)
+        if work_dir is None: work_dir = self.work_dir
+        run_theseus = theseus.Theseus(work_dir=work_dir, theseus_exe=self.theseus_exe, cache=self.cache)
         try:
             run_theseus.superpose_models(models, basename=basename, homologs=homologs)
         except Exception as e:
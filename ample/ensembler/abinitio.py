@@ -5,6 +5,7 @@ __date__ = "17 Feb 2016"
 __version__ = "1.0"
 
 import logging
+import multiprocessing
 import os
 import shutil
 
@@ -15,14 +16,45 @@ import subcluster_util
 import truncation_util
 
 from ample.ensembler.constants import (
-    SIDE_CHAIN_TREATMENTS, SUBCLUSTER_RADIUS_THRESHOLDS, SPICKER_RMSD, SPICKER_TM
+    SIDE_CHAIN_TREATMENTS, SUBCLUSTER_RADIUS_THRESHOLDS, SPICKER_RMSD, SPICKER_TM, SPICKER_NUMPY_RMSD,
+    SPICKER_NUMPY_TM
 )
+from ample.util import coordinate_store
 from ample.util import fast_protein_cluster
 from ample.util import scwrl_util
 from ample.util import spicker
+from ample.util import spicker_numpy
 
 logger = logging.getLogger(__name__)
 
+# The ensembler used by the processes of the pool in AbinitioEnsembler.generate_ensembles
+_worker_ensembler = None
+# Seconds between checks for cancellation while waiting for the pool
+CANCEL_POLL_INTERVAL = 5
+
+
+def _init_worker(ensembler, nproc):
+    """Set the ensembler for a worker process - it is only pickled once per process rather than per task"""
+    global _worker_ensembler
+    _worker_ensembler = ensembler
+    _worker_ensembler.nproc = nproc
+
+
+def _ensemble_truncation(args):
+    """Create the ensembles for a truncation level in a worker process"""
+    return _worker_ensembler.ensemble_truncation(*args)
+
+
+def _ensemble_truncation_indexed(indexed_args):
+    """Create the ensembles for a truncation level in a worker process, returning them with the task index"""
+    index, args = indexed_args
+    return index, _ensemble_truncation(args)
+
+
+def _truncation_priority(truncation):
+    """Order truncations by cluster and then with the truncation levels most likely to succeed first"""
+    return (truncation.cluster.index, truncation_util.sweet_spot_bin(truncation.level), truncation.level)
+
 
 class AbinitioEnsembler(_ensembler.Ensembler):
     """Ensemble creator using on multiple models with identical sequences most
@@ -44,6 +76,9 @@ class AbinitioEnsembler(_ensembler.Ensembler):
         # we save the truncator so that we can query it for data later
         self.truncator = None
 
+        # Coordinates of the models so they only need to be read once
+        self.coordinate_store = None
+
         return
 
     def cluster_models(self, models=None, cluster_method=SPICKER_RMSD, num_clusters=1, cluster_dir=None, max_cluster_size=200):
@@ -85,16 +120,21 @@ class AbinitioEnsembler(_ensembler.Ensembler):
                                                    max_cluster_size,
                                                    models,
                                                    num_clusters)
-        elif cluster_method_type == 'spicker':
-            logger.info('* Running SPICKER to cluster models *')
-            spickerer = spicker.Spickerer(spicker_exe=cluster_exe)
+        elif cluster_method_type in ['spicker', 'spicker_numpy']:
+            if cluster_method_type == 'spicker_numpy':
+                logger.info('* Clustering models with the numpy implementation of SPICKER *')
+                spickerer = spicker_numpy.NumpySpickerer()
+            else:
+                logger.info('* Running SPICKER to cluster models *')
+                spickerer = spicker.Spickerer(spicker_exe=cluster_exe)
             clusters = spickerer.cluster(models,
                                          num_clusters=num_clusters,
                                          max_cluster_size=max_cluster_size,
                                          score_type=cluster_score_type,
                                          run_dir=cluster_dir,
                                          score_matrix=None,
-                                         nproc=self.nproc)
+                                         nproc=self.nproc,
+                                         coordinate_store=self.coordinate_store)
             logger.debug(spickerer.results_summary())
         else:
             raise RuntimeError('Unrecognised clustering method: {}'.format(cluster_method_type))
@@ -104,7 +144,6 @@ class AbinitioEnsembler(_ensembler.Ensembler):
     def ensemble_from_subcluster(self, cluster_files, radius, truncation, cluster_score=None):
         subcluster_dir = os.path.join(truncation.directory, 'subcluster_{0}'.format(radius))
         os.mkdir(subcluster_dir)
-        os.chdir(subcluster_dir)
 
         cluster_num = truncation.cluster.index
         truncation_level = truncation.level
@@ -116,17 +155,34 @@ class AbinitioEnsembler(_ensembler.Ensembler):
                 f.write(m + "\n")
             f.write("\n")
 
-        cluster_file = self.superpose_models(cluster_files, work_dir=subcluster_dir)
-        if not cluster_file:
-            msg = "Error running theseus on ensemble {0} in directory: {1}\nSkipping subcluster: {0}".format(basename,
-                                                                                                             subcluster_dir)
-            logger.critical(msg)
-            return None
-
         ensemble_pdb = os.path.join(subcluster_dir, basename + '.pdb')
-        shutil.move(cluster_file, ensemble_pdb)
+        if self.lazy:
+            # Record how to write and superpose the truncated models so that it can be done when the ensemble is used
+            sources = {os.path.abspath(m): s for m, s in zip(truncation.models, truncation.source_models)}
+            recipe = {
+                'models': [os.path.abspath(m) for m in cluster_files],
+                'source_models': [sources[os.path.abspath(m)] for m in cluster_files],
+                'residues_idxs': [int(i) for i in truncation.residues_idxs],
+                'superposed_pdb': ensemble_pdb,
+                'work_dir': subcluster_dir,
+                'theseus_exe': self.theseus_exe,
+                'cache_dir': self.cache_dir,
+                'cache_max_size': self.cache_max_size,
+            }
+        else:
+            recipe = None
+            # The truncated models may not have been written if the distance matrix was calculated in memory
+            truncation.write_models(cluster_files)
+            cluster_file = self.superpose_models(cluster_files, work_dir=subcluster_dir)
+            if not cluster_file:
+                msg = "Error running theseus on ensemble {0} in directory: {1}\nSkipping subcluster: {0}".format(
+                    basename, subcluster_dir)
+                logger.critical(msg)
+                return None
+            shutil.move(cluster_file, ensemble_pdb)
 
         ensemble = _ensembler.Ensemble()
+        ensemble.recipe = recipe
 
         # First add the data from the cluster
         ensemble.cluster_method = truncation.cluster.cluster_method
@@ -148,6 +204,7 @@ class AbinitioEnsembler(_ensembler.Ensembler):
         # Now the subcluster info
         # The data we've collected is the same for all pdbs in this level so just keep using the first
         ensemble.subcluster_num_models = len(cluster_files)
+        ensemble.subcluster_models = [os.path.abspath(m) for m in cluster_files]
         # Get the centroid model name from the list of files given to theseus - we can't parse
         # the pdb file as theseus truncates the filename
         ensemble.subcluster_centroid_model =  os.path.abspath(cluster_files[0])
@@ -171,7 +228,17 @@ class AbinitioEnsembler(_ensembler.Ensembler):
                            subcluster_program=None,
                            truncation_method=None,
                            truncation_pruning=None,
-                           use_scwrl=False):
+                           use_scwrl=False,
+                           ensemble_callback=None,
+                           cancel=None):
+        """Cluster and truncate the models and create the ensembles for each truncation level
+
+        The truncation levels are ensembled with those most likely to succeed in MR first.
+        If ensemble_callback is given it is called with the list of ensembles for each truncation
+        level as soon as they have been created, so that they can be used before all the
+        ensembles are ready. If the :obj:`threading.Event` cancel is set no more truncation
+        levels are ensembled and only the ensembles created so far are returned.
+        """
 
         if not num_clusters:
             num_clusters = self.num_clusters
@@ -186,7 +253,11 @@ class AbinitioEnsembler(_ensembler.Ensembler):
         if not all([os.path.isfile(m) for m in models]):
             raise RuntimeError("Problem reading models given to Ensembler: {}".format(models))
 
-        self.ensembles = []
+        self.coordinate_store = coordinate_store.CoordinateStore.from_models(
+            models, path=os.path.join(self.work_dir, coordinate_store.COORDINATE_STORE_NAME))
+
+        # Truncate each cluster and then create the ensembles for each truncation level in parallel
+        truncations = []
         for cluster in self.cluster_models(models=models,
                                            cluster_method=cluster_method,
                                            num_clusters=num_clusters,
@@ -199,31 +270,95 @@ class AbinitioEnsembler(_ensembler.Ensembler):
             truncate_dir = os.path.join(self.work_dir, "cluster_{0}".format(cluster.index))
             if not os.path.isdir(truncate_dir):
                 os.mkdir(truncate_dir)
-            os.chdir(truncate_dir)
 
             # Add sidechains using SCWRL here so we only add them to the models we actually use
             if use_scwrl:
-                cluster.models = self.scwrl_models(cluster.models, truncate_dir, self.scwrl_exe)
+                scwrled_models = self.scwrl_models(cluster.models, truncate_dir, self.scwrl_exe)
+                # Scwrl only changes the side chains so the models keep the CA coordinates of the originals
+                for scwrled_model, model in zip(scwrled_models, cluster.models):
+                    self.coordinate_store.add_subset(scwrled_model, model)
+                cluster.models = scwrled_models
 
             self.truncator = truncation_util.Truncator(work_dir=truncate_dir)
             self.truncator.theseus_exe = self.theseus_exe
+            self.truncator.coordinate_store = self.coordinate_store
+            self.truncator.cache = self.cache
+            # The kabsch subclusterer calculates the distance matrix from the coordinate store, so we only
+            # need to write the truncated models that end up in an ensemble
             for truncation in self.truncator.truncate_models(models=cluster.models,
                                                              truncation_method=truncation_method,
                                                              percent_truncation=percent_truncation,
                                                              percent_fixed_intervals=percent_fixed_intervals,
-                                                             truncation_pruning=truncation_pruning):
+                                                             truncation_pruning=truncation_pruning,
+                                                             write_models=subcluster_program != 'kabsch'):
                 # Add cluster information
                 truncation.cluster = cluster
-                for ensemble in self.subcluster_models(truncation,
-                                                       subcluster_program=subcluster_program,
-                                                       ensemble_max_models=self.ensemble_max_models,
-                                                       radius_thresholds=subcluster_radius_thresholds):
-                    # Now add the side chains
-                    for ensemble in self.edit_side_chains(ensemble, side_chain_treatments):
-                        self.ensembles.append(ensemble)
+                truncations.append(truncation)
+
+        tasks = [(truncation, subcluster_program, subcluster_radius_thresholds, side_chain_treatments)
+                 for truncation in truncations]
+        order = sorted(range(len(tasks)), key=lambda i: _truncation_priority(truncations[i]))
+        results = [[] for _ in tasks]
+        nworkers = min(self.nproc or 1, len(tasks))
+        if nworkers > 1:
+            logger.info('Creating ensembles for %d truncation levels on %d processors', len(tasks), nworkers)
+            # Share the processors between the workers for the multi-core subclustering programs
+            pool = multiprocessing.Pool(processes=nworkers,
+                                        initializer=_init_worker,
+                                        initargs=(self, max(1, self.nproc // nworkers)))
+            try:
+                completed = pool.imap_unordered(_ensemble_truncation_indexed, [(i, tasks[i]) for i in order])
+                while True:
+                    try:
+                        i, ensembles = completed.next(timeout=CANCEL_POLL_INTERVAL)
+                    except multiprocessing.TimeoutError:
+                        if cancel is not None and cancel.is_set():
+                            break
+                        continue
+                    except StopIteration:
+                        break
+                    results[i] = ensembles
+                    if ensemble_callback:
+                        ensemble_callback(ensembles)
+                    if cancel is not None and cancel.is_set():
+                        break
+                if cancel is not None and cancel.is_set():
+                    pool.terminate()
+                else:
+                    pool.close()
+            except Exception:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        else:
+            for i in order:
+                if cancel is not None and cancel.is_set():
+                    break
+                results[i] = self.ensemble_truncation(*tasks[i])
+                if ensemble_callback:
+                    ensemble_callback(results[i])
+
+        if cancel is not None and cancel.is_set():
+            logger.info('Ensembling was cancelled after creating ensembles for %d of %d truncation levels',
+                        sum(1 for r in results if r), len(tasks))
+
+        # The results are in the order of the tasks so the ensembles are the same as for a serial run
+        self.ensembles = [ensemble for ensembles in results for ensemble in ensembles]
         return self.ensembles
 
-    def generate_ensembles_from_amoptd(self, models, amoptd):
+    def ensemble_truncation(self, truncation, subcluster_program, radius_thresholds, side_chain_treatments):
+        """Create the side-chain treated ensembles for a single truncation level"""
+        ensembles = []
+        for ensemble in self.subcluster_models(truncation,
+                                               subcluster_program=subcluster_program,
+                                               ensemble_max_models=self.ensemble_max_models,
+                                               radius_thresholds=radius_thresholds):
+            # Now add the side chains
+            ensembles.extend(self.edit_side_chains(ensemble, side_chain_treatments))
+        return ensembles
+
+    def generate_ensembles_from_amoptd(self, models, amoptd, ensemble_callback=None, cancel=None):
         """Generate ensembles from data in supplied ample data dictionary."""
         kwargs = {
                   'cluster_dir' : amoptd['cluster_dir'],
@@ -242,7 +377,7 @@ class AbinitioEnsembler(_ensembler.Ensembler):
         # strip out any that are None
         kwargs = { k : v for k, v in kwargs.iteritems() if v is not None }
 
-        ensembles = self.generate_ensembles(models, **kwargs)
+        ensembles = self.generate_ensembles(models, ensemble_callback=ensemble_callback, cancel=cancel, **kwargs)
 
         # We need to save these data to amopt as it's impossible to reconstruct otherwise
         amoptd['truncation_levels'] = self.truncator.truncation_levels
@@ -262,6 +397,11 @@ class AbinitioEnsembler(_ensembler.Ensembler):
             cluster_exe = self.spicker_exe
             if cluster_method == SPICKER_TM:
                 cluster_score_type = 'tm'
+        elif cluster_method in [SPICKER_NUMPY_RMSD, SPICKER_NUMPY_TM]:
+            cluster_method_type = 'spicker_numpy'
+            cluster_exe = None
+            if cluster_method == SPICKER_NUMPY_TM:
+                cluster_score_type = 'tm'
         elif cluster_method in ['import', 'random', 'skip']:
             cluster_method_type = cluster_method
             cluster_exe = None
@@ -276,21 +416,25 @@ class AbinitioEnsembler(_ensembler.Ensembler):
         scwrl_directory = os.path.join(work_dir, "scrwl")
         if not os.path.isdir(scwrl_directory): os.mkdir(scwrl_directory)
 
-        scwrled_models = scwrl_util.Scwrl(scwrl_exe=scwrl_exe).process_models(models,
-                                                                              scwrl_directory,
-                                                                              strip_oxt=True)
+        scwrled_models = scwrl_util.Scwrl(scwrl_exe=scwrl_exe, workdir=scwrl_directory).process_models(models,
+                                                                                                     scwrl_directory,
+                                                                                                     strip_oxt=True)
         return scwrled_models
 
-    def subclusterer_factory(self, subcluster_program):
-        """Return an instantiated subclusterer based on the given program"""
+    def subclusterer_factory(self, subcluster_program, work_dir=None):
+        """Return an instantiated subclusterer based on the given program that runs in work_dir"""
         if subcluster_program == 'gesamt':
-            clusterer = subcluster.GesamtClusterer(self.gesamt_exe, nproc=self.nproc)
+            clusterer = subcluster.GesamtClusterer(self.gesamt_exe, nproc=self.nproc, work_dir=work_dir)
         elif subcluster_program == 'maxcluster':
-            clusterer = subcluster.MaxClusterer(self.maxcluster_exe)
+            clusterer = subcluster.MaxClusterer(self.maxcluster_exe, work_dir=work_dir)
         elif subcluster_program == 'lsqkab':
-            clusterer = subcluster.LsqkabClusterer(self.lsqkab_exe)
+            clusterer = subcluster.LsqkabClusterer(self.lsqkab_exe, work_dir=work_dir)
+        elif subcluster_program == 'kabsch':
+            clusterer = subcluster.KabschClusterer(nproc=self.nproc, work_dir=work_dir)
         else:
             raise RuntimeError("Unrecognised subcluster_program: {0}".format(subcluster_program))
+        clusterer.coordinate_store = self.coordinate_store
+        clusterer.cache = self.cache
         return clusterer
 
     def subcluster_models(self,
@@ -323,13 +467,9 @@ class AbinitioEnsembler(_ensembler.Ensembler):
         if not radius_thresholds:
             radius_thresholds = self.subcluster_radius_thresholds
 
-        # Make sure everyting happens in the truncation directory
-        owd = os.getcwd()
-        os.chdir(truncation.directory)
-
-        # Generate the distance matrix
-        clusterer = self.subclusterer_factory(subcluster_program)
-        clusterer.generate_distance_matrix(truncation.models)
+        # Generate the distance matrix in the truncation directory
+        clusterer = self.subclusterer_factory(subcluster_program, work_dir=truncation.directory)
+        clusterer.generate_cached_distance_matrix(truncation.models)
         # clusterer.dump_matrix(os.path.join(truncation_dir,"subcluster_distance.matrix")) # for debugging
 
         # Loop through the radius thresholds
@@ -361,9 +501,7 @@ class AbinitioEnsembler(_ensembler.Ensembler):
                 continue
             ensembles.append(ensemble)
 
-        # back to where we started
-        os.chdir(owd)
-
+        clusterer.distance_matrix.close()
         return ensembles
 
     def subcluster_models_floating_radii(self,
@@ -372,8 +510,8 @@ class AbinitioEnsembler(_ensembler.Ensembler):
                                          ensemble_max_models=None):
         logger.info("subclustering with floating radii")
 
-        clusterer = self.subclusterer_factory(subcluster_program)
-        clusterer.generate_distance_matrix(truncation.models)
+        clusterer = self.subclusterer_factory(subcluster_program, work_dir=truncation.directory)
+        clusterer.generate_cached_distance_matrix(truncation.models)
         # clusterer.dump_matrix(os.path.join(truncation_dir,"subcluster_distance.matrix")) # for debugging
 
         subclusters = []
@@ -381,15 +519,13 @@ class AbinitioEnsembler(_ensembler.Ensembler):
         radii = []
         len_truncated_models = len(truncation.models)
         for i in range(len(self.subcluster_radius_thresholds)):
-            radius = None
             nmodels = None
             if i > 0 and radii[i - 1] > self.subcluster_radius_thresholds[i]:
+                # The last radius already gave the last cluster
                 radius = radii[i - 1]
-                nmodels = len(clusters[i - 1])
-                cluster_files, radius = subcluster_util.subcluster_nmodels(nmodels, radius, clusterer, direction='up', increment=1)
             else:
                 radius = self.subcluster_radius_thresholds[i]
-                cluster_files = clusterer.cluster_by_radius(radius)
+            cluster_files = clusterer.cluster_by_radius(radius)
 
             if cluster_files:
                 cluster_files = tuple(sorted(cluster_files))  # Need to sort so that we can check if we've had this lot before
@@ -399,13 +535,12 @@ class AbinitioEnsembler(_ensembler.Ensembler):
                 cluster_size = 0
 
             if radius in radii or cluster_size == 0:
-                # Increase radius till we have one more than the last one
+                # Find the smallest radius that gives one more than the last one
                 if cluster_size == 0:
                     nmodels = 2
                 else:
-                    radius = radii[i - 1]
                     nmodels = len(clusters[i - 1]) + 1
-                cluster_files, radius = subcluster_util.subcluster_nmodels(nmodels, radius, clusterer, direction='up', increment=1)
+                cluster_files, radius = subcluster_util.subcluster_nmodels(nmodels, clusterer)
                 cluster_files = sorted(cluster_files)
             elif cluster_size >= ensemble_max_models or cluster_files in clusters:
                 # Randomly pick ensemble_max_models
@@ -430,4 +565,5 @@ class AbinitioEnsembler(_ensembler.Ensembler):
             if cluster_size == len_truncated_models:
                 break
 
+        clusterer.distance_matrix.close()
         return subclusters
@@ -11,3 +11,14 @@ ALLOWED_SIDE_CHAIN_TREATMENTS = [POLYALA, RELIABLE, ALLATOM, UNMODIFIED] # All p
 SUBCLUSTER_RADIUS_THRESHOLDS = [1, 3]
 SPICKER_RMSD = 'spicker'
 SPICKER_TM = 'spicker_tm'
+SPICKER_NUMPY_RMSD = 'spicker_numpy'
+SPICKER_NUMPY_TM = 'spicker_numpy_tm'
+# Ensembles with the same side chain treatment whose model and residue overlaps are both at least this are similar
+ENSEMBLE_SIMILARITY_THRESHOLD = 0.9
+# What to do with ensembles that are identical or similar to a higher priority ensemble
+REDUNDANT_DROP = 'drop'
+REDUNDANT_DEPRIORITISE = 'deprioritise'
+REDUNDANT_KEEP = 'keep'
+REDUNDANT_ENSEMBLES = [REDUNDANT_DROP, REDUNDANT_DEPRIORITISE, REDUNDANT_KEEP]
+# Truncation levels (% of residues kept) in this range are the most likely to succeed in MR so are tried first
+TRUNCATION_SWEET_SPOT = (20, 50)
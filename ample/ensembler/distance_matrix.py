@@ -0,0 +1,189 @@
+"""Symmetric distance matrices stored as their condensed upper triangle"""
+
+__author__ = "Jens Thomas, and Felix Simkovic"
+__date__ = "17 Oct 2026"
+__version__ = "1.0"
+
+import logging
+import os
+
+import numpy
+
+logger = logging.getLogger(__name__)
+
+# Matrices of more models than this are memory-mapped to a file if a directory is given
+MEMMAP_MIN_SIZE = 5000
+# Maximum number of rows to format at once when writing a score matrix
+WRITE_BATCH = 100000
+# Names of the files the condensed distances and diagonal are saved to
+CONDENSED_NAME = 'condensed.npy'
+DIAGONAL_NAME = 'diagonal.npy'
+
+
+class DistanceMatrix(object):
+    """A symmetric matrix of distances between N models
+
+    Only the N(N-1)/2 elements of the upper triangle are stored, as float32 by default, in a
+    single array that can be memory-mapped to a file. Setting element [i, j] also sets [j, i].
+
+    Parameters
+    ----------
+    size : int
+       The number of models
+    fill : float
+       The initial value of all elements, including the diagonal
+    path : str, optional
+       A file to memory-map the upper triangle to
+    dtype : :obj:`numpy.dtype`
+       The type of the stored distances
+    """
+
+    def __init__(self, size, fill=0.0, path=None, dtype=numpy.float32):
+        self.size = int(size)
+        self.path = path
+        nelements = self.size * (self.size - 1) // 2
+        if path:
+            self.condensed = numpy.memmap(path, dtype=dtype, mode='w+', shape=(max(nelements, 1),))[:nelements]
+        else:
+            self.condensed = numpy.empty(nelements, dtype=dtype)
+        self.condensed.fill(fill)
+        self.diagonal = numpy.full(self.size, fill, dtype=dtype)
+
+    @classmethod
+    def create(cls, size, fill=0.0, directory=None, name='distance_matrix.dat', dtype=numpy.float32):
+        """Create a matrix, memory-mapped to a file in directory if there are more than MEMMAP_MIN_SIZE models"""
+        path = None
+        if directory and size > MEMMAP_MIN_SIZE:
+            path = os.path.join(directory, name)
+            logger.debug("Memory-mapping %d x %d distance matrix to %s", size, size, path)
+        return cls(size, fill=fill, path=path, dtype=dtype)
+
+    @classmethod
+    def from_dense(cls, matrix, path=None, dtype=numpy.float32):
+        """Create a matrix from the upper triangle and diagonal of a square array"""
+        matrix = numpy.asarray(matrix)
+        if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+            raise RuntimeError("Need a square matrix not one of shape {0}".format(matrix.shape))
+        distance_matrix = cls(matrix.shape[0], path=path, dtype=dtype)
+        distance_matrix.condensed[:] = matrix[numpy.triu_indices(matrix.shape[0], 1)]
+        distance_matrix.diagonal[:] = numpy.diag(matrix)
+        return distance_matrix
+
+    @classmethod
+    def load(cls, directory, work_dir=None):
+        """Load a matrix saved with :meth:`save`, memory-mapping it to a file in work_dir if it is large"""
+        condensed = numpy.load(os.path.join(directory, CONDENSED_NAME), mmap_mode='r')
+        diagonal = numpy.load(os.path.join(directory, DIAGONAL_NAME))
+        distance_matrix = cls.create(len(diagonal), directory=work_dir, dtype=condensed.dtype)
+        if len(condensed) != len(distance_matrix.condensed):
+            raise RuntimeError("Distances in {0} do not match a matrix of size {1}".format(directory, len(diagonal)))
+        distance_matrix.condensed[:] = condensed
+        distance_matrix.diagonal[:] = diagonal
+        return distance_matrix
+
+    def save(self, directory):
+        """Save the upper triangle and diagonal as numpy .npy files in directory"""
+        numpy.save(os.path.join(directory, CONDENSED_NAME), self.condensed)
+        numpy.save(os.path.join(directory, DIAGONAL_NAME), self.diagonal)
+        return
+
+    @property
+    def shape(self):
+        return (self.size, self.size)
+
+    @property
+    def dtype(self):
+        return self.condensed.dtype
+
+    def __len__(self):
+        return self.size
+
+    def _offset(self, i):
+        """Return the index in the condensed array of element [i, i + 1]"""
+        return i * (2 * self.size - i - 1) // 2
+
+    def _index(self, i, j):
+        if i > j:
+            i, j = j, i
+        return self._offset(i) + j - i - 1
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            return self.row(key)
+        i, j = key
+        if i == j:
+            return self.diagonal[i]
+        return self.condensed[self._index(i, j)]
+
+    def __setitem__(self, key, value):
+        i, j = key
+        if i == j:
+            self.diagonal[i] = value
+        else:
+            self.condensed[self._index(i, j)] = value
+
+    def __array__(self, dtype=None):
+        matrix = self.to_dense()
+        return matrix if dtype is None else matrix.astype(dtype)
+
+    def row(self, i):
+        """Return row i as an array"""
+        row = numpy.empty(self.size, dtype=self.dtype)
+        lower = numpy.arange(i)
+        row[:i] = self.condensed[self._offset(lower) + i - lower - 1]
+        row[i] = self.diagonal[i]
+        row[i + 1:] = self.condensed[self._offset(i):self._offset(i + 1)]
+        return row
+
+    def set_row(self, i, values):
+        """Set the elements [i, i + 1:] of row i (and so column i) from values"""
+        self.condensed[self._offset(i):self._offset(i + 1)] = values
+
+    def submatrix(self, indices):
+        """Return the square array of the distances between the models at indices"""
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        i, j = numpy.meshgrid(indices, indices, indexing='ij')
+        lo, hi = numpy.minimum(i, j), numpy.maximum(i, j)
+        off_diagonal = lo != hi
+        submatrix = numpy.empty(i.shape, dtype=self.dtype)
+        submatrix[off_diagonal] = self.condensed[self._offset(lo[off_diagonal]) + (hi - lo - 1)[off_diagonal]]
+        submatrix[~off_diagonal] = self.diagonal[lo[~off_diagonal]]
+        return submatrix
+
+    def to_dense(self):
+        """Return the full square matrix as an array"""
+        matrix = numpy.empty(self.shape, dtype=self.dtype)
+        upper = numpy.triu_indices(self.size, 1)
+        matrix[upper] = self.condensed
+        matrix[upper[1], upper[0]] = self.condensed
+        matrix[numpy.diag_indices(self.size)] = self.diagonal
+        return matrix
+
+    def flush(self):
+        if isinstance(self.condensed, numpy.memmap):
+            self.condensed.flush()
+
+    def close(self):
+        """Release the distances and remove the file they are memory-mapped to"""
+        self.condensed = None
+        if self.path and os.path.isfile(self.path):
+            os.unlink(self.path)
+
+    def write_score_matrix(self, file_name, offset=0):
+        """Write the upper triangle and diagonal in the SPICKER score.matrix format
+
+        Each line holds i, j and the distance for j >= i with the indices starting at offset.
+        The lines are formatted in batches of rows rather than element by element.
+        """
+        with open(file_name, 'w') as f:
+            rows = max(1, WRITE_BATCH // max(self.size, 1))
+            for start in range(0, self.size, rows):
+                stop = min(start + rows, self.size)
+                i = numpy.concatenate([numpy.full(self.size - r, r, dtype=numpy.int64) for r in range(start, stop)])
+                j = numpy.concatenate([numpy.arange(r, self.size) for r in range(start, stop)])
+                distances = numpy.concatenate([numpy.concatenate([[self.diagonal[r]],
+                                                                  self.condensed[self._offset(r):self._offset(r + 1)]])
+                                               for r in range(start, stop)])
+                numpy.savetxt(f, numpy.column_stack([i + offset, j + offset, distances]), fmt='% 4d % 4d % 8.3f')
+            f.write("\n")
+        return file_name
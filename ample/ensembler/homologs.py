@@ -23,11 +23,9 @@ def align_mustang(models, mustang_exe=None, work_dir=None):
         msg = "Cannot find mustang executable: {0}".format(mustang_exe)
         raise RuntimeError(msg)
     
-    owd = os.getcwd()
-    if not work_dir: work_dir = owd
+    if not work_dir: work_dir = os.getcwd()
     work_dir = os.path.abspath(work_dir)
     if not os.path.isdir(work_dir): os.mkdir(work_dir)
-    os.chdir(work_dir)
 
     logfile = os.path.join(work_dir, 'mustang.log')
     basename = 'mustang'
@@ -41,7 +39,6 @@ def align_mustang(models, mustang_exe=None, work_dir=None):
     if not os.path.isfile(alignment_file): 
         msg = "Could not find alignment file: {0} after running mustang!".format(alignment_file)
         raise RuntimeError(msg)
-    os.chdir(owd) # always need to go back to original directory
     return alignment_file
 
 
@@ -50,11 +47,9 @@ def align_gesamt(models, gesamt_exe=None, work_dir=None):
         msg = "Cannot find gesamt executable: {0}".format(gesamt_exe)
         raise RuntimeError(msg)
     
-    owd = os.getcwd()
-    if not work_dir: work_dir = owd
+    if not work_dir: work_dir = os.getcwd()
     work_dir = os.path.abspath(work_dir)
     if not os.path.isdir(work_dir): os.mkdir(work_dir)
-    os.chdir(work_dir)
     
     # Need to map chain name to pdb
     model2chain = {}
@@ -73,7 +68,7 @@ def align_gesamt(models, gesamt_exe=None, work_dir=None):
     cmd = [gesamt_exe]
     # We iterate through the models to make sure the order stays the same
     for m in models: cmd += [ m, '-s', model2chain[m] ]
-    cmd += ['-o', '{0}.pdb'.format(basename), '-a', alignment_file]
+    cmd += ['-o', os.path.join(work_dir, '{0}.pdb'.format(basename)), '-a', alignment_file]
     
     rtn = ample_util.run_command(cmd, logfile=logfile, directory=work_dir)
     if not rtn == 0:
@@ -87,7 +82,6 @@ def align_gesamt(models, gesamt_exe=None, work_dir=None):
     if sys.platform.startswith("win"):
         alignment_file = _gesamt_aln_windows_fix(alignment_file)
     
-    os.chdir(owd) # always need to go back to original directory
     return alignment_file
  
 
@@ -183,7 +177,6 @@ class HomologEnsembler(_ensembler.Ensembler):
                                                          alignment_file=alignment_file):
             ensemble_dir = os.path.join(truncation.directory, "ensemble_{0}".format(truncation.level))
             os.mkdir(ensemble_dir)
-            os.chdir(ensemble_dir)
              
             # Need to create an alignment file for theseus
             basename = "e{0}".format(truncation.level)
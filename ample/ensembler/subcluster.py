@@ -13,34 +13,101 @@ import re
 import os
 import shutil
 
+from ample.ensembler.distance_matrix import DistanceMatrix
+from ample.ensembler.subcluster_util import NeighbourIndex
 from ample.util import ample_util
+from ample.util import cache_util
 from ample.util import pdb_edit
+from ample.util import rmsd_util
 
 logger = logging.getLogger()
 
 SCORE_MATRIX_NAME = 'score.matrix'
 FILE_LIST_NAME = 'files.list'
+# Name of the file in a cache entry holding the rank of the model hash of each row of the distance matrix
+INDEX_NAME = 'index.npy'
 RMSD_MAX = 50
 QSCORE_MIN = 0.01
 
+# A line of the output file of a gesamt archive search
+GesamtData = namedtuple('GesamtData',
+                        ['count', 'chain_id', 'q_score', 'rmsd', 'seq_id', 'nalign', 'nres', 'file_name'])
+
 
 class SubClusterer(object):
     """Base class for clustering pdbs by distance
     Sub-classes just need to provide a generate_distance_matrix class
+
+    The distances are held in a :obj:`DistanceMatrix <ample.ensembler.distance_matrix.DistanceMatrix>`,
+    which is memory-mapped to a file in work_dir for large numbers of models.
+
+    Any files are written to and programs run in work_dir (the current directory if not given)
+
+    If a :obj:`ResultCache <ample.util.cache_util.ResultCache>` is set as the cache, distance matrices
+    are stored in it and reused for any later set of models with identical coordinates.
     """
 
-    def __init__(self, executable=None, nproc=1):
+    def __init__(self, executable=None, nproc=1, work_dir=None):
         if executable and not os.path.exists(executable) and os.access(executable, os.X_OK):
             raise RuntimeError("Cannot find subclusterer executable: {0}".format(executable))
         self.executable = executable
         self.nproc = nproc
+        self.work_dir = os.path.abspath(work_dir or os.getcwd())
+        self.coordinate_store = None
+        self.cache = None
         self.distance_matrix = None
         self.index2pdb = []
         self.cluster_score = None
+        self._neighbour_index = None
+
+    @property
+    def neighbour_index(self):
+        """The :obj:`NeighbourIndex <ample.ensembler.subcluster_util.NeighbourIndex>` of the distance matrix"""
+        if self.distance_matrix is None:
+            raise RuntimeError("Need to call generate_distance_matrix before using the neighbour index!")
+        if self._neighbour_index is None or self._neighbour_index[0] is not self.distance_matrix:
+            self._neighbour_index = (self.distance_matrix, NeighbourIndex(self.distance_matrix))
+        return self._neighbour_index[1]
 
     def generate_distance_matrix(self, *args, **kwargs):
         raise NotImplementedError
 
+    def generate_cached_distance_matrix(self, pdb_list):
+        """Generate the distance matrix, or load it from the cache if these models have been compared before
+
+        The key does not depend on the order of the models, so each row of a cached matrix is
+        recorded by the rank of the hash of its model.
+        """
+        if self.cache is None:
+            return self.generate_distance_matrix(pdb_list)
+        hashes = cache_util.models_hash(pdb_list, self.coordinate_store)
+        by_hash = numpy.argsort(hashes, kind='mergesort')
+        key = self.cache.key('distance_matrix', self.__class__.__name__, cache_util.program_version(self.executable),
+                             sorted(hashes))
+        entry = self.cache.get(key)
+        if entry:
+            logger.debug("Using cached distance matrix for %d models from %s", len(pdb_list), entry)
+            self.distance_matrix = DistanceMatrix.load(entry, work_dir=self.work_dir)
+            self.index2pdb = [pdb_list[by_hash[rank]] for rank in numpy.load(os.path.join(entry, INDEX_NAME))]
+            return
+        self.generate_distance_matrix(pdb_list)
+        rank = dict((pdb_list[i], r) for r, i in enumerate(by_hash))
+        if not all(pdb in rank for pdb in self.index2pdb):
+            logger.debug("Not caching distance matrix as the models have been renamed")
+            return
+
+        def write(directory):
+            self.distance_matrix.save(directory)
+            numpy.save(os.path.join(directory, INDEX_NAME), [rank[pdb] for pdb in self.index2pdb])
+
+        self.cache.store(key, write)
+        return
+
+    def _create_distance_matrix(self, num_models, fill=0.0):
+        """Set the distance_matrix to a new DistanceMatrix of num_models"""
+        self.distance_matrix = DistanceMatrix.create(num_models, fill=fill, directory=self.work_dir)
+        return self.distance_matrix
+
     def cluster_by_radius(self, radius):
         """Return a list of pdbs clustered by the given radius"""
         if self.distance_matrix is None:
@@ -52,31 +119,17 @@ class SubClusterer(object):
         else:
             return None
 
-    def _cluster_indices(self,thresh):
+    def _cluster_indices(self, thresh):
         """Return the indices of the largest cluster that have distances < thresh.
-        We loop through each row of the distance matrix and for each row (pdb) see
-        how many pdbs are < thresh to this pdb. We return the largest cluster.
+        For each row (pdb) the neighbour index gives how many pdbs are <= thresh to this pdb
+        and we return the largest cluster.
         """
-        #self.dump_matrix("maxcluster.csv")
-        thresh = float(thresh)
-
-        # get mask of all elements where condition is true. We exclude 0.0 to ensure we don't get the
-        # index of the model that the row is compared with, as this needs to be the first model in the
-        # ensemble. This means we would also exclude models that had an rmsd of zero to the centroid, but
-        # as these are likely to be identical (and this occurrence rare), this should be ok
-        condition = numpy.logical_and(self.distance_matrix <= thresh, self.distance_matrix != 0.0)
-
-        # Array of sums of each row - largest number is a row where most items satisfy condition
-        condition_sum =  condition.sum(axis=1)
-
-        # Find all rows that have the maximum of the condition true and then select the first one
-        row_index = numpy.where(condition_sum == numpy.max(condition_sum))[0][0]
-
-        # Select all values from that row where the condition is true and insert the first index so that
-        # it becomes the centroid of that cluster
-        max_cluster = numpy.insert(numpy.where(condition[row_index])[0], 0, row_index)
-
-        if len(max_cluster) == 1:
+        # Distances of 0.0 are not counted as neighbours to ensure we don't get the index of the model that
+        # the row is compared with, as this needs to be the first model in the ensemble. This means we would
+        # also exclude models that had an rmsd of zero to the centroid, but as these are likely to be identical
+        # (and this occurrence rare), this should be ok
+        max_cluster = self.neighbour_index.largest_cluster(float(thresh))
+        if max_cluster is None:
             return None, None
         else:
             cluster_score = self.calculate_score(max_cluster)
@@ -85,32 +138,19 @@ class SubClusterer(object):
     def calculate_score(self, cluster):
         """Given a list of indices of a cluster, calculate the rmsd we want to give to phaser
         """
-        ALL_BY_ALL = True
-        if ALL_BY_ALL:
-            rmsds = [self.distance_matrix[i] for i in itertools.combinations(cluster, 2)]
-        else:
-            # Just use the rmsds of the decoys to the the cluster centroid - assumes
-            # the centroid approximates the native
-            row = cluster[0]
-            rmsds = [self.distance_matrix[row][j] for j in cluster[1:]]
-
-        return max(rmsds)
+        # The maximum all-by-all distance between the models
+        return self.neighbour_index.cluster_diameter(cluster)
 
     def dump_raw_matrix(self,file_name):
         with open(file_name,'w') as f:
-            for row in self.distance_matrix:
-                f.write(",".join(map(str,row))+"\n")
+            for i in range(len(self.distance_matrix)):
+                f.write(",".join(map(str, self.distance_matrix.row(i)))+"\n")
             f.write("\n")
         return
 
     def dump_pdb_matrix(self, file_name=SCORE_MATRIX_NAME, offset=0):
-        with open(file_name,'w') as f:
-            l = len(self.distance_matrix) + offset
-            for i in range(offset, l):
-                for j in range(i, l):
-                    f.write("{0: > 4d} {1: > 4d} {2: > 8.3F}\n".format(i,j, self.distance_matrix[i-offset][j-offset]))
-            f.write("\n")
-        return os.path.abspath(file_name)
+        file_name = os.path.join(self.work_dir, file_name)
+        return self.distance_matrix.write_score_matrix(file_name, offset=offset)
 
 
 class CctbxClusterer(SubClusterer):
@@ -127,13 +167,13 @@ class CctbxClusterer(SubClusterer):
         self.index2pdb = sorted(pdb_list)
 
         # Create a square matrix storing the rmsd distances between models
-        self.distance_matrix = numpy.zeros([num_models, num_models])
+        self._create_distance_matrix(num_models)
         for m1, m2 in itertools.combinations(pdb_list, 2):
             i, j = pdb_list.index(m1), pdb_list.index(m2)
             fixed = mmtbx.superpose.SuperposePDB(m1, preset='ca', log=None, quiet=True)
             moving = mmtbx.superpose.SuperposePDB(m2, preset='ca', log=None, quiet=True)
             rmsd, _ = moving.superpose(fixed)
-            self.distance_matrix[i, j] = self.distance_matrix[j, i] = float(rmsd)
+            self.distance_matrix[i, j] = float(rmsd)
 
         # # Might be deleted when confirmed that above code works
         # for i, m1 in enumerate(pdb_list):
@@ -157,7 +197,7 @@ class FpcClusterer(SubClusterer):
     def generate_distance_matrix(self,pdb_list):
 
         # Create list of pdb files
-        fname = os.path.join(os.getcwd(), "files.list" )
+        fname = os.path.join(self.work_dir, "files.list" )
         with open( fname, 'w' ) as f: f.write( "\n".join( pdb_list )+"\n" )
 
         # Index is just the order of the pdb in the file
@@ -166,15 +206,15 @@ class FpcClusterer(SubClusterer):
         # Run fast_protein_cluster - this is just to generate the distance matrix, but there
         # doesn't seem to be a way to stop it clustering as well - not a problem as it just
         # generates more files
-        log_name = os.path.abspath("fast_protein_cluster.log")
-        matrix_file = "fpc.matrix"
+        log_name = os.path.join(self.work_dir, "fast_protein_cluster.log")
+        matrix_file = os.path.join(self.work_dir, "fpc.matrix")
         cmd = [self.executable,
                "--cluster_write_text_matrix",
                matrix_file,
                "-i",
                fname]
 
-        retcode = ample_util.run_command( cmd, logfile=log_name )
+        retcode = ample_util.run_command( cmd, logfile=log_name, directory=self.work_dir )
         if retcode != 0:
             raise RuntimeError("non-zero return code for fast_protein_cluster in generate_distance_matrix!\nCheck logfile:{0}".format(log_name))
 
@@ -189,25 +229,10 @@ class FpcClusterer(SubClusterer):
                 mlen = max(mlen,x+1) # +1 as we want the length
                 data.append((x,y,d))
 
-        # create empty matrix - we use None's but this means we need to check for then when
-        # looking through the matrix
-        # use square matrix to make indexing easier as we're unlikely to be very big
-        m = numpy.zeros([mlen, mlen])
-
-        # Fill in all values (upper triangle)
+        # The matrix is symmetric so setting [i, j] also sets [j, i]
+        m = self._create_distance_matrix(mlen)
         for i,j,d in data:
-            if i > j:
-                m[j][i] = d
-            else:
-                m[i][j] = d
-
-        # Copy to lower
-        for x in range(mlen):
-            for y in range(mlen):
-                if x==y: continue
-                m[y][x] = m[x][y]
-
-        self.distance_matrix = m
+            m[i, j] = d
         return
 
 
@@ -245,7 +270,7 @@ where inp_list.dat  contains:
         self.index2pdb = models
 
         # Create file with list of pdbs and model/chain
-        glist = 'gesamt_models.dat'
+        glist = os.path.join(self.work_dir, 'gesamt_models.dat')
         with open(glist, 'w') as w:
             for m in models:
                 w.write("{0} -s /1/A \n".format(m))
@@ -253,48 +278,52 @@ where inp_list.dat  contains:
 
         cmd = [self.executable, '-input-list', glist, '-sheaf-x', '-nthreads={0}'.format(self.nproc)]
 
-        logfile = os.path.abspath('gesamt_archive.log')
-        rtn = ample_util.run_command(cmd, logfile)
-        if rtn != 0:
-            raise RuntimeError("Error running gesamt - check logfile: {0}".format(logfile))
-
-        # Create a square distance_matrix no_models in size filled with None
         num_models = len(models)
-        self.distance_matrix = numpy.zeros([num_models, num_models])
+        self._create_distance_matrix(num_models)
 
-        # Read in the rmsds calculated
-        self._parse_gesamt_rmsd_log(logfile, num_models)
+        # Read in the rmsds as gesamt writes them, only keeping the log if we are not purging
+        logfile = None if purge else os.path.join(self.work_dir, 'gesamt_archive.log')
+        with ample_util.CommandOutput(cmd, logfile=logfile, directory=self.work_dir) as output:
+            nrows = self._parse_gesamt_rmsd_lines(output, num_models)
+        if output.returncode != 0:
+            raise RuntimeError(output.error_message("Error running gesamt"))
+        if nrows != num_models:
+            raise RuntimeError(output.error_message("Could not generate distance matrix with gesamt"))
 
         if purge:
             os.unlink(glist)
-            os.unlink(logfile)
         return
 
     def _parse_gesamt_rmsd_log(self, logfile, num_models):
-        reading = -1
-        nmodel = 0
         with open(logfile) as f:
-            for line in f:
-                if line.startswith(' ===== CROSS-RMSDs') or reading == 0:
-                    # find start of RMSDS and skip blank line
-                    reading += 1
-                    continue
-                if reading == 1:
-                    fields = line.strip().split('|')
-                    nmodel = int(fields[0])
-                    rmsd_txt = fields[2].strip()
-                    # poke into distance matrix
-                    rmsds = [ float(r) for r in rmsd_txt.split() ]
-                    for j in range(len(rmsds)):
-                        if j == nmodel:
-                            continue
-                        self.distance_matrix[nmodel-1][j] = rmsds[j]
-                    if nmodel == num_models:
-                        reading = -1
-        if nmodel != num_models:
+            nrows = self._parse_gesamt_rmsd_lines(f, num_models)
+        if nrows != num_models:
             raise RuntimeError("Could not generate distance matrix with gesamt")
         return
 
+    def _parse_gesamt_rmsd_lines(self, lines, num_models):
+        """Set the rows of the distance matrix from the CROSS-RMSDs table in the lines of gesamt output
+
+        Returns the number of the last row read, which is num_models if the table was complete
+        """
+        reading = -1
+        nmodel = 0
+        for line in lines:
+            if line.startswith(' ===== CROSS-RMSDs') or reading == 0:
+                # find start of RMSDS and skip blank line
+                reading += 1
+                continue
+            if reading == 1:
+                fields = line.strip().split('|')
+                nmodel = int(fields[0])
+                rmsd_txt = fields[2].strip()
+                # poke the upper triangle into the distance matrix
+                rmsds = numpy.array(rmsd_txt.split(), dtype=numpy.float64)
+                self.distance_matrix.set_row(nmodel - 1, rmsds[nmodel:num_models])
+                if nmodel == num_models:
+                    reading = -1
+        return nmodel
+
     def _generate_distance_matrix_generic(self, models, purge=True, purge_all=False, metric='qscore'):
         # Make sure all the files are in the same directory otherwise we wont' work
         mdir = os.path.dirname(models[0])
@@ -306,22 +335,22 @@ where inp_list.dat  contains:
         nmodels = len(models)
 
         # Create list of pdb files
-        fname = os.path.join(os.getcwd(), FILE_LIST_NAME)
+        fname = os.path.join(self.work_dir, FILE_LIST_NAME)
         with open(fname, 'w') as f:
             f.write("\n".join(models) + "\n")
 
         # Make the archive
         logger.debug("Generating gesamt archive from models in directory %s", mdir)
-        garchive = 'gesamt.archive'
+        garchive = os.path.join(self.work_dir, 'gesamt.archive')
         if not os.path.isdir(garchive): os.mkdir(garchive)
-        logfile = os.path.abspath('gesamt_archive.log')
+        logfile = os.path.join(self.work_dir, 'gesamt_archive.log')
         cmd = [self.executable, '--make-archive', garchive, '-pdb', mdir]
         #cmd += [ '-nthreads=auto' ]
         cmd += ['-nthreads={0}'.format(self.nproc)]
         # HACK FOR DYLD!!!!
         env = None
         #env = {'DYLD_LIBRARY_PATH' : '/opt/ccp4-devtools/install/lib'}
-        rtn = ample_util.run_command(cmd, logfile,env = env)
+        rtn = ample_util.run_command(cmd, logfile, directory=self.work_dir, env=env)
         if rtn != 0:
             raise RuntimeError("Error running gesamt - check logfile: {0}".format(logfile))
 
@@ -336,19 +365,17 @@ where inp_list.dat  contains:
         else:
             raise RuntimeError("Unrecognised metric: {0}".format(metric))
 
-        #m = [[parity for _ in range(nmodels)] for _ in range(nmodels)]
-        m = numpy.full([nmodels, nmodels], parity, dtype=numpy.float)
+        m = self._create_distance_matrix(nmodels, fill=parity)
         for i, model in enumerate(models):
             mname = os.path.basename(model)
-            gesamt_out = '{0}_gesamt.out'.format(mname)
-            logfile = '{0}_gesamt.log'.format(mname)
+            gesamt_out = os.path.join(self.work_dir, '{0}_gesamt.out'.format(mname))
+            logfile = None if purge else os.path.join(self.work_dir, '{0}_gesamt.log'.format(mname))
             cmd = [self.executable, model, '-archive', garchive, '-o', gesamt_out]
             cmd += ['-nthreads={0}'.format(self.nproc)]
-            rtn = ample_util.run_command(cmd, logfile)
-            if rtn != 0:
-                raise RuntimeError("Error running gesamt!")
-            else:
-                if purge: os.unlink(logfile)
+            with ample_util.CommandOutput(cmd, logfile=logfile, directory=self.work_dir) as output:
+                pass
+            if output.returncode != 0:
+                raise RuntimeError(output.error_message("Error running gesamt!"))
 
             gdata = self._parse_gesamt_out(gesamt_out)
             assert gdata[0].file_name == mname, gdata[0].file_name + " " + mname
@@ -373,11 +400,6 @@ where inp_list.dat  contains:
             if purge_all:
                 os.unlink(gesamt_out)
 
-        # Copy upper half of matrix to lower
-        i_lower = numpy.tril_indices(nmodels, -1)
-        m[i_lower] = m.T[i_lower]  # make the matrix symmetric
-        self.distance_matrix = m
-
         # Remove the gesamt archive
         if purge:
             shutil.rmtree(garchive)
@@ -387,36 +409,80 @@ where inp_list.dat  contains:
         return
 
     def _parse_gesamt_out(self, out_file):
-        # Assumption is there are no pdb_codes
-        GesamtData = namedtuple('GesamtData',
-                                ['count', 'chain_id', 'q_score', 'rmsd', 'seq_id', 'nalign', 'nres', 'file_name'])
-        data = []
         with open(out_file) as f:
-            for i, line in enumerate(f):
-                if i < 2:
-                    continue # First 2 lines are headers
-                if not line.strip():
-                    continue # ignore blanks
-                try:
-                    tmp = GesamtData(*line.split())
-                    # Convert from strings to correct types
-                    data.append(
-                        GesamtData(
-                            int(tmp.count), tmp.chain_id, float(tmp.q_score), float(tmp.rmsd), 
-                            tmp.seq_id, int(tmp.nalign), int(tmp.nres), os.path.basename(tmp.file_name)
-                        )
-                    )
-                except Exception as e:
-                    raise RuntimeError('Error parsing line {0}: {1}\n{2}'.format(i, line, e.message))
-
+            data = list(self._parse_gesamt_out_lines(f))
         assert len(data),"Failed to read any data!"
         return data
 
+    @staticmethod
+    def _parse_gesamt_out_lines(lines):
+        """Yield a GesamtData for each line of gesamt -o output as it is read"""
+        # Assumption is there are no pdb_codes
+        for i, line in enumerate(lines):
+            if i < 2:
+                continue # First 2 lines are headers
+            if not line.strip():
+                continue # ignore blanks
+            try:
+                tmp = GesamtData(*line.split())
+                # Convert from strings to correct types
+                yield GesamtData(
+                    int(tmp.count), tmp.chain_id, float(tmp.q_score), float(tmp.rmsd),
+                    tmp.seq_id, int(tmp.nalign), int(tmp.nres), os.path.basename(tmp.file_name)
+                )
+            except Exception as e:
+                raise RuntimeError('Error parsing line {0}: {1}\n{2}'.format(i, line, e.message))
+
+
+class KabschClusterer(SubClusterer):
+    """Class to cluster files by the CA RMSD after optimal superposition, calculated with numpy"""
+
+    def generate_distance_matrix(self, models):
+        """Calculate the RMSDs between all the models in one vectorised operation"""
+
+        num_models = len(models)
+        if not num_models:
+            raise RuntimeError("generate_distance_matrix got empty pdb_list!")
+
+        # Index is just the order of the pdbs
+        models = sorted(models)
+        self.index2pdb = models
+        if self.coordinate_store is not None and all(m in self.coordinate_store for m in models):
+            coords = self.coordinate_store.ca_coordinates(models)
+        else:
+            coords = self.ca_coordinates(models)
+        self._create_distance_matrix(num_models)
+        for start, stop, rows in rmsd_util.pairwise_rmsd_rows(coords):
+            for i in range(start, stop):
+                self.distance_matrix.set_row(i, rows[i - start, i + 1:])
+        return
+
+    @staticmethod
+    def ca_coordinates(models):
+        """Return an (N, L, 3) array of the CA coordinates of the residues common to all models"""
+        ca_coords = [dict(pdb_edit.xyz_ca_coordinates(m)) for m in models]
+        common = set(ca_coords[0]).intersection(*ca_coords[1:])
+        if not common:
+            raise RuntimeError("Models have no CA atoms in common")
+        if any(len(c) != len(common) for c in ca_coords):
+            logger.debug("Only using the %d CA atoms common to all models", len(common))
+        resseqs = sorted(common)
+        return numpy.array([[c[r] for r in resseqs] for c in ca_coords])
+
 
 class LsqkabClusterer(SubClusterer):
     """Class to cluster files with Lsqkab"""
 
-    def calc_rmsd(self, model1, model2, nresidues=None, logfile='lsqkab.out', purge=False):
+    def calc_rmsd(self, model1, model2, nresidues=None, logfile=None, purge=False):
+        """Return the CA RMSD between two models
+
+        The RMSD is read from the output of lsqkab as it runs, and the output is only written to a log if logfile
+        is given. lsqkab writes its RMSTAB file alongside the logfile, or with a unique name in work_dir.
+        """
+        if logfile:
+            rmstab = self._rmstab(logfile)
+        else:
+            rmstab = ample_util.tmp_file_name(directory=self.work_dir, suffix='.rmstab')
         if not nresidues:
             _, nresidues = pdb_edit.num_atoms_and_residues(model1, first=True)
 
@@ -425,14 +491,18 @@ MATCH 1 to  {0} CHAIN {1}
 output  RMS
 end""".format(nresidues, 'A')
 
-        cmd = ['lsqkab', 'XYZINM', model1, 'XYZINF', model2]
-        ample_util.run_command(cmd, logfile=logfile, stdin=stdin)
-        rmsd =  self.parse_lsqkab_output(logfile)
+        cmd = ['lsqkab', 'XYZINM', model1, 'XYZINF', model2, 'RMSTAB', rmstab]
+        with ample_util.CommandOutput(cmd, logfile=logfile, directory=self.work_dir, stdin=stdin) as output:
+            rmsd = self._parse_lsqkab_lines(output)
+        if rmsd is None:
+            raise RuntimeError(output.error_message("Could not read RMSD from lsqkab output"))
 
         # cleanup
         if purge:
-            os.unlink(logfile)
-            os.unlink('RMSTAB')
+            if logfile:
+                os.unlink(logfile)
+            if os.path.isfile(rmstab):
+                os.unlink(rmstab)
 
         return rmsd
 
@@ -444,45 +514,42 @@ end""".format(nresidues, 'A')
 
         # Assume all models are the same size and only have a single chain
         # We also assume that the chain is called 'A' (not relevant here)
-        _, nresidues = pdb_edit.num_atoms_and_residues(models[0], first=True)
+        if self.coordinate_store is not None and models[0] in self.coordinate_store:
+            nresidues = self.coordinate_store.num_residues(models[0])
+        else:
+            _, nresidues = pdb_edit.num_atoms_and_residues(models[0], first=True)
 
-        # Create a square distance_matrix no_models in size filled with None
-        self.distance_matrix = numpy.zeros([num_models, num_models])
+        self._create_distance_matrix(num_models)
 
-        logfile = 'lsqkab.out'
-        parity = 0.0
         for i, fixed in enumerate(models):
-            for j, model2 in enumerate(models):
-                if j < i:
-                    continue
-                if j == i:
-                    rmsd = parity
-                elif j > i:
-                    rmsd = self.calc_rmsd(fixed, model2, nresidues=nresidues, logfile=logfile)
-                self.distance_matrix[i][j] = rmsd
-
-        # Clean up output files from lsqkab
-        os.unlink(logfile)
-        os.unlink('RMSTAB')
-
-        # Copy in other half of matrix - we use a full matrix as it's easier to scan for clusters
-        for x in range(len(self.distance_matrix)):
-            for y in range(len(self.distance_matrix)):
-                self.distance_matrix[y][x] = self.distance_matrix[x][y]
+            rmsds = [self.calc_rmsd(fixed, model2, nresidues=nresidues, purge=True) for model2 in models[i + 1:]]
+            self.distance_matrix.set_row(i, rmsds)
         return
 
+    @staticmethod
+    def _rmstab(logfile):
+        """Return the name of the RMSTAB file written for the lsqkab logfile"""
+        return os.path.splitext(logfile)[0] + '.rmstab'
+
     def parse_lsqkab_output(self, output_file):
         with open(output_file) as f:
-            for  l in f.readlines():
-                if l.startswith("          RMS     XYZ DISPLACEMENT ="):
-                    return float(l.split()[4])
-        assert False
+            rmsd = self._parse_lsqkab_lines(f)
+        assert rmsd is not None
+        return rmsd
+
+    @staticmethod
+    def _parse_lsqkab_lines(lines):
+        """Return the RMS XYZ displacement from the lines of lsqkab output, or None if there is none"""
+        for l in lines:
+            if l.startswith("          RMS     XYZ DISPLACEMENT ="):
+                return float(l.split()[4])
+        return None
 
 
 class MaxClusterer(SubClusterer):
     """Class to cluster files with maxcluster"""
 
-    def generate_distance_matrix(self, pdb_list):
+    def generate_distance_matrix(self, pdb_list, keep_log=True):
         """Run maxcluster to generate the distance distance_matrix"""
 
         num_models = len(pdb_list)
@@ -500,26 +567,27 @@ class MaxClusterer(SubClusterer):
         # -rmsd ???
 
         # Create the list of files for maxcluster
-        fname = os.path.join(os.getcwd(), FILE_LIST_NAME )
+        fname = os.path.join(self.work_dir, FILE_LIST_NAME )
         with open( fname, 'w' ) as f:
             f.write( "\n".join( pdb_list )+"\n" )
 
-        #log_name = "maxcluster_radius_{0}.log".format(radius)
-        log_name = os.path.abspath("maxcluster.log")
-        cmd = [ self.executable, "-l", fname, "-L", "4", "-rmsd", "-d", "1000", "-bb", "-C0" ]
-        retcode = ample_util.run_command( cmd, logfile=log_name )
+        self._create_distance_matrix(num_models)
 
-        if retcode != 0:
-            raise RuntimeError("non-zero return code for maxcluster in generate_distance_matrix!\nSee logfile: {0}".format(log_name))
+        # The distances are read as maxcluster writes them, and the output is only logged if keep_log
+        log_name = os.path.join(self.work_dir, "maxcluster.log") if keep_log else None
+        cmd = [ self.executable, "-l", fname, "-L", "4", "-rmsd", "-d", "1000", "-bb", "-C0" ]
+        with ample_util.CommandOutput(cmd, logfile=log_name, directory=self.work_dir) as output:
+            self._parse_maxcluster_lines(output)
 
-        # Create a square distance_matrix no_models in size filled with None
-        parity = 0.0
-        self.distance_matrix = numpy.full([num_models, num_models], parity)
+        if output.returncode != 0:
+            raise RuntimeError(output.error_message("non-zero return code for maxcluster in generate_distance_matrix!"))
+        return
 
-        #jmht Save output for parsing - might make more sense to use one of the dedicated maxcluster output formats
-        max_log = open(log_name, 'r')
+    def _parse_maxcluster_lines(self, lines):
+        """Set the distances and the index2pdb names from the lines of maxcluster output"""
+        #jmht might make more sense to use one of the dedicated maxcluster output formats
         pattern = re.compile('INFO  \: Model')
-        for line in max_log:
+        for line in lines:
             if re.match(pattern, line):
 
                 # Split so that we get a list with
@@ -529,15 +597,11 @@ class MaxClusterer(SubClusterer):
                 # 3: path to model 2 without .pdb suffix
                 # 4: distance metric
                 split = re.split('INFO  \: Model\s*(\d*)\s*(.*)\.pdb\s*vs\. Model\s*(\d*)\s*(.*)\.pdb\s*=\s*(\d*\.\d*)', line)
-                self.distance_matrix[  int(split[1]) -1 ][  int(split[3]) -1]  = float(split[5])
+                self.distance_matrix[int(split[1]) - 1, int(split[3]) - 1] = float(split[5])
 
                 if split[2]+'.pdb' not  in self.index2pdb:
                     self.index2pdb[int(split[1]) -1]  =  split[2]+'.pdb'
 
                 if split[4]+'.pdb' not  in self.index2pdb:
                     self.index2pdb[int(split[3]) -1]  =  split[4]+'.pdb'
-
-        # Copy in other half of matrix - we use a full matrix as it's easier to scan for clusters
-        for x in range(len(self.distance_matrix)):
-            for y in range(len(self.distance_matrix)):
-                self.distance_matrix[y][x] = self.distance_matrix[x][y]
+        return
@@ -5,10 +5,104 @@ __date__ = "02 Mar 2016"
 __version__ = "1.0"
 
 import logging
+import math
+import numpy
 import random
 
+from ample.ensembler.distance_matrix import DistanceMatrix
+
 logger = logging.getLogger(__name__)
 
+# Number of decimal places that the radius is rounded up to when finding the radius for a number of models
+RADIUS_DECIMALS = 4
+# Number of nearest neighbours of each model held by a NeighbourIndex
+MAX_NEIGHBOURS = 100
+
+
+class NeighbourIndex(object):
+    """Index of the nearest neighbours of each model in a distance matrix, sorted by distance
+
+    The index is built once for a distance matrix and then answers queries for any radius from the
+    nearest max_neighbours neighbours of each model, only reading a row of the matrix again for the models
+    with more neighbours than that under the radius. It holds 8 bytes for each of the N x max_neighbours
+    neighbours, so the matrix itself can stay condensed (and memory-mapped). As in the original subclustering,
+    a distance of zero is not counted as a neighbour so that a model is never its own neighbour.
+    """
+
+    def __init__(self, distance_matrix, max_neighbours=MAX_NEIGHBOURS):
+        if not isinstance(distance_matrix, DistanceMatrix):
+            distance_matrix = numpy.asarray(distance_matrix)
+            distance_matrix = DistanceMatrix.from_dense(distance_matrix, dtype=distance_matrix.dtype)
+        self.distance_matrix = distance_matrix
+        size = len(distance_matrix)
+        self.max_neighbours = max(min(max_neighbours, size - 1), 1)
+        self.order = numpy.empty((size, self.max_neighbours), dtype=numpy.int32)
+        self.sorted_distances = numpy.empty((size, self.max_neighbours), dtype=distance_matrix.dtype)
+        self.num_neighbours = numpy.zeros(size, dtype=numpy.int64)
+        for i in range(size):
+            row = self._row(i)
+            self.num_neighbours[i] = numpy.isfinite(row).sum()
+            nearest = numpy.sort(numpy.argpartition(row, self.max_neighbours - 1)[:self.max_neighbours])
+            # Sorted stably so that equal distances are in the order of the models
+            self.order[i] = nearest[numpy.argsort(row[nearest], kind='mergesort')]
+            self.sorted_distances[i] = row[self.order[i]]
+
+    def _row(self, i):
+        """Return row i of the distance matrix with the distances that are not neighbours set to infinity"""
+        row = self.distance_matrix.row(i)
+        row[row == 0.0] = numpy.inf
+        return row
+
+    def _overflows(self, counts):
+        """Return the models whose neighbours under a radius may not all be in the index"""
+        return numpy.flatnonzero((counts == self.max_neighbours) & (self.num_neighbours > self.max_neighbours))
+
+    def counts(self, radius):
+        """Return the number of neighbours of each model that are <= radius"""
+        radius = self.sorted_distances.dtype.type(radius)
+        counts = (self.sorted_distances <= radius).sum(axis=1)
+        for i in self._overflows(counts):
+            counts[i] = (self._row(i) <= radius).sum()
+        return counts
+
+    def largest_cluster(self, radius):
+        """Return the indices of the largest cluster under radius, centre first, or None if there is no cluster
+
+        The cluster is the first model with the most neighbours <= radius and those neighbours.
+        """
+        counts = self.counts(radius)
+        centre = int(numpy.argmax(counts))
+        if counts[centre] == 0:
+            return None
+        if counts[centre] > self.max_neighbours:
+            radius = self.sorted_distances.dtype.type(radius)
+            return [centre] + [int(i) for i in numpy.flatnonzero(self._row(centre) <= radius)]
+        return [centre] + sorted(int(i) for i in self.order[centre, :counts[centre]])
+
+    def radius_for_nmodels(self, nmodels):
+        """Return the smallest radius at which the largest cluster has at least nmodels models
+
+        If no cluster can be that large, the smallest radius giving the largest possible cluster
+        is returned, and None if no models have any neighbours.
+        """
+        max_neighbours = self.num_neighbours.max() if len(self.num_neighbours) else 0
+        if max_neighbours == 0:
+            return None
+        rank = min(max(nmodels - 2, 0), max_neighbours - 1)
+        if rank < self.max_neighbours:
+            return float(self.sorted_distances[:, rank].min())
+        # Only the models with enough neighbours can reach the rank
+        return float(min(numpy.partition(self._row(i), rank)[rank]
+                         for i in numpy.flatnonzero(self.num_neighbours > rank)))
+
+    def cluster_diameter(self, cluster):
+        """Return the maximum distance between the members of a cluster
+
+        The distances are taken between each member and those after it in the cluster.
+        """
+        distances = self.distance_matrix.submatrix(cluster)
+        return float(distances[numpy.triu_indices(len(cluster), 1)].max())
+
 
 def pick_nmodels(models, clusters, ensemble_max_models):
     MAXTRIES = 50
@@ -68,45 +162,16 @@ def slice_subcluster(cluster_files, previous_clusters, ensemble_max_models, radi
     return None
 
 
-def subcluster_nmodels(nmodels, radius, clusterer, direction, increment):
+def subcluster_nmodels(nmodels, clusterer):
+    """Return the largest cluster at the smallest radius that gives at least nmodels models and the radius
 
-    MINRADIUS = 0.0001
-    MAXRADIUS = 100
-    
+    The radius is rounded up to RADIUS_DECIMALS decimal places.
+    """
+    radius = clusterer.neighbour_index.radius_for_nmodels(nmodels)
+    if radius is None:
+        logger.debug("subcluster nmodels: no models can be clustered")
+        return None, radius
+    radius = math.ceil(round(radius * 10 ** RADIUS_DECIMALS, 6)) / 10.0 ** RADIUS_DECIMALS
     subcluster_models = clusterer.cluster_by_radius(radius)
-    len_models = len(subcluster_models) if subcluster_models else 0
-    
-    logger.debug("subcluster nmodels: {0} {1} {2} {3} {4}".format(len_models, nmodels, radius, direction, increment))
-    if len_models == nmodels or radius < MINRADIUS or radius > MAXRADIUS:
-        logger.debug("nmodels: {0} radius: {1}".format(len_models, radius))
-        return subcluster_models, radius
-    
-    def lower_increment(increment):
-        increment = increment / float(10)
-        if increment <= 0.00001: raise RuntimeError, "increment out of bounds"
-        return increment
-    
-    # Am sure the logic could be improved here, but it seems to  work
-    try:
-        if len_models > nmodels:
-            # If we have more models than we want and we are increasing the radius, we've overshot, so we need to
-            # decrease the radius but by a smaller increment
-            # If the radius is the same as the increment, we need to decrease the incrememnt before we subtract it
-            # as both of the above require decreasing the increment we have one test and just change the direction
-            # for the overshoot
-            if direction == 'up' or abs(radius - increment) < 0.0000001:
-                if direction == 'up': direction = 'down'
-                increment = lower_increment(increment)
-            radius -= increment
-        elif len_models < nmodels:
-            if direction == 'down' :
-                direction = 'up'
-                increment = lower_increment(increment)
-            radius += increment
-    except RuntimeError:
-        # Can't get a match so just return what we have
-        logger.debug("subcluster nmodels exceeded increment. Returning: nmodels: {0} radius: {1}".format(len(subcluster_models), radius))
-        return subcluster_models, radius
-        
-    return subcluster_nmodels(nmodels, radius, clusterer, direction, increment)
-
+    logger.debug("nmodels: {0} radius: {1}".format(len(subcluster_models), radius))
+    return subcluster_models, radius
@@ -3,13 +3,129 @@
 __author__ = "Felix Simkovic"
 __date__ = "22 Mar 2017"
 
+import os
+import shutil
+import tempfile
 import unittest
 
 from ample import ensembler
+from ample.ensembler._ensembler import Ensemble
 
 
 class Test(unittest.TestCase):
 
+    def test_prune_redundant_ensembles(self):
+        work_dir = tempfile.mkdtemp()
+        atom = "ATOM      1  CA  ALA A   1    {0:8.3f}   0.000   0.000  1.00  0.00           C\n"
+        models = ['m{0}.pdb'.format(i) for i in range(40)]
+        ensembles = [('c1_t100_r1_polyala', 1.0, models[:20], range(1, 101)),
+                     # Identical to the first ensemble
+                     ('c1_t100_r2_polyala', 1.0, models[:20], range(1, 101)),
+                     # One model and five residues different
+                     ('c1_t95_r1_polyala', 2.0, models[1:21], range(1, 96)),
+                     ('c1_t95_r1_allatom', 3.0, models[1:21], range(1, 96)),
+                     ('c1_t50_r1_polyala', 4.0, models[20:], range(1, 51))]
+        ensemble_pdbs, ensembles_data = [], []
+        for name, x, ensemble_models, residues in ensembles:
+            pdb = os.path.join(work_dir, name + '.pdb')
+            with open(pdb, 'w') as f:
+                f.write("REMARK {0}\n".format(name))
+                f.write(atom.format(x))
+            ensemble_pdbs.append(pdb)
+            ensembles_data.append({'name': name, 'pdb': pdb, 'side_chain_treatment': name.split('_')[-1],
+                                   'subcluster_models': ensemble_models, 'truncation_residues': residues})
+
+        pruned = ensembler.prune_redundant_ensembles(ensemble_pdbs, ensembles_data)
+        self.assertEqual([ensemble_pdbs[i] for i in [0, 3, 4, 2]], pruned)
+        self.assertEqual([None, 'identical', 'similar', None, None], [d['redundancy'] for d in ensembles_data])
+        self.assertEqual([None, 'c1_t100_r1_polyala', 'c1_t100_r1_polyala', None, None],
+                         [d['redundant_with'] for d in ensembles_data])
+
+        pruned = ensembler.prune_redundant_ensembles(ensemble_pdbs, ensembles_data, redundant='drop')
+        self.assertEqual([ensemble_pdbs[i] for i in [0, 3, 4]], pruned)
+        pruned = ensembler.prune_redundant_ensembles(ensemble_pdbs, ensembles_data, redundant='keep')
+        self.assertEqual(ensemble_pdbs, pruned)
+        pruned = ensembler.prune_redundant_ensembles(ensemble_pdbs, ensembles_data, similarity_threshold=0.95)
+        self.assertEqual([ensemble_pdbs[i] for i in [0, 2, 3, 4]], pruned)
+        # Without any data only identical ensembles are found
+        pruned = ensembler.prune_redundant_ensembles(ensemble_pdbs, redundant='drop')
+        self.assertEqual([ensemble_pdbs[i] for i in [0, 2, 3, 4]], pruned)
+
+        # In batches the ensembles are checked against those kept from the earlier batches
+        for d in ensembles_data:
+            del d['redundancy'], d['redundant_with']
+        index = ensembler.EnsembleIndex()
+        pruned = ensembler.prune_redundant_ensembles(ensemble_pdbs[:2], ensembles_data[:2], index=index)
+        self.assertEqual(ensemble_pdbs[:1], pruned)
+        # The ensembles of the earlier batches aren't read again
+        for pdb in ensemble_pdbs[:2]:
+            os.unlink(pdb)
+        pruned = ensembler.prune_redundant_ensembles(ensemble_pdbs[2:], ensembles_data[2:], index=index)
+        self.assertEqual([ensemble_pdbs[i] for i in [3, 4, 2]], pruned)
+        self.assertEqual([None, 'identical', 'similar', None, None], [d['redundancy'] for d in ensembles_data])
+        self.assertEqual([None, 'c1_t100_r1_polyala', 'c1_t100_r1_polyala', None, None],
+                         [d['redundant_with'] for d in ensembles_data])
+        shutil.rmtree(work_dir)
+
+    def test_prune_redundant_ensembles_recipes(self):
+        # Ensembles that are only recipes don't have pdb files to compare
+        ensembles_data = []
+        for name, source_models, residues_idxs in [('c1_t100_r1_polyala', ['m1.pdb', 'm2.pdb'], [0, 1, 2]),
+                                                   ('c1_t100_r2_polyala', ['m2.pdb', 'm1.pdb'], [0, 1, 2]),
+                                                   ('c1_t95_r1_polyala', ['m1.pdb', 'm2.pdb'], [0, 1])]:
+            recipe = {'source_models': source_models, 'residues_idxs': residues_idxs}
+            ensembles_data.append({'name': name, 'pdb': name + '.pdb', 'side_chain_treatment': 'polyala',
+                                   'recipe': recipe})
+        ensemble_pdbs = [d['pdb'] for d in ensembles_data]
+        pruned = ensembler.prune_redundant_ensembles(ensemble_pdbs, ensembles_data, redundant='drop')
+        self.assertEqual([ensemble_pdbs[0], ensemble_pdbs[2]], pruned)
+        self.assertEqual([None, 'identical', None], [d['redundancy'] for d in ensembles_data])
+        # Ensembles without recipes are already created
+        self.assertEqual('e.pdb', ensembler.materialise_ensemble({'name': 'e', 'ensemble_pdb': 'e.pdb'}))
+
+    def test_ensembles_data(self):
+        ensembles = []
+        for truncation_level, residues in [(100, range(1, 101)), (50, range(1, 51))]:
+            raw_ensemble = Ensemble()
+            raw_ensemble.truncation_level = truncation_level
+            raw_ensemble.truncation_residues = residues
+            for sct in ['allatom', 'polyala']:
+                ensemble = raw_ensemble.copy()
+                ensemble.name = 'c1_t{0}_r1_{1}'.format(truncation_level, sct)
+                ensemble.side_chain_treatment = sct
+                ensembles.append(ensemble)
+        self.assertIs(ensembles[0].truncation_residues, ensembles[1].truncation_residues)
+
+        amoptd = {}
+        ensembles_data = ensembler.ensembles_data(ensembles, amoptd)
+        self.assertEqual([range(1, 101), range(1, 51)], amoptd['truncation_residues'])
+        self.assertEqual([0, 0, 1, 1], [d['truncation_residues_id'] for d in ensembles_data])
+        self.assertNotIn('truncation_residues', ensembles_data[0])
+        self.assertEqual('c1_t50_r1_polyala', ensembles_data[3]['name'])
+        self.assertEqual(range(1, 51), ensembler.truncation_residues(ensembles_data[3], amoptd['truncation_residues']))
+        # Residues already in the table are not added again
+        ensembles_data = ensembler.ensembles_data(ensembles[2:], amoptd)
+        self.assertEqual(2, len(amoptd['truncation_residues']))
+        self.assertEqual([1, 1], [d['truncation_residues_id'] for d in ensembles_data])
+
+    def test_ensemble_priority(self):
+        ensembles_data = []
+        for cluster_num in [2, 1]:
+            for truncation_level in [100, 61, 37, 13, 27]:
+                for radius in [3, 1]:
+                    name = 'c{0}_t{1}_r{2}_polyala'.format(cluster_num, truncation_level, radius)
+                    ensembles_data.append({'name': name, 'pdb': name + '.pdb', 'cluster_num': cluster_num,
+                                           'truncation_level': truncation_level, 'subcluster_radius_threshold': radius,
+                                           'side_chain_treatment': 'polyala', 'redundancy': None})
+        # The same order as the ensembles are sorted in before running MRBUMP
+        keys = ['cluster_num', 'truncation_level', 'subcluster_radius_threshold', 'side_chain_treatment']
+        ref = ensembler.sort_ensembles([d['pdb'] for d in ensembles_data], ensembles_data, keys=keys, prioritise=True)
+        self.assertEqual(ref, [d['pdb'] for d in sorted(ensembles_data, key=ensembler.ensemble_priority)])
+        self.assertEqual('c1_t27_r1_polyala.pdb', ref[0])
+        # Redundant ensembles come last
+        ensembles_data[0]['redundancy'] = 'similar'
+        self.assertEqual(ensembles_data[0], sorted(ensembles_data, key=ensembler.ensemble_priority)[-1])
+
     def test__sort_ensembles_1(self):
         ensemble_pdbs = [
             'c1_t100_r3_polyAla.pdb', 'c1_t85_r1_polyAla.pdb', 'c1_t76_r3_polyAla.pdb', 'c1_t61_r1_polyAla.pdb',
@@ -0,0 +1,79 @@
+"""Test functions for ensembler.abinitio"""
+
+import glob
+from multiprocessing.pool import ThreadPool
+import os
+import shutil
+import tempfile
+import unittest
+
+from ample import constants
+from ample.ensembler import abinitio
+from ample.testing import test_funcs
+from ample.util import ample_util
+
+
+@unittest.skipUnless(test_funcs.found_exe("spicker" + ample_util.EXE_EXT), "spicker exe not found")
+@unittest.skipUnless(test_funcs.found_exe("theseus" + ample_util.EXE_EXT), "theseus exe not found")
+class Test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.models = glob.glob(os.path.join(constants.SHARE_DIR, 'testfiles', 'models', '*.pdb'))
+        cls.spicker_exe = ample_util.find_exe('spicker' + ample_util.EXE_EXT)
+        cls.theseus_exe = ample_util.find_exe('theseus' + ample_util.EXE_EXT)
+
+    def setUp(self):
+        self.owd = os.getcwd()
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        os.chdir(self.owd)
+        shutil.rmtree(self.work_dir)
+
+    def generate_ensembles(self, nproc, name=None):
+        run_dir = os.path.join(self.work_dir, name or 'nproc_{0}'.format(nproc))
+        os.mkdir(run_dir)
+        ensembler = abinitio.AbinitioEnsembler(ensembles_directory=os.path.join(run_dir, 'ensembles'),
+                                               work_dir=os.path.join(run_dir, 'ensemble_workdir'),
+                                               nproc=nproc,
+                                               spicker_exe=self.spicker_exe,
+                                               theseus_exe=self.theseus_exe)
+        return ensembler.generate_ensembles(self.models,
+                                            cluster_method='spicker',
+                                            num_clusters=2,
+                                            percent_truncation=20,
+                                            subcluster_program='kabsch')
+
+    def test_generate_ensembles_parallel(self):
+        """The ensembles created in parallel are the same and in the same order as those created serially"""
+        serial = self.generate_ensembles(1)
+        parallel = self.generate_ensembles(4)
+        self.assertTrue(len(serial) > 0)
+        self.assertEqual([e.name for e in serial], [e.name for e in parallel])
+        self.assertEqual([e.num_residues for e in serial], [e.num_residues for e in parallel])
+        self.assertEqual([e.subcluster_num_models for e in serial], [e.subcluster_num_models for e in parallel])
+        self.assertEqual([os.path.basename(e.subcluster_centroid_model) for e in serial],
+                         [os.path.basename(e.subcluster_centroid_model) for e in parallel])
+        self.assertTrue(all(os.path.isfile(e.pdb) for e in parallel))
+
+    def test_generate_ensembles_threads(self):
+        """Ensembling runs started concurrently from threads don't interfere with each other"""
+        serial = self.generate_ensembles(1)
+        cwd = os.getcwd()
+        pool = ThreadPool(4)
+        try:
+            results = pool.map(lambda i: self.generate_ensembles(1, name='thread_{0}'.format(i)), range(8))
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(cwd, os.getcwd())
+        for i, ensembles in enumerate(results):
+            run_dir = os.path.join(self.work_dir, 'thread_{0}'.format(i))
+            self.assertEqual([e.name for e in serial], [e.name for e in ensembles])
+            self.assertEqual([e.subcluster_num_models for e in serial], [e.subcluster_num_models for e in ensembles])
+            self.assertTrue(all(e.pdb.startswith(run_dir) and os.path.isfile(e.pdb) for e in ensembles))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+"""Test functions for ensembler.distance_matrix"""
+
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+from ample.ensembler import distance_matrix
+from ample.ensembler.distance_matrix import DistanceMatrix
+
+
+class Test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        numpy.random.seed(1)
+        dense = numpy.random.uniform(0.0, 20.0, size=(7, 7)).astype(numpy.float32)
+        cls.dense = numpy.triu(dense, 1) + numpy.triu(dense, 1).T
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_from_dense(self):
+        matrix = DistanceMatrix.from_dense(self.dense)
+        self.assertEqual((7, 7), matrix.shape)
+        self.assertEqual(21, len(matrix.condensed))
+        self.assertEqual(numpy.float32, matrix.dtype)
+        self.assertTrue(numpy.all(self.dense == matrix.to_dense()))
+        self.assertTrue(numpy.all(self.dense == numpy.asarray(matrix)))
+        for i in range(7):
+            self.assertTrue(numpy.all(self.dense[i] == matrix.row(i)))
+            self.assertTrue(numpy.all(self.dense[i] == matrix[i]))
+            for j in range(7):
+                self.assertEqual(self.dense[i, j], matrix[i, j])
+        indices = [5, 0, 3]
+        self.assertTrue(numpy.all(self.dense[numpy.ix_(indices, indices)] == matrix.submatrix(indices)))
+
+    def test_set(self):
+        matrix = DistanceMatrix(4, fill=1.0)
+        self.assertTrue(numpy.all(matrix.to_dense() == 1.0))
+        matrix[2, 1] = 3.5
+        self.assertEqual(3.5, matrix[1, 2])
+        matrix[3, 3] = 0.0
+        self.assertEqual(0.0, matrix[3, 3])
+        matrix.set_row(1, [4.0, 5.0])
+        self.assertEqual([1.0, 1.0, 4.0, 5.0], list(matrix.row(1)))
+        self.assertEqual([1.0, 4.0, 1.0, 1.0], list(matrix.row(2)))
+
+    def test_memmap(self):
+        memmap_min_size = distance_matrix.MEMMAP_MIN_SIZE
+        distance_matrix.MEMMAP_MIN_SIZE = 5
+        try:
+            matrix = DistanceMatrix.create(7, directory=self.work_dir)
+            in_memory = DistanceMatrix.create(5, directory=self.work_dir)
+        finally:
+            distance_matrix.MEMMAP_MIN_SIZE = memmap_min_size
+        self.assertTrue(isinstance(matrix.condensed, numpy.memmap))
+        self.assertFalse(isinstance(in_memory.condensed, numpy.memmap))
+        self.assertTrue(os.path.isfile(matrix.path))
+        for i in range(7):
+            matrix.set_row(i, self.dense[i, i + 1:])
+        matrix.flush()
+        self.assertTrue(numpy.all(self.dense == matrix.to_dense()))
+        matrix.close()
+        self.assertFalse(os.path.exists(matrix.path))
+
+    def test_save_load(self):
+        matrix = DistanceMatrix.from_dense(self.dense)
+        matrix.save(self.work_dir)
+        memmap_min_size = distance_matrix.MEMMAP_MIN_SIZE
+        distance_matrix.MEMMAP_MIN_SIZE = 5
+        try:
+            loaded = DistanceMatrix.load(self.work_dir, work_dir=self.work_dir)
+        finally:
+            distance_matrix.MEMMAP_MIN_SIZE = memmap_min_size
+        self.assertTrue(isinstance(loaded.condensed, numpy.memmap))
+        self.assertEqual(numpy.float32, loaded.dtype)
+        self.assertTrue(numpy.all(self.dense == loaded.to_dense()))
+        loaded.close()
+
+    def test_write_score_matrix(self):
+        write_batch = distance_matrix.WRITE_BATCH
+        distance_matrix.WRITE_BATCH = 10
+        matrix = DistanceMatrix.from_dense(self.dense)
+        score_matrix = os.path.join(self.work_dir, 'score.matrix')
+        try:
+            matrix.write_score_matrix(score_matrix, offset=1)
+        finally:
+            distance_matrix.WRITE_BATCH = write_batch
+        # The format written by the original element by element loop
+        ref = ""
+        for i in range(1, 8):
+            for j in range(i, 8):
+                ref += "{0: > 4d} {1: > 4d} {2: > 8.3F}\n".format(i, j, self.dense[i - 1][j - 1])
+        ref += "\n"
+        with open(score_matrix) as f:
+            self.assertEqual(ref, f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
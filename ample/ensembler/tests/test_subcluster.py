@@ -1,10 +1,15 @@
 
 import glob
+from multiprocessing.pool import ThreadPool
 import os
+import shutil
+import tempfile
 import unittest
 from ample import constants
 from ample.ensembler import subcluster
+from ample.ensembler import subcluster_util
 from ample.util import ample_util
+from ample.util import cache_util
 from ample.testing import test_funcs
 
 class Test_1(unittest.TestCase):
@@ -68,6 +73,25 @@ class Test_1(unittest.TestCase):
         os.unlink(subcluster.FILE_LIST_NAME)
         return
 
+    def test_gesamt_rmsd_lines(self):
+        lines = [" ===== CROSS-RMSDs\n",
+                 "\n",
+                 "   1 | A | 0.000 1.000 2.000\n",
+                 "   2 | B | 1.000 0.000 3.000\n",
+                 "   3 | C | 2.000 3.000 0.000\n",
+                 "\n"]
+        work_dir = tempfile.mkdtemp()
+        clusterer = subcluster.GesamtClusterer(work_dir=work_dir)
+        clusterer._create_distance_matrix(3)
+        self.assertEqual(3, clusterer._parse_gesamt_rmsd_lines(iter(lines), 3))
+        self.assertEqual(1.0, clusterer.distance_matrix[0, 1])
+        self.assertEqual(2.0, clusterer.distance_matrix[0, 2])
+        self.assertEqual(3.0, clusterer.distance_matrix[1, 2])
+        # An incomplete table only sets the rows that were read
+        clusterer._create_distance_matrix(3)
+        self.assertEqual(2, clusterer._parse_gesamt_rmsd_lines(iter(lines[:4]), 3))
+        shutil.rmtree(work_dir)
+
     @unittest.skipUnless(test_funcs.found_exe("gesamt" + ample_util.EXE_EXT), "gesamt exec missing")
     def test_gesamt_radius(self):
         # Test we can reproduce the original thresholds
@@ -85,6 +109,77 @@ class Test_1(unittest.TestCase):
         self.assertEqual(0, len(ref - cluster_files1))
         return
 
+    def test_subcluster_nmodels(self):
+        clusterer = subcluster.KabschClusterer()
+        pdb_list = glob.glob(os.path.join(self.testfiles_dir, "models", '*.pdb'))
+        clusterer.generate_distance_matrix(pdb_list)
+        cluster_files, radius = subcluster_util.subcluster_nmodels(13, clusterer)
+        self.assertGreaterEqual(len(cluster_files), 13)
+        self.assertEqual(radius, round(radius, subcluster_util.RADIUS_DECIMALS))
+        self.assertLess(len(clusterer.cluster_by_radius(radius - 0.001) or []), 13)
+        self.assertEqual(clusterer.neighbour_index.cluster_diameter(clusterer._cluster_indices(radius)[0]),
+                         clusterer.cluster_score)
+
+    def test_radius_kabsch(self):
+        clusterer = subcluster.KabschClusterer()
+        pdb_list = glob.glob(os.path.join(self.testfiles_dir, "models", '*.pdb'))
+        radius = 4
+        clusterer.generate_distance_matrix(pdb_list)
+        cluster_files1 = [os.path.basename(x) for x in clusterer.cluster_by_radius(radius)]
+        # Same cluster as maxcluster and includes all the models found by gesamt
+        ref = ['4_S_00000003.pdb', '2_S_00000005.pdb', '2_S_00000001.pdb', '3_S_00000006.pdb',
+               '5_S_00000005.pdb', '3_S_00000003.pdb', '1_S_00000004.pdb', '4_S_00000005.pdb',
+               '3_S_00000004.pdb', '1_S_00000002.pdb', '5_S_00000004.pdb', '4_S_00000002.pdb', '1_S_00000005.pdb']
+        self.assertItemsEqual(ref, cluster_files1)
+        self.assertAlmostEqual(4.767, clusterer.cluster_score, 3)
+        self.assertAlmostEqual(9.849, clusterer.distance_matrix[0, 1], 3)
+
+    def test_kabsch_cached(self):
+        work_dir = tempfile.mkdtemp()
+        cache = cache_util.ResultCache(os.path.join(work_dir, 'cache'))
+        pdb_list = glob.glob(os.path.join(self.testfiles_dir, "models", '*.pdb'))
+        clusterer = subcluster.KabschClusterer(work_dir=work_dir)
+        clusterer.cache = cache
+        clusterer.generate_cached_distance_matrix(pdb_list)
+        self.assertEqual((0, 1), (cache.hits, cache.misses))
+        # The same models in a different order give the same matrix from the cache
+        cached = subcluster.KabschClusterer(work_dir=work_dir)
+        cached.cache = cache
+        cached.generate_cached_distance_matrix(list(reversed(pdb_list)))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertEqual(clusterer.index2pdb, cached.index2pdb)
+        self.assertTrue((clusterer.distance_matrix.to_dense() == cached.distance_matrix.to_dense()).all())
+        self.assertEqual(clusterer.cluster_by_radius(4), cached.cluster_by_radius(4))
+        shutil.rmtree(work_dir)
+
+    @unittest.skipUnless(test_funcs.found_exe("lsqkab" + ample_util.EXE_EXT), "lsqkab exec missing")
+    def test_kabsch_lsqkab(self):
+        pdb_list = sorted(glob.glob(os.path.join(self.testfiles_dir, "models", '*.pdb')))
+        clusterer = subcluster.KabschClusterer()
+        clusterer.generate_distance_matrix(pdb_list)
+        lsqkab = subcluster.LsqkabClusterer()
+        for i, j in [(0, 1), (2, 25), (10, 29)]:
+            rmsd = lsqkab.calc_rmsd(pdb_list[i], pdb_list[j], purge=True)
+            self.assertAlmostEqual(rmsd, clusterer.distance_matrix[i, j], 2)
+
+    @unittest.skipUnless(test_funcs.found_exe("lsqkab" + ample_util.EXE_EXT), "lsqkab exec missing")
+    def test_lsqkab_threads(self):
+        # lsqkab runs started from several threads in the same directory must not share scratch files
+        pdb_list = sorted(glob.glob(os.path.join(self.testfiles_dir, "models", '*.pdb')))
+        work_dir = tempfile.mkdtemp()
+        lsqkab = subcluster.LsqkabClusterer(work_dir=work_dir)
+        pairs = [(i, j) for i in range(6) for j in range(i + 1, 6)]
+        serial = [lsqkab.calc_rmsd(pdb_list[i], pdb_list[j], purge=True) for i, j in pairs]
+        pool = ThreadPool(4)
+        try:
+            threaded = pool.map(lambda p: lsqkab.calc_rmsd(pdb_list[p[0]], pdb_list[p[1]], purge=True), pairs)
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(serial, threaded)
+        self.assertEqual([], os.listdir(work_dir))
+        shutil.rmtree(work_dir)
+
     def test_radius_lsqkab(self):
         # Test we can reproduce the original thresholds
         clusterer = subcluster.LsqkabClusterer()
@@ -4,8 +4,14 @@
 @author: hlasimpk
 """
 
+import itertools
+import numpy
+import os
+import shutil
+import tempfile
 import unittest
 from ample.ensembler import subcluster_util
+from ample.ensembler.distance_matrix import DistanceMatrix
 
 class Test(unittest.TestCase):
         
@@ -96,6 +102,58 @@ class Test(unittest.TestCase):
         pdbs = subcluster_util.pick_nmodels(models, clusters, 30)
         ref_pdbs = None
         self.assertEqual(ref_pdbs, pdbs)
+
+    def test_neighbourIndex(self):
+        numpy.random.seed(1)
+        coords = numpy.random.uniform(0.0, 10.0, size=(25, 3))
+        matrix = numpy.sqrt(((coords[:, numpy.newaxis] - coords[numpy.newaxis]) ** 2).sum(axis=-1))
+        # A duplicate model has a distance of 0.0 and is not a neighbour
+        matrix[3, 7] = matrix[7, 3] = 0.0
+        # Few enough neighbours that some queries need the rows of the matrix
+        for max_neighbours in [subcluster_util.MAX_NEIGHBOURS, 3]:
+            self._check_neighbour_index(matrix, subcluster_util.NeighbourIndex(matrix, max_neighbours=max_neighbours))
+        self.assertIsNone(subcluster_util.NeighbourIndex(numpy.zeros((3, 3))).radius_for_nmodels(2))
+
+    def _check_neighbour_index(self, matrix, index):
+        for radius in [0.5, 1.0, 2.5, 4.0, 20.0]:
+            # Compare with the original full scan of the matrix
+            condition = numpy.logical_and(matrix <= radius, matrix != 0.0)
+            counts = condition.sum(axis=1)
+            self.assertEqual(list(counts), list(index.counts(radius)))
+            row = numpy.where(counts == numpy.max(counts))[0][0]
+            cluster = index.largest_cluster(radius)
+            if counts[row] == 0:
+                self.assertIsNone(cluster)
+                continue
+            self.assertEqual([row] + list(numpy.where(condition[row])[0]), cluster)
+            diameter = max(matrix[i] for i in itertools.combinations(cluster, 2))
+            self.assertEqual(diameter, index.cluster_diameter(cluster))
+
+        for nmodels in [2, 5, 12]:
+            radius = index.radius_for_nmodels(nmodels)
+            self.assertGreaterEqual(len(index.largest_cluster(radius)), nmodels)
+            self.assertLess(len(index.largest_cluster(radius - 1e-9) or []), nmodels)
+        # Too many models gives the radius of the largest possible cluster
+        self.assertEqual(25, len(index.largest_cluster(index.radius_for_nmodels(100))))
+
+    def test_neighbourIndex_memmap(self):
+        # The index of a memory-mapped matrix only holds the nearest neighbours of each model
+        work_dir = tempfile.mkdtemp()
+        size = 2000
+        matrix = DistanceMatrix(size, path=os.path.join(work_dir, 'distance_matrix.dat'))
+        numpy.random.seed(1)
+        matrix.condensed[:] = numpy.random.uniform(0.1, 10.0, size=len(matrix.condensed))
+        index = subcluster_util.NeighbourIndex(matrix, max_neighbours=10)
+        arrays = [a for a in vars(index).values() if isinstance(a, numpy.ndarray)]
+        self.assertLessEqual(sum(a.nbytes for a in arrays), size * (10 * 8 + 8))
+        radius = index.radius_for_nmodels(5)
+        self.assertEqual(5, len(index.largest_cluster(radius)))
+        counts = index.counts(radius)
+        self.assertEqual(4, counts.max())
+        self.assertEqual(size - 1, index.counts(20.0)[0])
+        self.assertEqual(size, len(index.largest_cluster(20.0)))
+        matrix.close()
+        shutil.rmtree(work_dir)
         
 if __name__ == "__main__":
     unittest.main()
@@ -10,6 +10,7 @@ from ample import constants
 from ample.ensembler import truncation_util 
 from ample.ensembler.truncation_util import Truncator
 from ample.util import ample_util
+from ample.util import pdb_edit
 from ample.util.theseus import TheseusVariances
 
 #import logging
@@ -397,6 +398,23 @@ class Test(unittest.TestCase):
         self.assertEqual(truncation.num_residues, 29, "Failed to return correct number of residues")
         self.assertEqual(truncation.method, truncation_method)
         return
+
+    def test_truncation_write_models(self):
+        """Test that Truncation.write_models only writes the models that are missing"""
+        from ample.ensembler.truncation_util import Truncation
+        models = sorted(glob.glob(os.path.join(self.testfiles_dir, "models", "*.pdb")))[:3]
+        work_dir = tempfile.mkdtemp()
+        truncation = Truncation()
+        truncation.residues_idxs = [0, 1, 2, 3, 4]
+        truncation.source_models = models
+        truncation.models = [ample_util.filename_append(m, "5", directory=work_dir) for m in models]
+        truncation.write_models(truncation.models[1:])
+        self.assertEqual([False, True, True], [os.path.isfile(m) for m in truncation.models])
+        self.assertEqual([1, 2, 3, 4, 5], pdb_edit.resseq(truncation.models[1])["A"])
+        truncation.write_models()
+        self.assertTrue(all(os.path.isfile(m) for m in truncation.models))
+        shutil.rmtree(work_dir)
+        return
         
 if __name__ == "__main__":
     unittest.main()
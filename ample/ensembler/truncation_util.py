@@ -10,6 +10,7 @@ import os
 import sys
 
 from ample.ensembler._ensembler import model_core_from_fasta
+from ample.ensembler.constants import TRUNCATION_SWEET_SPOT
 from ample.util import ample_util
 from ample.util import pdb_edit
 from ample.util import theseus
@@ -30,6 +31,15 @@ class TRUNCATION_METHODS(Enum):
 ScoreVariances = collections.namedtuple("ScoreVariances", ["idx", "resSeq", "variance"])
 
 
+def sweet_spot_bin(truncation_level):
+    """Return 0 for a truncation level in the sweet spot, 1 if below it and 2 if above it"""
+    if truncation_level > TRUNCATION_SWEET_SPOT[1]:
+        return 2
+    elif truncation_level < TRUNCATION_SWEET_SPOT[0]:
+        return 1
+    return 0
+
+
 def calculate_residues_focussed(var_by_res):
     """
     The sweet spot for success seems to occur in the interval 5-40 residues.
@@ -215,6 +225,8 @@ def _split_sequence(length, percent_interval, min_chunk=3):
 
 class Truncation(object):
     """Holds information relating to a single truncation of a cluster of models"""
+    __slots__ = ('cluster', 'directory', 'level', 'method', 'models', 'percent', 'residues', 'residues_idxs',
+                 'source_models', 'variances')
 
     def __init__(self):
         self.cluster = None  # The cluster object this truncation was created from
@@ -225,29 +237,50 @@ class Truncation(object):
         self.percent = None
         self.residues = None
         self.residues_idxs = None
+        self.source_models = None  # The untruncated models, in the same order as models
         self.variances = None
 
     @property
     def num_residues(self):
         return 0 if self.residues is None else len(self.residues)
 
+    def __getstate__(self):
+        """Return the attributes for pickling, as objects with __slots__ have no __dict__"""
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+
+    def write_models(self, models=None):
+        """Write any of the truncated models (all if models is None) that haven't been written yet"""
+        if models is None:
+            models = self.models
+        sources = dict(zip(self.models, self.source_models))
+        for pdbout in models:
+            if not os.path.isfile(pdbout):
+                pdb_edit.select_residues(pdbin=sources[pdbout], pdbout=pdbout, tokeep_idx=self.residues_idxs)
+        return
+
     def __str__(self):
         """Return a string representation of this object."""
         _str = super(Truncation, self).__str__() + "\n"
         # Iterate through all attributes in order
-        for k in sorted(self.__dict__.keys()):
-            _str += "{0} : {1}\n".format(k, self.__dict__[k])
+        for k in sorted(self.__slots__):
+            _str += "{0} : {1}\n".format(k, getattr(self, k))
         return _str
 
 
 class Truncator(object):
     def __init__(self, work_dir):
         """Class to take one or more models and truncate them based on a supplied or generated metric"""
-        self.work_dir = work_dir
+        self.work_dir = os.path.abspath(work_dir)
         self.models = None
         self.aligned_models = None
         self.truncations = None
         self.theseus_exe = None
+        self.coordinate_store = None
+        self.cache = None
 
         # We keep these for bookeeping as they go in the ample dictionary
         self.truncation_levels = None
@@ -273,14 +306,12 @@ class Truncator(object):
             truncation_method, percent_truncation)
         assert ample_util.is_exe(self.theseus_exe), "Cannot find theseus_exe: {0}".format(self.theseus_exe)
 
-        # Create the directories we'll be working in
         assert self.work_dir and os.path.isdir(self.work_dir), "truncate_models needs a self.work_dir"
-        os.chdir(self.work_dir)
 
         self.models = models
         # Calculate variances between pdb and align them (we currently only require the aligned models for homologs)
         if truncation_method != TRUNCATION_METHODS.SCORES:
-            run_theseus = theseus.Theseus(work_dir=self.work_dir, theseus_exe=self.theseus_exe)
+            run_theseus = theseus.Theseus(work_dir=self.work_dir, theseus_exe=self.theseus_exe, cache=self.cache)
             try:
                 run_theseus.superpose_models(self.models, homologs=homologs, alignment_file=alignment_file)
                 self.aligned_models = run_theseus.aligned_models
@@ -366,8 +397,13 @@ class Truncator(object):
                         residue_scores=None,
                         homologs=False,
                         alignment_file=None,
-                        work_dir=None):
-        """Generate a set of Truncation objects, referencing a set of truncated models generated from the supplied models"""
+                        work_dir=None,
+                        write_models=True):
+        """Generate a set of Truncation objects, referencing a set of truncated models generated from the supplied models
+
+        If write_models is False, truncated models whose source model is in the coordinate_store are only
+        recorded in the store and need to be written with :meth:`Truncation.write_models` before they are used.
+        """
         truncations = self.calculate_truncations(
             models=models,
             truncation_method=truncation_method,
@@ -387,10 +423,16 @@ class Truncator(object):
             os.mkdir(truncation.directory)
             logger.info('Truncating at: %s in directory %s', truncation.level, truncation.directory)
             truncation.models = []
+            truncation.source_models = list(self.models)
             for infile in self.models:
                 pdbout = ample_util.filename_append(infile, str(truncation.level), directory=truncation.directory)
+                # Record the truncated model in the coordinate store so it doesn't need to be read again
+                in_store = self.coordinate_store is not None and infile in self.coordinate_store
+                if in_store:
+                    self.coordinate_store.add_subset(pdbout, infile, truncation.residues_idxs)
                 # Loop through PDB files and create new ones that only contain the residues left after truncation
-                pdb_edit.select_residues(pdbin=infile, pdbout=pdbout, tokeep_idx=truncation.residues_idxs)
+                if write_models or not in_store:
+                    pdb_edit.select_residues(pdbin=infile, pdbout=pdbout, tokeep_idx=truncation.residues_idxs)
                 truncation.models.append(pdbout)
         self.truncations = truncations
         return truncations
@@ -7,6 +7,7 @@ import os
 import platform
 import shutil
 import sys
+import threading
 import time
 
 from ample import ensembler
@@ -97,15 +98,20 @@ class Ample(object):
         self.modelling(amopt.d, rosetta_modeller)
         amopt.write_config_file()
 
-        # Ensembling business next
-        if amopt.d['make_ensembles']:
-            self.ensembling(amopt.d)
+        if amopt.d['make_ensembles'] and amopt.d['do_mr'] and self.can_pipeline(amopt.d):
+            # Run MR on the ensembles while they are still being made
+            self.pipelined_molecular_replacement(amopt.d)
             amopt.write_config_file()
+        else:
+            # Ensembling business next
+            if amopt.d['make_ensembles']:
+                self.ensembling(amopt.d)
+                amopt.write_config_file()
 
-        # Some MR here
-        if amopt.d['do_mr']:
-            self.molecular_replacement(amopt.d)
-            amopt.write_config_file()
+            # Some MR here
+            if amopt.d['do_mr']:
+                self.molecular_replacement(amopt.d)
+                amopt.write_config_file()
 
         # Timing data
         time_stop = time.time()
@@ -167,6 +173,12 @@ class Ample(object):
             ample_util.save_amoptd(optd)
         return
     
+    @staticmethod
+    def can_pipeline(optd):
+        """Return True if MRBUMP can be run on the ensembles as they are created"""
+        return bool(optd['pipeline'] and not optd['submit_cluster'] and not optd['mrbump_scripts']
+                    and not optd['import_ensembles'] and not optd['ideal_helices'])
+
     @staticmethod
     def cleanup(optd):
         """Remove directories based on purge level
@@ -183,7 +195,7 @@ class Ample(object):
             mrbump_util.purge_MRBUMP(optd)
         return
         
-    def ensembling(self, optd):
+    def ensembling(self, optd, ensemble_callback=None, cancel=None):
         if optd['import_ensembles']:
             ensembler.import_ensembles(optd)
         elif optd['ideal_helices']:
@@ -224,7 +236,7 @@ class Ample(object):
                 optd.update(ample_util.read_amoptd(optd['results_path']))
             else:
                 try:
-                    ensembler.create_ensembles(optd)
+                    ensembler.create_ensembles(optd, ensemble_callback=ensemble_callback, cancel=cancel)
                 except Exception as e:
                     msg = "Error creating ensembles: {0}".format(e)
                     exit_util.exit_error(msg, sys.exc_info()[2])
@@ -329,7 +341,7 @@ class Ample(object):
                 except Exception as e:
                     msg = "Error running ROSETTA to create models: {0}".format(e)
                     exit_util.exit_error(msg, sys.exc_info()[2])
-                if not pdb_edit.check_pdb_directory(optd['models_dir'], sequence=optd['sequence']):
+                if not pdb_edit.check_pdb_directory(optd['models_dir'], sequence=optd['sequence'], nproc=optd['nproc']):
                     msg = "Problem with rosetta pdb files - please check the log for more information"
                     exit_util.exit_error(msg)
                 logger.info('Modelling complete - models stored in: %s\n', optd['models_dir'])
@@ -369,16 +381,7 @@ class Ample(object):
                 msg = "ERROR! Cannot run MRBUMP as there are no ensembles!"
                 exit_util.exit_error(msg)
 
-            if optd['mrbump_dir'] is None:
-                bump_dir = os.path.join(optd['work_dir'], 'MRBUMP')
-                optd['mrbump_dir'] = bump_dir
-            else:
-                bump_dir = optd['mrbump_dir']
-            if not os.path.exists(bump_dir):
-                os.mkdir(bump_dir)
-
-            optd['mrbump_results'] = []
-            logger.info("Running MRBUMP jobs in directory: %s", bump_dir)
+            bump_dir = self.mrbump_directory(optd)
 
             # Set an ensemble-specific phaser_rms if required
             if optd['phaser_rms'] == 'auto':
@@ -390,6 +393,14 @@ class Ample(object):
             ensemble_pdbs_sorted = ensembler.sort_ensembles(
                 optd['ensembles'], optd['ensembles_data'], keys=sort_keys, prioritise=True)
 
+            # Drop or deprioritise ensembles that duplicate a higher priority ensemble
+            ensemble_pdbs_sorted = ensembler.prune_redundant_ensembles(
+                ensemble_pdbs_sorted,
+                optd['ensembles_data'],
+                similarity_threshold=optd['ensemble_similarity_threshold'],
+                redundant=optd['redundant_ensembles'],
+                residues_table=optd.get('truncation_residues'))
+
             # Create job scripts
             logger.info("Generating MRBUMP runscripts")
             optd['mrbump_scripts'] = mrbump_util.write_mrbump_files(
@@ -399,26 +410,21 @@ class Ample(object):
                 ensemble_options=optd['ensemble_options'],
                 directory=bump_dir)
 
-        # Create function for monitoring jobs - static function decorator?
-        if self.ample_output:
-            def monitor():
-                r = mrbump_util.ResultsSummary()
-                r.extractResults(optd['mrbump_dir'], purge=bool(optd['purge']))
-                optd['mrbump_results'] = r.results
-                return self.ample_output.display_results(optd)
-        else:
-            monitor = None
-
         # Save results here so that we have the list of scripts and mrbump directory set
         ample_util.save_amoptd(optd)
 
         # Change to mrbump directory before running
         os.chdir(optd['mrbump_dir'])
+        job_stats = {}
         ok = workers_util.run_scripts(
             job_scripts=optd['mrbump_scripts'],
-            monitor=monitor,
+            monitor=self.mrbump_monitor(optd),
             check_success=mrbump_util.checkSuccess,
             early_terminate=optd['early_terminate'],
+            early_terminate_kill=optd['early_terminate_kill'],
+            cleanup=mrbump_util.remove_job_directory,
+            prepare=self.mrbump_prepare({d['name']: d for d in optd.get('ensembles_data') or []}),
+            job_stats=job_stats,
             nproc=optd['nproc'],
             job_time=mrbump_util.MRBUMP_RUNTIME,
             job_name='mrbump',
@@ -430,6 +436,127 @@ class Ample(object):
             submit_array=optd['submit_array'],
             submit_max_array=optd['submit_max_array'])
 
+        optd.update(job_stats)
+        self.collect_mrbump_results(optd, ok)
+
+    def pipelined_molecular_replacement(self, optd):
+        """Create the ensembles and run MRBUMP on them as soon as they are made
+
+        The ensembling runs in a separate thread and passes each batch of ensembles to the job
+        scheduler, which starts the MRBUMP jobs in the same order as :func:`ensembler.sort_ensembles`
+        with any redundant ensembles last. If early termination stops the MRBUMP jobs because
+        one has succeeded, any ensembling that hasn't started yet is cancelled.
+        """
+        logger.info('----- Running MRBUMP on ensembles as they are created --------\n\n')
+        bump_dir = self.mrbump_directory(optd)
+        optd['mrbump_scripts'] = []
+
+        scheduler = workers_util.JobScheduler()
+        scheduler.open()
+        submitted = ensembler.EnsembleIndex()
+        submitted_by_name = {}
+
+        def add_ensembles(ensembles_data):
+            if not ensembles_data:
+                return
+            # These are the data dictionaries that end up in optd['ensembles_data']
+            ensembles_data = sorted(ensembles_data, key=ensembler.ensemble_priority)
+            if optd['phaser_rms'] == 'auto':
+                ensembler.set_phaser_rms_from_subcluster_score(optd, ensembles_data)
+            # Check the new ensembles against all those already submitted
+            pruned = ensembler.prune_redundant_ensembles(
+                [d['pdb'] for d in ensembles_data],
+                ensembles_data,
+                similarity_threshold=optd['ensemble_similarity_threshold'],
+                redundant=optd['redundant_ensembles'],
+                residues_table=optd['truncation_residues'],
+                index=submitted)
+            pruned = set(pruned)
+            ensembles_data = [d for d in ensembles_data if d['pdb'] in pruned]
+            submitted_by_name.update((d['name'], d) for d in ensembles_data)
+            if not ensembles_data:
+                return
+            scripts = mrbump_util.write_mrbump_files(
+                [d['pdb'] for d in ensembles_data],
+                optd,
+                job_time=mrbump_util.MRBUMP_RUNTIME,
+                ensemble_options=optd['ensemble_options'],
+                directory=bump_dir)
+            for script, ensemble_data in zip(scripts, ensembles_data):
+                optd['mrbump_scripts'].append(script)
+                if not scheduler.add_job(script, priority=ensembler.ensemble_priority(ensemble_data)):
+                    logger.debug("Not running MRBUMP on ensemble %s as a solution has been found", ensemble_data['name'])
+
+        errors = []
+
+        def run_ensembling():
+            try:
+                self.ensembling(optd, ensemble_callback=add_ensembles, cancel=scheduler.terminated)
+            except BaseException:
+                # Includes the SystemExit from exit_util.exit_error
+                errors.append(sys.exc_info())
+            finally:
+                scheduler.close()
+
+        ensembling_thread = threading.Thread(target=run_ensembling)
+        ensembling_thread.start()
+        ok = scheduler.start(nproc=optd['nproc'] or 1,
+                             early_terminate=bool(optd['early_terminate']),
+                             early_terminate_kill=bool(optd['early_terminate_kill']),
+                             cleanup=mrbump_util.remove_job_directory,
+                             prepare=self.mrbump_prepare(submitted_by_name),
+                             check_success=mrbump_util.checkSuccess,
+                             monitor=self.mrbump_monitor(optd))
+        ensembling_thread.join()
+        if errors:
+            exc_type, exc_value, exc_traceback = errors[0]
+            raise exc_type, exc_value, exc_traceback
+
+        optd.update(scheduler.stats)
+        ample_util.save_amoptd(optd)
+        self.collect_mrbump_results(optd, ok)
+
+    @staticmethod
+    def mrbump_directory(optd):
+        """Create the directory the MRBUMP jobs are run in and return its path"""
+        if optd['mrbump_dir'] is None:
+            bump_dir = os.path.join(optd['work_dir'], 'MRBUMP')
+            optd['mrbump_dir'] = bump_dir
+        else:
+            bump_dir = optd['mrbump_dir']
+        if not os.path.exists(bump_dir):
+            os.mkdir(bump_dir)
+
+        optd['mrbump_results'] = []
+        logger.info("Running MRBUMP jobs in directory: %s", bump_dir)
+        return bump_dir
+
+    @staticmethod
+    def mrbump_prepare(ensembles_by_name):
+        """Return a function that creates the ensemble for an MRBUMP job script just before it is run
+
+        Only ensembles that were recorded as recipes with -lazy_ensembles need to be created.
+        """
+        def prepare(script):
+            name = os.path.splitext(os.path.basename(script))[0]
+            if name in ensembles_by_name:
+                ensembler.materialise_ensemble(ensembles_by_name[name])
+        return prepare
+
+    def mrbump_monitor(self, optd):
+        """Return a function for monitoring the MRBUMP jobs or None if there are no results to update"""
+        if self.ample_output:
+            def monitor():
+                r = mrbump_util.ResultsSummary()
+                r.extractResults(optd['mrbump_dir'], purge=bool(optd['purge']))
+                optd['mrbump_results'] = r.results
+                return self.ample_output.display_results(optd)
+        else:
+            monitor = None
+        return monitor
+
+    @staticmethod
+    def collect_mrbump_results(optd, ok):
         if not ok:
             msg = "An error code was returned after running MRBUMP on the ensembles!\n" + \
                   "For further information check the logs in directory: {0}".format(optd['mrbump_dir'])
@@ -0,0 +1,333 @@
+"""Module containing a framework for benchmarking the performance of AMPLE routines"""
+
+from __future__ import print_function
+
+__author__ = "Jens Thomas, and Felix Simkovic"
+__date__ = "17 Oct 2026"
+__version__ = "1.0"
+
+import copy
+import functools
+import logging
+import multiprocessing
+import os
+import pickle
+import random
+import resource
+import shutil
+import stat
+import tarfile
+import tempfile
+import time
+
+import numpy
+
+from ample import constants
+from ample import ensembler
+from ample.ensembler._ensembler import Ensemble
+from ample.util import ample_util
+from ample.util import coordinate_store
+from ample.util import decoy_archive
+from ample.util import model_source
+from ample.util import pdb_contents
+from ample.util import pdb_edit
+from ample.util import pdb_model
+from ample.util import pdb_reader
+from ample.util import spicker_numpy
+from ample.util import workers_util
+
+logger = logging.getLogger(__name__)
+
+
+def add_cmd_options(parser):
+    parser.add_argument('benchmarks', nargs='*',
+                        help="[ {0} ]".format(" | ".join(sorted(BENCHMARKS.keys()))))
+    parser.add_argument('-run_dir', default=None,
+                        help="directory to run the benchmarks in [default: temporary directory]")
+
+
+class AMPLEBenchmarkFramework(object):
+    """Framework to run the AMPLE performance benchmarks"""
+
+    def run(self, benchmarks=None, nproc=None, run_dir=None, **kwargs):
+        """Run the benchmarks and print a summary of the results"""
+        if nproc is None: nproc = 4
+        if not benchmarks: benchmarks = sorted(BENCHMARKS.keys())
+        for name in benchmarks:
+            if name not in BENCHMARKS:
+                raise RuntimeError("Unknown benchmark: {0}".format(name))
+        cleanup = run_dir is None
+        if cleanup: run_dir = tempfile.mkdtemp(prefix="ample_benchmark_")
+        try:
+            for name in benchmarks:
+                work_dir = os.path.join(os.path.abspath(run_dir), name)
+                if not os.path.isdir(work_dir): os.makedirs(work_dir)
+                results = BENCHMARKS[name](work_dir, nproc=nproc)
+                print(format_results(name, results))
+        finally:
+            if cleanup: shutil.rmtree(run_dir)
+
+
+def format_results(name, results):
+    """Format a list of (label, value) tuples as a table"""
+    width = max(len(label) for label, _ in results)
+    lines = ["Benchmark: {0}".format(name)]
+    for label, value in results:
+        if isinstance(value, float): value = "{0:.3f}".format(value)
+        lines.append("  {0:<{1}} : {2}".format(label, width, value))
+    return os.linesep.join(lines)
+
+
+def _synthetic_ensembles(work_dir, nclusters, nlevels, nradii, nresidues, nmodels):
+    """Return ensembles with the data of an ab initio run, sharing lists the way the ensembler does"""
+    ensembles = []
+    for cluster_num in range(1, nclusters + 1):
+        for level in range(nlevels):
+            residues = range(1, nresidues - level * nresidues // nlevels + 1)
+            for radius in [1, 2, 3][:nradii]:
+                raw_ensemble = Ensemble()
+                raw_ensemble.cluster_num = cluster_num
+                raw_ensemble.truncation_level = level
+                raw_ensemble.truncation_residues = residues
+                raw_ensemble.num_residues = len(residues)
+                raw_ensemble.subcluster_radius_threshold = radius
+                raw_ensemble.subcluster_models = [os.path.join(work_dir, 'models', 'model_{0}.pdb'.format(i))
+                                                  for i in range(nmodels)]
+                for sct in ['allatom', 'reliable', 'polyala']:
+                    ensemble = raw_ensemble.copy()
+                    ensemble.side_chain_treatment = sct
+                    ensemble.name = 'c{0}_t{1}_r{2}_{3}'.format(cluster_num, level, radius, sct)
+                    ensemble.pdb = os.path.join(work_dir, ensemble.name + '.pdb')
+                    ensembles.append(ensemble)
+    return ensembles
+
+
+def _ensembles_data_usage(queue, work_dir, copied, sizes):
+    """Put the peak RSS increase in kB and the pickled size of the ensembles' data of an ab initio run in queue"""
+    start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ensembles = _synthetic_ensembles(work_dir, *sizes)
+    amoptd = {}
+    if copied:
+        # Every ensemble has its own copy of its data, as when ensembles were deep copied and stored as their __dict__
+        amoptd['ensembles_data'] = [copy.deepcopy(e._asdict()) for e in ensembles]
+    else:
+        amoptd['ensembles_data'] = ensembler.ensembles_data(ensembles, amoptd)
+    del ensembles
+    size = len(pickle.dumps(amoptd))
+    queue.put((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start, size))
+
+
+def benchmark_check_pdbs(work_dir, nproc=4, ncopies=100):
+    """Compare the time to validate copies of the models in testfiles with cctbx hierarchies and with check_pdbs"""
+    models = sorted(os.listdir(os.path.join(constants.SHARE_DIR, 'testfiles', 'models')))
+    pdbs = []
+    for i in range(ncopies):
+        for model in models:
+            pdb = os.path.join(work_dir, "{0}_{1}".format(i, model))
+            shutil.copy(os.path.join(constants.SHARE_DIR, 'testfiles', 'models', model), pdb)
+            pdbs.append(pdb)
+    results = [('pdb files', len(pdbs)), ('nproc', nproc)]
+    start = time.time()
+    for pdb in pdbs:
+        pdb_edit._check_pdb_hierarchy(pdb, True, True)
+    results.append(('cctbx hierarchy seconds', time.time() - start))
+    for n in (1, nproc):
+        pdb_edit.hierarchy_cache.clear()
+        start = time.time()
+        if not pdb_edit.check_pdbs(pdbs, single=True, allsame=True, nproc=n):
+            raise RuntimeError("check_pdbs failed to validate the models")
+        results.append(('check_pdbs nproc={0} seconds'.format(n), time.time() - start))
+    return results
+
+
+def benchmark_decoy_archive(work_dir, nproc=4, ncopies=100, nsample=100, seed=1):
+    """Compare a tar archive of copies of the models in testfiles with a decoy archive of them
+
+    Measures the inodes used, the time to load the models as for -models (writing, checking and storing the
+    coordinates of every model with :meth:`ModelSource.load <ample.util.model_source.ModelSource.load>`) and
+    the time to read the atoms of nsample models chosen at random.
+    """
+    models = sorted(os.listdir(os.path.join(constants.SHARE_DIR, 'testfiles', 'models')))
+    models_dir = os.path.join(work_dir, 'models')
+    os.mkdir(models_dir)
+    pdbs = []
+    for i in range(ncopies):
+        for model in models:
+            pdb = os.path.join(models_dir, "{0}_{1}".format(i, model))
+            shutil.copy(os.path.join(constants.SHARE_DIR, 'testfiles', 'models', model), pdb)
+            pdbs.append(pdb)
+    tar_path = os.path.join(work_dir, 'models.tar.gz')
+    with tarfile.open(tar_path, 'w:gz') as tf:
+        for pdb in pdbs:
+            tf.add(pdb, arcname=os.path.basename(pdb))
+    archive_path = os.path.join(work_dir, 'models' + decoy_archive.DECOY_ARCHIVE_SUFFIX)
+    start = time.time()
+    decoy_archive.DecoyArchive.create(archive_path, model_source.ModelSource(models_dir))
+    results = [('models', len(pdbs)), ('archive seconds', time.time() - start),
+               ('directory inodes', len(os.listdir(models_dir)) + 1), ('archive inodes', 1),
+               ('tar MB', os.path.getsize(tar_path) / 1024.0 ** 2),
+               ('archive MB', os.path.getsize(archive_path) / 1024.0 ** 2)]
+
+    check = functools.partial(pdb_edit.check_pdb_atoms, single=True, get_sequence=True)
+    for name, path in (('tar', tar_path), ('archive', archive_path)):
+        start = time.time()
+        model_source.ModelSource(path).load(os.path.join(work_dir, name), check=check,
+                                            coordinate_store=coordinate_store.CoordinateStore())
+        results.append(('{0} load seconds'.format(name), time.time() - start))
+
+    random.seed(seed)
+    sample = random.sample(pdbs, min(nsample, len(pdbs)))
+    start = time.time()
+    for pdb in sample:
+        pdb_reader.PdbAtoms.from_file(pdb)
+    results.append(('directory random access seconds', time.time() - start))
+    start = time.time()
+    archive = decoy_archive.DecoyArchive(archive_path)
+    for pdb in sample:
+        numpy.array(archive.atoms(os.path.basename(pdb)))
+    results.append(('archive random access seconds', time.time() - start))
+    return results
+
+
+def benchmark_ensembles_data(work_dir, nproc=4, nclusters=10, nlevels=20, nradii=3, nresidues=300, nmodels=30):
+    """Compare the memory used by and pickled size of the ensembles' data of a large ab initio run when each
+    ensemble holds a copy of its data and when the lists are shared and the truncation residues stored once
+    """
+    sizes = (nclusters, nlevels, nradii, nresidues, nmodels)
+    results = [('ensembles', nclusters * nlevels * nradii * 3)]
+    for name, copied in (('copied', True), ('shared', False)):
+        # Each in a new process so the peak RSS is only that of the ensembles' data
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_ensembles_data_usage, args=(queue, work_dir, copied, sizes))
+        process.start()
+        rss, size = queue.get()
+        process.join()
+        results.append(('{0} peak RSS increase MB'.format(name), rss / 1024.0))
+        results.append(('{0} pickle MB'.format(name), size / 1024.0 ** 2))
+    return results
+
+
+def benchmark_pdb_contents(work_dir, nproc=4, repeats=3):
+    """Compare the time to count the atoms and residues of the pdb files in testfiles with rwcontents and pdb_contents
+
+    rwcontents is only run if it can be found.
+    """
+    pdbs = sorted(os.path.join(constants.SHARE_DIR, 'testfiles', f)
+                  for f in os.listdir(os.path.join(constants.SHARE_DIR, 'testfiles')) if f.endswith('.pdb'))
+
+    def run_rwcontents():
+        logfile = os.path.join(work_dir, 'rwcontents.log')
+        for pdb in pdbs:
+            pdb_edit._run_rwcontents(pdb, logfile)
+            pdb_edit._parse_rwcontents(logfile)
+
+    def run_pdb_contents():
+        for pdb in pdbs:
+            pdb_contents.pdb_contents(pdb)
+
+    programs = [('pdb_contents', run_pdb_contents)]
+    try:
+        ample_util.find_exe('rwcontents')
+        programs.insert(0, ('rwcontents', run_rwcontents))
+    except ample_util.FileNotFoundError:
+        logger.info("Cannot find rwcontents so only timing pdb_contents")
+    results = [('pdb files', len(pdbs))]
+    for name, run in programs:
+        start = time.time()
+        for _ in range(repeats):
+            run()
+        results.append(('{0} ms per file'.format(name), (time.time() - start) * 1000.0 / (repeats * len(pdbs))))
+    return results
+
+
+def benchmark_pdb_reader(work_dir, nproc=4, repeats=3):
+    """Compare the throughput of reading the atoms of the pdb files in testfiles line by line and with pdb_reader"""
+    pdbs = []
+    for root, _, files in os.walk(os.path.join(constants.SHARE_DIR, 'testfiles')):
+        pdbs.extend(os.path.join(root, f) for f in files if f.endswith('.pdb'))
+    megabytes = sum(os.path.getsize(pdb) for pdb in pdbs) / 1024.0 ** 2
+
+    def read_lines():
+        natoms = 0
+        for pdb in pdbs:
+            with open(pdb) as f:
+                for line in f:
+                    if line.startswith('ATOM  '):
+                        pdb_model.PdbAtom(line)
+                    elif line.startswith('HETATM'):
+                        pdb_model.PdbHetatm(line)
+                    else:
+                        continue
+                    natoms += 1
+        return natoms
+
+    def read_arrays():
+        return sum(len(pdb_reader.PdbAtoms.from_file(pdb)) for pdb in pdbs)
+
+    results = [('pdb files', len(pdbs)), ('MB', megabytes)]
+    for name, reader in (('PdbAtom', read_lines), ('pdb_reader', read_arrays)):
+        reader()  # So that both read the files from the page cache
+        start = time.time()
+        for _ in range(repeats):
+            natoms = reader()
+        wall = (time.time() - start) / repeats
+        results.append(('{0} atoms'.format(name), natoms))
+        results.append(('{0} MB per second'.format(name), megabytes / wall))
+    return results
+
+
+def benchmark_scheduler(work_dir, nproc=4, njobs=40, seed=1):
+    """Compare how long cores sit idle between jobs with the JobServer and JobScheduler
+
+    The jobs sleep for between 0.2 and 2 seconds so the idle time is the difference
+    between the core time available (nproc * wall clock time) and the total time the jobs slept.
+    """
+    random.seed(seed)
+    durations = [round(random.uniform(0.2, 2.0), 1) for _ in range(njobs)]
+    busy = sum(durations)
+    results = [('jobs', njobs), ('nproc', nproc), ('job seconds', busy)]
+    for name, server in (('JobServer', workers_util.JobServer), ('JobScheduler', workers_util.JobScheduler)):
+        jobs = []
+        for i, duration in enumerate(durations):
+            script = os.path.join(work_dir, "{0}_{1}{2}".format(name, i, ample_util.SCRIPT_EXT))
+            with open(script, 'w') as f:
+                f.write(ample_util.SCRIPT_HEADER + os.linesep + "sleep {0}".format(duration) + os.linesep)
+            os.chmod(script, stat.S_IRWXU)
+            jobs.append(script)
+        start = time.time()
+        js = server()
+        js.setJobs(jobs)
+        js.start(nproc=nproc)
+        wall = time.time() - start
+        results.append(('{0} wall clock seconds'.format(name), wall))
+        results.append(('{0} idle core seconds'.format(name), nproc * wall - busy))
+    return results
+
+
+def benchmark_spicker_numpy(work_dir, nproc=4, ndecoys=5000, nresidues=60, nfamilies=5, seed=1):
+    """Time clustering a set of synthetic decoys with the numpy implementation of SPICKER
+
+    The decoys are noisy copies of nfamilies random structures of nresidues CA atoms.
+    """
+    numpy.random.seed(seed)
+    natives = numpy.random.uniform(-15.0, 15.0, size=(nfamilies, nresidues, 3))
+    coords = natives[numpy.random.randint(nfamilies, size=ndecoys)]
+    coords += numpy.random.normal(0.0, 1.5, size=coords.shape)
+    start = time.time()
+    cutoff, clusters = spicker_numpy.cluster_coordinates(coords, nproc=nproc,
+                                                         scratch_file=os.path.join(work_dir, 'score_bins.dat'))
+    wall = time.time() - start
+    return [('decoys', ndecoys), ('residues', nresidues), ('nproc', nproc), ('cutoff', cutoff),
+            ('clusters', len(clusters)), ('largest cluster', len(clusters[0][0])), ('wall clock seconds', wall),
+            ('pairs per second', ndecoys * ndecoys / wall)]
+
+
+BENCHMARKS = {
+    'check_pdbs': benchmark_check_pdbs,
+    'decoy_archive': benchmark_decoy_archive,
+    'ensembles_data': benchmark_ensembles_data,
+    'pdb_contents': benchmark_pdb_contents,
+    'pdb_reader': benchmark_pdb_reader,
+    'scheduler': benchmark_scheduler,
+    'spicker_numpy': benchmark_spicker_numpy,
+}
@@ -2,7 +2,7 @@
 
 import argparse
 
-from ample.testing import integration_util, unittest_util
+from ample.testing import benchmark_util, integration_util, unittest_util
 from ample.util.argparse_util import add_core_options, add_cluster_submit_options
 
 __author__ = "Felix Simkovic"
@@ -20,12 +20,17 @@ def run_unittest(argd):
     m = unittest_util.AMPLEUnittestFramework()
     m.run(buffer=argd['buffer'], cases=argd['test_cases'], verbosity=argd['verbosity'])
 
+def run_benchmark(argd):
+    m = benchmark_util.AMPLEBenchmarkFramework()
+    m.run(benchmarks=argd['benchmarks'], nproc=argd['nproc'], run_dir=argd['run_dir'])
+
 def main():  
     desc = """ccp4-python -m ample.testing <command> [<args>]
 
 Available tests include:
    integration     Integration testing of typical Ample routines
    unittest        Unittesting of all Ample subroutines
+   benchmark       Performance benchmarks of Ample subroutines
 """
     
     parser = argparse.ArgumentParser(prog="run_tests.py", usage=desc)
@@ -44,6 +49,10 @@ Available tests include:
     unit.set_defaults(which="unittest")
     unittest_util.add_cmd_options(unit)
     
+    bench = suboptions.add_parser("benchmark", help="Benchmark the performance of Ample subroutines")
+    bench.set_defaults(which="benchmark")
+    benchmark_util.add_cmd_options(bench)
+    
     argd = vars(parser.parse_args())
     
     which_test = argd['which']
@@ -51,6 +60,8 @@ Available tests include:
         run_integration(argd)
     elif which_test is 'unittest':
         run_unittest(argd)
+    elif which_test is 'benchmark':
+        run_benchmark(argd)
     
 if __name__ == "__main__":
     main()
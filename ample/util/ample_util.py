@@ -5,6 +5,8 @@ __date__ = "01 Jan 2016"
 __version__ = "1.0"
 
 import pickle
+import collections
+import functools
 import glob
 import logging
 import os
@@ -16,7 +18,10 @@ import warnings
 import zipfile
 
 import ccp4
+import coordinate_store
 import exit_util
+import model_source
+import model_splitter
 import pdb_edit
 
 from ample.constants import SHARE_DIR, AMPLEDIR, I2DIR
@@ -26,6 +31,9 @@ SCRIPT_EXT = '.bat' if sys.platform.startswith('win') else '.sh'
 EXE_EXT = '.exe' if sys.platform.startswith('win') else ''
 SCRIPT_HEADER = '' if sys.platform.startswith('win') else '#!/bin/bash'
 
+# Number of lines of output kept by a CommandOutput for reporting errors
+OUTPUT_TAIL_LINES = 50
+
 class FileNotFoundError(Exception): pass
 
 # ample_util is used before anything else so there is no logger available
@@ -86,12 +94,19 @@ def extract_and_validate_models(amoptd, sequence=None, single=True, allsame=True
     allsame : bool
        only extract a file if the suffix is in the list
 
+    Notes
+    -----
+    The members of an archive are read straight from it in a single pass, in which they are written to
+    the models_dir, checked from their coordinate records and their coordinates saved in a
+    :obj:`CoordinateStore <ample.util.coordinate_store.CoordinateStore>` in the models_dir. Only the models
+    that cannot be checked from their records are read again.
+
     """
 
     filepath = amoptd['models']
     models_dir = amoptd['models_dir']
 
-    filenames = None
+    checked = None
     quark_models = False
 
     if os.path.isfile(filepath):
@@ -99,12 +114,14 @@ def extract_and_validate_models(amoptd, sequence=None, single=True, allsame=True
         if basename in ['result.tar.bz2', 'decoys.tar.gz']:
             logger.info('Assuming QUARK models in file: %s', filepath)
             quark_models = True
-            filenames = ['alldecoy.pdb']
         try:
-            extract_models_from_archive(filepath,
-                                        models_dir,
-                                        suffixes=['.pdb', '.PDB'],
-                                        filenames=filenames)
+            if quark_models:
+                model_source.ModelSource(filepath, filenames=['alldecoy.pdb']).write(models_dir)
+            else:
+                store = coordinate_store.CoordinateStore()
+                check = functools.partial(pdb_edit.check_pdb_atoms, single=single, get_sequence=True)
+                _, checked = model_source.ModelSource(filepath).load(models_dir, check=check, coordinate_store=store)
+                store.save(os.path.join(models_dir, coordinate_store.COORDINATE_STORE_NAME))
         except Exception as e:
             exit_util.exit_error("Error extracting models from file: {0}\n{1}".format(filepath, e))
     elif os.path.isdir(filepath):
@@ -117,7 +134,8 @@ def extract_and_validate_models(amoptd, sequence=None, single=True, allsame=True
             exit_util.exit_error("Error splitting QUARK models from file: {0}\n{1}".format(filepath, e))
         amoptd['quark_models'] = True
 
-    if not pdb_edit.check_pdb_directory(models_dir, sequence=sequence, single=single, allsame=allsame):
+    if not pdb_edit.check_pdb_directory(models_dir, sequence=sequence, single=single, allsame=allsame,
+                                        nproc=amoptd.get('nproc'), checked=checked):
         msg = "Problem importing pdb files - please check the log for more information"
         exit_util.exit_error(msg)
 
@@ -479,6 +497,96 @@ def run_command(cmd, logfile=None, directory=None, dolog=True, stdin=None, check
     return p.returncode
 
 
+class CommandOutput(object):
+    """Run a command and iterate over the lines of its output as they are written
+
+    The output can be parsed while the command runs instead of being written to a logfile and read back
+    once it has finished. Only the last tail_lines lines are kept in memory, and the output is only written
+    to a logfile if one is given.
+
+    Examples
+    --------
+    >>> with CommandOutput(['ls', '-l'], directory='/tmp') as output:
+    ...     for line in output:
+    ...         pass
+    >>> output.returncode
+    0
+
+    Parameters
+    ----------
+    cmd : list
+       Command to run as a list
+    logfile : str, optional
+       The path to a logfile to write the output to
+    directory : str, optional
+       The directory to run the command in (cwd assumed)
+    stdin : str, optional
+       Stdin for the command
+    tail_lines : int, optional
+       The number of lines of output to keep for the tail
+
+    Notes
+    -----
+    Any output not read when the with block ends is read (and written to the logfile) before waiting for the
+    command to finish. If the block raises an exception the command is killed.
+    """
+
+    def __init__(self, cmd, logfile=None, directory=None, stdin=None, tail_lines=OUTPUT_TAIL_LINES, **kwargs):
+        assert type(cmd) is list, "CommandOutput needs a list!"
+        self.cmd = cmd
+        self.logfile = os.path.abspath(logfile) if logfile else None
+        self.directory = directory if directory else os.getcwd()
+        self.stdin = stdin
+        self.kwargs = kwargs
+        self.returncode = None
+        self._lines = collections.deque(maxlen=tail_lines)
+        self._logf = None
+        self._process = None
+
+    def __enter__(self):
+        logger.debug("Running command in directory %s: %s", self.directory, " ".join(self.cmd))
+        if self.logfile:
+            self._logf = open(self.logfile, 'w')
+        stdin = None if self.stdin is None else subprocess.PIPE
+        self._process = subprocess.Popen(self.cmd, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                         cwd=self.directory, **self.kwargs)
+        if self.stdin is not None:
+            self._process.stdin.write(self.stdin)
+            self._process.stdin.close()
+        return self
+
+    def __iter__(self):
+        # readline rather than iterating over the file, which reads ahead in blocks
+        for line in iter(self._process.stdout.readline, ''):
+            self._lines.append(line)
+            if self._logf:
+                self._logf.write(line)
+            yield line
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            for _ in self:
+                pass
+        elif self._process.poll() is None:
+            self._process.kill()
+        self._process.stdout.close()
+        self.returncode = self._process.wait()
+        if self._logf:
+            self._logf.close()
+        return False
+
+    @property
+    def tail(self):
+        """The last lines of output"""
+        return "".join(self._lines)
+
+    def error_message(self, msg):
+        """Return msg with the logfile or the tail of the output, for reporting an error"""
+        if self.logfile:
+            return "{0}\nSee logfile: {1}".format(msg, self.logfile)
+        return "{0}\nLast lines of output of command {1}:\n{2}".format(msg, " ".join(self.cmd), self.tail)
+
+
 def read_amoptd(amoptd_fname):
     """Read a PICKLE-formatted AMPLE options file
 
@@ -555,54 +663,37 @@ def split_quark(models_dir):
     return
 
 
-def split_models(dfile, directory):
+def split_models(dfile, directory, coordinate_store=None):
     """Split a single PDB with multiple models in individual PDB files
 
+    The models are streamed from the file by :func:`model_splitter.split_models
+    <ample.util.model_splitter.split_models>` so only one is held in memory at a time.
+
     Parameters
     ----------
     dfile : str
        Single PDB file with multiple model entries
     directory : str
        Directory to extract the PDB files to
+    coordinate_store : :obj:`CoordinateStore <ample.util.coordinate_store.CoordinateStore>`, optional
+       A store to add the residues of the models to as they are extracted
 
     Returns
     -------
     extracted_models : list
        List of PDB files for all models
 
-    TODO
-    ----
-    * Use the CCTBX library to perform this step
-
     """
     logger.info("Extracting decoys from: %s into %s", dfile, directory)
-    smodels = []
-    with open(dfile, 'r') as f:
-        m = []
-        for line in f:
-            if line.startswith("ENDMDL"):
-                m.append(line)
-                smodels.append(m)
-                m = []
-            else:
-                m.append(line)
-
-    if not len(smodels):
-        raise RuntimeError("Could not extract any models from: {0}".format(dfile))
 
-    extracted_models = []
-    for i, m in enumerate(smodels):
-        fpath = os.path.join(directory, "quark_{0}.pdb".format(i))
-        with open(fpath, 'w') as f:
-            for line in m:
-                #  Reconstruct something sensible as from the coordinates on it's all quark-specific
-                # and there is no chain ID
-                if line.startswith("ATOM"):
-                    line = line[:21] + 'A' + line[22:54] + "  1.00  0.00              \n"
-                f.write(line)
-            extracted_models.append(fpath)
-            logger.debug("Wrote: %s", fpath)
+    def model_path(idx, model_id):
+        return os.path.join(directory, "quark_{0}.pdb".format(idx))
 
+    #  Reconstruct something sensible as from the coordinates on it's all quark-specific
+    # and there is no chain ID
+    extracted_models = model_splitter.split_models(dfile, model_path, quark=True, coordinate_store=coordinate_store)
+    if not len(extracted_models):
+        raise RuntimeError("Could not extract any models from: {0}".format(dfile))
     return extracted_models
 
 
@@ -68,6 +68,7 @@ def add_general_options(parser=None):
     parser.add_argument('-devel_mode', metavar='devel_mode', help='Preset options to run in development mode - takes longer')
     parser.add_argument('-dry_run', metavar='True/False', help='Check if input files and supplied options are valid.')
     parser.add_argument('-early_terminate', metavar='True/False', help='Stop the run as soon as a success has been found.')
+    parser.add_argument('-early_terminate_kill', metavar='True/False', help='With -early_terminate, kill any MRBUMP jobs still running when a success has been found.')
     parser.add_argument('-ensembles', help='Path to directory containing existing ensembles')
     parser.add_argument('-fasta', help='protein fasta file. (required)')
     parser.add_argument('-fast_protein_cluster_exe', help='path to fast_protein_cluster executable')
@@ -89,6 +90,7 @@ def add_general_options(parser=None):
     parser.add_argument('-nmr_process', type=int, help='number of times to process the NMR models')
     parser.add_argument('-nmr_remodel', metavar='True/False', help='Remodel the NMR structures')
     parser.add_argument('-nmr_remodel_fasta', help='The FASTA sequence to be used for remodelling the NMR ensemble if different from the default FASTA sequence')
+    parser.add_argument('-pipeline', metavar='True/False', help='Start running MRBUMP on the ensembles as soon as they are created, while the remaining ensembles are still being made (local runs only)')
     parser.add_argument('-purge', metavar='purge_level', type=int, choices=[0, 1, 2], help='Delete intermediate files and failed MRBUMP results: 0 - None, 1 - Some, 2 - All possible')
     parser.add_argument('-psipred_ss2', metavar='PSIPRED_FILE', help='Psipred secondary structure prediction file')
     parser.add_argument('-quick_mode', metavar='True/False', help='Preset options to run quickly, but less thoroughly')
@@ -200,24 +202,29 @@ def add_ensembler_options(parser=None):
         import argparse
         parser = argparse.ArgumentParser()
     ensembler_group = parser.add_argument_group('Ensemble Options')
+    ensembler_group.add_argument('-cache_dir', help='Directory to cache distance matrices and theseus superpositions in so that they can be reused by later runs')
+    ensembler_group.add_argument('-cache_max_size', type=float, help='Maximum size of the cache in MB [1024]')
     ensembler_group.add_argument('-cluster_dir', help='Path to directory of pre-clustered models to import')
-    ensembler_group.add_argument('-cluster_method', help='How to cluster the models for ensembling (spicker|fast_protein_cluster')
+    ensembler_group.add_argument('-cluster_method', help='How to cluster the models for ensembling (spicker|spicker_tm|spicker_numpy|spicker_numpy_tm|fast_protein_cluster)')
     ensembler_group.add_argument('-ensembler_timeout', type=int, help='Time in seconds before timing out ensembling')
     ensembler_group.add_argument('-gesamt_exe', metavar='gesamt_exe', help='Path to the gesamt executable')
     ensembler_group.add_argument('-homologs', metavar='True/False', help='Generate ensembles from homologs models (requires -alignment_file)')
     ensembler_group.add_argument('-homolog_aligner', metavar='homolog_aligner', help='Program to use for structural alignment of homologs (gesamt|mustang)')
     ensembler_group.add_argument('-ensemble_max_models', help='Maximum number of models permitted in an ensemble')
+    ensembler_group.add_argument('-ensemble_similarity_threshold', type=float, help='Ensembles with the same side chain treatment whose subcluster model and truncation residue overlaps are both at least this are treated as redundant (> 1 to only remove identical ensembles) [0.9]')
+    ensembler_group.add_argument('-lazy_ensembles', metavar='True/False', help='Only record how to make each ab initio ensemble and build it just before its MRBUMP job is run, so ensembles that are never run with -early_terminate cost nothing [False]')
     ensembler_group.add_argument('-maxcluster_exe', help='Path to Maxcluster executable')
     ensembler_group.add_argument('-mustang_exe', metavar='mustang_exe', help='Path to the mustang executable')
     ensembler_group.add_argument('-num_clusters', type=int, help='The number of Spicker clusters of the original decoys that will be sampled [1]')
     ensembler_group.add_argument('-percent', metavar='percent_truncation', help='percent interval for truncation')
     ensembler_group.add_argument('-percent_fixed_intervals', nargs='+', type=int, help='list of integer percentage intervals for truncation')
+    ensembler_group.add_argument('-redundant_ensembles', choices=['drop', 'deprioritise', 'keep'], help='Drop identical and similar ensembles, drop identical and run similar ensembles last, or keep them all [deprioritise]')
     ensembler_group.add_argument('-score_matrix', help='Path to score matrix for spicker')
     ensembler_group.add_argument('-score_matrix_file_list', help='File with list of ordered model names for the score_matrix')
     ensembler_group.add_argument('-side_chain_treatments', type=str, nargs='+', help='The side chain treatments to use. Default: ' + '|'.join(side_chain_treatments))
     ensembler_group.add_argument('-spicker_exe', help='Path to spicker executable')
     ensembler_group.add_argument('-subcluster_radius_thresholds', type=float, nargs='+', help='The radii to use for subclustering the truncated ensembles')
-    ensembler_group.add_argument('-subcluster_program', help='Program for subclustering models [maxcluster]')
+    ensembler_group.add_argument('-subcluster_program', help='Program for subclustering models: gesamt|maxcluster|lsqkab|kabsch [maxcluster]')
     ensembler_group.add_argument('-theseus_exe', metavar='Theseus exe (required)', help='Path to theseus executable')
     ensembler_group.add_argument('-thin_clusters', metavar='True/False', help='Create ensembles from 10 clusters with 1 + 3A subclustering and polyAlanine sidechains')
     ensembler_group.add_argument('-truncation_method', help='How to truncate the models for ensembling: ' + '|'.join(truncation_methods))
@@ -161,7 +161,6 @@ def analyse(amoptd, newroot=None):
 
     if not os.path.isdir(fixpath(amoptd['benchmark_dir'])):
         os.mkdir(fixpath(amoptd['benchmark_dir']))
-    os.chdir(fixpath(amoptd['benchmark_dir']))
     
     # AnalysePdb may have already been called from the main script
     if amoptd['native_pdb'] and 'native_pdb_std' not in amoptd:
@@ -193,7 +192,8 @@ def analyse(amoptd, newroot=None):
         return
     
     data = []
-    mrinfo = shelxe.MRinfo(amoptd['shelxe_exe'], amoptd['native_pdb_info'].pdb, amoptd['mtz'])
+    mrinfo = shelxe.MRinfo(amoptd['shelxe_exe'], amoptd['native_pdb_info'].pdb, amoptd['mtz'],
+                           work_dir=fixpath(amoptd['benchmark_dir']))
     for result in amoptd['mrbump_results']:
         
         # use mrbump dict as basis for result object
@@ -426,7 +426,8 @@ def analyseSolution(amoptd, d, mrinfo):
         csymmatch.Csymmatch().wrapModelToNative(originPdb,
                                                 amoptd['native_pdb'],
                                                 csymmatchPdb=os.path.join(fixpath(amoptd['benchmark_dir']),
-                                                "phaser_{0}_csymmatch.pdb".format(d['ensemble_name'])))
+                                                "phaser_{0}_csymmatch.pdb".format(d['ensemble_name'])),
+                                                workdir=fixpath(amoptd['benchmark_dir']))
         # can now delete origin pdb
         os.unlink(originPdb)
         
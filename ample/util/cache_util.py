@@ -0,0 +1,288 @@
+"""A content-addressed on-disk cache for the results of expensive calculations
+
+Results are stored in directories named by a hash of everything that they depend on - the
+coordinates of the input models, the residue selection, the program and its version - so that
+they can be reused by any later run with identical inputs, regardless of where the files are.
+The least recently used entries are removed when the cache grows beyond its maximum size.
+
+:obj:`FileCache` is a much simpler in-memory cache of objects parsed from files, so that files that
+are read several times during a run are only parsed once.
+"""
+
+__author__ = "Jens Thomas, and Felix Simkovic"
+__date__ = "17 Oct 2026"
+__version__ = "1.0"
+
+import collections
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy
+
+from ample.util import version
+
+logger = logging.getLogger(__name__)
+
+# Default maximum size of the cache in MB
+DEFAULT_MAX_SIZE = 1024
+# File marking that an entry has been completely written - its modification time records the last use
+ENTRY_MARKER = 'entry.complete'
+TMP_PREFIX = '.tmp_'
+# Default maximum number of objects kept by a FileCache
+DEFAULT_MAX_ENTRIES = 32
+# Records that define the coordinates of a pdb file - anything else (headers, remarks) is ignored for hashing
+COORDINATE_RECORDS = ('ATOM', 'HETATM', 'MODEL', 'ENDMDL', 'TER')
+
+
+def _hash_update(hasher, item):
+    """Add an item to the hash, recursing into lists and tuples"""
+    if isinstance(item, numpy.ndarray):
+        hasher.update('a{0}{1}:'.format(item.dtype.str, item.shape))
+        hasher.update(numpy.ascontiguousarray(item).tobytes())
+    elif isinstance(item, (list, tuple)):
+        hasher.update('l{0}:'.format(len(item)))
+        for i in item:
+            _hash_update(hasher, i)
+    elif isinstance(item, basestring):
+        if isinstance(item, unicode):
+            item = item.encode('utf-8')
+        hasher.update('s{0}:'.format(len(item)))
+        hasher.update(item)
+    else:
+        hasher.update('r{0}:'.format(repr(item)))
+    return
+
+
+def pdb_coordinates_hash(pdb):
+    """Return the hash of the coordinate records of a pdb file"""
+    hasher = hashlib.sha1()
+    with open(pdb) as f:
+        for line in f:
+            if line.startswith(COORDINATE_RECORDS):
+                hasher.update(line.rstrip() + '\n')
+    return hasher.hexdigest()
+
+
+def models_hash(models, coordinate_store=None):
+    """Return a list of hashes of the coordinates of a list of models
+
+    The pdb file of each model is hashed if it exists. Models that have only been recorded in the
+    :obj:`CoordinateStore <ample.util.coordinate_store.CoordinateStore>` (such as truncated models
+    that have not been written) are hashed from their stored residues and coordinates.
+    """
+    hashes = []
+    for model in models:
+        if os.path.isfile(model):
+            hashes.append(pdb_coordinates_hash(model))
+        elif coordinate_store is not None and model in coordinate_store:
+            hasher = hashlib.sha1()
+            _hash_update(hasher, list(coordinate_store.residues(model)))
+            _hash_update(hasher, coordinate_store.ca_coordinates([model]))
+            _hash_update(hasher, coordinate_store.cb_coordinates([model]))
+            hashes.append(hasher.hexdigest())
+        else:
+            raise RuntimeError("Cannot find model to hash: {0}".format(model))
+    return hashes
+
+
+def program_version(executable):
+    """Return a string identifying the version of an executable from its path, size and modification time"""
+    if not executable:
+        return None
+    stat = os.stat(executable)
+    return "{0}:{1}:{2}".format(os.path.realpath(executable), stat.st_size, int(stat.st_mtime))
+
+
+class ResultCache(object):
+    """A size-bounded cache of directories of files keyed by the hash of their inputs
+
+    Each entry is written to a temporary directory that is only renamed into place once complete,
+    so the cache can be shared by several processes.
+
+    Parameters
+    ----------
+    cache_dir : str
+       The directory to store the cache in
+    max_size : float
+       The maximum size of the cache in MB
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = float(max_size)
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    @staticmethod
+    def key(*items):
+        """Return the key for a result that depends on items
+
+        The AMPLE version is always included so that results are never reused across versions.
+        """
+        hasher = hashlib.sha1()
+        _hash_update(hasher, [version.__version__] + list(items))
+        return hasher.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key):
+        """Return the directory holding the result for key, or None if it is not in the cache"""
+        marker = os.path.join(self._entry(key), ENTRY_MARKER)
+        try:
+            # Mark the entry as recently used
+            os.utime(marker, None)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.debug("Cache hit for key %s", key)
+        return self._entry(key)
+
+    def store(self, key, writer):
+        """Store a result under key
+
+        Parameters
+        ----------
+        key : str
+           The key from :meth:`key`
+        writer : callable
+           A function that takes the path of a directory and writes the result into it
+
+        Returns
+        -------
+        str
+           The directory holding the result
+        """
+        entry = self._entry(key)
+        parent = os.path.dirname(entry)
+        if not os.path.isdir(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                # Created by another process
+                if not os.path.isdir(parent):
+                    raise
+        tmp_dir = tempfile.mkdtemp(prefix=TMP_PREFIX, dir=parent)
+        try:
+            writer(tmp_dir)
+            open(os.path.join(tmp_dir, ENTRY_MARKER), 'w').close()
+            os.rename(tmp_dir, entry)
+        except OSError:
+            # Another process stored the same result first
+            if not os.path.isdir(entry):
+                raise
+        finally:
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict()
+        return entry
+
+    def entries(self):
+        """Return a list of (last used time, size in bytes, directory) of the complete entries"""
+        entries = []
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                entry = os.path.join(prefix_dir, name)
+                if name.startswith(TMP_PREFIX):
+                    continue
+                try:
+                    last_used = os.path.getmtime(os.path.join(entry, ENTRY_MARKER))
+                    size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                except OSError:
+                    # Removed by another process
+                    continue
+                entries.append((last_used, size, entry))
+        return entries
+
+    def size(self):
+        """Return the size of the cache in MB"""
+        return sum(e[1] for e in self.entries()) / 1024.0 ** 2
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is no larger than max_size"""
+        entries = sorted(self.entries())
+        max_bytes = self.max_size * 1024.0 ** 2
+        total = sum(e[1] for e in entries)
+        for last_used, size, entry in entries:
+            if total <= max_bytes:
+                break
+            logger.debug("Removing least recently used cache entry: %s", entry)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+        return
+
+
+class FileCache(object):
+    """A size-bounded in-memory cache of the objects read from files
+
+    Each entry is keyed by the absolute path of the file and checked against its modification time
+    and size, so a file that has been rewritten since it was read is read again. The least recently
+    used entries are dropped when there are more than max_entries.
+
+    The cached objects are shared by every caller, so must not be modified. The cache can be used from several
+    threads at once; the files are read outside the lock, so a file may be read by two threads that miss together.
+
+    Parameters
+    ----------
+    reader : callable
+       A function that takes the path of a file and returns the object read from it
+    max_entries : int
+       The maximum number of objects to keep - 0 disables the cache
+    """
+
+    def __init__(self, reader, max_entries=DEFAULT_MAX_ENTRIES):
+        self.reader = reader
+        self.max_entries = int(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def stamp(path):
+        """Return the (modification time, size) of a file, or None if it cannot be read"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime, stat.st_size)
+
+    def get(self, path):
+        """Return the object read from path, only calling the reader if it is not in the cache"""
+        key = os.path.abspath(path)
+        stamp = self.stamp(key)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and stamp is not None and entry[0] == stamp:
+                self.hits += 1
+                # Put back as the most recently used
+                self._entries[key] = entry
+                return entry[1]
+            self.misses += 1
+        value = self.reader(path)
+        if stamp is not None and self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = (stamp, value)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        """Remove all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
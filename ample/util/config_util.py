@@ -51,6 +51,7 @@ _SECTIONS_REFERENCE = {"AMPLE_info": ["ample_version",
                        "Files": ['alignment_file',
                                  'ample_log',
                                  'bbcontacts_file',
+                                 'cache_dir',
                                  'cluster_dir',
                                  'config_file',
                                  'contact_file',
@@ -99,6 +100,7 @@ _SECTIONS_REFERENCE = {"AMPLE_info": ["ample_version",
                                      "fasta_length",
                                      "mrbump_results",
                                      "sequence",
+                                     "truncation_residues",
                                      "truncation_variances",
                                      "truncation_levels",
                                      "truncation_nresidues"],
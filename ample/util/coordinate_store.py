@@ -0,0 +1,291 @@
+"""Store of the CA and CB coordinates of a set of models so that each model only needs to be read once"""
+
+__author__ = "Jens Thomas, and Felix Simkovic"
+__date__ = "17 Oct 2026"
+__version__ = "1.0"
+
+import logging
+import os
+
+import numpy
+
+from ample.util import cache_util
+from ample.util import pdb_reader
+
+logger = logging.getLogger(__name__)
+
+COORDINATE_STORE_NAME = 'coordinates.npz'
+
+
+def read_residues(pdbin):
+    """Read the residue data and CA/CB coordinates from the first chain of the first model of a pdb
+
+    Residues containing HETATM records are skipped so that the residue indices match those
+    used by :func:`pdb_edit.select_residues <ample.util.pdb_edit.select_residues>`.
+    Residues without a CA have their CA coordinates set to nan and glycines (or any residue
+    without a CB) have the CA coordinates as their CB coordinates.
+
+    Parameters
+    ----------
+    pdbin : str
+       The path to the pdb file
+
+    Returns
+    -------
+    list
+       A list of [resseq, resname, ca, cb] for each residue
+    """
+    return residues_from_atoms(pdb_reader.PdbAtoms.from_file(pdbin).model(0))
+
+
+def residues_from_atoms(atoms):
+    """Return the residues of the first chain of the atoms of a model as for :func:`read_residues`"""
+    if not len(atoms):
+        return []
+    chain_starts, _ = pdb_reader.runs(atoms['chainID'])
+    if len(chain_starts) > 1:
+        atoms = atoms[:chain_starts[1]]
+    starts, residue = pdb_reader.residue_runs(atoms)
+    hetero = numpy.zeros(len(starts), dtype=bool)
+    hetero[residue[atoms['record'] == 'HETATM']] = True
+    names = pdb_reader.atom_names(atoms)
+    keep = numpy.flatnonzero(~hetero)
+    ca_idxs = pdb_reader.first_in_group(residue, names == 'CA', len(starts))[keep]
+    cb_idxs = pdb_reader.first_in_group(residue, names == 'CB', len(starts))[keep]
+    ca = numpy.full((len(keep), 3), numpy.nan)
+    ca[ca_idxs >= 0] = atoms['xyz'][ca_idxs[ca_idxs >= 0]]
+    cb = ca.copy()
+    cb[cb_idxs >= 0] = atoms['xyz'][cb_idxs[cb_idxs >= 0]]
+    return [[resseq, str(resname), tuple(ca_xyz), tuple(cb_xyz)]
+            for resseq, resname, ca_xyz, cb_xyz in zip(atoms['resSeq'][starts[keep]].tolist(),
+                                                       atoms['resName'][starts[keep]].tolist(),
+                                                       ca.tolist(), cb.tolist())]
+
+
+class CoordinateStore(object):
+    """Holds the CA and CB coordinates and residue data of a set of models as compact numpy arrays
+
+    The residues of all models are concatenated into single float32 coordinate arrays, with
+    offsets giving the first residue of each model. Models derived from a stored model (such
+    as truncated models) are recorded as a subset of the residue indices of their source model
+    so that they never need to be read. The (modification time, size) of each model's file when it
+    was added is kept so that a saved store is only reused if the models are unchanged.
+    """
+
+    def __init__(self):
+        self.models = []
+        self.stamps = numpy.zeros((0, 2), dtype=numpy.float64)
+        self.ca = numpy.zeros((0, 3), dtype=numpy.float32)
+        self.cb = numpy.zeros((0, 3), dtype=numpy.float32)
+        self.resseq = numpy.zeros(0, dtype=numpy.int32)
+        self.resname = numpy.zeros(0, dtype='S3')
+        self.offsets = numpy.zeros(1, dtype=numpy.int64)
+        self._index = {}
+        self._subsets = {}
+
+    @classmethod
+    def from_models(cls, models, path=None):
+        """Create a store from a list of models, reusing the store saved at path if it holds the same models
+
+        A store saved as COORDINATE_STORE_NAME in the directory of the models (as when the models are
+        imported from an archive) is also reused if it holds the same models, and is then saved at path.
+        A saved store is not reused if the modification time or size of any of the models has changed.
+        """
+        abspaths = sorted(os.path.abspath(m) for m in models)
+        saved = [path]
+        if models:
+            saved.append(os.path.join(os.path.dirname(abspaths[0]), COORDINATE_STORE_NAME))
+        for saved_path in saved:
+            if saved_path and os.path.isfile(saved_path):
+                store = cls.load(saved_path)
+                if sorted(store.models) == abspaths and store.is_current():
+                    logger.debug("Using coordinates of %d models from %s", len(store.models), saved_path)
+                    if path and saved_path != path: store.save(path)
+                    return store
+        store = cls()
+        store.add_models(models)
+        if path: store.save(path)
+        return store
+
+    def __contains__(self, model):
+        model = os.path.abspath(model)
+        return model in self._index or model in self._subsets
+
+    def __len__(self):
+        return len(self.models)
+
+    def is_current(self):
+        """Return True if the files of the models have the same modification time and size as when they were added"""
+        return numpy.array_equal(self.stamps, _stamps(self.models))
+
+    def add_models(self, models, model_residues=None):
+        """Read the models and add them to the store
+
+        If given, model_residues holds the residues of each model as returned by :func:`read_residues`
+        and the models are not read, so they need not exist as files.
+        """
+        ca, cb, resseq, resname, offsets, added = [], [], [], [], [], []
+        start = self.offsets[-1]
+        for i, model in enumerate(models):
+            model = os.path.abspath(model)
+            if model in self:
+                raise RuntimeError("Model {0} is already in the coordinate store".format(model))
+            # Taken before the model is read so that any later change is seen
+            stamps = _stamps([model])
+            residues = read_residues(model) if model_residues is None else model_residues[i]
+            if not residues:
+                raise RuntimeError("Could not read any residues from model: {0}".format(model))
+            self._index[model] = len(self.models)
+            self.models.append(model)
+            added.append(stamps)
+            for r in residues:
+                resseq.append(r[0])
+                resname.append(r[1])
+                ca.append(r[2])
+                cb.append(r[3])
+            start += len(residues)
+            offsets.append(start)
+        if not offsets:
+            return
+        self.ca = numpy.concatenate([self.ca, numpy.array(ca, dtype=numpy.float32)])
+        self.cb = numpy.concatenate([self.cb, numpy.array(cb, dtype=numpy.float32)])
+        self.resseq = numpy.concatenate([self.resseq, numpy.array(resseq, dtype=numpy.int32)])
+        self.resname = numpy.concatenate([self.resname, numpy.array(resname, dtype='S3')])
+        self.offsets = numpy.concatenate([self.offsets, numpy.array(offsets, dtype=numpy.int64)])
+        self.stamps = numpy.concatenate([self.stamps] + added)
+        return
+
+    def add_subset(self, model, source, residue_idxs=None):
+        """Record that model contains the residues at residue_idxs of source (all residues if None)"""
+        source_idx, source_residues = self._resolve(source)
+        if residue_idxs is None:
+            residues = source_residues
+        else:
+            residue_idxs = numpy.asarray(residue_idxs, dtype=numpy.int64)
+            residues = residue_idxs if source_residues is None else source_residues[residue_idxs]
+        self._subsets[os.path.abspath(model)] = (source_idx, residues)
+        return
+
+    def _resolve(self, model):
+        """Return the index of the stored model and the residue indices that model is made of"""
+        model = os.path.abspath(model)
+        if model in self._index:
+            return self._index[model], None
+        try:
+            return self._subsets[model]
+        except KeyError:
+            raise RuntimeError("Model {0} is not in the coordinate store".format(model))
+
+    def _select(self, array, model):
+        idx, residues = self._resolve(model)
+        data = array[self.offsets[idx]:self.offsets[idx + 1]]
+        return data if residues is None else data[residues]
+
+    def num_residues(self, model):
+        return len(self._select(self.resseq, model))
+
+    def residues(self, model):
+        """Return the arrays of residue sequence numbers and names of a model"""
+        return self._select(self.resseq, model), self._select(self.resname, model)
+
+    def common_residues(self, models, residue_idxs=None):
+        """Return the indices of the residues of the models (of residue_idxs if given) with a CA in all the models
+
+        These are the residues whose coordinates are returned by :meth:`ca_coordinates` and
+        :meth:`cb_coordinates`, so the indices can be used to select the matching residue data.
+        """
+        missing = self._missing(self._stack(self.ca, models, residue_idxs))
+        idxs = numpy.arange(len(missing)) if residue_idxs is None else numpy.asarray(residue_idxs, dtype=numpy.int64)
+        return idxs[~missing]
+
+    def ca_coordinates(self, models, residue_idxs=None):
+        """Return an (N, L, 3) float32 array of the CA coordinates of the models
+
+        residue_idxs index the residues of the models. Residues without a CA in any of the models
+        are left out; :meth:`common_residues` returns the indices of the residues that are kept.
+        """
+        return self._coordinates(self.ca, models, residue_idxs)
+
+    def cb_coordinates(self, models, residue_idxs=None):
+        """Return an (N, L, 3) float32 array of the CB coordinates (CA for glycine) of the models
+
+        The same residues are left out as by :meth:`ca_coordinates`.
+        """
+        return self._coordinates(self.cb, models, residue_idxs)
+
+    def _coordinates(self, array, models, residue_idxs=None):
+        ca = self._stack(self.ca, models, residue_idxs)
+        coords = ca if array is self.ca else self._stack(array, models, residue_idxs)
+        missing = self._missing(ca)
+        if missing.any():
+            logger.debug("Ignoring %d residues without a CA", missing.sum())
+            coords = coords[:, ~missing]
+        return coords
+
+    def _stack(self, array, models, residue_idxs=None):
+        coords = [self._select(array, m) for m in models]
+        if residue_idxs is not None:
+            coords = [c[residue_idxs] for c in coords]
+        if len(set(len(c) for c in coords)) != 1:
+            raise RuntimeError("Models do not all have the same number of residues")
+        return numpy.array(coords, dtype=numpy.float32)
+
+    @staticmethod
+    def _missing(ca):
+        """Return a mask of the residues without a CA in any of the models"""
+        return numpy.isnan(ca).any(axis=(0, 2))
+
+    def save(self, path):
+        """Save the store to a numpy .npz file"""
+        subset_models = sorted(self._subsets.keys())
+        subset_sources = [self._subsets[m][0] for m in subset_models]
+        subset_residues = [self._subsets[m][1] for m in subset_models]
+        subset_all = [r is None for r in subset_residues]
+        subset_residues = [numpy.zeros(0, dtype=numpy.int64) if r is None else r for r in subset_residues]
+        subset_offsets = numpy.cumsum([0] + [len(r) for r in subset_residues])
+        numpy.savez(path,
+                    models=numpy.array(self.models, dtype=str),
+                    stamps=self.stamps,
+                    ca=self.ca,
+                    cb=self.cb,
+                    resseq=self.resseq,
+                    resname=self.resname,
+                    offsets=self.offsets,
+                    subset_models=numpy.array(subset_models, dtype=str),
+                    subset_sources=numpy.array(subset_sources, dtype=numpy.int64),
+                    subset_all=numpy.array(subset_all, dtype=bool),
+                    subset_residues=numpy.concatenate([numpy.zeros(0, dtype=numpy.int64)] + subset_residues),
+                    subset_offsets=subset_offsets)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Load a store saved with :meth:`save`"""
+        store = cls()
+        data = numpy.load(path)
+        store.models = [str(m) for m in data['models']]
+        store._index = dict((m, i) for i, m in enumerate(store.models))
+        if 'stamps' in data.files:
+            store.stamps = data['stamps']
+        else:
+            # Saved without the stamps, so is never current
+            store.stamps = numpy.full((len(store.models), 2), numpy.nan)
+        store.ca = data['ca']
+        store.cb = data['cb']
+        store.resseq = data['resseq']
+        store.resname = data['resname']
+        store.offsets = data['offsets']
+        subset_offsets = data['subset_offsets']
+        subset_residues = data['subset_residues']
+        for i, model in enumerate(data['subset_models']):
+            residues = None
+            if not data['subset_all'][i]:
+                residues = subset_residues[subset_offsets[i]:subset_offsets[i + 1]]
+            store._subsets[str(model)] = (int(data['subset_sources'][i]), residues)
+        return store
+
+
+def _stamps(models):
+    """Return an (N, 2) array of the (modification time, size) of the models' files, -1 for those without a file"""
+    stamps = [cache_util.FileCache.stamp(model) or (-1, -1) for model in models]
+    return numpy.array(stamps, dtype=numpy.float64).reshape(len(models), 2)
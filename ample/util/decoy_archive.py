@@ -0,0 +1,212 @@
+"""A single indexed binary file holding the coordinates of a set of decoys
+
+The atoms of all the decoys are stored as one array of :data:`pdb_reader.ATOM_DTYPE <ample.util.pdb_reader.ATOM_DTYPE>`
+records, followed by an index giving the slice of atoms and any metadata (such as ROSETTA scores) of each decoy.
+The atoms are memory-mapped when the archive is opened, so any decoy can be read by name without reading the
+others, and a whole set of decoys takes a single inode instead of one per file. Only the ATOM/HETATM records
+of the first model of each file are kept.
+
+An archive given to AMPLE with -models is read by :obj:`ModelSource <ample.util.model_source.ModelSource>` like
+any other archive, so each decoy is still written to a pdb file for the programs that need one. The metadata
+is kept with the decoys but is not used by AMPLE.
+
+File layout::
+
+    MAGIC, version, number of atoms, offset of the index  (padded to DATA_OFFSET bytes)
+    atoms                                                  (little-endian ATOM_DTYPE records)
+    index                                                  (JSON)
+"""
+
+__author__ = "Jens Thomas, and Felix Simkovic"
+__date__ = "17 Oct 2026"
+__version__ = "1.0"
+
+import json
+import logging
+import os
+import struct
+
+import numpy
+
+from ample.util import coordinate_store
+from ample.util import pdb_reader
+
+logger = logging.getLogger(__name__)
+
+DECOY_ARCHIVE_SUFFIX = '.dcy'
+MAGIC = 'AMPLEDCY'
+VERSION = 1
+# The atoms start at this offset, after the header
+DATA_OFFSET = 64
+ARCHIVE_DTYPE = pdb_reader.ATOM_DTYPE.newbyteorder('<')
+
+_HEADER = struct.Struct('<8sIQQ')
+_ATOM_FORMAT = "{0:6s}{1:5d} {2:4s}{3:1s}{4:>3s} {5:1s}{6:4d}{7:1s}   {8:8.3f}{9:8.3f}{10:8.3f}{11:6.2f}{12:6.2f}" \
+               "          {13:>2s}\n"
+
+
+def is_decoy_archive(path):
+    """Return True if path is a decoy archive"""
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_rosetta_scores(score_file):
+    """Read the scores of each model in a ROSETTA score file for use as the metadata of a :obj:`DecoyArchive`
+
+    Returns
+    -------
+    dict
+       The numeric fields of each line keyed by the name of the model file (the description with .pdb added)
+    """
+    scores = {}
+    with open(score_file) as f:
+        fields = f.readline().split()
+        if 'description' not in fields:
+            raise RuntimeError("Missing header field from score file: {0}".format(score_file))
+        idx_desc = fields.index('description')
+        for line in f:
+            values = line.split()
+            if len(values) != len(fields):
+                continue
+            model_scores = {}
+            for field, value in zip(fields, values):
+                try:
+                    model_scores[field] = float(value)
+                except ValueError:
+                    pass
+            scores[values[idx_desc] + '.pdb'] = model_scores
+    return scores
+
+
+class DecoyArchive(object):
+    """A decoy archive opened for reading
+
+    Attributes
+    ----------
+    path : str
+       The path to the archive
+    names : list
+       The names of the decoys, in the order they were added
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size or header[:len(MAGIC)] != MAGIC:
+                raise RuntimeError("File is not a decoy archive: {0}".format(path))
+            _, version, natoms, index_offset = _HEADER.unpack(header)
+            if version != VERSION:
+                raise RuntimeError("Cannot read version {0} decoy archive: {1}".format(version, path))
+            f.seek(index_offset)
+            index = json.loads(f.read())
+        self.names = [str(name) for name, _, _ in index['models']]
+        self._slices = dict((str(name), slice(start, stop)) for name, start, stop in index['models'])
+        self._metadata = dict((str(name), data) for name, data in index['metadata'].items())
+        if natoms:
+            # A plain array of the mapped memory, as slicing a memmap is much slower
+            self._atoms = numpy.memmap(path, dtype=ARCHIVE_DTYPE, mode='r', offset=DATA_OFFSET,
+                                       shape=(natoms,)).view(numpy.ndarray)
+        else:
+            self._atoms = numpy.zeros(0, dtype=ARCHIVE_DTYPE)
+
+    @classmethod
+    def create(cls, path, models, metadata=None):
+        """Write an archive of models and open it
+
+        Parameters
+        ----------
+        path : str
+           The archive to write
+        models : iterable
+           The name and the text of the pdb file of each model, such as a
+           :obj:`ModelSource <ample.util.model_source.ModelSource>`. The models are read one at a time.
+        metadata : dict, optional
+           A dict of data for each model keyed by its name, such as from :func:`read_rosetta_scores`
+        """
+        index, names = [], set()
+        natoms = 0
+        with open(path, 'wb') as f:
+            f.write('\0' * DATA_OFFSET)
+            for name, data in models:
+                if name in names:
+                    raise RuntimeError("Model {0} is already in the decoy archive".format(name))
+                atoms = pdb_reader.PdbAtoms.from_string(data).model(0).astype(ARCHIVE_DTYPE)
+                atoms['model'] = 0
+                f.write(atoms.tobytes())
+                index.append([name, natoms, natoms + len(atoms)])
+                names.add(name)
+                natoms += len(atoms)
+            index_offset = f.tell()
+            metadata = metadata or {}
+            f.write(json.dumps({'models': index,
+                                'metadata': dict((name, metadata[name]) for name, _, _ in index if name in metadata)}))
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, VERSION, natoms, index_offset))
+        logger.debug("Wrote %d models with %d atoms to decoy archive: %s", len(index), natoms, path)
+        return cls(path)
+
+    def __contains__(self, name):
+        return name in self._slices
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        """Yield the name and the text of the pdb file of each model, as for a ModelSource"""
+        for name in self.names:
+            yield name, self.pdb_string(name)
+
+    def atoms(self, name):
+        """Return the atoms of a model"""
+        return self._atoms[self._slices[name]]
+
+    def metadata(self, name):
+        """Return the metadata of a model (an empty dict if there is none)"""
+        return self._metadata.get(name, {})
+
+    def residues(self, name):
+        """Return the residues of a model as for :func:`read_residues <ample.util.coordinate_store.read_residues>`"""
+        return coordinate_store.residues_from_atoms(self.atoms(name))
+
+    def pdb_string(self, name):
+        """Return the text of a pdb file of a model"""
+        # The fields of ATOM_DTYPE are in the order of the columns, with the model last
+        lines = [_ATOM_FORMAT.format(*(fields[:8] + tuple(fields[8]) + fields[9:12]))
+                 for fields in self.atoms(name).tolist()]
+        return "".join(lines) + "TER\nEND\n"
+
+    def export(self, directory, names=None):
+        """Write the models (or only those in names) to pdb files in directory, returning their paths"""
+        if not os.path.isdir(directory):
+            os.mkdir(directory)
+        paths = []
+        for name in self.names if names is None else names:
+            path = os.path.abspath(os.path.join(directory, name))
+            with open(path, 'w') as f:
+                f.write(self.pdb_string(name))
+            paths.append(path)
+        return paths
+
+
+if __name__ == "__main__":
+    import argparse
+    from ample.util import model_source
+    parser = argparse.ArgumentParser(description="Create a decoy archive or export the models in one to pdb files")
+    parser.add_argument('-m', '--models', help="Directory or tar/zip archive of models to add to the archive")
+    parser.add_argument('-s', '--score_file', help="ROSETTA score file with the scores of the models")
+    parser.add_argument('-e', '--export', help="Directory to export the models in the archive to")
+    parser.add_argument('archive', help="The decoy archive")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.models:
+        scores = read_rosetta_scores(args.score_file) if args.score_file else None
+        archive = DecoyArchive.create(args.archive, model_source.ModelSource(args.models), metadata=scores)
+        logger.info("Wrote %d models to: %s", len(archive), args.archive)
+    if args.export:
+        paths = DecoyArchive(args.archive).export(args.export)
+        logger.info("Exported %d models to: %s", len(paths), args.export)
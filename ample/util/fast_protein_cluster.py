@@ -30,16 +30,15 @@ class FPC(object):
             msg = "Cannot work with more than {0} clusters, got: {1}.".format(FPC_NUM_CLUSTERS,num_clusters)
             raise RuntimeError(msg)
   
-        owd=os.getcwd()
+        work_dir=os.path.abspath(work_dir)
         if not os.path.isdir(work_dir): os.mkdir(work_dir)
-        os.chdir(work_dir)
         
         if not len(models) or not all([os.path.isfile(m) for m in models]):
             msg = "Missing models: {0}".format(models)
             raise RuntimeError(msg)
         
         # Create list of files
-        flist='files.list'
+        flist=os.path.join(work_dir,'files.list')
         with open(flist,'w') as f:
             for m in models:
                 f.write("{0}\n".format(os.path.abspath(m)))
@@ -77,14 +76,14 @@ class FPC(object):
         # Finally the list of files
         cmd += ['-i',flist]
         
-        logfile=os.path.abspath("fast_protein_cluster.log")
-        retcode = ample_util.run_command(cmd,logfile=logfile)
+        logfile=os.path.join(work_dir,"fast_protein_cluster.log")
+        retcode = ample_util.run_command(cmd,logfile=logfile,directory=work_dir)
         if retcode != 0:
             msg = "non-zero return code for fast_protein_cluster in cluster!\nCheck logfile:{0}".format(logfile)
             raise RuntimeError(msg)
     
-        cluster_list='cluster_output.clusters'
-        cluster_stats='cluster_output.cluster.stats'
+        cluster_list=os.path.join(work_dir,'cluster_output.clusters')
+        cluster_stats=os.path.join(work_dir,'cluster_output.cluster.stats')
         if not os.path.isfile(cluster_list) or not os.path.isfile(cluster_stats):
             msg = "Cannot find files: {0} and {1}".format(cluster_list,cluster_stats)
             raise RuntimeError(msg)
@@ -142,5 +141,4 @@ class FPC(object):
             cluster.centroid = centroids[i]
             cluster.num_clusters = num_clusters
             cluster.models = all_clusters[i]
-        os.chdir(owd)
         return clusters
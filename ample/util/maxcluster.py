@@ -103,11 +103,10 @@ class Maxcluster(object):
         
         logfile = os.path.join( self.workdir, "maxclusterD.log" )
         self.runCompareDirectory( nativePdb=nativePdb, modelsDirectory=modelsDirectory, logfile=logfile )
-        self.parseLogDirectory( logfile=logfile )
 
         return
 
-    def compareModelList(self, nativePdbInfo=None, resSeqMap=None, models=None, workdir=None):
+    def compareModelList(self, nativePdbInfo=None, resSeqMap=None, models=None, workdir=None, keep_log=True):
 
         self.data = []
         self.workdir = workdir
@@ -117,13 +116,13 @@ class Maxcluster(object):
         #refModel = os.path.join( modelsDirectory, "S_00000001.pdb" )
         nativePdb = self.prepareNative(nativePdbInfo=nativePdbInfo, resSeqMap=resSeqMap)
 
-        logfile = os.path.join(self.workdir, "maxclusterD.log")
+        logfile = os.path.join(self.workdir, "maxclusterD.log") if keep_log else None
         self.run_compare_model_list(nativePdb=nativePdb, models=models, logfile=logfile)
-        self.parseLogDirectory(logfile=logfile)
 
         return
     
-    def compareSingle(self, nativePdb=None, modelPdb=None, sequenceIndependant=True, rmsd=False, workdir=None ):
+    def compareSingle(self, nativePdb=None, modelPdb=None, sequenceIndependant=True, rmsd=False, workdir=None,
+                      keep_log=True):
 
         self.workdir = workdir
         if not self.workdir:
@@ -145,17 +144,17 @@ class Maxcluster(object):
             logfile = os.path.splitext( logfile )[0] + "_rmsd.log"
         else:
             logfile = os.path.splitext( logfile )[0] + ".log"
-        self.maxclusterLogfile = logfile
+        self.maxclusterLogfile = logfile if keep_log else None
         
-        retcode = ample_util.run_command( cmd, logfile=self.maxclusterLogfile, dolog=False )
+        # The output is parsed as maxcluster writes it
+        with ample_util.CommandOutput(cmd, logfile=self.maxclusterLogfile) as output:
+            if rmsd:
+                data = self._parse_single_rmsd_lines(output)
+            else:
+                data = self._parse_single_tm_lines(output)
         
-        if retcode != 0:
-            print("non-zero return code for maxcluster in runMaxcluster!")
-        
-        if rmsd:
-            data = self.parseLogSingleRmsd()
-        else:
-            data = self.parseLogSingleTm()
+        if output.returncode != 0:
+            print(output.error_message("non-zero return code for maxcluster in runMaxcluster!"))
         
         return data
         
@@ -191,11 +190,18 @@ class Maxcluster(object):
         
     def parseLogDirectory(self, logfile=None ):
         
-        self.data = []
         assert logfile
+        with open( logfile, 'r' ) as f:
+            self.data = list( self._parse_directory_lines( f ) )
+        
+        return
+
+    @staticmethod
+    def _parse_directory_lines(lines):
+        """Yield the scores of each model from the lines of maxcluster output comparing a list of models"""
         
         #INFO  : 1000. 2XOV_clean_ren.pdb vs. /media/data/shared/TM/2XOV/models/S_00000444.pdb  Pairs=  36, RMSD= 3.065, MaxSub=0.148, TM=0.192, MSI=0.148
-        for line in open( logfile, 'r' ):
+        for line in lines:
             
             if re.match( "INFO *: .* vs\. .* Pairs=", line ):
                 
@@ -237,9 +243,7 @@ class Maxcluster(object):
                 assert label == "MSI"
                 d['msi'] = float( value )
                 
-                self.data.append( d )
-                
-        return
+                yield d
 
     def parseLogSingleTm(self, logfile=None):
         
@@ -248,8 +252,15 @@ class Maxcluster(object):
         
         assert logfile
         
+        with open( logfile, 'r' ) as f:
+            return self._parse_single_tm_lines( f )
+
+    @staticmethod
+    def _parse_single_tm_lines(lines):
+        """Return the scores from the lines of maxcluster output comparing a single model"""
+        
         d = {}
-        for line in open( logfile, 'r' ):
+        for line in lines:
             
             line = line.strip()
             #"Iter 1: Pairs=  14, RMSD= 0.155, MAXSUB=0.855. Len=  15. gRMSD= 0.673, TM=0.858
@@ -297,10 +308,17 @@ class Maxcluster(object):
         
         assert logfile
         
+        with open(logfile, 'r') as f:
+            return self._parse_single_rmsd_lines(f)
+
+    @staticmethod
+    def _parse_single_rmsd_lines(lines):
+        """Return the RMSD from the lines of maxcluster -rmsd output comparing a single model"""
+        
         d = {}
         
         #INFO  : 1000. 2XOV_clean_ren.pdb vs. /media/data/shared/TM/2XOV/models/S_00000444.pdb  Pairs=  36, RMSD= 3.065, MaxSub=0.148, TM=0.192, MSI=0.148
-        for line in open(logfile, 'r'):
+        for line in lines:
             
             line = line.strip()
             
@@ -357,10 +375,7 @@ class Maxcluster(object):
             f.write( os.linesep.join( l ) )
             
         cmd = [self.maxclusterExe, "-e", nativePdb, "-l", pdblist]
-        retcode = ample_util.run_command(cmd, logfile=logfile, dolog=True)
-        
-        if retcode != 0:
-            raise RuntimeError("non-zero return code for maxcluster in runMaxcluster!")
+        self._run_model_list(cmd, logfile)
 
     def run_compare_model_list(self, nativePdb=None, models=None, logfile=None):
 
@@ -370,11 +385,15 @@ class Maxcluster(object):
             f.write(os.linesep.join(models))
 
         cmd = [self.maxclusterExe, "-e", nativePdb, "-l", pdblist]
-        retcode = ample_util.run_command(cmd, logfile=logfile, dolog=True)
-
-        if retcode != 0:
-            raise RuntimeError("non-zero return code for maxcluster in runMaxcluster!")
+        self._run_model_list(cmd, logfile)
      
+    def _run_model_list(self, cmd, logfile):
+        """Run maxcluster on a list of models, setting the data from its output as it is written"""
+        with ample_util.CommandOutput(cmd, logfile=logfile) as output:
+            self.data = list(self._parse_directory_lines(output))
+        if output.returncode != 0:
+            raise RuntimeError(output.error_message("non-zero return code for maxcluster in runMaxcluster!"))
+
     def tmSorted(self, reverse=True ):
         return sorted(self.data, key=lambda data: data['tm'], reverse=reverse)
 
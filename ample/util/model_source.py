@@ -0,0 +1,182 @@
+"""Sources of model files that are read in a single streaming pass
+
+A :obj:`ModelSource` gives the name and contents of each model in a directory, a tar or zip archive or a
+:obj:`DecoyArchive <ample.util.decoy_archive.DecoyArchive>` in turn, without extracting the archive first. Models are only written to disk when a path is needed,
+and :meth:`ModelSource.load` checks the models and reads their coordinates in the same pass.
+"""
+
+__author__ = "Jens Thomas, and Felix Simkovic"
+__date__ = "17 Oct 2026"
+__version__ = "1.0"
+
+import logging
+import os
+import tarfile
+import zipfile
+
+from ample.util import coordinate_store as coordinate_store_module
+from ample.util import decoy_archive
+from ample.util import pdb_reader
+
+logger = logging.getLogger(__name__)
+
+TAR_SUFFIXES = ['.tar.gz', '.tgz', '.tar.bz', '.tar.bz2', '.tbz']
+ZIP_SUFFIXES = ['.zip']
+MODEL_SUFFIXES = ['.pdb', '.PDB']
+
+
+def archive_suffix(path):
+    """Return the suffix of an archive, including the .tar of compressed tar files"""
+    name, suffix = os.path.splitext(path)
+    if suffix in ['.gz', '.bz', '.bz2']:
+        name, suffix2 = os.path.splitext(name)
+        if suffix2 == '.tar':
+            suffix = suffix2 + suffix
+    return suffix
+
+
+class ModelSource(object):
+    """The model files in a directory, a tar or zip archive or a decoy archive
+
+    Parameters
+    ----------
+    path : str
+       The directory or archive
+    suffixes : list
+       Only use the files with these suffixes
+    filenames : list, optional
+       Only use the files with these names (without any directory)
+    """
+
+    def __init__(self, path, suffixes=None, filenames=None):
+        self.path = path
+        self.suffixes = MODEL_SUFFIXES if suffixes is None else suffixes
+        self.filenames = filenames
+        if os.path.isdir(path):
+            self.kind = 'directory'
+        elif not os.path.isfile(path):
+            raise RuntimeError("Cannot find models file: {0}".format(path))
+        elif decoy_archive.is_decoy_archive(path):
+            self.kind = 'decoys'
+        elif archive_suffix(path) in TAR_SUFFIXES:
+            self.kind = 'tar'
+        elif archive_suffix(path) in ZIP_SUFFIXES:
+            if not zipfile.is_zipfile(path):
+                raise RuntimeError("File is not a valid zip archive: {0}".format(path))
+            self.kind = 'zip'
+        else:
+            suffixes = TAR_SUFFIXES + ZIP_SUFFIXES + [decoy_archive.DECOY_ARCHIVE_SUFFIX]
+            msg = "Do not know how to extract files from file: {0}\n " \
+                  "Acceptable file types are: {1}".format(path, suffixes)
+            raise RuntimeError(msg)
+
+    def _wanted(self, name):
+        if self.filenames:
+            return os.path.basename(name) in self.filenames
+        return not self.suffixes or os.path.splitext(name)[1] in self.suffixes
+
+    def __iter__(self):
+        """Yield the name (without any directory) and contents of each model in turn"""
+        if self.kind == 'directory':
+            for name in sorted(os.listdir(self.path)):
+                path = os.path.join(self.path, name)
+                if self._wanted(name) and os.path.isfile(path):
+                    with open(path, 'rb') as f:
+                        yield name, f.read()
+        elif self.kind == 'decoys':
+            archive = decoy_archive.DecoyArchive(self.path)
+            for name in archive.names:
+                if self._wanted(name):
+                    yield name, archive.pdb_string(name)
+        elif self.kind == 'tar':
+            # Stream mode reads the members in order without seeking back through the archive
+            tf = tarfile.open(self.path, 'r|*')
+            try:
+                for member in tf:
+                    if member.isfile() and self._wanted(member.name):
+                        yield os.path.basename(member.name), tf.extractfile(member).read()
+            finally:
+                tf.close()
+        else:
+            zf = zipfile.ZipFile(self.path)
+            try:
+                for info in zf.infolist():
+                    if not info.filename.endswith('/') and self._wanted(info.filename):
+                        yield os.path.basename(info.filename), zf.read(info)
+            finally:
+                zf.close()
+
+    def names(self):
+        """Return the names of the models"""
+        return [name for name, _ in self]
+
+    def write(self, directory, names=None):
+        """Write the models (or only those in names) to directory in a single pass, returning their paths"""
+        if not os.path.isdir(directory):
+            os.mkdir(directory)
+        paths = []
+        for name, data in self:
+            if names is None or name in names:
+                paths.append(write_model(directory, name, data))
+        return paths
+
+    def load(self, directory=None, check=None, coordinate_store=None):
+        """Read each model once, checking it and adding its residues to a coordinate store
+
+        Parameters
+        ----------
+        directory : str
+           The directory to write the models to - if None the models are not written, which is only
+           possible for a directory of models as the models need a path
+        check : callable, optional
+           A function taking the :obj:`PdbAtoms <ample.util.pdb_reader.PdbAtoms>` of a model and returning
+           the result of checking it, such as :func:`pdb_edit.check_pdb_atoms <ample.util.pdb_edit.check_pdb_atoms>`
+        coordinate_store : :obj:`CoordinateStore <ample.util.coordinate_store.CoordinateStore>`, optional
+           A store to add the residues of the models to. Models that cannot be read or have no residues are
+           not added.
+
+        Returns
+        -------
+        tuple
+           The paths to the models and a dict of the results of check keyed by path (empty if check is None)
+        """
+        if directory is None and self.kind != 'directory':
+            raise RuntimeError("Need a directory to write the models in archive {0} to".format(self.path))
+        if directory and not os.path.isdir(directory):
+            os.mkdir(directory)
+        paths, checked, stored, residues = [], {}, [], []
+        for name, data in self:
+            if directory:
+                path = write_model(directory, name, data)
+            else:
+                path = os.path.abspath(os.path.join(self.path, name))
+            paths.append(path)
+            if check is None and coordinate_store is None:
+                continue
+            try:
+                reader = pdb_reader.PdbAtoms.from_string(data)
+            except ValueError as e:
+                # Left for the full check to report
+                logger.debug("Cannot read coordinates from model %s: %s", path, e)
+                continue
+            if check is not None:
+                checked[path] = check(reader)
+            if coordinate_store is not None:
+                model_residues = coordinate_store_module.residues_from_atoms(reader.model(0))
+                if model_residues:
+                    stored.append(path)
+                    residues.append(model_residues)
+        if not paths:
+            raise RuntimeError("Could not find any models in: {0}".format(self.path))
+        if coordinate_store is not None:
+            coordinate_store.add_models(stored, model_residues=residues)
+        logger.info("Read %d models from: %s", len(paths), self.path)
+        return paths, checked
+
+
+def write_model(directory, name, data):
+    """Write the contents of a model to directory, returning its path"""
+    path = os.path.abspath(os.path.join(directory, name))
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
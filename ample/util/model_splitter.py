@@ -0,0 +1,132 @@
+"""Streaming splitter for PDB files holding many models, such as QUARK decoys and NMR ensembles
+
+The file is memory-mapped and each model is written out as soon as it has been read, so only one
+model is held in memory however large the file is.
+"""
+
+__author__ = "Jens Thomas, and Felix Simkovic"
+__date__ = "17 Oct 2026"
+__version__ = "1.0"
+
+import logging
+import os
+import re
+
+from ample.util import coordinate_store as coordinate_store_module
+from ample.util import pdb_reader
+
+logger = logging.getLogger(__name__)
+
+# Records copied from the header of the file to the top of each model
+CRYSTAL_RECORDS = ('CRYST1', 'SCALE1', 'SCALE2', 'SCALE3')
+# QUARK decoys have no chain ID or occupancies, so the ATOM records are given chain A and these columns 55-80
+QUARK_COLUMNS = "  1.00  0.00              "
+
+_MODEL = re.compile(r'^MODEL (.*)$', re.MULTILINE)
+_CRYSTAL = re.compile(r'^(?:{0}).*\n'.format('|'.join(CRYSTAL_RECORDS)), re.MULTILINE)
+
+
+def _strip_hetatm(lines):
+    """Remove the HETATM records, and any ANISOU records following them"""
+    stripped = []
+    hetatm = False
+    for line in lines:
+        if line.startswith('HETATM'):
+            hetatm = True
+        elif not (hetatm and line.startswith('ANISOU')):
+            hetatm = False
+            stripped.append(line)
+    return stripped
+
+
+def _num_residues(atoms):
+    """Return the number of residues in the first chain of the atoms of a model"""
+    if not len(atoms):
+        return 0
+    chain_starts, _ = pdb_reader.runs(atoms['chainID'])
+    if len(chain_starts) > 1:
+        atoms = atoms[:chain_starts[1]]
+    return len(pdb_reader.residue_runs(atoms)[0])
+
+
+def split_models(pdbin, model_path, quark=False, strip_hetatm=False, same_size=False, coordinate_store=None,
+                 write_models=True):
+    """Split a pdb file into its models, one model at a time
+
+    Parameters
+    ----------
+    pdbin : str
+       The pdb file, with each model ended by an ENDMDL record
+    model_path : callable
+       A function taking the index of a model (from 0) and its MODEL serial number (or the index
+       from 1 if it has no MODEL record) as a string and returning the path to write the model to
+    quark : bool
+       Write each model exactly as it is in the file, but with chain A, occupancy 1 and B-factor 0
+       for the ATOM records, as for QUARK decoys. Otherwise each model is written with the CRYST1 and
+       SCALE records of the header and remarks giving its origin.
+    strip_hetatm : bool
+       Remove the HETATM records
+    same_size : bool
+       Only keep the models with the largest number of residues in the first chain of the atoms written
+    coordinate_store : :obj:`CoordinateStore <ample.util.coordinate_store.CoordinateStore>`, optional
+       A store to add the residues of the models to
+    write_models : bool
+       Write the model files - if False the models are only added to the coordinate_store
+
+    Returns
+    -------
+    list
+       The paths to the models
+    """
+    if not (write_models or coordinate_store is not None):
+        raise RuntimeError("Need to write the models or add them to a coordinate store")
+    nmodels = pdb_reader.count_records(pdbin, 'ENDMDL')
+    paths, sizes, residues = [], [], []
+    crystal = []
+    for idx, block in enumerate(pdb_reader.model_blocks(pdbin)):
+        model = _MODEL.search(block)
+        if idx == 0 and not quark and model:
+            crystal = _CRYSTAL.findall(block, 0, model.start())
+        model_id = str(idx + 1)
+        if model and model.group(1).strip():
+            model_id = model.group(1).strip()
+        path = model_path(idx, model_id)
+
+        if same_size or coordinate_store is not None:
+            atoms = pdb_reader.PdbAtoms.from_string(block, hetatm=not strip_hetatm).model(0)
+            sizes.append(_num_residues(atoms))
+            if coordinate_store is not None:
+                residues.append(coordinate_store_module.residues_from_atoms(atoms))
+
+        if quark:
+            block = "".join([line[:21] + 'A' + line[22:54] + QUARK_COLUMNS + "\n" if line.startswith('ATOM') else line
+                             for line in block.splitlines(True)])
+        elif model:
+            block = block[model.start():]
+        if strip_hetatm:
+            block = "".join(_strip_hetatm(block.splitlines(True)))
+        if write_models:
+            with open(path, 'w') as f:
+                if not quark:
+                    f.writelines(crystal)
+                    f.write("REMARK Model {0} of {1}\n".format(idx + 1, nmodels))
+                    f.write("REMARK Original file:\n")
+                    f.write("REMARK   {0}\n".format(pdbin))
+                f.write(block)
+                if not quark:
+                    f.write("END\n")
+            logger.debug("Wrote: %s", path)
+        paths.append(path)
+
+    if same_size and len(set(sizes)) > 1:
+        # The models were of different lengths
+        keep = [size == max(sizes) for size in sizes]
+        logger.debug('All models were not of the same length, only %d will be kept.', sum(keep))
+        if write_models:
+            for path in (p for p, k in zip(paths, keep) if not k):
+                os.unlink(path)
+        paths = [p for p, k in zip(paths, keep) if k]
+        residues = [r for r, k in zip(residues, keep) if k]
+    if coordinate_store is not None:
+        coordinate_store.add_models(paths, model_residues=residues)
+    return paths
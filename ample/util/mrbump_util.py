@@ -497,6 +497,25 @@ def checkSuccess(script_path):
         return False
 
 
+def remove_job_directory(script_path):
+    """Remove the MRBUMP search directory of a job that was killed.
+
+    Parameters
+    ----------
+    script_path : str
+       Path to the MrBUMP script
+
+    """
+    directory, script = os.path.split(script_path)
+    scriptname = os.path.splitext(script)[0]
+    for jobdir in [os.path.join(directory, 'search_' + scriptname + '_mrbump'),
+                   os.path.join(directory, 'search_' + scriptname)]:
+        if os.path.isdir(jobdir):
+            logger.debug("Removing directory of killed job: %s", jobdir)
+            shutil.rmtree(jobdir, ignore_errors=True)
+    return
+
+
 def finalSummary(amoptd):
     """Print a final summary of the job"""
     
@@ -11,12 +11,14 @@ import shutil
 
 from ample.constants import AMPLE_PKL
 from ample.ensembler.constants import  SUBCLUSTER_RADIUS_THRESHOLDS, SIDE_CHAIN_TREATMENTS, \
-    ALLOWED_SIDE_CHAIN_TREATMENTS, SPICKER_RMSD, SPICKER_TM, POLYALA, RELIABLE, ALLATOM
+    ALLOWED_SIDE_CHAIN_TREATMENTS, SPICKER_RMSD, SPICKER_TM, SPICKER_NUMPY_RMSD, SPICKER_NUMPY_TM, POLYALA, \
+    RELIABLE, ALLATOM
 from ample.modelling import rosetta_model
 from ample.util import ample_util
 from ample.util import contact_util
 from ample.util import exit_util
 from ample.util import maxcluster
+from ample.util import model_source
 from ample.util import mrbump_util
 from ample.util import mtz_util
 from ample.util import pdb_edit
@@ -133,7 +135,7 @@ def process_ensemble_options(optd):
             optd['fast_protein_cluster_exe'] = ample_util.find_exe(optd['fast_protein_cluster_exe'])
         except ample_util.FileNotFoundError:
             raise RuntimeError("Cannot find fast_protein_cluster executable: {0}".format(optd['fast_protein_cluster_exe']))
-    elif optd['cluster_method'] in ['import', 'random', 'skip']:
+    elif optd['cluster_method'] in [SPICKER_NUMPY_RMSD, SPICKER_NUMPY_TM, 'import', 'random', 'skip']:
         pass
     else:
         raise RuntimeError("Unrecognised cluster_method: {0}".format(optd['cluster_method']))
@@ -271,6 +273,8 @@ def process_modelling_options(optd):
                               "Please supply the models with the -models flag")
         optd['import_models'] = True
     elif optd['models']:
+        # Raises if the models are not a directory or an archive they can be read from
+        model_source.ModelSource(optd['models'])
         optd['import_models'] = True
         optd['make_frags'] = False
         optd['make_models'] = False
@@ -500,7 +504,8 @@ def process_restart_options(optd):
         elif 'models_dir' in optd and optd['models_dir'] and os.path.isdir(optd['models_dir']):
             logger.info('Restarting from existing models: %s', optd['models_dir'])
             allsame = False if optd['homologs'] else True
-            if not pdb_edit.check_pdb_directory(optd['models_dir'], sequence=None, single=True, allsame=allsame):
+            if not pdb_edit.check_pdb_directory(optd['models_dir'], sequence=None, single=True, allsame=allsame,
+                                                nproc=optd['nproc']):
                 raise RuntimeError("Error importing restart models: {0}".format(optd['models_dir']))
             optd['make_ensembles'] = True
         elif optd['frags_3mers'] and optd['frags_9mers']:
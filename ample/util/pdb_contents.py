@@ -0,0 +1,105 @@
+"""Counts of the atoms and residues and the molecular weight of a PDB file, in place of running rwcontents
+
+The contents are calculated from the atoms read by :obj:`PdbAtoms <ample.util.pdb_reader.PdbAtoms>` with tables
+of the element masses and the number of hydrogens bonded to each atom of the amino acids, rather than running
+rwcontents and reading its log. Only the amino acid residues are counted. Each atom is counted once whatever its
+occupancy, with only the most probable conformation of residues with alternate conformations. The hydrogens in
+the file are replaced by those of the table, so a residue with a truncated side chain only has the hydrogens of
+the atoms it still has.
+"""
+
+__author__ = "Jens Thomas, and Felix Simkovic"
+__date__ = "17 Oct 2026"
+__version__ = "1.0"
+
+import logging
+
+import numpy
+
+from ample.util import pdb_reader
+from ample.util import pdb_transform
+
+logger = logging.getLogger(__name__)
+
+# Standard atomic weights
+ELEMENT_MASSES = {
+    'H': 1.008, 'D': 2.014, 'C': 12.011, 'N': 14.007, 'O': 15.999, 'F': 18.998, 'NA': 22.990, 'MG': 24.305,
+    'P': 30.974, 'S': 32.06, 'CL': 35.45, 'K': 39.098, 'CA': 40.078, 'MN': 54.938, 'FE': 55.845, 'CO': 58.933,
+    'NI': 58.693, 'CU': 63.546, 'ZN': 65.38, 'SE': 78.971, 'BR': 79.904, 'CD': 112.414, 'I': 126.904,
+    'HG': 200.592,
+}
+HYDROGEN_MASS = ELEMENT_MASSES['H']
+# The backbone hydrogens of an amino acid in a chain
+_BACKBONE_HYDROGENS = {'N': 1, 'CA': 1, 'C': 0, 'O': 0}
+# The number of hydrogens bonded to each atom of the amino acids in a chain (uncharged). Any other atoms
+# (such as OXT) have none.
+ATOM_HYDROGENS = {
+    'ALA': dict(_BACKBONE_HYDROGENS, CB=3),
+    'ARG': dict(_BACKBONE_HYDROGENS, CB=2, CG=2, CD=2, NE=1, CZ=0, NH1=2, NH2=1),
+    'ASN': dict(_BACKBONE_HYDROGENS, CB=2, CG=0, OD1=0, ND2=2),
+    'ASP': dict(_BACKBONE_HYDROGENS, CB=2, CG=0, OD1=0, OD2=1),
+    'CYS': dict(_BACKBONE_HYDROGENS, CB=2, SG=1),
+    'GLN': dict(_BACKBONE_HYDROGENS, CB=2, CG=2, CD=0, OE1=0, NE2=2),
+    'GLU': dict(_BACKBONE_HYDROGENS, CB=2, CG=2, CD=0, OE1=0, OE2=1),
+    'GLY': dict(_BACKBONE_HYDROGENS, CA=2),
+    'HIS': dict(_BACKBONE_HYDROGENS, CB=2, CG=0, ND1=1, CD2=1, CE1=1, NE2=0),
+    'ILE': dict(_BACKBONE_HYDROGENS, CB=1, CG1=2, CG2=3, CD1=3),
+    'LEU': dict(_BACKBONE_HYDROGENS, CB=2, CG=1, CD1=3, CD2=3),
+    'LYS': dict(_BACKBONE_HYDROGENS, CB=2, CG=2, CD=2, CE=2, NZ=2),
+    'MET': dict(_BACKBONE_HYDROGENS, CB=2, CG=2, SD=0, CE=3),
+    'MSE': dict(_BACKBONE_HYDROGENS, CB=2, CG=2, SE=0, CE=3),
+    'PHE': dict(_BACKBONE_HYDROGENS, CB=2, CG=0, CD1=1, CD2=1, CE1=1, CE2=1, CZ=1),
+    'PRO': dict(_BACKBONE_HYDROGENS, N=0, CB=2, CG=2, CD=2),
+    'SER': dict(_BACKBONE_HYDROGENS, CB=2, OG=1),
+    'THR': dict(_BACKBONE_HYDROGENS, CB=1, OG1=1, CG2=3),
+    'TRP': dict(_BACKBONE_HYDROGENS, CB=2, CG=0, CD1=1, CD2=0, NE1=1, CE2=0, CE3=1, CZ2=1, CZ3=1, CH2=1),
+    'TYR': dict(_BACKBONE_HYDROGENS, CB=2, CG=0, CD1=1, CD2=1, CE1=1, CE2=1, CZ=0, OH=1),
+    'VAL': dict(_BACKBONE_HYDROGENS, CB=1, CG1=3, CG2=3),
+}
+# The number of hydrogens of each complete amino acid in a chain
+AMINO_ACID_HYDROGENS = dict((resname, sum(atoms.values())) for resname, atoms in ATOM_HYDROGENS.items())
+
+
+def contents(atoms):
+    """Return the number of atoms, the number of amino acid residues and the molecular weight of the protein
+
+    Parameters
+    ----------
+    atoms : :obj:`numpy.ndarray`
+       The atoms of a model, as read by :obj:`PdbAtoms <ample.util.pdb_reader.PdbAtoms>`
+
+    Returns
+    -------
+    tuple
+       The number of atoms of the amino acids including their hydrogens, the number of amino acid residues and
+       the molecular weight of the amino acids in Daltons
+    """
+    atoms = atoms[numpy.in1d(atoms['resName'], list(ATOM_HYDROGENS))]
+    atoms = atoms[pdb_transform.most_probable(atoms)]
+    if not len(atoms):
+        return 0, 0, 0.0
+    elements = pdb_transform.element_symbols(atoms)
+    atoms = atoms[~numpy.in1d(elements, ['H', 'D'])]
+    elements = elements[~numpy.in1d(elements, ['H', 'D'])]
+
+    keys = numpy.zeros(len(atoms), dtype=[('chainID', 'S1'), ('resSeq', 'i4'), ('iCode', 'S1')])
+    for name in keys.dtype.names:
+        keys[name] = atoms[name]
+    starts, _ = pdb_reader.runs(keys)
+    names = pdb_reader.atom_names(atoms)
+    nhydrogens = sum(ATOM_HYDROGENS[resname].get(name, 0) for resname, name in zip(atoms['resName'], names))
+
+    unknown = set(elements) - set(ELEMENT_MASSES)
+    if unknown:
+        logger.warning("Ignoring the mass of atoms of unknown elements: %s", sorted(unknown))
+    weight = sum(ELEMENT_MASSES.get(element, 0.0) for element in elements) + nhydrogens * HYDROGEN_MASS
+    return len(atoms) + nhydrogens, len(starts), float(weight)
+
+
+def pdb_contents(pdbin):
+    """Return the contents of the first model of a pdb file (see :func:`contents`)"""
+    try:
+        reader = pdb_reader.PdbAtoms.from_file(pdbin)
+    except (IOError, ValueError) as e:
+        raise RuntimeError("Cannot read the atoms of pdb file {0}: {1}".format(pdbin, e))
+    return contents(reader.model(0))
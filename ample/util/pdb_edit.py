@@ -4,21 +4,27 @@ Useful manipulations on PDB files
 '''
 
 # Python imports
-from collections import defaultdict
 import copy
 import glob
 import logging
+import multiprocessing
 import os
 import re
+import shutil
 import sys
 import unittest
 
-import iotbx.file_reader
 import iotbx.pdb
+import numpy
 #iotbx.pdb.amino_acid_codes.one_letter_given_three_letter
 
 import ample_util
+import cache_util
+import model_splitter
+import pdb_contents
 import pdb_model
+import pdb_reader
+import pdb_transform
 import residue_map
 import sequence_util
 
@@ -52,43 +58,62 @@ one2three = dict((v, k) for (k, v) in three2one.items())
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of parsed pdb files kept in memory by hierarchy_cache
+HIERARCHY_CACHE_SIZE = 32
+# Maximum number of pdb files checked by each task of the check_pdbs process pool
+CHECK_PDBS_CHUNKSIZE = 50
 
-def backbone(inpath=None, outpath=None):
-    """Only output backbone atoms.
-    """
+# Residues that cctbx always counts as protein
+STANDARD_RESIDUES = set(r for r in three2one if r != 'UNK')
+# Atoms kept by the polyala side chain treatment
+BACKBONE_ATOMS = ['N', 'CA', 'C', 'O', 'CB']
+# Residues truncated to their CB by the reliable side chain treatment
+UNRELIABLE_SIDE_CHAINS = ['MET', 'ASP', 'PRO', 'GLN', 'LYS', 'ARG', 'GLU', 'SER']
 
-    # pdbcur segfaults with long pathnames
-    inpath = os.path.relpath(inpath)
-    outpath = os.path.relpath(outpath)
 
-    logfile = outpath + ".log"
-    cmd = "pdbcur xyzin {0} xyzout {1}".format(inpath, outpath).split()
+def _read_pdb_input(pdbin):
+    pdb_input = iotbx.pdb.pdb_input(file_name=pdbin)
+    return pdb_input, pdb_input.construct_hierarchy()
 
-    stdin = 'lvatom "N,CA,C,O,CB[N,C,O]"'
-    retcode = ample_util.run_command(cmd=cmd, logfile=logfile, directory=os.getcwd(), dolog=False, stdin=stdin)
 
-    if retcode == 0:
-        os.unlink(logfile)
-    else:
-        raise RuntimeError("Error stripping PDB to backbone atoms. See log:{0}".format(logfile))
+# Parsed pdb files, so that a file is only parsed once however many functions read it
+hierarchy_cache = cache_util.FileCache(_read_pdb_input, max_entries=HIERARCHY_CACHE_SIZE)
 
 
-def calpha_only(inpdb, outpdb):
-    """Strip PDB to c-alphas only"""
+def _read_hierarchy(pdbin, copy=False):
+    """Return the pdb_input and hierarchy of a pdb file, parsing the file only if it is not in hierarchy_cache
 
-    logfile = outpdb + ".log"
-    cmd = "pdbcur xyzin {0} xyzout {1}".format(inpdb, outpdb).split()
+    The cached hierarchy is shared, so any caller that modifies it must set copy to get a deep copy.
+    """
+    pdb_input, hierarchy = hierarchy_cache.get(pdbin)
+    if copy:
+        hierarchy = hierarchy.deep_copy()
+    return pdb_input, hierarchy
 
-    stdin = 'lvatom "CA[C]:*"'
-    retcode = ample_util.run_command(cmd=cmd, logfile=logfile, directory=os.getcwd(), dolog=False, stdin=stdin)
 
-    if retcode == 0:
-        os.unlink(logfile)
-    else:
-        raise RuntimeError("Error stripping PDB to c-alpha atoms")
+def _read_records(pdbin):
+    """Read the coordinate records of a pdb for editing with pdb_transform"""
+    try:
+        return pdb_reader.PdbAtoms.from_file(pdbin)
+    except (IOError, ValueError) as e:
+        raise RuntimeError("Error reading pdb {0}: {1}".format(pdbin, e))
+
+
+def backbone(inpath=None, outpath=None):
+    """Only output backbone atoms.
+    """
+    reader = _read_records(inpath)
+    keep = pdb_transform.select_atoms(reader.atoms, names=BACKBONE_ATOMS, elements=['N', 'C', 'O'])
+    pdb_transform.write(reader, outpath, keep=keep)
+
+
+def calpha_only(inpdb, outpdb):
+    """Strip PDB to c-alphas only"""
+    reader = _read_records(inpdb)
+    pdb_transform.write(reader, outpdb, keep=pdb_transform.select_atoms(reader.atoms, names=['CA'], elements=['C']))
 
 
-def check_pdb_directory(directory, single=True, allsame=True, sequence=None):
+def check_pdb_directory(directory, single=True, allsame=True, sequence=None, nproc=1, max_errors=None, checked=None):
     """Check a directory of pdb files to ensure they are valid
 
     Parameters
@@ -102,6 +127,12 @@ def check_pdb_directory(directory, single=True, allsame=True, sequence=None):
        if True check each pdb only contains a single model
     allsame : bool
        only extract a file if the suffix is in the list
+    nproc : int
+       the number of processes to check the pdbs with
+    max_errors : int
+       stop checking once this many invalid pdbs have been found
+    checked : dict
+       the results of :func:`check_pdb_atoms` for pdbs that have already been checked, keyed by their path
 
     Returns
     -------
@@ -118,12 +149,16 @@ def check_pdb_directory(directory, single=True, allsame=True, sequence=None):
         return False
     if not (single or sequence or allsame):
         return True
-    return check_pdbs(models, sequence=sequence, single=single, allsame=allsame)
+    return check_pdbs(models, sequence=sequence, single=single, allsame=allsame, nproc=nproc, max_errors=max_errors,
+                      checked=checked)
 
 
-def check_pdbs(models, single=True, allsame=True, sequence=None):
+def check_pdbs(models, single=True, allsame=True, sequence=None, nproc=1, max_errors=None, checked=None):
     """Check a list of PDB files to ensure they are valid
 
+    Most models are checked from their ATOM, MODEL and TER records alone by :func:`_check_pdb_records`;
+    any that it cannot decide are parsed with cctbx.
+
     Parameters
     ----------
     models : list
@@ -135,48 +170,71 @@ def check_pdbs(models, single=True, allsame=True, sequence=None):
        if True check each pdb only contains a single model
     allsame : bool
        only extract a file if the suffix is in the list
+    nproc : int
+       the number of processes to check the pdbs with
+    max_errors : int
+       stop checking once this many invalid pdbs have been found
+    checked : dict
+       the results of :func:`check_pdb_atoms` for pdbs that have already been checked (with the same
+       value of single and get_sequence True), keyed by their path. Only the pdbs it could not decide
+       are read again.
 
     Returns
     -------
     bool
         True if models all validated
     """
+    checked = dict((os.path.abspath(pdb), result) for pdb, result in (checked or {}).items() if result)
     if allsame and not sequence:
         # Get sequence from first model
-        try:
-            h = iotbx.pdb.pdb_input(models[0]).construct_hierarchy()
-        except Exception as e:
-            s = "*** ERROR reading sequence from first pdb: {0}\n{1}".format(models[0], e)
-            logger.critical(s)
-            return False
-        sequence = _sequence1(h)  # only one model/chain
+        first = checked.get(os.path.abspath(models[0])) if single else None
+        if not first:
+            first = _check_pdb_records(models[0], True, True)
+        if first and first[0] is None:
+            sequence = first[1]
+        else:
+            try:
+                _, h = _read_hierarchy(models[0])
+            except Exception as e:
+                s = "*** ERROR reading sequence from first pdb: {0}\n{1}".format(models[0], e)
+                logger.critical(s)
+                return False
+            sequence = _sequence1(h)  # only one model/chain
     errors = []
     multi = []
     no_protein = []
     sequence_err = []
     unnamed_chain = []
-    for pdb in models:
-        try:
-            h = iotbx.pdb.pdb_input(pdb).construct_hierarchy()
-        except Exception as e:
-            errors.append((pdb, e))
-            continue
-        if not single:
-            continue
-        if not (h.models_size() == 1 and h.models()[0].chains_size() == 1):
-            multi.append(pdb)
-            continue
-        # single chain from one model so check is protein
-        if not h.models()[0].chains()[0].is_protein():
-            no_protein.append(pdb)
-            continue
-        if not h.models()[0].chains()[0].id.strip():  # Check we have a named chain
-            unnamed_chain.append(pdb)
-            continue
-        if sequence:
-            s = _sequence1(h)  # only one chain/model
-            if not s == sequence:
-                sequence_err.append((pdb, s))
+    problems = {'multi': multi, 'no_protein': no_protein, 'unnamed_chain': unnamed_chain}
+    tasks = [(pdb, single, bool(sequence)) for pdb in models if os.path.abspath(pdb) not in checked]
+    nworkers = min(nproc or 1, len(tasks))
+    pool = None
+    if nworkers > 1:
+        logger.debug("Checking %d pdbs on %d processors", len(tasks), nworkers)
+        pool = multiprocessing.Pool(processes=nworkers)
+        chunksize = max(1, min(CHECK_PDBS_CHUNKSIZE, len(tasks) // (4 * nworkers)))
+        computed = pool.imap(_check_pdb, tasks, chunksize=chunksize)
+    else:
+        computed = (_check_pdb(task) for task in tasks)
+    # The computed results are in the same order as the models that were not already checked
+    results = (checked.get(os.path.abspath(pdb)) or next(computed) for pdb in models)
+    try:
+        for i, (problem, data) in enumerate(results):
+            pdb = models[i]
+            if problem == 'error':
+                errors.append((pdb, data))
+            elif problem:
+                problems[problem].append(pdb)
+            elif sequence and single and not data == sequence:
+                sequence_err.append((pdb, data))
+            if max_errors and len(errors) + len(multi) + len(no_protein) + len(unnamed_chain) + \
+                    len(sequence_err) >= max_errors:
+                logger.info("Stopped checking pdbs after finding %d invalid pdbs", max_errors)
+                break
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
 
     if not (len(errors) or len(multi) or len(sequence_err) or len(no_protein) or len(unnamed_chain)):
         logger.info("check_pdb_directory - pdb files all seem valid")
@@ -217,45 +275,123 @@ def check_pdbs(models, single=True, allsame=True, sequence=None):
     return False
 
 
-def extract_chain(inpdb, outpdb, chainID=None, newChainID=None, cAlphaOnly=False, renumber=True):
-    """Extract chainID from inpdb and renumner.
-    If cAlphaOnly is set, strip down to c-alpha atoms
+def _check_pdb(task):
+    """Check a pdb for check_pdbs, returning (problem, data)
+
+    problem is None for a valid pdb, in which case data is the sequence of its chain if one was asked for,
+    or one of the keys of the problems in check_pdbs, with data the error message for 'error'.
     """
-    logfile = outpdb + ".log"
-    cmd = "pdbcur xyzin {0} xyzout {1}".format(inpdb, outpdb).split()
+    pdbin, single, get_sequence = task
+    return _check_pdb_records(pdbin, single, get_sequence) or _check_pdb_hierarchy(pdbin, single, get_sequence)
+
+
+def _check_pdb_hierarchy(pdbin, single, get_sequence):
+    """Check a pdb for check_pdbs from its cctbx hierarchy, returning (problem, data) as for _check_pdb"""
+    try:
+        _, h = _read_hierarchy(pdbin)
+    except Exception as e:
+        # Exceptions from cctbx may not be picklable
+        return ('error', str(e))
+    if not single:
+        return (None, None)
+    if not (h.models_size() == 1 and h.models()[0].chains_size() == 1):
+        return ('multi', None)
+    # single chain from one model so check is protein
+    if not h.models()[0].chains()[0].is_protein():
+        return ('no_protein', None)
+    if not h.models()[0].chains()[0].id.strip():  # Check we have a named chain
+        return ('unnamed_chain', None)
+    if get_sequence:
+        return (None, _sequence1(h))  # only one chain/model
+    return (None, None)
+
+
+def _check_pdb_records(pdbin, single, get_sequence):
+    """Check a pdb for check_pdbs from its coordinate records without building a cctbx hierarchy
+
+    Only files that cctbx would certainly read the same way are checked: the atoms of a single model
+    with no HETATM records, alternate conformations, TER records between the atoms, two-character chain
+    IDs, changes of segment ID or non-standard residues. Models with more than one chain ID are reported
+    as having more than one chain.
 
-    stdin = "lvchain {0}\n".format(chainID)
-    if newChainID:
-        stdin += "renchain {0} {1}\n".format(chainID, newChainID)
-    if cAlphaOnly:
-        stdin += 'lvatom "CA[C]:*"\n'
-    if renumber:
-        stdin += "sernum\n"
+    Returns
+    -------
+    tuple
+       (problem, data) as for _check_pdb, or None if the pdb needs to be checked with cctbx
+    """
+    try:
+        reader = pdb_reader.PdbAtoms.from_file(pdbin)
+    except (IOError, ValueError):
+        return None
+    return check_pdb_atoms(reader, single, get_sequence)
 
-    retcode = ample_util.run_command(cmd=cmd, logfile=logfile, directory=os.getcwd(), dolog=False, stdin=stdin)
 
-    if retcode == 0:
-        os.unlink(logfile)
-    else:
-        raise RuntimeError("Error extracting chain {0}".format(chainID))
+def check_pdb_atoms(reader, single, get_sequence):
+    """Check the coordinate records of a pdb read by :obj:`PdbAtoms <ample.util.pdb_reader.PdbAtoms>`
 
+    This allows pdbs that are already in memory, such as the members of an archive, to be checked
+    as for :func:`_check_pdb_records`, which describes the pdbs that can be checked.
 
-def extract_model(inpdb, outpdb, modelID):
-    """Extract modelID from inpdb into outpdb"""
+    Returns
+    -------
+    tuple
+       (problem, data) as for _check_pdb, or None if the pdb needs to be checked with cctbx
+    """
+    atoms = reader.atoms
+    if not len(atoms) or len(reader.model_serials) > 1 or \
+            len(reader.model_serials) != len(reader.record_index('ENDMDL')):
+        return None
+    if numpy.any(atoms['record'] != 'ATOM  ') or numpy.any(atoms['altLoc'] != ' ') or \
+            numpy.any(reader.record_index('TER') < reader.atom_index[-1]):
+        return None
+    chars = reader.atom_lines.view(numpy.uint8).reshape(len(atoms), pdb_reader.LINE_LENGTH)
+    # Short lines are padded with nulls
+    segids = numpy.where(chars[:, 72:76] == 0, ord(' '), chars[:, 72:76])
+    if numpy.any((chars[:, 20] != ord(' ')) & (chars[:, 20] != 0)) or numpy.any(segids != segids[0]):
+        return None
+    starts, residue = pdb_reader.residue_runs(atoms)
+    resnames = atoms['resName'][starts]
+    if numpy.any(atoms['resName'] != resnames[residue]) or not set(resnames).issubset(STANDARD_RESIDUES):
+        return None
+    if not single:
+        return (None, None)
+    if numpy.any(atoms['chainID'] != atoms['chainID'][0]):
+        return ('multi', None)
+    if not atoms['chainID'][0].strip():
+        return ('unnamed_chain', None)
+    if get_sequence:
+        return (None, "".join(three2one[r] for r in resnames))
+    return (None, None)
 
-    assert modelID > 0
 
-    logfile = outpdb + ".log"
-    cmd = "pdbcur xyzin {0} xyzout {1}".format(inpdb, outpdb).split()
+def extract_chain(inpdb, outpdb, chainID=None, newChainID=None, cAlphaOnly=False, renumber=True):
+    """Extract chainID from inpdb and renumner.
+    If cAlphaOnly is set, strip down to c-alpha atoms
+    """
+    reader = _read_records(inpdb)
+    keep = pdb_transform.select_atoms(reader.atoms, chains=[chainID])
+    if not numpy.any(keep):
+        raise RuntimeError("Error extracting chain {0}".format(chainID))
+    if cAlphaOnly:
+        keep &= pdb_transform.select_atoms(reader.atoms, names=['CA'], elements=['C'])
+    if newChainID:
+        pdb_transform.rename_chains(reader, [chainID], [newChainID])
+    pdb_transform.write(reader, outpdb, keep=keep, renumber=renumber)
 
-    stdin = "lvmodel /{0}\n".format(modelID)
 
-    retcode = ample_util.run_command(cmd=cmd, logfile=logfile, directory=os.getcwd(), dolog=False, stdin=stdin)
+def extract_model(inpdb, outpdb, modelID):
+    """Extract modelID from inpdb into outpdb"""
 
-    if retcode != 0:
-        raise RuntimeError("Problem extracting model with cmd: {0}".format)
+    assert modelID > 0
 
-    os.unlink(logfile)
+    reader = _read_records(inpdb)
+    if modelID in reader.model_serials:
+        keep = reader.atoms['model'] == reader.model_serials.index(modelID)
+    elif not reader.model_serials and modelID == 1:
+        keep = None
+    else:
+        raise RuntimeError("Cannot find model {0} in pdb: {1}".format(modelID, inpdb))
+    pdb_transform.write(reader, outpdb, keep=keep)
 
 
 def extract_header_pdb_code(pdb_input):
@@ -277,23 +413,11 @@ def keep_matching(refpdb=None, targetpdb=None, outpdb=None, resSeqMap=None):
 
     assert refpdb and targetpdb and outpdb and resSeqMap
 
-    tmp1 = ample_util.tmp_file_name() + ".pdb"  # pdbcur insists names have a .pdb suffix
-
-    _keep_matching(refpdb, targetpdb, tmp1, resSeqMap=resSeqMap)
-
-    # now renumber with pdbcur
-    logfile = tmp1 + ".log"
-    cmd = "pdbcur xyzin {0} xyzout {1}".format(tmp1, outpdb).split()
-    stdint = """sernum
-"""
-    retcode = ample_util.run_command(cmd=cmd, logfile=logfile, directory=os.getcwd(), dolog=False, stdin=stdint)
-
-    if retcode == 0:
-        # remove temporary files
-        os.unlink(tmp1)
-        os.unlink(logfile)
+    _keep_matching(refpdb, targetpdb, outpdb, resSeqMap=resSeqMap)
 
-    return retcode
+    # now renumber the atoms
+    pdb_transform.write(_read_records(outpdb), outpdb, renumber=True)
+    return 0
 
 
 def _keep_matching(refpdb=None, targetpdb=None, outpdb=None, resSeqMap=None):
@@ -466,15 +590,10 @@ def get_info(inpath):
     info = pdb_model.PdbInfo()
     info.pdb = inpath
 
-    currentModel = None
-    currentChain = -1
-
-    modelAtoms = []  # list of models, each of which is a list of chains with the list of atoms
+    reader = pdb_reader.PdbAtoms.from_file(inpath, hetatm=False)
 
-    # Go through refpdb and find which ref_residues are present
-    f = open(inpath, 'r')
-    line = f.readline()
-    while line:
+    header = iter(reader.header)
+    for line in header:
 
         # First line of title
         if line.startswith('HEADER'):
@@ -482,19 +601,18 @@ def get_info(inpath):
 
         # First line of title
         if line.startswith('TITLE') and not info.title:
-            info.title = line[10:-1].strip()
+            info.title = line[10:].strip()
 
         if line.startswith("REMARK"):
 
             try:
                 numRemark = int(line[7:10])
             except ValueError:
-                line = f.readline()
                 continue
 
             # Resolution
             if numRemark == 2:
-                line = f.readline()
+                line = next(header, '')
                 if line.find("RESOLUTION") != -1:
                     try:
                         info.resolution = float(line[25:30])
@@ -509,7 +627,7 @@ def get_info(inpath):
                 # Clunky - read up to maxread lines to see if we can get the information we're after
                 # We assume the floats are at the end of the lines
                 for _ in range(maxread):
-                    line = f.readline()
+                    line = next(header, '')
                     if line.find("SOLVENT CONTENT") != -1:
                         try:
                             info.solventContent = float(line.split()[-1])
@@ -531,113 +649,64 @@ def get_info(inpath):
                 logger.critical("ERROR READING CRYST1 LINE in file %s\":%s\"\n%s", inpath, line.rstrip(), e)
                 info.crystalInfo = None
 
-        if line.startswith("MODEL"):
-            if currentModel:
-                # Need to make sure that we have an id if only 1 chain and none given
-                if len(currentModel.chains) <= 1:
-                    if currentModel.chains[0] == None:
-                        currentModel.chains[0] = 'A'
-
-                info.models.append(currentModel)
-
-            # New/first model
-            currentModel = pdb_model.PdbModel()
-            # Get serial
-            currentModel.serial = int(line.split()[1])
-
-            currentChain = None
-            modelAtoms.append([])
-
-        # Count chains (could also check against the COMPND line if present?)
-        if line.startswith('ATOM'):
-
-            # Create atom object
-            atom = pdb_model.PdbAtom(line)
-
-            # Check for the first model
-            if not currentModel:
-                # This must be the first model and there should only be one
-                currentModel = pdb_model.PdbModel()
-                modelAtoms.append([])
-
-            if atom.chainID != currentChain:
-                currentChain = atom.chainID
-                currentModel.chains.append(currentChain)
-                modelAtoms[-1].append([])
-
-            modelAtoms[-1][-1].append(atom)
-
-        # Can ignore TER and ENDMDL for time being as we'll pick up changing chains anyway,
-        # and new models get picked up by the models line
-
-        line = f.readline()
-        # End while loop
-
-    # End of reading loop so add the last model to the list
-    info.models.append(currentModel)
-
-    f.close()
+    # Now process the atoms - each run of atoms with the same chain ID is a chain
+    for modelIdx in range(reader.num_models):
+        model = pdb_model.PdbModel()
+        if reader.model_serials:
+            model.serial = reader.model_serials[modelIdx]
+        atoms = reader.model(modelIdx)
+        starts, _ = pdb_reader.runs(atoms['chainID'])
+        for start, stop in zip(starts, list(starts[1:]) + [len(atoms)]):
+            chainAtoms = atoms[start:stop].view(numpy.recarray)
+            chainID = chainAtoms['chainID'][0]
+            model.chains.append(chainID if chainID.strip() else None)
+            model.atoms.append(chainAtoms)
+            resSeqs, sequence, caMask, bbMask = _residue_info(chainAtoms)
+            model.resSeqs.append(resSeqs)
+            model.sequences.append(sequence)
+            model.caMask.append(caMask)
+            model.bbMask.append(bbMask)
+        info.models.append(model)
+
+    # Need to make sure that we have an id if only 1 chain and none given
+    for model in info.models[:-1]:
+        if len(model.chains) == 1 and model.chains[0] is None:
+            model.chains[0] = 'A'
 
-    bbatoms = ['N', 'CA', 'C', 'O', 'CB']
-
-    # Now process the atoms
-    for modelIdx, model in enumerate(info.models):
-
-        chainList = modelAtoms[modelIdx]
-
-        for chainIdx, atomList in enumerate(chainList):
-
-            # Paranoid check
-            assert model.chains[chainIdx] == atomList[0].chainID
-
-            # Add list of atoms to model
-            model.atoms.append(atomList)
-
-            # Initialise new chain
-            currentResSeq = atomList[0].resSeq
-            currentResName = atomList[0].resName
-            model.resSeqs.append([])
-            model.sequences.append("")
-            model.caMask.append([])
-            model.bbMask.append([])
-
-            atomTypes = []
-            for i, atom in enumerate(atomList):
+    return info
 
-                aname = atom.name.strip()
-                if atom.resSeq != currentResSeq and i == len(atomList) - 1:
-                    # Edge case - last residue containing one atom
-                    atomTypes = [aname]
-                else:
-                    if aname not in atomTypes:
-                        atomTypes.append(aname)
-
-                if atom.resSeq != currentResSeq or i == len(atomList) - 1:
-                    # End of reading the atoms for a residue
-                    model.resSeqs[chainIdx].append(currentResSeq)
-                    model.sequences[chainIdx] += three2one[currentResName]
-
-                    if 'CA' not in atomTypes:
-                        model.caMask[chainIdx].append(True)
-                    else:
-                        model.caMask[chainIdx].append(False)
-
-                    missing = False
-                    for bb in bbatoms:
-                        if bb not in atomTypes:
-                            missing = True
-                            break
-
-                    if missing:
-                        model.bbMask[chainIdx].append(True)
-                    else:
-                        model.bbMask[chainIdx].append(False)
 
-                    currentResSeq = atom.resSeq
-                    currentResName = atom.resName
-                    atomTypes = []
+def _residue_info(atoms):
+    """Return the resSeqs, sequence, caMask and bbMask of the atoms of a chain
 
-    return info
+    The atom types of each residue are assigned as by the original line by line parser so that
+    the masks are unchanged: the first atom of each residue is counted with the residue before
+    it, and a final residue of one atom replaces the atoms of the residue before it and is not
+    itself included.
+    """
+    resSeqs = atoms['resSeq']
+    starts, residue = pdb_reader.runs(resSeqs)
+    total = nresidues = len(starts)
+    owner = residue.copy()
+    owner[starts[1:]] -= 1
+    if len(atoms) > 1 and starts[-1] == len(atoms) - 1:
+        # Edge case - last residue containing one atom
+        owner[owner == nresidues - 2] = -1
+        owner[-1] = nresidues - 2
+        nresidues -= 1
+        starts = starts[:-1]
+    names = pdb_reader.atom_names(atoms)
+    valid = owner >= 0
+    present = {}
+    for name in BACKBONE_ATOMS:
+        present[name] = numpy.zeros(total, dtype=bool)
+        present[name][owner[valid & (names == name)]] = True
+        present[name] = present[name][:nresidues]
+    bbMask = numpy.zeros(nresidues, dtype=bool)
+    for name in BACKBONE_ATOMS:
+        bbMask |= ~present[name]
+    sequence = "".join(three2one[resName] for resName in atoms['resName'][starts])
+    return [int(r) for r in resSeqs[starts]], sequence, [bool(m) for m in ~present['CA']], [bool(m) for m in bbMask]
 
 
 def match_resseq(targetPdb=None, outPdb=None, resMap=None, sourcePdb=None):
@@ -705,29 +774,21 @@ def merge(pdb1=None, pdb2=None, pdbout=None):
 
 
 def molecular_weight(pdbin):
-    logfile = "rwcontents.log"
-    _run_rwcontents(pdbin, logfile)
-    _, _, mw = _parse_rwcontents(logfile)
-    os.unlink(logfile)
+    """Return the molecular weight of the protein in the first model of a pdb file (see :mod:`ample.util.pdb_contents`)"""
+    _, _, mw = pdb_contents.pdb_contents(pdbin)
     return mw
 
 
 def num_atoms_and_residues(pdbin, first=False):
     """"Return number of atoms and residues in a pdb file.
-    If all is True, return all atoms and residues, else just for the first chain in the first model'
+    If first is False, return the atoms (including hydrogens) and residues of the amino acids in the first model
+    (see :mod:`ample.util.pdb_contents`), else all the atoms and residues of the first chain in the first model
     """
-    #pdb_obj = iotbx.pdb.hierarchy.input(file_name=pdbin)
-    #model = pdb_obj.hierarchy.models()[0]
-    #return sum(  [ len( chain.residues() ) for chain in model.chains() ]  )
-
     if not first:
-        logfile = "rwcontents.log"
-        _run_rwcontents(pdbin, logfile)
-        natoms, nresidues, _ = _parse_rwcontents(logfile)
-        os.unlink(logfile)
+        natoms, nresidues, _ = pdb_contents.pdb_contents(pdbin)
     else:
-        pdb_obj = iotbx.pdb.hierarchy.input(file_name=pdbin)
-        model = pdb_obj.hierarchy.models()[0]
+        _, hierarchy = _read_hierarchy(pdbin)
+        model = hierarchy.models()[0]
         nresidues = len(model.chains()[0].residues())
         natoms = len(model.chains()[0].atoms())
 
@@ -736,26 +797,8 @@ def num_atoms_and_residues(pdbin, first=False):
     return (natoms, nresidues)
 
 
-def _only_equal_sizes(hierarchy):
-    """If a hiearchy contains different size models, only keep models of the most numerous size"""
-    lengths = defaultdict(list)
-    lmax = 0
-    for i, model in enumerate(hierarchy.models()):
-        l = model.chains()[0].residue_groups_size()
-        lengths[l].append(i)
-        lmax = max(lmax, l)
-
-    if len(lengths) > 1:
-        # The pdbs were of different lengths
-        to_keep = lengths[lmax]
-        logger.debug('All models were not of the same length, only {0} will be kept.'.format(len(to_keep)))
-        # Delete any that are not of most numerous length
-        for i, model in enumerate(hierarchy.models()):
-            if i not in to_keep: hierarchy.remove_model(model)
-    return hierarchy
-
-
 def _parse_rwcontents(logfile):
+    """Return the number of atoms and residues and the molecular weight from a rwcontents log"""
     natoms = 0
     nresidues = 0
     molecular_weight = 0
@@ -773,9 +816,9 @@ def _parse_rwcontents(logfile):
 
 def _run_rwcontents(pdbin, logfile):
     logfile = os.path.abspath(logfile)
-    cmd = ['rwcontents', 'xyzin', pdbin]
+    cmd = ['rwcontents', 'xyzin', os.path.abspath(pdbin)]
     stdin = ''  # blank to trigger EOF
-    retcode = ample_util.run_command(cmd=cmd, directory=os.getcwd(), logfile=logfile, stdin=stdin)
+    retcode = ample_util.run_command(cmd=cmd, directory=os.path.dirname(logfile), logfile=logfile, stdin=stdin)
     if retcode != 0:
         raise RuntimeError("Error running cmd {0}\nSee logfile: {1}".format(cmd, logfile))
     return
@@ -854,8 +897,7 @@ def reliable_sidechains_cctbx(pdbin=None, pdbout=None):
     res_names = ['MET', 'ASP', 'PRO', 'GLN', 'LYS', 'ARG', 'GLU', 'SER']
     atom_names = ['N', 'CA', 'C', 'O', 'CB']
 
-    pdb_input = iotbx.pdb.pdb_input(pdbin)
-    hierachy = pdb_input.construct_hierarchy()
+    _, hierachy = _read_hierarchy(pdbin, copy=True)
     # Remove HETATMS
     for model in hierachy.models():
         for chain in model.chains():
@@ -883,23 +925,13 @@ def rename_chains(inpdb=None, outpdb=None, fromChain=None, toChain=None):
 
     assert len(fromChain) == len(toChain)
 
-    logfile = outpdb + ".log"
-    cmd = "pdbcur xyzin {0} xyzout {1}".format(inpdb, outpdb).split()
-
-    stdin = ""
-    for i in range(len(fromChain)):
-        stdin += "renchain {0} {1}\n".format(fromChain[i], toChain[i])
-
-    retcode = ample_util.run_command(cmd=cmd, logfile=logfile, directory=os.getcwd(), dolog=False, stdin=stdin)
-
-    if retcode == 0:
-        os.unlink(logfile)
-    else:
-        raise RuntimeError("Error renaming chains {0}".format(fromChain))
+    reader = _read_records(inpdb)
+    pdb_transform.rename_chains(reader, fromChain, toChain)
+    pdb_transform.write(reader, outpdb)
 
 
 def resseq(pdbin):
-    return _resseq(iotbx.pdb.pdb_input(pdbin).construct_hierarchy())
+    return _resseq(_read_hierarchy(pdbin)[1])
 
 
 def _resseq(hierarchy):
@@ -910,8 +942,7 @@ def _resseq(hierarchy):
 
 def renumber_residues(pdbin, pdbout, start=1):
     """ Renumber the residues in the chain """
-    pdb_input = iotbx.pdb.pdb_input(file_name=pdbin)
-    hierarchy = pdb_input.construct_hierarchy()
+    _, hierarchy = _read_hierarchy(pdbin, copy=True)
 
     _renumber(hierarchy, start)
 
@@ -941,8 +972,7 @@ def renumber_residues_gaps(pdbin, pdbout, gaps, start=1):
     gaps : list
         List containing True/False for gaps
     """
-    pdb_input = iotbx.pdb.pdb_input(file_name=pdbin)
-    hierarchy = pdb_input.construct_hierarchy()
+    _, hierarchy = _read_hierarchy(pdbin, copy=True)
 
     for model in hierarchy.models():
         for chain in model.chains():
@@ -968,11 +998,8 @@ def renumber_residues_gaps(pdbin, pdbout, gaps, start=1):
 
 def select_residues(pdbin, pdbout, delete=None, tokeep=None, delete_idx=None, tokeep_idx=None):
 
-    pdbf = iotbx.file_reader.any_file(pdbin, force_type="pdb")
-    pdbf.check_file_type("pdb")
-    hierarchy = pdbf.file_object.construct_hierarchy()
-
-    crystal_symmetry = pdbf.file_object.crystal_symmetry()
+    pdb_input, hierarchy = _read_hierarchy(pdbin, copy=True)
+    crystal_symmetry = pdb_input.crystal_symmetry()
 
     if len(hierarchy.models()) > 1 or len(hierarchy.models()[0].chains()) > 1:
         logger.debug("pdb %s has > 1 model or chain - only first model/chain will be kept", pdbin)
@@ -1020,7 +1047,7 @@ def select_residues(pdbin, pdbout, delete=None, tokeep=None, delete_idx=None, to
 
 
 def sequence(pdbin):
-    return _sequence(iotbx.pdb.pdb_input(pdbin).construct_hierarchy())
+    return _sequence(_read_hierarchy(pdbin)[1])
 
 
 def _sequence(hierarchy):
@@ -1036,7 +1063,7 @@ def _sequence1(hierarchy):
 
 
 def sequence_data(pdbin):
-    return _sequence_data(iotbx.pdb.pdb_input(pdbin).construct_hierarchy())
+    return _sequence_data(_read_hierarchy(pdbin)[1])
 
 
 def _sequence_data(hierarchy):
@@ -1058,9 +1085,66 @@ def _sequence_data(hierarchy):
     return chain2data
 
 
-def split_pdb(pdbin, directory=None, strip_hetatm=False, same_size=False):
+def side_chain_treatments(pdbin, pdbouts):
+    """Write several side chain treatments of a pdb file from a single read of it
+
+    The 'allatom' and 'unmod' treatments are copies of the file, 'reliable' removes the side chain atoms
+    beyond the CB of the residues in UNRELIABLE_SIDE_CHAINS and 'polyala' keeps only the BACKBONE_ATOMS,
+    as :func:`backbone` does. The treatments are written with :func:`pdb_transform.write
+    <ample.util.pdb_transform.write>`, so the header records of the file (such as the REMARKs
+    written by theseus) are kept.
+
+    Parameters
+    ----------
+    pdbin : str
+       The pdb file to treat
+    pdbouts : dict
+       The path of the output pdb file for each side chain treatment
+
+    Returns
+    -------
+    dict
+       The number of atoms and residues in the first chain of the first model of each treatment
+    """
+    reader = _read_records(pdbin)
+    atoms = reader.atoms
+    is_backbone = pdb_transform.select_atoms(atoms, names=BACKBONE_ATOMS)
+
+    counts = {}
+    for treatment, pdbout in pdbouts.items():
+        if treatment in ['allatom', 'unmod']:
+            shutil.copy2(pdbin, pdbout)
+            keep = numpy.ones(len(atoms), dtype=bool)
+        elif treatment == 'reliable':
+            keep = is_backbone | ~pdb_transform.select_atoms(atoms, resnames=UNRELIABLE_SIDE_CHAINS)
+            keep |= atoms['record'] == 'HETATM'
+            pdb_transform.write(reader, pdbout, keep=keep)
+        elif treatment == 'polyala':
+            keep = is_backbone & pdb_transform.select_atoms(atoms, elements=['N', 'C', 'O'])
+            pdb_transform.write(reader, pdbout, keep=keep)
+        else:
+            raise RuntimeError("Unrecognised side_chain_treatment: {0}".format(treatment))
+        counts[treatment] = _first_chain_counts(atoms[keep])
+    return counts
+
+
+def _first_chain_counts(atoms):
+    """Return the number of atoms and residues in the first chain of the first model of the atoms"""
+    if not len(atoms):
+        return 0, 0
+    atoms = atoms[atoms['model'] == atoms['model'][0]]
+    chain_starts, _ = pdb_reader.runs(atoms['chainID'])
+    if len(chain_starts) > 1:
+        atoms = atoms[:chain_starts[1]]
+    return len(atoms), len(pdb_reader.residue_runs(atoms)[0])
+
+
+def split_pdb(pdbin, directory=None, strip_hetatm=False, same_size=False, coordinate_store=None):
     """Split a pdb file into its separate models
 
+    The models are streamed from the file by :func:`model_splitter.split_models
+    <ample.util.model_splitter.split_models>` so only one is held in memory at a time.
+
     Parameters
     ----------
     pdbin : str
@@ -1070,54 +1154,26 @@ def split_pdb(pdbin, directory=None, strip_hetatm=False, same_size=False):
     strip_hetatm : bool
         remove HETATMS if true
     same_size : bool
-      Only output models of equal length (the most numerous length is selected)
+      Only output models of equal length (the models with the most residues are selected)
+    coordinate_store : :obj:`CoordinateStore <ample.util.coordinate_store.CoordinateStore>`, optional
+      A store to add the residues of the models to as they are split
     """
 
     if directory is None: directory = os.path.dirname(pdbin)
     if not os.path.isdir(directory): os.mkdir(directory)
 
-    # Largely stolen from pdb_split_models.py in phenix
-    #http://cci.lbl.gov/cctbx_sources/iotbx/command_line/pdb_split_models.py
-
-    pdbf = iotbx.file_reader.any_file(pdbin, force_type="pdb")
-    pdbf.check_file_type("pdb")
-    hierarchy = pdbf.file_object.construct_hierarchy()
-
     # Nothing to do
-    n_models = hierarchy.models_size()
-    if n_models == 1: 
+    if pdb_reader.count_records(pdbin, 'ENDMDL') < 2:
         raise RuntimeError("split_pdb {0} only contained 1 model!".format(pdbin))
 
-    if same_size: _only_equal_sizes(hierarchy)
-    crystal_symmetry = pdbf.file_object.crystal_symmetry()
-    output_files = []
-    for k, model in enumerate(hierarchy.models()):
-        k += 1
-        new_hierarchy = iotbx.pdb.hierarchy.root()
-        new_hierarchy.append_model(model.detached_copy())
-        if strip_hetatm: _strip(
-                new_hierarchy,
-                hetatm=True,
-        )
-        if (model.id == ""):
-            model_id = str(k)
-        else:
-            model_id = model.id.strip()
-        output_file = ample_util.filename_append(pdbin, model_id, directory)
-        with open(output_file, "w") as f:
-            if (crystal_symmetry is not None):
-                f.write(
-                    iotbx.pdb.format_cryst1_and_scale_records(
-                        crystal_symmetry=crystal_symmetry, write_scale_records=True
-                    ) + '\n'
-                )
-            f.write("REMARK Model %d of %d\n" % (k, n_models))
-            if (pdbin is not None):
-                f.write('REMARK Original file:\n')
-                f.write('REMARK   %s\n' % pdbin)
-            f.write(new_hierarchy.as_pdb_string())
-        output_files.append(output_file)
-    return output_files
+    def model_path(idx, model_id):
+        return ample_util.filename_append(pdbin, model_id, directory)
+
+    return model_splitter.split_models(pdbin,
+                                       model_path,
+                                       strip_hetatm=strip_hetatm,
+                                       same_size=same_size,
+                                       coordinate_store=coordinate_store)
 
 
 def split_into_chains(pdbin, chain=None, directory=None):
@@ -1128,16 +1184,14 @@ def split_into_chains(pdbin, chain=None, directory=None):
 
     # Largely stolen from pdb_split_models.py in phenix
     #http://cci.lbl.gov/cctbx_sources/iotbx/command_line/pdb_split_models.py
-    pdbf = iotbx.file_reader.any_file(pdbin, force_type="pdb")
-    pdbf.check_file_type("pdb")
-    hierarchy = pdbf.file_object.construct_hierarchy()
+    pdb_input, hierarchy = _read_hierarchy(pdbin)
 
     # Nothing to do
     n_models = hierarchy.models_size()
     if n_models != 1: 
         raise RuntimeError("split_into_chains only works with single-mdoel pdbs!")
 
-    crystal_symmetry = pdbf.file_object.crystal_symmetry()
+    crystal_symmetry = pdb_input.crystal_symmetry()
 
     output_files = []
     n_chains = len(hierarchy.models()[0].chains())
@@ -1176,36 +1230,29 @@ def standardise(pdbin, pdbout, chain=None, del_hetatm=False):
     """Rename any non-standard AA, remove solvent and only keep most probably conformation.
     """
 
-    tmp1 = ample_util.tmp_file_name() + ".pdb"  # pdbcur insists names have a .pdb suffix
+    tmp1 = ample_util.tmp_file_name() + ".pdb"
 
-    # Now clean up with pdbcur
-    logfile = tmp1 + ".log"
-    cmd = "pdbcur xyzin {0} xyzout {1}".format(pdbin, tmp1).split()
-    stdin = """delsolvent
-noanisou
-mostprob
-"""
+    # Remove the solvent and ANISOU records and keep the most probable conformation
+    reader = _read_records(pdbin)
+    keep = ~pdb_transform.select_atoms(reader.atoms, resnames=pdb_transform.SOLVENT_RESIDUES)
+    keep &= pdb_transform.most_probable(reader.atoms)
+    pdb_transform.clear_altlocs(reader)
     # We are extracting one  of the chains
-    if chain: stdin += "lvchain {0}\n".format(chain)
-
-    retcode = ample_util.run_command(cmd=cmd, logfile=logfile, directory=os.getcwd(), dolog=False, stdin=stdin)
-    if retcode == 0: 
-        os.unlink(logfile)
-    else: 
-        raise RuntimeError("Error standardising pdb!")
+    if chain: keep &= pdb_transform.select_atoms(reader.atoms, chains=[chain])
+    pdb_transform.write(reader, tmp1, keep=keep, anisou=False)
 
     # Standardise AA names and then remove any remaining HETATMs
     std_residues_cctbx(tmp1, pdbout, del_hetatm=del_hetatm)
     os.unlink(tmp1)
 
-    return retcode
+    return 0
 
 
 def std_residues_cctbx(pdbin, pdbout, del_hetatm=False):
     """Map all residues in MODRES section to their standard counterparts
     optionally delete all other HETATMS"""
 
-    pdb_input = iotbx.pdb.pdb_input(pdbin)
+    pdb_input, hierachy = _read_hierarchy(pdbin, copy=True)
     crystal_symmetry = pdb_input.crystal_symmetry()
 
     # Get MODRES Section & build up dict mapping the changes
@@ -1217,7 +1264,6 @@ def std_residues_cctbx(pdbin, pdbout, del_hetatm=False):
             modres[chain] = {}
         modres[chain][int(resseq)] = (resname, stdres)
 
-    hierachy = pdb_input.construct_hierarchy()
     for model in hierachy.models():
         for chain in model.chains():
             for residue_group in chain.residue_groups():
@@ -1249,10 +1295,9 @@ def std_residues_cctbx(pdbin, pdbout, del_hetatm=False):
 def strip(pdbin, pdbout, hetatm=False, hydrogen=False, atom_types=[]):
     assert hetatm or hydrogen or atom_types, "Need to set what to strip!"
 
-    pdb_input = iotbx.pdb.pdb_input(pdbin)
+    pdb_input, hierachy = _read_hierarchy(pdbin, copy=True)
     crystal_symmetry = pdb_input.crystal_symmetry()
 
-    hierachy = pdb_input.construct_hierarchy()
     _strip(hierachy, hetatm=hetatm, hydrogen=hydrogen, atom_types=atom_types)
 
     with open(pdbout, 'w') as f:
@@ -1356,24 +1401,17 @@ def translate(inpdb=None, outpdb=None, ftranslate=None):
     ftranslate -- vector of fractional coordinates to shift by
     """
 
-    logfile = outpdb + ".log"
-    cmd = "pdbcur xyzin {0} xyzout {1}".format(inpdb, outpdb).split()
-
-    # Build up stdin
-    stdin = 'translate * frac {0:F} {1:F} {2:F}'.format(ftranslate[0], ftranslate[1], ftranslate[2])
-    retcode = ample_util.run_command(cmd=cmd, logfile=logfile, directory=os.getcwd(), dolog=False, stdin=stdin)
-
-    if retcode == 0:
-        # remove temporary files
-        os.unlink(logfile)
-    else:
-        raise RuntimeError("Error translating PDB")
+    reader = _read_records(inpdb)
+    try:
+        pdb_transform.translate(reader, ftranslate, fractional=True)
+    except (RuntimeError, ValueError) as e:
+        raise RuntimeError("Error translating PDB: {0}".format(e))
+    pdb_transform.write(reader, outpdb)
 
 
 def xyz_coordinates(pdbin):
     ''' Extract xyz for all atoms '''
-    pdb_input = iotbx.pdb.pdb_input(file_name=pdbin)
-    hierarchy = pdb_input.construct_hierarchy()
+    _, hierarchy = _read_hierarchy(pdbin)
     return _xyz_coordinates(hierarchy)
 
 
@@ -1392,8 +1430,7 @@ def _xyz_coordinates(hierarchy):
 
 def xyz_cb_coordinates(pdbin):
     ''' Extract xyz for CA/CB atoms '''
-    pdb_input = iotbx.pdb.pdb_input(file_name=pdbin)
-    hierarchy = pdb_input.construct_hierarchy()
+    _, hierarchy = _read_hierarchy(pdbin)
 
     res_dict = _xyz_cb_coordinates(hierarchy)
 
@@ -1407,6 +1444,24 @@ def xyz_cb_coordinates(pdbin):
     return cb_lst
 
 
+def xyz_ca_coordinates(pdbin):
+    ''' Extract xyz for CA atoms '''
+    _, hierarchy = _read_hierarchy(pdbin)
+    return _xyz_ca_coordinates(hierarchy)
+
+
+def _xyz_ca_coordinates(hierarchy):
+    res_lst = []
+
+    for residue_group in hierarchy.models()[0].chains()[0].residue_groups():
+        for atom in residue_group.atoms():
+            if atom.name.strip() == "CA":
+                res_lst.append([residue_group.resseq_as_int(), atom.xyz])
+                break
+
+    return res_lst
+
+
 def _xyz_cb_coordinates(hierarchy):
     res_lst = []
 
@@ -1572,6 +1627,44 @@ class Test(unittest.TestCase):
 
         return
 
+    def testCheckPdbRecords(self):
+        pdbs = sorted(glob.glob(os.path.join(self.testfiles_dir, "models", "*.pdb")))
+        pdbs += [os.path.join(self.testfiles_dir, f) for f in ("1GU8.pdb", "4DZN.pdb", "2UUI.pdb")]
+        for pdb in pdbs:
+            for single in (True, False):
+                checked = _check_pdb_records(pdb, single, True)
+                if checked:
+                    self.assertEqual(_check_pdb_hierarchy(pdb, single, True), checked)
+        # The models are checked without cctbx, but not the files with HETATM records or more than one model
+        self.assertTrue(all(_check_pdb_records(pdb, True, False) for pdb in pdbs[:-3]))
+        self.assertTrue(all(_check_pdb_records(pdb, True, False) is None for pdb in pdbs[-3:]))
+
+        pdbout = "testCheckPdbRecords.pdb"
+        with open(pdbs[0]) as f:
+            lines = f.readlines()
+        with open(pdbout, 'w') as f:
+            for i, line in enumerate(lines):
+                f.write(line[:21] + 'B' + line[22:] if i > len(lines) // 2 and line.startswith('ATOM') else line)
+        self.assertEqual(('multi', None), _check_pdb_records(pdbout, True, True))
+        self.assertEqual(('multi', None), _check_pdb_hierarchy(pdbout, True, True))
+        os.unlink(pdbout)
+
+    def testCheckPdbsParallel(self):
+        pdbs = sorted(glob.glob(os.path.join(self.testfiles_dir, "models", "*.pdb")))
+        self.assertTrue(check_pdbs(pdbs, nproc=2))
+        pdbs += [os.path.join(self.testfiles_dir, "1GU8.pdb"), os.path.join(self.testfiles_dir, "4DZN.pdb")]
+        self.assertFalse(check_pdbs(pdbs, single=True, sequence="AABBCC", nproc=2))
+        self.assertFalse(check_pdbs(pdbs, single=True, sequence="AABBCC", nproc=2, max_errors=1))
+
+    def testCheckPdbsChecked(self):
+        pdbs = sorted(glob.glob(os.path.join(self.testfiles_dir, "models", "*.pdb")))
+        checked = dict((pdb, check_pdb_atoms(pdb_reader.PdbAtoms.from_file(pdb), True, True)) for pdb in pdbs)
+        self.assertTrue(all(checked.values()))
+        self.assertTrue(check_pdbs(pdbs, checked=checked))
+        # A wrong result for a model that was already checked is used rather than checking it again
+        checked[pdbs[1]] = ('multi', None)
+        self.assertFalse(check_pdbs(pdbs, checked=checked))
+
     def testSelectResidues(self):
         pdbin = os.path.join(self.testfiles_dir, "4DZN.pdb")
         pdbout = "testSelectResidues1.pdb"
@@ -1739,6 +1832,108 @@ class Test(unittest.TestCase):
 
         return
 
+    def testSideChainTreatments(self):
+        pdbin = os.path.join(self.testfiles_dir, "1GU8.pdb")
+        pdbouts = {'allatom': 'sct_allatom.pdb', 'reliable': 'sct_reliable.pdb', 'polyala': 'sct_polyala.pdb'}
+        counts = side_chain_treatments(pdbin, pdbouts)
+
+        reliable_sidechains(pdbin, 'std.pdb')
+        for treatment in pdbouts:
+            chain = iotbx.pdb.pdb_input(pdbouts[treatment]).construct_hierarchy().models()[0].chains()[0]
+            self.assertEqual((len(chain.atoms()), len(chain.residues())), counts[treatment])
+        self.assertEqual(num_atoms_and_residues('std.pdb', first=True), counts['reliable'])
+        # The RET and CL HETATM residues have no backbone atoms
+        self.assertEqual(counts['allatom'][1] - 2, counts['polyala'][1])
+        self.assertLess(counts['polyala'][0], counts['reliable'][0])
+        self.assertLess(counts['reliable'][0], counts['allatom'][0])
+
+        hierarchy = iotbx.pdb.pdb_input(pdbouts['polyala']).construct_hierarchy()
+        self.assertTrue(all(a.name.strip() in BACKBONE_ATOMS for a in hierarchy.atoms()))
+        backbone(pdbin, 'std.pdb')
+        self.assertEqual(num_atoms_and_residues('std.pdb', first=True), counts['polyala'])
+        # The header records of the input are kept, other than those referring to atoms by serial number
+        def header(pdb):
+            return [l for l in pdb_reader.PdbAtoms.from_file(pdb).header
+                    if l[:6].strip() not in pdb_transform.SERIAL_RECORDS]
+        for treatment in pdbouts:
+            self.assertEqual(header(pdbin), header(pdbouts[treatment]))
+        for pdbout in pdbouts.values() + ['std.pdb']:
+            os.unlink(pdbout)
+
+    def _pdbcur(self, pdbin, pdbout, stdin):
+        """Edit pdbin with pdbcur, for comparing the results with those of the in-process edits"""
+        logfile = pdbout + ".log"
+        cmd = "pdbcur xyzin {0} xyzout {1}".format(pdbin, pdbout).split()
+        retcode = ample_util.run_command(cmd=cmd, logfile=logfile, directory=os.getcwd(), dolog=False, stdin=stdin)
+        self.assertEqual(0, retcode)
+        os.unlink(logfile)
+        atoms = pdb_reader.PdbAtoms.from_file(pdbout).atoms
+        os.unlink(pdbout)
+        return atoms
+
+    def assertSameAtoms(self, ref, pdbout, fields):
+        atoms = pdb_reader.PdbAtoms.from_file(pdbout).atoms
+        os.unlink(pdbout)
+        self.assertEqual(len(ref), len(atoms))
+        for field in fields:
+            self.assertTrue(numpy.all(ref[field] == atoms[field]), "Field {0} differs".format(field))
+
+    def testPdbcurEquivalence(self):
+        fields = ['serial', 'name', 'altLoc', 'resName', 'chainID', 'resSeq', 'iCode', 'xyz', 'occupancy']
+        for name in ["1BYZ.pdb", "2UUI.pdb", "4DZN.pdb"]:
+            pdbin = os.path.join(self.testfiles_dir, name)
+            ref = self._pdbcur(pdbin, "pdbcur.pdb", 'lvatom "N,CA,C,O,CB[N,C,O]"')
+            backbone(pdbin, "backbone.pdb")
+            self.assertSameAtoms(ref, "backbone.pdb", fields)
+
+            ref = self._pdbcur(pdbin, "pdbcur.pdb", 'lvatom "CA[C]:*"')
+            calpha_only(pdbin, "calpha.pdb")
+            self.assertSameAtoms(ref, "calpha.pdb", fields)
+
+        pdbin = os.path.join(self.testfiles_dir, "4DZN.pdb")
+        ref = self._pdbcur(pdbin, "pdbcur.pdb", 'lvchain B\nrenchain B X\nlvatom "CA[C]:*"\nsernum\n')
+        extract_chain(pdbin, "chain.pdb", chainID='B', newChainID='X', cAlphaOnly=True)
+        self.assertSameAtoms(ref, "chain.pdb", fields)
+
+        ref = self._pdbcur(pdbin, "pdbcur.pdb", "renchain A X\nrenchain C Y\n")
+        rename_chains(pdbin, "renamed.pdb", fromChain=['A', 'C'], toChain=['X', 'Y'])
+        self.assertSameAtoms(ref, "renamed.pdb", fields)
+
+        pdbin = os.path.join(self.testfiles_dir, "1GU8.pdb")
+        ref = self._pdbcur(pdbin, "pdbcur.pdb", "lvmodel /2\n")
+        extract_model(pdbin, "model.pdb", 2)
+        self.assertSameAtoms(ref, "model.pdb", fields)
+
+        pdbin = os.path.join(self.testfiles_dir, "1BYZ.pdb")
+        ref = self._pdbcur(pdbin, "pdbcur.pdb", "translate * frac 1.0 0.0 0.5\n")
+        translate(pdbin, "translated.pdb", [1.0, 0.0, 0.5])
+        self.assertSameAtoms(ref, "translated.pdb", fields)
+
+        # The alternate conformations are resolved before cctbx standardises the residue names
+        ref = self._pdbcur(pdbin, "pdbcur.pdb", "delsolvent\nnoanisou\nmostprob\nlvchain A\n")
+        standardise(pdbin, "std.pdb", chain='A')
+        atoms = pdb_reader.PdbAtoms.from_file("std.pdb").atoms
+        os.unlink("std.pdb")
+        self.assertEqual(len(ref), len(atoms))
+        for field in ['name', 'resSeq', 'xyz', 'occupancy']:
+            self.assertTrue(numpy.all(ref[field] == atoms[field]), "Field {0} differs".format(field))
+
+    def testHierarchyCache(self):
+        pdbin = os.path.join(self.testfiles_dir, "4DZN.pdb")
+        hierarchy_cache.clear()
+        ref = sequence(pdbin)
+        self.assertEqual(ref, sequence(pdbin))
+        self.assertEqual(len(resseq(pdbin)['A']), len(xyz_ca_coordinates(pdbin)))
+        self.assertEqual((3, 1), (hierarchy_cache.hits, hierarchy_cache.misses))
+
+        # Changes to a copy do not change the cached hierarchy
+        pdbout = "testHierarchyCache.pdb"
+        select_residues(pdbin=pdbin, pdbout=pdbout, delete=[5, 10])
+        self.assertEqual(ref, sequence(pdbin))
+        self.assertNotEqual(ref['A'], sequence(pdbout)['A'])
+        self.assertEqual((5, 2), (hierarchy_cache.hits, hierarchy_cache.misses))
+        os.unlink(pdbout)
+
     def testXyzCoordinates(self):
         pdbin = os.path.join(self.testfiles_dir, "4DZN.pdb")
         test_hierarchy = iotbx.pdb.pdb_input(file_name=pdbin).construct_hierarchy()
@@ -1770,6 +1965,15 @@ class Test(unittest.TestCase):
         self.assertSequenceEqual(ref_data_start[1], xyz_cb_lst[1][:6])
         self.assertEqual(35, len(xyz_cb_lst))
 
+    def testXyzCaCoordinates(self):
+        pdbin = os.path.join(self.testfiles_dir, "4DZN.pdb")
+        test_hierarchy = iotbx.pdb.pdb_input(file_name=pdbin).construct_hierarchy()
+        xyz_ca_lst = _xyz_ca_coordinates(test_hierarchy)
+
+        self.assertEqual([1, (22.806, 12.124, -9.698)], xyz_ca_lst[0])
+        self.assertEqual([2, (20.675, 9.156, -8.637)], xyz_ca_lst[1])
+        self.assertEqual(32, len(xyz_ca_lst))
+
 
 if __name__ == "__main__":
     #unittest.TextTestRunner(verbosity=2).run(testSuite())
@@ -469,9 +469,20 @@ class CrystalInfo(object):
 
 class PdbInfo(object):
     """A class to hold information extracted from a PDB file"""
+    __slots__ = ('pdb', 'models', 'pdbCode', 'title', 'resolution', 'solventContent', 'matthewsCoefficient',
+                 'crystalInfo')
+
+    def __getstate__(self):
+        """Return the attributes for pickling, as objects with __slots__ have no __dict__"""
+        return dict((k, getattr(self, k)) for k in PdbInfo.__slots__ if hasattr(self, k))
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
     
     def __init__(self ):
         
+        self.pdb = None
         self.models = [] # List of PdbModel objects
         
         self.pdbCode=None
@@ -525,13 +536,22 @@ class PdbInfo(object):
     
 class PdbModel(object):
     """A class to hold information on a single model in a PDB file"""
+    __slots__ = ('pdb', 'serial', 'chains', 'atoms', 'resSeqs', 'sequences', 'caMask', 'bbMask')
+
+    def __getstate__(self):
+        """Return the attributes for pickling, as objects with __slots__ have no __dict__"""
+        return dict((k, getattr(self, k)) for k in PdbModel.__slots__ if hasattr(self, k))
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
     
     def __init__(self ):
         
         self.pdb = None
         self.serial = None
         self.chains = [] # Ordered list of chain IDs
-        self.atoms = [] # List of atoms in each chain
+        self.atoms = [] # List of the atoms of each chain - numpy record arrays from pdb_edit.get_info
         
         self.resSeqs = [] # Ordered list of list of resSeqs for each chain - matches order in self.chains
         self.sequences = [] # Ordered list of list of sequences for each chain - matches order in self.chains
@@ -561,6 +581,17 @@ class PdbAtom(object):
 77 - 78        LString(2)    element      Element symbol, right-justified.
 79 - 80        LString(2)    charge       Charge  on the atom.
 """
+    __slots__ = ('_atomType', 'line', 'serial', 'name', 'altLoc', 'resName', 'chainID', 'resSeq', 'iCode', 'x', 'y',
+                 'z', 'occupancy', 'tempFactor', 'segID', 'element', 'charge')
+
+    def __getstate__(self):
+        """Return the attributes for pickling, as objects with __slots__ have no __dict__"""
+        return dict((k, getattr(self, k)) for k in PdbAtom.__slots__ if hasattr(self, k))
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+
     def __init__(self, line=None):
         """Set up attributes"""
         
@@ -730,6 +761,9 @@ class PdbAtom(object):
         """List the data attributes of this object"""
         me = {}
         for slot in dir(self):
+            if not hasattr(self, slot):
+                # Unset slot
+                continue
             attr = getattr(self, slot)
             if not slot.startswith("__") and not ( isinstance(attr, types.MethodType) or
               isinstance(attr, types.FunctionType) ):
@@ -738,6 +772,7 @@ class PdbAtom(object):
 
 class PdbHetatm( PdbAtom ):
     """Identical to PdbAtom but just with a different _atomType"""
+    __slots__ = ()
     
     def _setAtomType(self):
         self._atomType = "HETATM"
@@ -0,0 +1,286 @@
+"""Vectorised reader for the coordinate records of PDB files
+
+The whole file is read at once and the fixed columns of the ATOM/HETATM records are sliced
+into a numpy structured array with a single conversion per field, rather than parsing each
+line into a :obj:`PdbAtom <ample.util.pdb_model.PdbAtom>` object.
+"""
+
+__author__ = "Jens Thomas, and Felix Simkovic"
+__date__ = "17 Oct 2026"
+__version__ = "1.0"
+
+import contextlib
+import logging
+import mmap
+import os
+
+import numpy
+
+logger = logging.getLogger(__name__)
+
+# Lines are cut to (or padded to) this length
+LINE_LENGTH = 80
+
+# The fields of each atom
+ATOM_DTYPE = numpy.dtype([
+    ('record', 'S6'),
+    ('serial', 'i4'),
+    ('name', 'S4'),
+    ('altLoc', 'S1'),
+    ('resName', 'S3'),
+    ('chainID', 'S1'),
+    ('resSeq', 'i4'),
+    ('iCode', 'S1'),
+    ('xyz', 'f8', (3,)),
+    ('occupancy', 'f4'),
+    ('tempFactor', 'f4'),
+    ('element', 'S2'),
+    ('model', 'i4'),
+])
+
+# The columns of each field of an ATOM/HETATM record (see the PdbAtom docstring)
+_COLUMNS = numpy.dtype({
+    'names': ['record', 'serial', 'name', 'altLoc', 'resName', 'chainID', 'resSeq', 'iCode',
+              'x', 'y', 'z', 'occupancy', 'tempFactor', 'element'],
+    'formats': ['S6', 'S5', 'S4', 'S1', 'S3', 'S1', 'S4', 'S1', 'S8', 'S8', 'S8', 'S6', 'S6', 'S2'],
+    'offsets': [0, 6, 12, 16, 17, 21, 22, 26, 30, 38, 46, 54, 60, 76],
+    'itemsize': LINE_LENGTH,
+})
+
+
+def _to_number(column, dtype):
+    """Convert a column of fixed-width fields to numbers, with blank fields as zero
+
+    If every field is a right-justified number with the decimal point in the same column (as written
+    by every program that writes PDB files), the digits are summed multiplied by their powers of ten
+    and the integer divided by a power of ten, which gives the same result as float() but is much
+    quicker than converting each string. Anything else is converted a string at a time.
+    """
+    width = column.dtype.itemsize
+    chars = numpy.ascontiguousarray(column).view(numpy.uint8).reshape(len(column), width)
+    if not len(chars):
+        return numpy.zeros(0, dtype=dtype)
+    digits = chars - ord('0')
+    is_digit = digits < 10
+    is_blank = chars == ord(' ')
+    is_minus = chars == ord('-')
+    allowed = is_digit | is_blank | is_minus
+    point = width
+    if numpy.issubdtype(dtype, numpy.floating):
+        points = numpy.flatnonzero(chars[0] == ord('.'))
+        if len(points) != 1 or not numpy.all(chars[:, points[0]] == ord('.')):
+            return _to_number_slow(column, dtype)
+        point = points[0]
+        allowed[:, point] = True
+    if not (numpy.all(allowed) and numpy.all(is_digit[:, -1]) and
+            numpy.all(is_blank[:, 1:] <= is_blank[:, :-1]) and numpy.all(is_minus[:, 1:] <= is_blank[:, :-1])):
+        return _to_number_slow(column, dtype)
+    decimals = max(width - 1 - point, 0)
+    powers = [point - i - 1 + decimals if i < point else width - 1 - i for i in range(width)]
+    weights = numpy.array([10 ** p if i != point else 0 for i, p in enumerate(powers)], dtype=numpy.int64)
+    values = numpy.where(is_digit, digits, 0).astype(numpy.int64).dot(weights)
+    if decimals:
+        values = values / 10.0 ** decimals
+    return numpy.where(is_minus.any(axis=1), -values, values).astype(dtype)
+
+
+def _strip(column):
+    """Remove the spaces around fixed-width fields, if there are any"""
+    width = column.dtype.itemsize
+    chars = numpy.ascontiguousarray(column).view(numpy.uint8).reshape(len(column), width)
+    if numpy.any(chars[:, 0] == ord(' ')) or numpy.any(chars[:, -1] == ord(' ')):
+        return numpy.char.strip(column)
+    return column
+
+
+def _to_number_slow(column, dtype):
+    """Convert a column of fixed-width fields to numbers as strings, with blank fields as zero"""
+    try:
+        return column.astype(dtype)
+    except ValueError:
+        column = numpy.char.strip(column)
+        return numpy.where(column == '', '0', column).astype(dtype)
+
+
+class PdbAtoms(object):
+    """The coordinate records of a pdb file
+
+    Attributes
+    ----------
+    lines : :obj:`numpy.ndarray`
+       All the lines of the file, cut to LINE_LENGTH characters
+    atom_index : :obj:`numpy.ndarray`
+       The index in lines of each atom
+    atoms : :obj:`numpy.ndarray`
+       A structured array of the atoms (see ATOM_DTYPE). The model field is the index of the model of the atom,
+       with any atoms before the first MODEL record counted as part of the first model.
+    model_serials : list
+       The serial numbers of the MODEL records - empty if there are none
+    """
+
+    def __init__(self, lines, atom_index, atoms, model_serials):
+        self.lines = lines
+        self.atom_index = atom_index
+        self.atoms = atoms
+        self.model_serials = model_serials
+
+    @classmethod
+    def from_file(cls, pdb, hetatm=True):
+        """Read a pdb file, including the HETATM records if hetatm is True"""
+        with open(pdb, 'rb') as f:
+            return cls.from_string(f.read(), hetatm=hetatm)
+
+    @classmethod
+    def from_string(cls, data, hetatm=True):
+        """Read the text of a pdb file, including the HETATM records if hetatm is True"""
+        lines = numpy.array(data.splitlines(), dtype='S{0}'.format(LINE_LENGTH))
+        if not len(lines):
+            return cls(lines, numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=ATOM_DTYPE), [])
+        columns = lines.view(_COLUMNS)
+        is_atom = columns['record'] == 'ATOM  '
+        if hetatm:
+            is_atom |= columns['record'] == 'HETATM'
+        is_model = columns['record'] == 'MODEL '
+
+        fields = columns[is_atom]
+        atoms = numpy.zeros(len(fields), dtype=ATOM_DTYPE)
+        for name in ['record', 'name', 'altLoc', 'chainID', 'iCode']:
+            atoms[name] = fields[name]
+        atoms['resName'] = _strip(fields['resName'])
+        atoms['element'] = _strip(fields['element'])
+        atoms['serial'] = _to_number(fields['serial'], numpy.int32)
+        atoms['resSeq'] = _to_number(fields['resSeq'], numpy.int32)
+        for i, axis in enumerate(['x', 'y', 'z']):
+            atoms['xyz'][:, i] = _to_number(fields[axis], numpy.float64)
+        atoms['occupancy'] = _to_number(fields['occupancy'], numpy.float32)
+        atoms['tempFactor'] = _to_number(fields['tempFactor'], numpy.float32)
+        atoms['model'] = numpy.maximum(numpy.cumsum(is_model)[is_atom] - 1, 0)
+
+        model_serials = [int(line.split()[1]) for line in lines[is_model]]
+        return cls(lines, numpy.flatnonzero(is_atom), atoms, model_serials)
+
+    def __len__(self):
+        return len(self.atoms)
+
+    @property
+    def atom_lines(self):
+        """The lines of the atom records"""
+        return self.lines[self.atom_index]
+
+    @property
+    def columns(self):
+        """A view of the fixed columns of the ATOM/HETATM records of all the lines
+
+        Assigning to a field of the view edits the lines in place. Fields beyond the end of a short line
+        are null characters.
+        """
+        return self.lines.view(_COLUMNS)
+
+    @property
+    def header(self):
+        """The lines of all records other than the atoms, in order"""
+        is_header = numpy.ones(len(self.lines), dtype=bool)
+        is_header[self.atom_index] = False
+        return list(self.lines[is_header])
+
+    @property
+    def num_models(self):
+        """The number of MODEL records, or 1 if there are atoms but no MODEL records"""
+        if self.model_serials:
+            return len(self.model_serials)
+        return 1 if len(self.atoms) else 0
+
+    def record_index(self, record):
+        """Return the indices in lines of the records of a type, e.g. 'ENDMDL'"""
+        return numpy.flatnonzero(self.columns['record'] == record.ljust(6))
+
+    def model_slice(self, model_idx=0):
+        """Return the slice of atoms in a model"""
+        start, stop = numpy.searchsorted(self.atoms['model'], [model_idx, model_idx + 1])
+        return slice(start, stop)
+
+    def model(self, model_idx=0):
+        """Return the atoms of a model"""
+        return self.atoms[self.model_slice(model_idx)]
+
+
+def atom_names(atoms):
+    """Return the names of atoms with the spaces removed"""
+    return numpy.char.strip(atoms['name'])
+
+
+def runs(values):
+    """Return the start of each run of equal consecutive values and the index of the run of each value"""
+    values = numpy.asarray(values)
+    if not len(values):
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+    is_start = numpy.ones(len(values), dtype=bool)
+    is_start[1:] = values[1:] != values[:-1]
+    return numpy.flatnonzero(is_start), numpy.cumsum(is_start) - 1
+
+
+def residue_runs(atoms):
+    """Return the start of each residue and the index of the residue of each atom
+
+    A new residue starts whenever the residue number or insertion code changes.
+    """
+    keys = numpy.zeros(len(atoms), dtype=[('resSeq', 'i4'), ('iCode', 'S1')])
+    keys['resSeq'] = atoms['resSeq']
+    keys['iCode'] = atoms['iCode']
+    return runs(keys)
+
+
+def first_in_group(groups, mask, ngroups):
+    """Return the index of the first element of each group for which mask is True, or -1 if there is none"""
+    first = numpy.full(ngroups, -1, dtype=numpy.int64)
+    idxs = numpy.flatnonzero(mask)[::-1]
+    # Assigned in reverse so the first index of each group is the one that is kept
+    first[groups[idxs]] = idxs
+    return first
+
+
+@contextlib.contextmanager
+def _mapped(pdb):
+    """Memory-map a file read-only, giving an empty string for an empty file (which cannot be mapped)"""
+    with open(pdb, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            yield ''
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def _record_starts(data, record):
+    """Yield the offset of each line of data that starts with record"""
+    if data[:len(record)] == record:
+        yield 0
+    pattern = '\n' + record
+    offset = data.find(pattern)
+    while offset >= 0:
+        yield offset + 1
+        offset = data.find(pattern, offset + 1)
+
+
+def count_records(pdb, record):
+    """Return the number of records of a type, e.g. 'ENDMDL', in a pdb file without reading it into memory"""
+    with _mapped(pdb) as data:
+        return sum(1 for _ in _record_starts(data, record))
+
+
+def model_blocks(pdb):
+    """Yield the text of each model of a pdb file in turn
+
+    Each block runs from the end of the previous ENDMDL record up to and including the next ENDMDL
+    record, so the first block also holds any header records. Anything after the last ENDMDL record
+    is ignored. The file is memory-mapped so only the current block is ever copied into memory.
+    """
+    with _mapped(pdb) as data:
+        start = 0
+        for offset in _record_starts(data, 'ENDMDL'):
+            end = data.find('\n', offset)
+            end = len(data) if end < 0 else end + 1
+            yield data[start:end]
+            start = end
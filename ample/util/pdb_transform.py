@@ -0,0 +1,208 @@
+"""In-process selections and transformations of the coordinate records of PDB files
+
+These replace running pdbcur for the simple edits made by :mod:`pdb_edit <ample.util.pdb_edit>`. A file is read
+with :obj:`PdbAtoms <ample.util.pdb_reader.PdbAtoms>`, the atoms to keep are selected with boolean masks and the
+fixed columns of the lines are edited in place, so all other records are written out unchanged.
+"""
+
+__author__ = "Jens Thomas, and Felix Simkovic"
+__date__ = "17 Oct 2026"
+__version__ = "1.0"
+
+import collections
+import logging
+import math
+
+import numpy
+
+from ample.util import pdb_reader
+
+logger = logging.getLogger(__name__)
+
+# Residue names removed as solvent, as by the pdbcur delsolvent keyword
+SOLVENT_RESIDUES = ['HOH', 'WAT', 'H2O', 'DOD', 'D2O', 'SOL', 'TIP']
+# Records that give a chain ID in the same column as the ATOM records
+CHAIN_RECORDS = ['ATOM', 'HETATM', 'ANISOU', 'SIGATM', 'SIGUIJ', 'TER']
+# Records that belong to the atom before them
+ATOM_DATA_RECORDS = ['ANISOU', 'SIGATM', 'SIGUIJ']
+# Records that refer to atoms by serial number, which are not written once atoms are removed or renumbered
+SERIAL_RECORDS = ['CONECT', 'MASTER']
+
+_TER_FORMAT = "TER   {0:5d}      {1:>3s} {2:1s}{3:4d}{4:1s}"
+
+
+def _records(reader):
+    """Return the record name of each line, without any spaces"""
+    return numpy.char.strip(reader.columns['record'])
+
+
+def element_symbols(atoms):
+    """Return the element of each atom, from the atom name if the element column is blank"""
+    elements = numpy.char.upper(numpy.char.strip(atoms['element']))
+    # The element is right-justified in the first two columns of the name, ignoring the digits of hydrogen names
+    from_name = numpy.char.lstrip(atoms['name'].astype('S2'), '0123456789 ')
+    return numpy.where(elements == '', from_name, elements)
+
+
+def select_atoms(atoms, names=None, elements=None, chains=None, resnames=None):
+    """Return a mask of the atoms with one of the names, elements, chain IDs and residue names given"""
+    mask = numpy.ones(len(atoms), dtype=bool)
+    if names is not None:
+        mask &= numpy.in1d(pdb_reader.atom_names(atoms), names)
+    if elements is not None:
+        mask &= numpy.in1d(element_symbols(atoms), elements)
+    if chains is not None:
+        mask &= numpy.in1d(atoms['chainID'], chains)
+    if resnames is not None:
+        mask &= numpy.in1d(atoms['resName'], resnames)
+    return mask
+
+
+def most_probable(atoms):
+    """Return a mask of the atoms of the most probable conformation of each residue with alternate conformations
+
+    Atoms without an alternate location are always kept. The conformation with the highest mean occupancy
+    is kept, or the first if they are equal.
+    """
+    keep = numpy.in1d(atoms['altLoc'], [' ', ''])
+    occupancies = collections.OrderedDict()
+    alternates = numpy.flatnonzero(~keep)
+    for i in alternates:
+        residue = (atoms['model'][i], atoms['chainID'][i], atoms['resSeq'][i], atoms['iCode'][i])
+        occupancies.setdefault(residue, collections.OrderedDict()).setdefault(atoms['altLoc'][i], []).append(
+            atoms['occupancy'][i])
+    best = {}
+    for residue, conformations in occupancies.items():
+        best[residue] = max(conformations.keys(), key=lambda altloc: numpy.mean(conformations[altloc]))
+    for i in alternates:
+        residue = (atoms['model'][i], atoms['chainID'][i], atoms['resSeq'][i], atoms['iCode'][i])
+        keep[i] = atoms['altLoc'][i] == best[residue]
+    return keep
+
+
+def clear_altlocs(reader):
+    """Blank the alternate location of every atom"""
+    reader.columns['altLoc'][reader.atom_index] = ' '
+    reader.atoms['altLoc'] = ' '
+
+
+def rename_chains(reader, from_chains, to_chains):
+    """Rename each chain in from_chains to the chain at the same position in to_chains
+
+    The chains are renamed one after another, as by the pdbcur renchain keyword.
+    """
+    if len(from_chains) != len(to_chains):
+        raise RuntimeError("Need a new chain ID for each chain: {0} {1}".format(from_chains, to_chains))
+    is_chain_record = numpy.in1d(_records(reader), CHAIN_RECORDS)
+    chain_ids = reader.columns['chainID']
+    for from_chain, to_chain in zip(from_chains, to_chains):
+        chain_ids[is_chain_record & (chain_ids == from_chain)] = to_chain
+        reader.atoms['chainID'][reader.atoms['chainID'] == from_chain] = to_chain
+
+
+def cell(reader):
+    """Return the cell dimensions a, b, c, alpha, beta, gamma from the CRYST1 record"""
+    idxs = reader.record_index('CRYST1')
+    if not len(idxs):
+        raise RuntimeError("Cannot find a CRYST1 record")
+    line = reader.lines[idxs[0]]
+    return [float(line[i:j]) for i, j in [(6, 15), (15, 24), (24, 33), (33, 40), (40, 47), (47, 54)]]
+
+
+def orthogonalisation_matrix(a, b, c, alpha, beta, gamma):
+    """Return the matrix converting fractional to orthogonal coordinates, with a along x and b in the xy plane"""
+    cos_alpha, cos_beta, cos_gamma = [math.cos(math.radians(angle)) for angle in (alpha, beta, gamma)]
+    sin_gamma = math.sin(math.radians(gamma))
+    volume = math.sqrt(1.0 - cos_alpha ** 2 - cos_beta ** 2 - cos_gamma ** 2 + 2.0 * cos_alpha * cos_beta * cos_gamma)
+    return numpy.array([[a, b * cos_gamma, c * cos_beta],
+                        [0.0, b * sin_gamma, c * (cos_alpha - cos_beta * cos_gamma) / sin_gamma],
+                        [0.0, 0.0, c * volume / sin_gamma]])
+
+
+def fractional_to_orthogonal(reader):
+    """Return the matrix converting fractional to orthogonal coordinates for a pdb
+
+    The inverse of the SCALE records is used if there are any, as they define the orthogonal frame,
+    and otherwise the standard frame of the cell of the CRYST1 record.
+    """
+    idxs = [reader.record_index('SCALE{0}'.format(i)) for i in (1, 2, 3)]
+    if all(len(idx) for idx in idxs):
+        scale = numpy.array([[float(reader.lines[idx[0]][i:i + 10]) for i in (10, 20, 30)] for idx in idxs])
+        return numpy.linalg.inv(scale)
+    return orthogonalisation_matrix(*cell(reader))
+
+
+def translate(reader, shift, fractional=False):
+    """Translate all the atoms by shift, in fractional coordinates if fractional"""
+    shift = numpy.asarray(shift, dtype=numpy.float64)
+    if fractional:
+        shift = fractional_to_orthogonal(reader).dot(shift)
+    reader.atoms['xyz'] += shift
+    columns = reader.columns
+    for i, axis in enumerate(['x', 'y', 'z']):
+        columns[axis][reader.atom_index] = numpy.char.mod('%8.3f', reader.atoms['xyz'][:, i])
+
+
+def write(reader, pdbout, keep=None, renumber=False, anisou=True, models=True):
+    """Write the lines of a pdb with only the atoms in keep
+
+    Parameters
+    ----------
+    reader : :obj:`PdbAtoms <ample.util.pdb_reader.PdbAtoms>`
+       The pdb
+    pdbout : str
+       The pdb file to write
+    keep : :obj:`numpy.ndarray`, optional
+       A mask of the atoms to write - all the atoms if None. The ANISOU and TER records following an atom that is
+       not kept are not written, nor are the MODEL and ENDMDL records of any model without an atom that is kept.
+    renumber : bool
+       Renumber the atoms (and TER records) from 1, as by the pdbcur sernum keyword
+    anisou : bool
+       Write the ANISOU records
+    models : bool
+       Write the MODEL and ENDMDL records
+    """
+    nlines = len(reader.lines)
+    records = _records(reader)
+    is_atom = numpy.zeros(nlines, dtype=bool)
+    is_atom[reader.atom_index] = True
+    kept_atom = numpy.zeros(nlines, dtype=bool)
+    kept_atom[reader.atom_index] = True if keep is None else keep
+    # The index of the last atom and the last atom that is kept at or before each line
+    last_atom = numpy.maximum.accumulate(numpy.where(is_atom, numpy.arange(nlines), -1))
+    last_kept = numpy.maximum.accumulate(numpy.where(kept_atom, numpy.arange(nlines), -1))
+    follows_kept = (last_atom >= 0) & (last_atom == last_kept)
+
+    write_line = ~is_atom | kept_atom
+    is_data = numpy.in1d(records, ATOM_DATA_RECORDS)
+    write_line[is_data] = follows_kept[is_data] & anisou
+    # A TER record is kept if any of the atoms since the previous TER record are kept
+    is_ter = records == 'TER'
+    ter_block = numpy.cumsum(is_ter) - is_ter
+    kept_in_block = numpy.bincount(ter_block[kept_atom], minlength=ter_block[-1] + 1 if nlines else 0)
+    write_line[is_ter] = kept_in_block[ter_block[is_ter]] > 0
+    is_model = numpy.in1d(records, ['MODEL', 'ENDMDL'])
+    if models:
+        kept_models = numpy.unique(reader.atoms['model'][kept_atom[reader.atom_index]])
+        model_of_line = numpy.maximum(numpy.cumsum(records == 'MODEL') - 1, 0)
+        write_line[is_model] = numpy.in1d(model_of_line[is_model], kept_models)
+    else:
+        write_line[is_model] = False
+    if renumber or (keep is not None and not numpy.all(keep)):
+        write_line[numpy.in1d(records, SERIAL_RECORDS)] = False
+
+    lines = reader.lines.copy()
+    if renumber:
+        numbered = write_line & (is_atom | is_ter)
+        serials = numpy.cumsum(numbered)
+        # The ANISOU records take the serial number of their atom
+        atom_lines = numpy.flatnonzero(write_line & (is_atom | is_data))
+        lines.view(reader.columns.dtype)['serial'][atom_lines] = numpy.char.mod('%5d', serials[atom_lines])
+        for i in numpy.flatnonzero(numbered & is_ter):
+            atom = reader.atoms[numpy.searchsorted(reader.atom_index, last_kept[i])]
+            lines[i] = _TER_FORMAT.format(serials[i], atom['resName'], atom['chainID'], atom['resSeq'], atom['iCode'])
+    with open(pdbout, 'w') as f:
+        for line in lines[write_line]:
+            # Fields written beyond the end of a short line leave nulls between them and the line
+            f.write(line.replace('\0', ' ') + '\n')
+    return pdbout
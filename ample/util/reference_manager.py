@@ -10,7 +10,7 @@ import os
 
 from ample.util.ample_util import is_file
 from ample.constants import SHARE_DIR
-from ample.ensembler.constants import SPICKER_RMSD, SPICKER_TM
+from ample.ensembler.constants import SPICKER_RMSD, SPICKER_TM, SPICKER_NUMPY_RMSD, SPICKER_NUMPY_TM
 
  
 class ReferenceManager():
@@ -98,7 +98,7 @@ class ReferenceManager():
                     labels += ['CCTBX', 'THESEUS', 'GESAMT']
                     if optd.get('use_scwrl'):
                         labels.append('SCWRL4')
-                    elif optd['cluster_method'] in [SPICKER_RMSD, SPICKER_TM]:
+                    elif optd['cluster_method'] in [SPICKER_RMSD, SPICKER_TM, SPICKER_NUMPY_RMSD, SPICKER_NUMPY_TM]:
                         labels.append('SPICKER')
                     elif optd['cluster_method'] in ['fast_protein_cluster']:
                         labels.append('FPC')
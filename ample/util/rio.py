@@ -145,8 +145,8 @@ class Rio(object):
                        sourceChains=contactData.fromChains,
                        targetChains=contactData.toChains,
                        allAtom=True,
-                       maxDist=0.5 )
-        self.parseNcontLog( contactData )
+                       maxDist=0.5,
+                       contactData=contactData )
         
         contactData.aaNumContacts = contactData.numContacts
         
@@ -168,8 +168,7 @@ class Rio(object):
         self.runNcont( pdbin=contactData.joinedPdb,
                        sourceChains=contactData.fromChains,
                        targetChains=contactData.toChains,
-                        )
-        self.parseNcontLog( contactData )
+                       contactData=contactData )
         self.analyseRio( contactData )
         
         contactData.rioNumContacts = contactData.numContacts
@@ -368,11 +367,17 @@ class Rio(object):
             
         return ( None, joinedChunk )
 
-    def runNcont( self, pdbin=None, sourceChains=None, targetChains=None, maxDist=1.5, allAtom=False ):
-        """FOO
+    def runNcont( self, pdbin=None, sourceChains=None, targetChains=None, maxDist=1.5, allAtom=False,
+                  contactData=None ):
+        """Run ncont to find the contacts between the source and target chains
+        
+        If contactData is given the contacts are parsed into it as ncont writes them and no log is kept,
+        otherwise the output is written to the log for parseNcontLog.
         """
         
-        if allAtom:
+        if contactData is not None:
+            self.ncontLog = None
+        elif allAtom:
             self.ncontLog = pdbin + ".ncont_aa.log"
         else:
             self.ncontLog = pdbin + ".ncont_rio.log"
@@ -392,10 +397,12 @@ class Rio(object):
         stdin += "cells 2\n"
         stdin += "sort target inc\n"
         
-        retcode = ample_util.run_command(cmd=cmd, logfile=self.ncontLog, directory=os.getcwd(), dolog=True, stdin=stdin)
+        with ample_util.CommandOutput(cmd, logfile=self.ncontLog, directory=os.getcwd(), stdin=stdin) as output:
+            if contactData is not None:
+                self._parseNcontLines( contactData, output )
         
-        if retcode != 0: 
-            raise RuntimeError("Error running ncont command: {0}\nCheck log: {1}".format(cmd,self.ncontLog))
+        if output.returncode != 0: 
+            raise RuntimeError(output.error_message("Error running ncont command: {0}".format(cmd)))
     
     def parseNcontLog( self, contactData, logfile=None, clean_up=True):
         """
@@ -407,31 +414,46 @@ class Rio(object):
         
         if not logfile: logfile = self.ncontLog
         
+        with open( logfile, 'r' ) as f:
+            found = self._parseNcontLines( contactData, f )
+        
+        if found is False:
+            return False
+        
+        if clean_up: 
+            os.unlink(logfile)
+    
+    def _parseNcontLines( self, contactData, lines ):
+        """Set the contacts of contactData from the lines of ncont output, as they are read
+        
+        Returns False if ncont found no contacts
+        """
+        
         contactData.contacts = None
         contactData.numContacts = 0
         clines = []
         
         capture=False
-        with open( logfile, 'r' ) as f:#
-            while True:
-                line = f.readline().rstrip()
-                
-                if capture and not line:
-                    break
-                
-                if "contacts found:" in line:
-                    contactData.numContacts = int( line.split()[0] )
-                
-                if "NO CONTACTS FOUND." in line:
-                    return False
-                
-                if "SOURCE ATOMS" in line:
-                    capture=True
-                    f.readline() # skip blank line
-                    continue
-                
-                if capture:
-                    clines.append( line )
+        lines = iter( lines )
+        for line in lines:
+            line = line.rstrip()
+            
+            if capture and not line:
+                break
+            
+            if "contacts found:" in line:
+                contactData.numContacts = int( line.split()[0] )
+            
+            if "NO CONTACTS FOUND." in line:
+                return False
+            
+            if "SOURCE ATOMS" in line:
+                capture=True
+                next( lines, None ) # skip blank line
+                continue
+            
+            if capture:
+                clines.append( line )
             
         assert contactData.numContacts == len(clines)
 
@@ -471,8 +493,6 @@ class Rio(object):
             contacts.append( d )
     
         contactData.contacts = contacts
-        if clean_up: 
-            os.unlink(logfile)
     
     def helixFromPdbs(self, origin, mrPdb, nativePdb, nativeChain, dsspLog, workdir=os.getcwd() ):
         """This is a wrapper to generate the info and resSeqMap objects needed by score Origin"""
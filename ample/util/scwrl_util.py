@@ -16,6 +16,7 @@ class Scwrl( object ):
     def __init__(self, scwrl_exe=None, workdir=None ):
         self.workdir = workdir
         if self.workdir is None: self.workdir = os.getcwd()
+        self.workdir = os.path.abspath(self.workdir)
         if not ample_util.is_exe(scwrl_exe): 
             raise RuntimeError("scwrl_exe {0} cannot be found.".format(scwrl_exe))
         self.scwrl_exe = scwrl_exe
@@ -23,11 +24,12 @@ class Scwrl( object ):
     def add_sidechains(self, pdbin=None, pdbout=None, sequence=None, hydrogens=False, strip_oxt=False):
         """Add the specified sidechains to the pdb"""
         
+        pdbout = os.path.abspath(pdbout)
         _pdbout = pdbout
         if strip_oxt:
             _pdbout = pdbout+"_OXT"
         
-        cmd = [ self.scwrl_exe, "-i", pdbin, "-o", _pdbout ]
+        cmd = [ self.scwrl_exe, "-i", os.path.abspath(pdbin), "-o", _pdbout ]
         
         # Not needed by default
         if sequence is not None:
@@ -39,8 +41,8 @@ class Scwrl( object ):
         # Don't output hydrogens
         if not hydrogens: cmd += ['-h']
             
-        logfile = os.path.abspath("scwrl.log")
-        retcode = ample_util.run_command(cmd, logfile=logfile)
+        logfile = ample_util.tmp_file_name(directory=self.workdir, suffix='_scwrl.log')
+        retcode = ample_util.run_command(cmd, logfile=logfile, directory=self.workdir)
         
         if retcode != 0:
             raise RuntimeError("Error running Scwrl - please check the logfile: {0}".format(logfile))
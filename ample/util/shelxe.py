@@ -50,7 +50,7 @@ class MRinfo(object):
 
         """
         if work_dir is None: work_dir = os.getcwd()
-        self.work_dir = work_dir
+        self.work_dir = os.path.abspath(work_dir)
         self.shelxe_exe = shelxe_exe
         self.stem = 'shelxe-input-{}'.format(str(uuid.uuid1()))
 
@@ -87,13 +87,12 @@ class MRinfo(object):
 
         """
 
-        os.chdir(self.work_dir)
         input_pdb = self.stem + ".pda"
         shutil.copyfile(mr_pdb, os.path.join(self.work_dir, input_pdb))
 
         cmd = [self.shelxe_exe, input_pdb, '-a0', '-q', '-s0.5', '-o', '-n', '-t0', '-m0', '-x']
-        logfile = os.path.abspath('shelxe_{}.log'.format( str(uuid.uuid1())))
-        ret = ample_util.run_command(cmd=cmd, logfile=logfile, directory=None, dolog=False, stdin=None)
+        logfile = os.path.join(self.work_dir, 'shelxe_{}.log'.format(str(uuid.uuid1())))
+        ret = ample_util.run_command(cmd=cmd, logfile=logfile, directory=self.work_dir, dolog=False, stdin=None)
         if ret != 0: 
             raise RuntimeError("Error running shelxe - see log: {0}".format(logfile))
 
@@ -106,7 +105,7 @@ class MRinfo(object):
 
         for ext in ['.hkl', '.ent', '.pda','.pdo','.phs','.lst','_trace.ps']:
             try:
-                os.unlink(self.stem + ext)
+                os.unlink(os.path.join(self.work_dir, self.stem + ext))
             except:
                 pass
         os.unlink(logfile)
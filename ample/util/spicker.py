@@ -3,13 +3,13 @@
 import glob
 import logging
 import os
-import re
 import shutil
 import sys
 
+import numpy
+
 from ample.util import ample_util
-from ample.ensembler._ensembler import Cluster
-from ample.ensembler.constants import SPICKER_RMSD
+from ample.util import pdb_reader
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +17,8 @@ logger = logging.getLogger(__name__)
 class Spickerer(object):
     def __init__(self, spicker_exe=None, run_dir=None):
         """Initialise from a dictionary of options"""
+        # Imported here as the ensembler imports this module
+        from ample.ensembler.constants import SPICKER_RMSD
 
         if not spicker_exe:
             spicker_exe = os.path.join(os.environ['CCP4'], 'bin', 'spicker')
@@ -29,22 +31,17 @@ class Spickerer(object):
         self.score_type = 'rmsd'
 
     def get_length(self, pdb):
-        pdb = open(pdb)
-        counter = 0
-        for line in pdb:
-            pdb_pattern = re.compile('^ATOM')
-            pdb_result = pdb_pattern.match(line)
-            if pdb_result:
-                atom = line[13:16]
-                if re.search('CA', atom):
-                    counter += 1
-        return str(counter)
-
-    def create_input_files(self, models, score_type='rmsd', score_matrix=None):
+        atoms = pdb_reader.PdbAtoms.from_file(pdb, hetatm=False).atoms
+        return str(numpy.count_nonzero(pdb_reader.atom_names(atoms) == 'CA'))
+
+    def create_input_files(self, models, score_type='rmsd', score_matrix=None, coordinate_store=None):
         """
         jmht
         Create the input files required to run spicker
         (See notes in spicker.f FORTRAN file for a description of the required files)
+
+        If all the models are in the coordinate_store, the coordinates are taken from there
+        rather than by reading the models.
         """
         if not len(models):
             raise RuntimeError("no models provided!")
@@ -63,32 +60,17 @@ class Spickerer(object):
 # file_list - a list of the full path of all PDBs - used so we can loop through it and copy the selected
 # ones to the relevant directory after we have run spicker - the order of these must match the order
 # of the structures in the rep1.tra1 file
-        list_string = ''
-        counter = 0
-        with open('rep1.tra1', "w") as read_out, open('file_list', "w") as file_list:
-            for infile in models:
-                pdbname = os.path.basename(infile)
-                file_list.write(infile + '\n')
-                list_string = list_string + pdbname + '\n'
-                counter += 1
-                length = self.get_length(infile)
-                # 1st field is length, 2nd energy, 3rd & 4th don't seem to be used for anything
-                read_out.write('\t' + length + '\t926.917       ' + str(counter) + '       ' + str(counter) + '\n')
-                with open(infile) as read:
-                    # Write out the coordinates of the CA atoms
-                    for line in read:
-                        pattern = re.compile(
-                            '^ATOM\s*(\d*)\s*(\w*)\s*(\w*)\s*(\w)\s*(\d*)\s*(.\d*.\d*)\s*(.\d*.\d*)\s*(.\d*.\d*)\s*(.\d*.\d*)'
-                        )
-                        result = re.match(pattern, line)
-                        if result:
-                            split = re.split(pattern, line)
-                            if split[2] == 'CA':
-                                read_out.write('     ' + split[6] + '     ' + split[7] + '     ' + split[8] + '\n')
+        use_store = coordinate_store is not None and all(m in coordinate_store for m in models)
+        if use_store:
+            # Residues without a CA are left out of rep1.tra1 so must also be left out of seq.dat
+            residue_idxs = coordinate_store.common_residues(models)
+            length = self._write_coordinates_from_store(models, coordinate_store, residue_idxs)
+        else:
+            length = self._write_coordinates(models)
 
         # from spicker.f
         # *       'rmsinp'---Mandatory, length of protein & piece for RMSD calculation;
-        with open('rmsinp', "w") as rmsinp:
+        with open(os.path.join(self.run_dir, 'rmsinp'), "w") as rmsinp:
             rmsinp.write('1  ' + length + '\n\n')
             rmsinp.write(length + '\n')
 
@@ -106,22 +88,53 @@ class Spickerer(object):
         # *                  From second lines are the file names which contain coordinates
         # *                  of 3D structure decoys. All these files are mandatory
         par2 = '-2' if score_type == 'tm' else '-1'
-        with open('tra.in', "w") as tra:
+        with open(os.path.join(self.run_dir, 'tra.in'), "w") as tra:
             tra.write('1 {0} 1 \nrep1.tra1\n'.format(par2))
 
         # Create the file with the sequence of the PDB structures
         # from spicker.f
         # *       'seq.dat'--Mandatory, sequence file, for output of PDB models.
-        with open('seq.dat', "w") as seq, open(models[0], 'r') as a_pdb:
-            for line in a_pdb:
-                pattern = re.compile('^ATOM\s*(\d*)\s*(\w*)\s*(\w*)\s*(\w)\s*(\d*)\s*(\d*)\s')
-                result = re.match(pattern, line)
-                if result:
-                    split = re.split(pattern, line)
-                    if split[2] == 'CA':
-                        seq.write('\t' + split[5] + '\t' + split[3] + '\n')
+        if use_store:
+            resseqs, resnames = coordinate_store.residues(models[0])
+            with open(os.path.join(self.run_dir, 'seq.dat'), "w") as seq:
+                for resseq, resname in zip(resseqs[residue_idxs], resnames[residue_idxs]):
+                    seq.write('\t{0}\t{1}\n'.format(resseq, resname))
+        else:
+            atoms = pdb_reader.PdbAtoms.from_file(models[0], hetatm=False).atoms
+            with open(os.path.join(self.run_dir, 'seq.dat'), "w") as seq:
+                for atom in atoms[pdb_reader.atom_names(atoms) == 'CA']:
+                    seq.write('\t{0}\t{1}\n'.format(atom['resSeq'], atom['resName']))
         return
 
+    def _write_coordinates(self, models):
+        """Write the rep1.tra1 and file_list files by reading the models and return the length"""
+        with open(os.path.join(self.run_dir, 'rep1.tra1'), "w") as read_out, \
+                open(os.path.join(self.run_dir, 'file_list'), "w") as file_list:
+            for counter, infile in enumerate(models, start=1):
+                file_list.write(infile + '\n')
+                atoms = pdb_reader.PdbAtoms.from_file(infile, hetatm=False).atoms
+                xyz = atoms['xyz'][pdb_reader.atom_names(atoms) == 'CA']
+                length = str(len(xyz))
+                # 1st field is length, 2nd energy, 3rd & 4th don't seem to be used for anything
+                read_out.write('\t' + length + '\t926.917       ' + str(counter) + '       ' + str(counter) + '\n')
+                # Write out the coordinates of the CA atoms
+                for x, y, z in xyz:
+                    read_out.write('     {0:.3f}     {1:.3f}     {2:.3f}\n'.format(x, y, z))
+        return length
+
+    def _write_coordinates_from_store(self, models, coordinate_store, residue_idxs=None):
+        """Write the rep1.tra1 and file_list files from the coordinate store and return the length"""
+        coords = coordinate_store.ca_coordinates(models, residue_idxs)
+        length = str(coords.shape[1])
+        with open(os.path.join(self.run_dir, 'rep1.tra1'), "w") as read_out, \
+                open(os.path.join(self.run_dir, 'file_list'), "w") as file_list:
+            for counter, (infile, xyz) in enumerate(zip(models, coords), start=1):
+                file_list.write(infile + '\n')
+                read_out.write('\t' + length + '\t926.917       ' + str(counter) + '       ' + str(counter) + '\n')
+                for x, y, z in xyz:
+                    read_out.write('     {0:.3f}     {1:.3f}     {2:.3f}\n'.format(x, y, z))
+        return length
+
     def cluster(self,
                 models,
                 num_clusters=10,
@@ -129,7 +142,8 @@ class Spickerer(object):
                 run_dir=None,
                 score_type='rmsd',
                 score_matrix=None,
-                nproc=1):
+                nproc=1,
+                coordinate_store=None):
         """Cluster decoys using spicker
 
         Parameters
@@ -152,6 +166,8 @@ class Spickerer(object):
            The number of processors to use
         score_matrix : str, optional
            The path to the score matrix to be used
+        coordinate_store : :obj:`CoordinateStore <ample.util.coordinate_store.CoordinateStore>`, optional
+           A store holding the coordinates of the models
 
         Returns
         -------
@@ -163,7 +179,8 @@ class Spickerer(object):
         RuntimeError
            No clusters returned by SPICKER
         """
-        self._cluster(models, run_dir=run_dir, score_type=score_type, score_matrix=score_matrix, nproc=nproc)
+        self._cluster(models, run_dir=run_dir, score_type=score_type, score_matrix=score_matrix, nproc=nproc,
+                      coordinate_store=coordinate_store)
 
         ns_clusters = len(self.results)
         if ns_clusters == 0: 
@@ -191,24 +208,23 @@ class Spickerer(object):
 
         return clusters
 
-    def _cluster(self, models, run_dir=None, score_type='rmsd', score_matrix=None, nproc=1):
+    def _cluster(self, models, run_dir=None, score_type='rmsd', score_matrix=None, nproc=1, coordinate_store=None):
         """
         Run spicker to cluster the models
         """
-        owd = os.getcwd()
         if run_dir:
             self.run_dir = os.path.abspath(run_dir)
         if not self.run_dir:
-            self.run_dir = os.path.join(owd, 'spicker')
+            self.run_dir = os.path.join(os.getcwd(), 'spicker')
         if not os.path.isdir(self.run_dir):
             os.mkdir(self.run_dir)
-        os.chdir(self.run_dir)
 
         logger.debug("Running spicker with score_type {0} in directory: {1}".format(score_type, self.run_dir))
         logger.debug("Using executable: {0} on {1} processors".format(self.spicker_exe, nproc))
 
         self.score_type = score_type
-        self.create_input_files(models, score_type=score_type, score_matrix=score_matrix)
+        self.create_input_files(models, score_type=score_type, score_matrix=score_matrix,
+                                coordinate_store=coordinate_store)
 
         # We need special care if we are running with tm scores as we will be using the OPENMP
         # version of spicker which requires increasing the stack size on linux and setting the
@@ -226,16 +242,14 @@ class Spickerer(object):
 
             preexec_fn = set_stack
 
-        logfile = os.path.abspath("spicker.log")
-        rtn = ample_util.run_command([self.spicker_exe], logfile=logfile, env=env, preexec_fn=preexec_fn)
+        logfile = os.path.join(self.run_dir, "spicker.log")
+        rtn = ample_util.run_command([self.spicker_exe], logfile=logfile, directory=self.run_dir, env=env,
+                                     preexec_fn=preexec_fn)
         if not rtn == 0:
             raise RuntimeError("Error running spicker, check logfile: {0}".format(logfile))
 
         # Read the log and generate the results
         self.results = self.process_log()
-
-        # Always go back to where we started
-        os.chdir(owd)
         return
 
     def process_log(self, logfile=None):
@@ -276,6 +290,8 @@ class Spickerer(object):
                 index2rcens.append(i2rcen)
             line = f.readline()
 
+        from ample.ensembler._ensembler import Cluster
+
         # Sort clusters by the R_cen - distance from cluster centroid
         for i, l in enumerate(index2rcens):
             # Sort by the distance form the centroid, so first becomes centroid
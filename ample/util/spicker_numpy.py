@@ -0,0 +1,302 @@
+"""In-process SPICKER-style clustering of large numbers of decoys with numpy
+
+This follows the algorithm of SPICKER (Zhang & Skolnick, J. Comput. Chem. 25, 865-871, 2004):
+the cutoff is chosen from the variation of the pairwise scores, clusters are picked greedily
+around the decoy with the most neighbours within the cutoff and the members of each cluster
+are ordered by their RMSD to the cluster centroid (R_cen). The pairwise scores are calculated
+in blocks of rows on several threads and only held as one byte per pair.
+"""
+
+from __future__ import division
+
+__author__ = "Jens Thomas, and Felix Simkovic"
+__date__ = "17 Oct 2026"
+__version__ = "1.0"
+
+import functools
+import logging
+from multiprocessing.pool import ThreadPool
+import os
+
+import numpy
+
+from ample.util import coordinate_store as coordinate_store_module
+from ample.util import rmsd_util
+from ample.util.spicker import Spickerer
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of pairs of decoys to score at once in each thread
+MAX_BLOCK_PAIRS = 200000
+# Maximum number of superposed atom positions to hold at once when calculating TM-scores
+MAX_BLOCK_ATOMS = 1000000
+# Maximum number of decoys above which the binned scores are held in a file rather than in memory
+MAX_IN_MEMORY = 5000
+
+# Scores are binned so that lower bins are more similar: the RMSD in 0.1 Angstrom bins and 1 - TM-score in 0.01 bins
+BIN_WIDTHS = {'rmsd': 0.1, 'tm': 0.01}
+# The initial, loosest and strictest cutoffs used when determining the cutoff from the variation
+CUTOFFS = {'rmsd': (8.0, 12.0, 3.5), 'tm': (0.5, 0.35, 0.8)}
+# The cutoff is adjusted until the largest cluster holds between these fractions of the decoys
+MIN_LARGEST_FRACTION = 0.15
+MAX_LARGEST_FRACTION = 0.7
+
+
+def tm_d0(length):
+    """Return the TM-score distance scale for a structure of length residues"""
+    if length <= 15:
+        return 0.5
+    return max(0.5, 1.24 * (length - 15) ** (1.0 / 3.0) - 1.8)
+
+
+def _superpose_block(coords1, coords2, rotations, centres1=None, centres2=None):
+    """Return the squared distances between the atoms of coords1 rotated onto coords2 for all pairs"""
+    rotations = rotations.transpose(0, 1, 3, 2)
+    if centres1 is None:
+        superposed = numpy.matmul(coords1[:, numpy.newaxis], rotations)
+        return ((superposed - coords2[numpy.newaxis]) ** 2).sum(axis=-1)
+    superposed = numpy.matmul(coords1[:, numpy.newaxis] - centres1[:, :, numpy.newaxis], rotations)
+    superposed += centres2[:, :, numpy.newaxis]
+    return ((superposed - coords2[numpy.newaxis]) ** 2).sum(axis=-1)
+
+
+def tm_score_block(coords1, coords2):
+    """Return approximate TM-scores between two sets of centred structures
+
+    The TM-score is the maximum over all superpositions. Here the superposition of all atoms
+    and the superposition of the atoms that lie within the TM-score search distance after it
+    are tried, which is the first iteration of the heuristic search in TM-score
+    (Zhang & Skolnick, Proteins 57, 702-710, 2004).
+
+    Parameters
+    ----------
+    coords1 : :obj:`numpy.ndarray`
+       An array of centred coordinates of shape (N1, L, 3)
+    coords2 : :obj:`numpy.ndarray`
+       An array of centred coordinates of shape (N2, L, 3)
+
+    Returns
+    -------
+    :obj:`numpy.ndarray`
+       An (N1, N2) array of TM-scores
+    """
+    n1, natoms = coords1.shape[0], coords1.shape[1]
+    d02 = tm_d0(natoms) ** 2
+    search2 = min(max(tm_d0(natoms), 4.5), 8.0) ** 2
+    scores = numpy.zeros((n1, coords2.shape[0]))
+    step = max(1, MAX_BLOCK_ATOMS // (n1 * natoms))
+    for start in range(0, coords2.shape[0], step):
+        stop = min(start + step, coords2.shape[0])
+        y = coords2[start:stop]
+        rotations = rmsd_util.kabsch_rotations(rmsd_util.covariance_block(coords1, y))
+        distances2 = _superpose_block(coords1, y, rotations)
+        score = (1.0 / (1.0 + distances2 / d02)).mean(axis=-1)
+        # Superpose the atoms within the search distance
+        weights = (distances2 < search2).astype(numpy.float64)
+        nweights = weights.sum(axis=-1)
+        refine = nweights >= 3
+        nweights = numpy.maximum(nweights, 1.0)[..., numpy.newaxis]
+        centres1 = numpy.einsum('ijl,ila->ija', weights, coords1) / nweights
+        centres2 = numpy.einsum('ijl,jla->ija', weights, y) / nweights
+        covariance = numpy.matmul((weights[..., numpy.newaxis] * coords1[:, numpy.newaxis]).transpose(0, 1, 3, 2),
+                                  y[numpy.newaxis])
+        covariance -= nweights[..., numpy.newaxis] * numpy.einsum('ija,ijb->ijab', centres1, centres2)
+        rotations = rmsd_util.kabsch_rotations(covariance)
+        distances2 = _superpose_block(coords1, y, rotations, centres1, centres2)
+        refined = (1.0 / (1.0 + distances2 / d02)).mean(axis=-1)
+        scores[:, start:stop] = numpy.where(refine, numpy.maximum(score, refined), score)
+    return scores
+
+
+def _cutoff_bin(cutoff, score_type):
+    """Return the bin of a cutoff so that decoys in lower bins are within the cutoff"""
+    if score_type == 'tm':
+        cutoff = 1.0 - cutoff
+    return int(round(cutoff / BIN_WIDTHS[score_type]))
+
+
+def _score_rows(coords, score_type, nbins, bins, block):
+    """Score a block of rows against all decoys, store the binned scores and return their histograms"""
+    start, stop = block
+    if score_type == 'tm':
+        scores = 1.0 - tm_score_block(coords[start:stop], coords)
+    else:
+        scores = rmsd_util.rmsd_block(coords[start:stop], coords)
+    binned = numpy.minimum((scores / BIN_WIDTHS[score_type]).astype(numpy.int64), nbins)
+    bins[start:stop] = binned
+    offsets = numpy.arange(stop - start)[:, numpy.newaxis] * (nbins + 1)
+    return numpy.bincount((binned + offsets).ravel(), minlength=(stop - start) * (nbins + 1)).reshape(-1, nbins + 1)
+
+
+def choose_cutoff(histograms, score_type='rmsd'):
+    """Return the bin of the cutoff based on the variation of the scores
+
+    Starting from the initial cutoff, the cutoff is made stricter or looser until the decoy
+    with the most neighbours has between MIN_LARGEST_FRACTION and MAX_LARGEST_FRACTION of
+    all decoys as neighbours.
+
+    Parameters
+    ----------
+    histograms : :obj:`numpy.ndarray`
+       An (N, nbins + 1) array of the number of decoys in each score bin for each decoy
+    score_type : str
+       rmsd or tm
+
+    Returns
+    -------
+    int
+       The bin of the cutoff
+    """
+    ndecoys = histograms.shape[0]
+    counts = numpy.cumsum(histograms, axis=1)
+    initial, loosest, strictest = [_cutoff_bin(c, score_type) for c in CUTOFFS[score_type]]
+
+    def largest(cutoff_bin):
+        return counts[:, cutoff_bin - 1].max() / ndecoys
+
+    cutoff_bin = initial
+    while cutoff_bin > strictest and largest(cutoff_bin) > MAX_LARGEST_FRACTION:
+        cutoff_bin -= 1
+    while cutoff_bin < loosest and largest(cutoff_bin) < MIN_LARGEST_FRACTION:
+        cutoff_bin += 1
+    return cutoff_bin
+
+
+def centroid_distances(coords, centre, members):
+    """Return the RMSDs of the members of a cluster to their centroid after superposition on the centre"""
+    superposed = coords[members]
+    rotations = rmsd_util.kabsch_rotations(rmsd_util.covariance_block(superposed, coords[centre][numpy.newaxis]))
+    superposed = numpy.einsum('kab,klb->kla', rotations[:, 0], superposed)
+    return rmsd_util.rmsd_to_reference(superposed.mean(axis=0), superposed)
+
+
+def cluster_coordinates(coords, score_type='rmsd', nproc=1, scratch_file=None):
+    """Cluster a set of structures following the SPICKER algorithm
+
+    Parameters
+    ----------
+    coords : :obj:`numpy.ndarray`
+       An array of coordinates of shape (N, L, 3)
+    score_type : str
+       Cluster by rmsd or tm score
+    nproc : int
+       The number of threads to calculate the scores on
+    scratch_file : str, optional
+       A file to hold the binned scores if there are more than MAX_IN_MEMORY structures
+
+    Returns
+    -------
+    tuple
+       The cutoff and a list of (indices, r_cen) tuples for each cluster, largest first, with the indices
+       ordered by the distance from the cluster centroid
+    """
+    if score_type not in BIN_WIDTHS:
+        raise RuntimeError("Unrecognised score_type: {0}".format(score_type))
+    coords = rmsd_util.centre(coords)
+    ndecoys = coords.shape[0]
+    nbins = _cutoff_bin(CUTOFFS[score_type][1], score_type)
+    if ndecoys > MAX_IN_MEMORY and scratch_file:
+        bins = numpy.memmap(scratch_file, dtype=numpy.uint8, mode='w+', shape=(ndecoys, ndecoys))
+    else:
+        bins = numpy.zeros((ndecoys, ndecoys), dtype=numpy.uint8)
+
+    rows = max(1, MAX_BLOCK_PAIRS // ndecoys)
+    blocks = [(start, min(start + rows, ndecoys)) for start in range(0, ndecoys, rows)]
+    score = functools.partial(_score_rows, coords, score_type, nbins, bins)
+    if nproc > 1 and len(blocks) > 1:
+        pool = ThreadPool(min(nproc, len(blocks)))
+        try:
+            histograms = pool.map(score, blocks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        histograms = [score(block) for block in blocks]
+    histograms = numpy.concatenate(histograms)
+
+    cutoff_bin = choose_cutoff(histograms, score_type)
+    cutoff = cutoff_bin * BIN_WIDTHS[score_type]
+    if score_type == 'tm':
+        cutoff = 1.0 - cutoff
+    counts = histograms[:, :cutoff_bin].sum(axis=1)
+    logger.debug("Clustering %d decoys with a %s cutoff of %.2f", ndecoys, score_type, cutoff)
+
+    clusters = []
+    remaining = numpy.ones(ndecoys, dtype=bool)
+    while remaining.any():
+        centre = int(numpy.argmax(numpy.where(remaining, counts, -1)))
+        members = numpy.flatnonzero((bins[centre] < cutoff_bin) & remaining)
+        remaining[members] = False
+        for start in range(0, len(members), rows):
+            counts -= (bins[members[start:start + rows]] < cutoff_bin).sum(axis=0)
+        r_cen = centroid_distances(coords, centre, members)
+        order = numpy.argsort(r_cen, kind='mergesort')
+        clusters.append((members[order], r_cen[order]))
+
+    if isinstance(bins, numpy.memmap):
+        del bins, score
+        os.unlink(scratch_file)
+    return cutoff, clusters
+
+
+class NumpySpickerer(Spickerer):
+    """Cluster decoys in-process following the SPICKER algorithm
+
+    No executable is required and the coordinates are taken from the coordinate store when
+    all the models are in it, so this is suited to clustering many thousands of decoys.
+    """
+
+    def __init__(self, run_dir=None):
+        # Imported here as the ensembler imports this module
+        from ample.ensembler.constants import SPICKER_NUMPY_RMSD
+
+        self.spicker_exe = None
+        self.run_dir = run_dir
+        self.results = None
+        self.cluster_method = SPICKER_NUMPY_RMSD
+        self.score_type = 'rmsd'
+        self.cutoff = None
+
+    def _cluster(self, models, run_dir=None, score_type='rmsd', score_matrix=None, nproc=1, coordinate_store=None):
+        """
+        Cluster the models
+        """
+        from ample.ensembler._ensembler import Cluster
+        from ample.ensembler.constants import SPICKER_NUMPY_RMSD, SPICKER_NUMPY_TM
+
+        if score_matrix:
+            raise RuntimeError("Cannot cluster from a score_matrix with {0}".format(SPICKER_NUMPY_RMSD))
+        if not len(models):
+            raise RuntimeError("no models provided!")
+        if run_dir:
+            self.run_dir = os.path.abspath(run_dir)
+        if not self.run_dir:
+            self.run_dir = os.path.join(os.getcwd(), 'spicker')
+        if not os.path.isdir(self.run_dir):
+            os.mkdir(self.run_dir)
+
+        self.score_type = score_type.lower() if score_type else 'rmsd'
+        self.cluster_method = SPICKER_NUMPY_TM if self.score_type == 'tm' else SPICKER_NUMPY_RMSD
+        logger.debug("Clustering %d models with score_type %s on %d threads in directory: %s", len(models),
+                     self.score_type, nproc, self.run_dir)
+
+        if coordinate_store is None or not all(m in coordinate_store for m in models):
+            coordinate_store = coordinate_store_module.CoordinateStore()
+            coordinate_store.add_models(models)
+        coords = coordinate_store.ca_coordinates(models)
+        self.cutoff, clusters = cluster_coordinates(coords, score_type=self.score_type, nproc=nproc,
+                                                    scratch_file=os.path.join(self.run_dir, 'score_bins.dat'))
+
+        self.results = []
+        for i, (indices, r_cen) in enumerate(clusters):
+            result = Cluster()
+            result.cluster_method = self.cluster_method
+            result.cluster_score_type = self.score_type
+            result.index = i + 1
+            result.num_clusters = len(clusters)
+            result.models = [models[idx] for idx in indices]
+            result.r_cen = [float(r) for r in r_cen]
+            with open(os.path.join(self.run_dir, "spicker_cluster_{0}.list".format(i + 1)), "w") as f:
+                f.write("\n".join(result.models) + "\n")
+            self.results.append(result)
+        return
@@ -3,9 +3,14 @@
 import pickle
 import os
 import shutil
+import sys
 import tempfile
 import unittest
+
+import numpy
+
 from ample.util import ample_util
+from ample.util import pdb_edit
 from ample.constants import AMPLE_PKL, SHARE_DIR
 
 
@@ -78,6 +83,43 @@ class Test(unittest.TestCase):
         for f in files:
             os.unlink(f)
 
+    def test_save_amoptd_pdb_info(self):
+        # Objects with __slots__, such as the PdbInfo saved by benchmarking, must pickle at the default protocol
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        info = pdb_edit.get_info(os.path.join(self.testfiles_dir, '1GU8.pdb'))
+        amoptd = {'results_path': os.path.join(work_dir, AMPLE_PKL), 'native_pdb_info': info}
+        ample_util.save_amoptd(amoptd)
+        loaded = ample_util.read_amoptd(amoptd['results_path'])['native_pdb_info']
+        self.assertEqual(info.pdb, loaded.pdb)
+        self.assertEqual(info.models[0].chains, loaded.models[0].chains)
+        self.assertEqual(info.models[0].sequences, loaded.models[0].sequences)
+        # The atoms of each chain are a record array
+        self.assertTrue(numpy.array_equal(info.models[0].atoms[0]['name'], loaded.models[0].atoms[0]['name']))
+        self.assertTrue(numpy.array_equal(info.models[0].atoms[0]['xyz'], loaded.models[0].atoms[0]['xyz']))
+
+    def test_command_output(self):
+        work_dir = tempfile.mkdtemp()
+        logfile = os.path.join(work_dir, 'out.log')
+        script = "import sys\nfor i in range(1000): print(i)\nsys.stdout.write(sys.stdin.read())\nsys.exit(3)"
+        with ample_util.CommandOutput([sys.executable, '-c', script], logfile=logfile, directory=work_dir,
+                                      stdin="end\n", tail_lines=2) as output:
+            # Stop reading early - the rest of the output is still read and logged
+            for line in output:
+                if line == "10\n":
+                    break
+        self.assertEqual(3, output.returncode)
+        self.assertEqual("999\nend\n", output.tail)
+        with open(logfile) as f:
+            self.assertEqual(1001, len(f.readlines()))
+        shutil.rmtree(work_dir)
+
+        with ample_util.CommandOutput([sys.executable, '-c', "print('a')\nprint('b')"]) as output:
+            lines = list(output)
+        self.assertEqual(["a\n", "b\n"], lines)
+        self.assertEqual(0, output.returncode)
+        self.assertIn("a\nb\n", output.error_message("error"))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,147 @@
+"""Test functions for util.cache_util"""
+
+import glob
+import multiprocessing.pool
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from ample import constants
+from ample.util import cache_util
+from ample.util import coordinate_store
+
+
+class Test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.models = sorted(glob.glob(os.path.join(constants.SHARE_DIR, 'testfiles', 'models', '*.pdb')))
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    @staticmethod
+    def write_file(size):
+        def writer(directory):
+            with open(os.path.join(directory, 'data'), 'w') as f:
+                f.write('x' * size)
+        return writer
+
+    def test_key(self):
+        key = cache_util.ResultCache.key('theseus', 'exe:1:2', ['a.pdb', 'b.pdb'], [1, 2])
+        self.assertEqual(key, cache_util.ResultCache.key('theseus', u'exe:1:2', ('a.pdb', 'b.pdb'), [1, 2]))
+        self.assertNotEqual(key, cache_util.ResultCache.key('theseus', 'exe:1:2', ['b.pdb', 'a.pdb'], [1, 2]))
+        self.assertNotEqual(key, cache_util.ResultCache.key('theseus', 'exe:1:2', ['a.pdb', 'b.pdb'], [1, 3]))
+
+    def test_models_hash(self):
+        # Headers and remarks are not part of the hash
+        model = os.path.join(self.work_dir, 'model.pdb')
+        with open(self.models[0]) as f:
+            atoms = f.read()
+        with open(model, 'w') as f:
+            f.write("REMARK   1 WRITTEN TODAY\n" + atoms)
+        hashes = cache_util.models_hash([self.models[0], model, self.models[1]])
+        self.assertEqual(hashes[0], hashes[1])
+        self.assertNotEqual(hashes[0], hashes[2])
+
+        # Models that are only in the coordinate store are hashed from their coordinates
+        store = coordinate_store.CoordinateStore.from_models(self.models[:2])
+        truncated = os.path.join(self.work_dir, 'truncated.pdb')
+        store.add_subset(truncated, self.models[0], [0, 1, 2])
+        hashes = cache_util.models_hash([truncated, self.models[0]], coordinate_store=store)
+        self.assertEqual(2, len(hashes))
+        self.assertNotEqual(hashes[0], hashes[1])
+        self.assertRaises(RuntimeError, cache_util.models_hash, [truncated])
+
+    def test_store_get(self):
+        cache = cache_util.ResultCache(os.path.join(self.work_dir, 'cache'))
+        key = cache.key('test')
+        self.assertIsNone(cache.get(key))
+        entry = cache.store(key, self.write_file(10))
+        self.assertEqual(entry, cache.get(key))
+        self.assertTrue(os.path.isfile(os.path.join(entry, 'data')))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        # Storing the same result again keeps the existing entry
+        self.assertEqual(entry, cache.store(key, self.write_file(20)))
+        self.assertEqual(1, len(cache.entries()))
+
+    def test_evict(self):
+        # Room for two entries of 400 kB
+        cache = cache_util.ResultCache(self.work_dir, max_size=0.8)
+        keys = [cache.key(i) for i in range(3)]
+        for i, key in enumerate(keys[:2]):
+            entry = cache.store(key, self.write_file(400 * 1024))
+            os.utime(os.path.join(entry, cache_util.ENTRY_MARKER), (time.time() - 100 + i, time.time() - 100 + i))
+        # Using the oldest entry means the second is the least recently used
+        self.assertTrue(cache.get(keys[0]))
+        cache.store(keys[2], self.write_file(400 * 1024))
+        self.assertTrue(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertTrue(cache.get(keys[2]))
+        self.assertLessEqual(cache.size(), 0.8)
+
+    def test_file_cache(self):
+        reads = []
+
+        def reader(path):
+            reads.append(path)
+            with open(path) as f:
+                return f.read()
+
+        cache = cache_util.FileCache(reader, max_entries=2)
+        paths = [os.path.join(self.work_dir, 'file{0}'.format(i)) for i in range(3)]
+        for path in paths:
+            with open(path, 'w') as f:
+                f.write(path)
+        self.assertEqual(paths[0], cache.get(paths[0]))
+        self.assertEqual(paths[0], cache.get(os.path.relpath(paths[0])))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+        # A rewritten file is read again
+        with open(paths[0], 'w') as f:
+            f.write('changed')
+        self.assertEqual('changed', cache.get(paths[0]))
+        self.assertEqual(2, len(reads))
+
+        # The least recently used file is dropped
+        cache.get(paths[1])
+        cache.get(paths[0])
+        cache.get(paths[2])
+        self.assertEqual(2, len(cache))
+        cache.get(paths[0])
+        cache.get(paths[1])
+        self.assertEqual([paths[1], paths[2], paths[1]], reads[2:])
+        self.assertEqual((3, 5), (cache.hits, cache.misses))
+        cache.clear()
+        self.assertEqual((0, 0, 0), (len(cache), cache.hits, cache.misses))
+
+    def test_file_cache_threads(self):
+        def reader(path):
+            with open(path) as f:
+                return f.read()
+
+        cache = cache_util.FileCache(reader, max_entries=5)
+        paths = [os.path.join(self.work_dir, 'file{0}'.format(i)) for i in range(10)]
+        for path in paths:
+            with open(path, 'w') as f:
+                f.write(path)
+        # Many more gets than entries, so entries are being added and dropped by all the threads at once
+        requests = [paths[i % len(paths)] for i in range(20000)]
+        pool = multiprocessing.pool.ThreadPool(8)
+        try:
+            values = pool.map(cache.get, requests, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(requests, values)
+        self.assertEqual(len(requests), cache.hits + cache.misses)
+        self.assertLessEqual(len(cache), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
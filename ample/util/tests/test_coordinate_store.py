@@ -0,0 +1,117 @@
+"""Test functions for util.coordinate_store"""
+
+import glob
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+from ample import constants
+from ample.util import coordinate_store
+from ample.util import pdb_edit
+
+
+class Test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.testfiles_dir = os.path.join(constants.SHARE_DIR, 'testfiles')
+        cls.models = sorted(glob.glob(os.path.join(cls.testfiles_dir, 'models', '*.pdb')))
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_read_residues(self):
+        pdbin = os.path.join(self.testfiles_dir, "4DZN.pdb")
+        residues = coordinate_store.read_residues(pdbin)
+        # The ACE and PHI HETATM residues are skipped as in pdb_edit.select_residues
+        self.assertEqual(31, len(residues))
+        self.assertEqual([1, 'GLY', (22.806, 12.124, -9.698), (22.806, 12.124, -9.698)], residues[0])
+        self.assertEqual([2, 'GLU', (20.675, 9.156, -8.637), (19.625, 8.485, -9.531)], residues[1])
+        ca = [xyz for resseq, xyz in pdb_edit.xyz_ca_coordinates(pdbin) if resseq != 22]
+        self.assertEqual(ca, [r[2] for r in residues])
+
+    def test_store(self):
+        store = coordinate_store.CoordinateStore()
+        store.add_models(self.models)
+        self.assertEqual(30, len(store))
+        ca = store.ca_coordinates(self.models)
+        self.assertEqual((30, 59, 3), ca.shape)
+        self.assertEqual(numpy.float32, ca.dtype)
+        self.assertTrue(numpy.allclose([1.458, 0.0, 0.0], ca[0, 0]))
+        self.assertTrue(numpy.allclose([1.994, -0.762, -1.215], store.cb_coordinates(self.models[:1])[0, 0]))
+        resseq, resname = store.residues(self.models[0])
+        self.assertEqual([1, 2, 3], list(resseq[:3]))
+        self.assertEqual(['GLN', 'PRO', 'ARG'], [str(r) for r in resname[:3]])
+
+    def test_subsets(self):
+        store = coordinate_store.CoordinateStore()
+        store.add_models(self.models[:2])
+        truncated = os.path.join(self.work_dir, 'truncated.pdb')
+        truncated2 = os.path.join(self.work_dir, 'truncated2.pdb')
+        store.add_subset(truncated, self.models[0], [0, 2, 4])
+        store.add_subset(truncated2, truncated, [1])
+        self.assertIn(truncated, store)
+        self.assertEqual(3, store.num_residues(truncated))
+        self.assertEqual([3], list(store.residues(truncated2)[0]))
+        self.assertTrue(numpy.allclose(store.ca_coordinates([self.models[0]])[:, [2]],
+                                       store.ca_coordinates([truncated2])))
+
+    def test_missing_ca(self):
+        nan = (float('nan'),) * 3
+        residues = [[[1, 'GLY', (0.0, 0.0, 0.0), (0.0, 0.0, 0.0)],
+                     [2, 'ALA', nan, (1.0, 1.0, 1.0)],
+                     [3, 'SER', (2.0, 2.0, 2.0), (3.0, 3.0, 3.0)]],
+                    [[1, 'GLY', (0.0, 0.0, 1.0), (0.0, 0.0, 1.0)],
+                     [2, 'ALA', (1.0, 0.0, 1.0), (1.0, 1.0, 1.0)],
+                     [3, 'SER', (2.0, 0.0, 2.0), (3.0, 0.0, 3.0)]]]
+        models = [os.path.join(self.work_dir, '1.pdb'), os.path.join(self.work_dir, '2.pdb')]
+        store = coordinate_store.CoordinateStore()
+        store.add_models(models, model_residues=residues)
+        # The residue without a CA in the first model is left out of both models' CA and CB coordinates
+        self.assertEqual([0, 2], list(store.common_residues(models)))
+        self.assertEqual([0, 1, 2], list(store.common_residues(models[1:])))
+        self.assertEqual([2], list(store.common_residues(models, [1, 2])))
+        self.assertEqual((2, 2, 3), store.ca_coordinates(models).shape)
+        self.assertTrue(numpy.allclose([[3.0, 3.0, 3.0], [3.0, 0.0, 3.0]], store.cb_coordinates(models)[:, 1]))
+        self.assertEqual((2, 1, 3), store.cb_coordinates(models, [1, 2]).shape)
+
+    def test_save_load(self):
+        path = os.path.join(self.work_dir, coordinate_store.COORDINATE_STORE_NAME)
+        store = coordinate_store.CoordinateStore.from_models(self.models[:3], path=path)
+        truncated = os.path.join(self.work_dir, 'truncated.pdb')
+        store.add_subset(truncated, self.models[1], [5, 6])
+        store.save(path)
+        loaded = coordinate_store.CoordinateStore.from_models(self.models[:3], path=path)
+        self.assertEqual(store.models, loaded.models)
+        self.assertTrue(numpy.all(store.ca_coordinates([truncated]) == loaded.ca_coordinates([truncated])))
+        # A different set of models is read again
+        self.assertNotIn(truncated, coordinate_store.CoordinateStore.from_models(self.models[:2], path=path))
+
+    def test_changed_models(self):
+        models = []
+        for model in self.models[:3]:
+            models.append(os.path.join(self.work_dir, os.path.basename(model)))
+            shutil.copy(model, models[-1])
+        path = os.path.join(self.work_dir, 'saved.npz')
+        store = coordinate_store.CoordinateStore.from_models(models, path=path)
+        truncated = os.path.join(self.work_dir, 'truncated.pdb')
+        store.add_subset(truncated, models[1], [5, 6])
+        store.save(path)
+        self.assertTrue(coordinate_store.CoordinateStore.load(path).is_current())
+        self.assertIn(truncated, coordinate_store.CoordinateStore.from_models(models, path=path))
+        # A model that has been replaced with a different one of the same name is read again
+        shutil.copy(self.models[3], models[1])
+        self.assertFalse(coordinate_store.CoordinateStore.load(path).is_current())
+        store = coordinate_store.CoordinateStore.from_models(models, path=path)
+        self.assertNotIn(truncated, store)
+        self.assertTrue(numpy.allclose(coordinate_store.read_residues(self.models[3])[0][2],
+                                       store.ca_coordinates([models[1]])[0, 0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+"""Test functions for util.decoy_archive"""
+
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from ample import constants
+from ample.util import coordinate_store
+from ample.util import decoy_archive
+from ample.util import model_source
+from ample.util import pdb_reader
+
+
+class Test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.testfiles_dir = os.path.join(constants.SHARE_DIR, 'testfiles')
+        cls.models_dir = os.path.join(cls.testfiles_dir, 'models')
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.archive_path = os.path.join(self.work_dir, 'models' + decoy_archive.DECOY_ARCHIVE_SUFFIX)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_create(self):
+        archive = decoy_archive.DecoyArchive.create(self.archive_path, model_source.ModelSource(self.models_dir))
+        models = sorted(glob.glob(os.path.join(self.models_dir, '*.pdb')))
+        self.assertEqual([os.path.basename(m) for m in models], archive.names)
+        self.assertTrue(decoy_archive.is_decoy_archive(self.archive_path))
+        self.assertFalse(decoy_archive.is_decoy_archive(models[0]))
+        for model in models[::-1]:
+            atoms = pdb_reader.PdbAtoms.from_file(model).atoms
+            stored = archive.atoms(os.path.basename(model))
+            for field in ['name', 'resName', 'chainID', 'resSeq', 'xyz']:
+                self.assertTrue(numpy.all(atoms[field] == stored[field]))
+
+    def test_export(self):
+        pdbin = os.path.join(self.testfiles_dir, '2UUI.pdb')
+        with open(pdbin) as f:
+            archive = decoy_archive.DecoyArchive.create(self.archive_path, [('2UUI.pdb', f.read())])
+        with open(pdbin) as f:
+            atoms = [l[:78] for l in f if l.startswith(('ATOM  ', 'HETATM'))]
+        pdbout, = archive.export(os.path.join(self.work_dir, 'export'))
+        self.assertEqual(os.path.join(self.work_dir, 'export', '2UUI.pdb'), pdbout)
+        with open(pdbout) as f:
+            self.assertEqual(atoms, [l[:78] for l in f if l.startswith(('ATOM  ', 'HETATM'))])
+
+    def test_metadata(self):
+        score_file = os.path.join(self.work_dir, 'score.fsc')
+        with open(score_file, 'w') as f:
+            f.write("SCORE: score rms maxsub description\n")
+            f.write("SCORE: -101.5 8.2 45.0 1_S_00000001\n")
+            f.write("SCORE: -99.0 7.1 50.0 1_S_00000002\n")
+        scores = decoy_archive.read_rosetta_scores(score_file)
+        self.assertEqual({'score': -101.5, 'rms': 8.2, 'maxsub': 45.0}, scores['1_S_00000001.pdb'])
+        source = model_source.ModelSource(self.models_dir, filenames=['1_S_00000001.pdb', '1_S_00000003.pdb'])
+        decoy_archive.DecoyArchive.create(self.archive_path, source, metadata=scores)
+        archive = decoy_archive.DecoyArchive(self.archive_path)
+        self.assertEqual(-101.5, archive.metadata('1_S_00000001.pdb')['score'])
+        self.assertEqual({}, archive.metadata('1_S_00000003.pdb'))
+        self.assertNotIn('1_S_00000002.pdb', archive)
+
+    def test_load(self):
+        decoy_archive.DecoyArchive.create(self.archive_path, model_source.ModelSource(self.models_dir))
+        source = model_source.ModelSource(self.archive_path)
+        self.assertEqual('decoys', source.kind)
+        models_dir = os.path.join(self.work_dir, 'models')
+        store = coordinate_store.CoordinateStore()
+        paths, _ = source.load(models_dir, coordinate_store=store)
+        self.assertEqual(sorted(os.listdir(self.models_dir)), sorted(os.listdir(models_dir)))
+        models_store = coordinate_store.CoordinateStore()
+        models, _ = model_source.ModelSource(self.models_dir).load(coordinate_store=models_store)
+        self.assertEqual([os.path.basename(p) for p in models], [os.path.basename(p) for p in paths])
+        for model, path in zip(models, paths):
+            for expected, residues in zip(models_store.residues(model), store.residues(path)):
+                self.assertTrue(numpy.all(expected == residues))
+        self.assertTrue(numpy.all(store.ca_coordinates(paths) == models_store.ca_coordinates(models)))
+        self.assertTrue(numpy.all(store.cb_coordinates(paths) == models_store.cb_coordinates(models)))
+
+    def test_not_archive(self):
+        self.assertRaises(RuntimeError, decoy_archive.DecoyArchive, os.path.join(self.models_dir, '1_S_00000001.pdb'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Test functions for util.model_source"""
+
+import glob
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from ample import constants
+from ample.util import coordinate_store
+from ample.util import model_source
+from ample.util import pdb_reader
+
+
+class Test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.testfiles_dir = os.path.join(constants.SHARE_DIR, 'testfiles')
+        cls.models = sorted(glob.glob(os.path.join(cls.testfiles_dir, 'models', '*.pdb')))
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def make_archives(self):
+        tar = os.path.join(self.work_dir, 'models.tar.gz')
+        with tarfile.open(tar, 'w:gz') as tf:
+            for model in self.models:
+                tf.add(model, arcname=os.path.join('models', os.path.basename(model)))
+        zip = os.path.join(self.work_dir, 'models.zip')
+        zf = zipfile.ZipFile(zip, 'w')
+        for model in self.models:
+            zf.write(model, arcname=os.path.join('models', os.path.basename(model)))
+        zf.writestr('models/README', "Not a model\n")
+        zf.close()
+        return tar, zip
+
+    def test_iterate(self):
+        names = [os.path.basename(m) for m in self.models]
+        for path in self.make_archives() + (os.path.join(self.testfiles_dir, 'models'),):
+            source = model_source.ModelSource(path)
+            self.assertEqual(names, sorted(source.names()))
+            for name, data in source:
+                with open(os.path.join(self.testfiles_dir, 'models', name), 'rb') as f:
+                    self.assertEqual(f.read(), data)
+
+    def test_quark(self):
+        source = model_source.ModelSource(os.path.join(self.testfiles_dir, 'decoys.tar.gz'),
+                                          filenames=['alldecoy.pdb'])
+        paths = source.write(os.path.join(self.work_dir, 'models'))
+        self.assertEqual([os.path.join(self.work_dir, 'models', 'alldecoy.pdb')], paths)
+        self.assertTrue(pdb_reader.count_records(paths[0], 'ENDMDL') > 1)
+
+    def test_load(self):
+        tar, zip = self.make_archives()
+        for path in tar, zip:
+            models_dir = os.path.join(self.work_dir, os.path.basename(path) + '_models')
+            store = coordinate_store.CoordinateStore()
+            paths, checked = model_source.ModelSource(path).load(models_dir, check=len, coordinate_store=store)
+            self.assertEqual(sorted(glob.glob(os.path.join(models_dir, '*.pdb'))), sorted(paths))
+            self.assertEqual(set(paths), set(checked.keys()))
+            self.assertEqual(sorted(paths), sorted(store.models))
+            for model, pdb in zip_models(self.models, paths):
+                self.assertEqual(len(pdb_reader.PdbAtoms.from_file(model)), checked[pdb])
+                resseqs, _ = store.residues(pdb)
+                self.assertEqual([r[0] for r in coordinate_store.read_residues(model)], list(resseqs))
+
+    def test_load_directory(self):
+        source = model_source.ModelSource(os.path.join(self.testfiles_dir, 'models'))
+        paths, checked = source.load()
+        self.assertEqual(self.models, paths)
+        self.assertEqual({}, checked)
+
+    def test_errors(self):
+        self.assertRaises(RuntimeError, model_source.ModelSource, os.path.join(self.work_dir, 'missing.tar.gz'))
+        self.assertRaises(RuntimeError, model_source.ModelSource, self.models[0])
+        tar, _ = self.make_archives()
+        self.assertRaises(RuntimeError, model_source.ModelSource(tar).load)
+
+
+def zip_models(models, paths):
+    """Pair each model with the path of the model of the same name"""
+    paths = dict((os.path.basename(p), p) for p in paths)
+    return [(m, paths[os.path.basename(m)]) for m in models]
+
+
+if __name__ == "__main__":
+    unittest.main()
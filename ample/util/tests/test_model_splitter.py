@@ -0,0 +1,101 @@
+"""Test functions for util.model_splitter"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from ample import constants
+from ample.util import coordinate_store
+from ample.util import model_splitter
+from ample.util import pdb_reader
+
+
+class Test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.testfiles_dir = os.path.join(constants.SHARE_DIR, 'testfiles')
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def model_path(self, idx, model_id):
+        return os.path.join(self.work_dir, "model_{0}.pdb".format(model_id))
+
+    def test_quark(self):
+        # Three decoys without chain IDs, the last with a shorter line and no MODEL record
+        decoy = "ATOM      1  CA  ALA     1       1.000   2.000   3.000\n" \
+                "ATOM      2  CA  GLY     2       4.000   5.000   6.000  0.50 10.00           C\n"
+        pdbin = os.path.join(self.work_dir, 'alldecoy.pdb')
+        with open(pdbin, 'w') as f:
+            f.write("MODEL        1\n" + decoy + "ENDMDL\nMODEL        2\n" + decoy + "ENDMDL\n" + decoy + "ENDMDL\n")
+
+        def model_path(idx, model_id):
+            return os.path.join(self.work_dir, "quark_{0}.pdb".format(idx))
+
+        models = model_splitter.split_models(pdbin, model_path, quark=True)
+        self.assertEqual([model_path(i, None) for i in range(3)], models)
+        atoms = "ATOM      1  CA  ALA A   1       1.000   2.000   3.000  1.00  0.00              \n" \
+                "ATOM      2  CA  GLY A   2       4.000   5.000   6.000  1.00  0.00              \n"
+        with open(models[1]) as f:
+            self.assertEqual("MODEL        2\n" + atoms + "ENDMDL\n", f.read())
+        with open(models[2]) as f:
+            self.assertEqual(atoms + "ENDMDL\n", f.read())
+
+    def test_split(self):
+        pdbin = os.path.join(self.testfiles_dir, '1GU8.pdb')
+        models = model_splitter.split_models(pdbin, self.model_path, strip_hetatm=True)
+        self.assertEqual([self.model_path(0, '1'), self.model_path(1, '2')], models)
+        reader = pdb_reader.PdbAtoms.from_file(pdbin)
+        for i, model in enumerate(models):
+            split = pdb_reader.PdbAtoms.from_file(model)
+            self.assertEqual(1, split.num_models)
+            atoms = reader.model(i)
+            atoms = atoms[atoms['record'] == 'ATOM  ']
+            self.assertEqual(list(atoms['serial']), list(split.atoms['serial']))
+            self.assertTrue(numpy.all(atoms['xyz'] == split.atoms['xyz']))
+            self.assertTrue(split.header[0].startswith('CRYST1'))
+            self.assertTrue(split.header[-1].startswith('END'))
+
+    def test_same_size_coordinate_store(self):
+        pdbin = os.path.join(self.work_dir, 'nmr.pdb')
+        with open(os.path.join(self.testfiles_dir, '1GU8.pdb')) as f:
+            lines = f.readlines()
+        # Remove the last residue of the first model
+        end = next(i for i, line in enumerate(lines) if line.startswith('ENDMDL'))
+        last = next(i for i in range(end, 0, -1) if lines[i].startswith('ATOM'))
+        resseq = lines[last][22:26]
+        with open(pdbin, 'w') as f:
+            f.writelines(l for i, l in enumerate(lines) if not (i < end and l.startswith('ATOM') and l[22:26] == resseq))
+        store = coordinate_store.CoordinateStore()
+        models = model_splitter.split_models(pdbin, self.model_path, strip_hetatm=True, same_size=True,
+                                             coordinate_store=store, write_models=False)
+        self.assertEqual([self.model_path(1, '2')], models)
+        self.assertFalse(os.path.exists(models[0]))
+        self.assertEqual(1, len(store))
+        resseqs, _ = store.residues(models[0])
+        self.assertEqual(list(range(2, 220)), list(resseqs))
+        atoms = pdb_reader.PdbAtoms.from_file(pdbin).model(1)
+        ca = atoms['xyz'][pdb_reader.atom_names(atoms) == 'CA'].astype(numpy.float32)
+        self.assertTrue(numpy.all(ca == store.ca_coordinates(models)[0]))
+        self.assertEqual(218, store.num_residues(models[0]))
+
+    def test_model_blocks(self):
+        pdbin = os.path.join(self.work_dir, 'blocks.pdb')
+        with open(pdbin, 'w') as f:
+            f.write("HEADER\nMODEL 1\nATOM\nENDMDL\nMODEL 2\nATOM\nENDMDL\nEND\n")
+        self.assertEqual(["HEADER\nMODEL 1\nATOM\nENDMDL\n", "MODEL 2\nATOM\nENDMDL\n"],
+                         list(pdb_reader.model_blocks(pdbin)))
+        self.assertEqual(2, pdb_reader.count_records(pdbin, 'ENDMDL'))
+        open(pdbin, 'w').close()
+        self.assertEqual([], list(pdb_reader.model_blocks(pdbin)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""Test functions for util.pdb_contents"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ample import constants
+from ample.testing import test_funcs
+from ample.util import ample_util
+from ample.util import pdb_contents
+from ample.util import pdb_edit
+from ample.util import pdb_reader
+
+
+class Test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.testfiles_dir = os.path.join(constants.SHARE_DIR, 'testfiles')
+
+    def test_contents(self):
+        atoms = pdb_reader.PdbAtoms.from_string("""ATOM      1  N   GLY A   1       0.000   0.000   0.000  1.00  0.00           N
+ATOM      2  CA  GLY A   1       0.000   0.000   0.000  1.00  0.00           C
+ATOM      3  C   GLY A   1       0.000   0.000   0.000  1.00  0.00           C
+ATOM      4  O   GLY A   1       0.000   0.000   0.000  1.00  0.00           O
+ATOM      5  H   GLY A   1       0.000   0.000   0.000  1.00  0.00           H
+ATOM      6  OG ASER A   2       0.000   0.000   0.000  0.50  0.00           O
+ATOM      7  OG BSER A   2       0.000   0.000   0.000  0.50  0.00           O
+HETATM    8  O   HOH A   3       0.000   0.000   0.000  1.00  0.00           O
+HETATM    9 ZN    ZN A   4       0.000   0.000   0.000  1.00  0.00          ZN
+""").atoms
+        natoms, nresidues, weight = pdb_contents.contents(atoms)
+        # The hydrogen in the file is replaced by the 3 of GLY, only the first conformation of the truncated SER
+        # is counted with the hydrogen of OG, and the water and zinc are not counted
+        self.assertEqual(4 + 3 + 1 + 1, natoms)
+        self.assertEqual(2, nresidues)
+        self.assertAlmostEqual(14.007 + 2 * 12.011 + 2 * 15.999 + 4 * 1.008, weight, 6)
+
+    def test_hydrogens(self):
+        # The hydrogens of the atoms of each amino acid add up to those of its formula less water
+        formulae = {'ALA': 7, 'ARG': 14, 'ASN': 8, 'ASP': 7, 'CYS': 7, 'GLN': 10, 'GLU': 9, 'GLY': 5, 'HIS': 9,
+                    'ILE': 13, 'LEU': 13, 'LYS': 14, 'MET': 11, 'MSE': 11, 'PHE': 11, 'PRO': 9, 'SER': 7, 'THR': 9,
+                    'TRP': 12, 'TYR': 11, 'VAL': 11}
+        self.assertEqual(dict((resname, h - 2) for resname, h in formulae.items()), pdb_contents.AMINO_ACID_HYDROGENS)
+
+    def test_testfiles(self):
+        # Regression values for the first model of the pdb files in testfiles. These are not from rwcontents,
+        # which test_rwcontents compares with where it is installed.
+        expected = {
+            '1BYZ.pdb': (856, 48, 5642.884),
+            '1D7M.pdb': (3334, 202, 23202.550),
+            '1GU8.pdb': (3312, 218, 22874.413),
+            '1K33.pdb': (951, 62, 6891.630),
+            '1K33_S_00000001.pdb': (1089, 68, 7827.713),
+            '2UUI.pdb': (2430, 156, 16981.990),
+            '2XOV.pdb': (2883, 181, 20324.276),
+            '4DZN.pdb': (1473, 93, 9983.895),
+            'orig.poly_ala_trunc_28.146439_rad_3.pdb': (513, 59, 4061.030),
+            'trunc_28.146439_rad_3.pdb': (973, 59, 7069.156),
+        }
+        for name, (natoms, nresidues, weight) in expected.items():
+            contents = pdb_contents.pdb_contents(os.path.join(self.testfiles_dir, name))
+            self.assertEqual((natoms, nresidues), contents[:2], name)
+            self.assertAlmostEqual(weight, contents[2], 2, name)
+
+    @unittest.skipUnless(test_funcs.found_exe("rwcontents" + ample_util.EXE_EXT), "rwcontents exec missing")
+    def test_rwcontents(self):
+        work_dir = tempfile.mkdtemp()
+        for name in ['1BYZ.pdb', '1D7M.pdb', '1GU8.pdb', '1K33.pdb', '1K33_S_00000001.pdb', '2UUI.pdb', '2XOV.pdb',
+                     '4DZN.pdb', 'orig.poly_ala_trunc_28.146439_rad_3.pdb', 'trunc_28.146439_rad_3.pdb']:
+            pdbin = os.path.join(self.testfiles_dir, name)
+            logfile = os.path.join(work_dir, name + '.log')
+            pdb_edit._run_rwcontents(pdbin, logfile)
+            natoms, nresidues, weight = pdb_edit._parse_rwcontents(logfile)
+            contents = pdb_contents.pdb_contents(pdbin)
+            self.assertEqual((natoms, nresidues), contents[:2], name)
+            self.assertAlmostEqual(weight, contents[2], delta=weight * 0.001, msg=name)
+        shutil.rmtree(work_dir)
+
+    def test_missing(self):
+        self.assertRaises(RuntimeError, pdb_contents.pdb_contents, os.path.join(self.testfiles_dir, 'missing.pdb'))
+
+
+if __name__ == "__main__":
+    unittest.main()
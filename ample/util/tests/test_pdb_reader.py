@@ -0,0 +1,79 @@
+"""Test functions for util.pdb_reader"""
+
+import os
+import unittest
+
+import numpy
+
+from ample import constants
+from ample.util import pdb_model
+from ample.util import pdb_reader
+
+
+class Test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.testfiles_dir = os.path.join(constants.SHARE_DIR, 'testfiles')
+
+    def test_read_models(self):
+        pdbin = os.path.join(self.testfiles_dir, '1GU8.pdb')
+        reader = pdb_reader.PdbAtoms.from_file(pdbin)
+        self.assertEqual(2, reader.num_models)
+        self.assertEqual([1, 2], reader.model_serials)
+        self.assertEqual(3314, len(reader))
+        self.assertEqual([1658, 1656], [len(reader.model(i)) for i in range(reader.num_models)])
+        self.assertEqual([2108, 3767], list(reader.record_index('ENDMDL')))
+
+        first = reader.atoms[0]
+        self.assertEqual(('ATOM  ', 1, ' N  ', 'VAL', 'A', 2, 'N', 0),
+                         (first['record'], first['serial'], first['name'], first['resName'], first['chainID'],
+                          first['resSeq'], first['element'], first['model']))
+        self.assertEqual([35.075, 18.239, -14.019], list(first['xyz']))
+        last = reader.atoms[-1]
+        self.assertEqual(('HETATM', 'HOH', 433, 1), (last['record'], last['resName'], last['resSeq'], last['model']))
+        self.assertEqual(3314 - 72, len(pdb_reader.PdbAtoms.from_file(pdbin, hetatm=False)))
+
+    def test_same_as_pdb_atom(self):
+        pdbin = os.path.join(self.testfiles_dir, '2UUI.pdb')
+        reader = pdb_reader.PdbAtoms.from_file(pdbin)
+        with open(pdbin) as f:
+            atoms = [pdb_model.PdbAtom(l) if l.startswith('ATOM') else pdb_model.PdbHetatm(l)
+                     for l in f if l.startswith(('ATOM  ', 'HETATM'))]
+        self.assertEqual(len(atoms), len(reader))
+        self.assertEqual([a.serial for a in atoms], list(reader.atoms['serial']))
+        self.assertEqual([a.resSeq for a in atoms], list(reader.atoms['resSeq']))
+        self.assertEqual([a.resName for a in atoms], list(reader.atoms['resName']))
+        self.assertEqual([a.name.strip() for a in atoms], list(pdb_reader.atom_names(reader.atoms)))
+        self.assertTrue(numpy.all(numpy.array([(a.x, a.y, a.z) for a in atoms]) == reader.atoms['xyz']))
+        self.assertTrue(numpy.all(numpy.array([a.tempFactor for a in atoms], dtype=numpy.float32)
+                                  == reader.atoms['tempFactor']))
+
+    def test_irregular_fields(self):
+        # Blank occupancy and B-factor, a coordinate in exponent form and a short line
+        pdbstr = """ATOM      1  N   ALA A   1      -1.500   2.250  10.125                       N
+ATOM      2  CA  ALA A   1      1.50E0  -0.000 -10.000  1.00 20.00           C
+ATOM      3  C   ALA A   1B      0.500   0.250   0.125
+"""
+        atoms = pdb_reader.PdbAtoms.from_string(pdbstr).atoms
+        self.assertEqual([[-1.5, 2.25, 10.125], [1.5, 0.0, -10.0], [0.5, 0.25, 0.125]], atoms['xyz'].tolist())
+        self.assertEqual([0.0, 1.0, 0.0], atoms['occupancy'].tolist())
+        self.assertEqual([0.0, 20.0, 0.0], atoms['tempFactor'].tolist())
+        self.assertEqual(['N', 'C', ''], atoms['element'].tolist())
+        self.assertEqual([' ', ' ', 'B'], atoms['iCode'].tolist())
+        self.assertEqual(1, pdb_reader.PdbAtoms.from_string(pdbstr).num_models)
+
+    def test_residue_runs(self):
+        atoms = numpy.zeros(6, dtype=pdb_reader.ATOM_DTYPE)
+        atoms['resSeq'] = [1, 1, 2, 2, 2, 3]
+        atoms['iCode'] = [' ', ' ', ' ', 'A', 'A', ' ']
+        atoms['name'] = [' CA ', ' CB ', ' N  ', ' CA ', ' CB ', ' N  ']
+        starts, residue = pdb_reader.residue_runs(atoms)
+        self.assertEqual([0, 2, 3, 5], list(starts))
+        self.assertEqual([0, 0, 1, 2, 2, 3], list(residue))
+        names = pdb_reader.atom_names(atoms)
+        self.assertEqual([0, -1, 3, -1], list(pdb_reader.first_in_group(residue, names == 'CA', len(starts))))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""Test functions for util.pdb_transform"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from ample import constants
+from ample.util import pdb_reader
+from ample.util import pdb_transform
+
+
+class Test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.testfiles_dir = os.path.join(constants.SHARE_DIR, 'testfiles')
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.pdbout = os.path.join(self.work_dir, 'out.pdb')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_select_atoms(self):
+        atoms = pdb_reader.PdbAtoms.from_string("""ATOM      1  CA  GLY A   1       0.000   0.000   0.000  1.00  0.00
+HETATM    2 CA    CA A   2       0.000   0.000   0.000  1.00  0.00
+ATOM      3 1HB  ALA A   3       0.000   0.000   0.000  1.00  0.00
+ATOM      4  N   ALA B   3       0.000   0.000   0.000  1.00  0.00           N
+""").atoms
+        self.assertEqual(['C', 'CA', 'H', 'N'], list(pdb_transform.element_symbols(atoms)))
+        self.assertEqual([True, False, False, False],
+                         list(pdb_transform.select_atoms(atoms, names=['CA'], elements=['C'])))
+        self.assertEqual([False, False, False, True], list(pdb_transform.select_atoms(atoms, chains=['B'])))
+
+    def test_most_probable(self):
+        reader = pdb_reader.PdbAtoms.from_file(os.path.join(self.testfiles_dir, '1BYZ.pdb'))
+        keep = pdb_transform.most_probable(reader.atoms)
+        leu = (reader.atoms['chainID'] == 'B') & (reader.atoms['resSeq'] == 203)
+        self.assertEqual(set(['A']), set(reader.atoms['altLoc'][leu & keep]) - set([' ']))
+        self.assertFalse(numpy.any(keep[leu & (reader.atoms['altLoc'] == 'B')]))
+        pdb_transform.clear_altlocs(reader)
+        pdb_transform.write(reader, self.pdbout, keep=keep, anisou=False)
+        written = pdb_reader.PdbAtoms.from_file(self.pdbout)
+        self.assertEqual(keep.sum(), len(written))
+        self.assertTrue(numpy.all(written.atoms['altLoc'] == ' '))
+        self.assertFalse(len(written.record_index('ANISOU')))
+
+    def test_extract_chain(self):
+        reader = pdb_reader.PdbAtoms.from_file(os.path.join(self.testfiles_dir, '4DZN.pdb'))
+        keep = pdb_transform.select_atoms(reader.atoms, chains=['B'])
+        ca = keep & pdb_transform.select_atoms(reader.atoms, names=['CA'], elements=['C'])
+        pdb_transform.rename_chains(reader, ['B'], ['X'])
+        pdb_transform.write(reader, self.pdbout, keep=ca, renumber=True)
+        written = pdb_reader.PdbAtoms.from_file(self.pdbout)
+        self.assertEqual(ca.sum(), len(written))
+        self.assertEqual(list(range(1, len(written) + 1)), list(written.atoms['serial']))
+        self.assertTrue(numpy.all(written.atoms['chainID'] == 'X'))
+        self.assertTrue(numpy.all(written.atoms['xyz'] == reader.atoms['xyz'][ca]))
+        ter = written.lines[written.record_index('TER')]
+        self.assertEqual(["TER      33      TYR X  32"], [l.rstrip() for l in ter])
+        self.assertFalse(len(written.record_index('CONECT')))
+        self.assertEqual(len(written), len(written.record_index('ANISOU')))
+
+    def test_models(self):
+        reader = pdb_reader.PdbAtoms.from_file(os.path.join(self.testfiles_dir, '1GU8.pdb'))
+        keep = reader.atoms['model'] == 1
+        pdb_transform.write(reader, self.pdbout, keep=keep)
+        written = pdb_reader.PdbAtoms.from_file(self.pdbout)
+        self.assertEqual([2], written.model_serials)
+        self.assertEqual(1, len(written.record_index('ENDMDL')))
+        self.assertTrue(numpy.all(written.atoms['serial'] == reader.atoms['serial'][keep]))
+        pdb_transform.write(reader, self.pdbout, keep=keep, models=False)
+        self.assertEqual([], pdb_reader.PdbAtoms.from_file(self.pdbout).model_serials)
+
+    def test_translate(self):
+        reader = pdb_reader.PdbAtoms.from_file(os.path.join(self.testfiles_dir, '1BYZ.pdb'))
+        # The SCALE records are those of the standard orthogonal frame of the triclinic cell
+        self.assertTrue(numpy.allclose(pdb_transform.orthogonalisation_matrix(*pdb_transform.cell(reader)),
+                                       pdb_transform.fractional_to_orthogonal(reader), atol=1.0e-3))
+        xyz = reader.atoms['xyz'].copy()
+        pdb_transform.translate(reader, [1.0, 0.0, 0.5], fractional=True)
+        pdb_transform.write(reader, self.pdbout)
+        shift = pdb_transform.fractional_to_orthogonal(reader).dot([1.0, 0.0, 0.5])
+        written = pdb_reader.PdbAtoms.from_file(self.pdbout)
+        self.assertTrue(numpy.allclose(xyz + shift, written.atoms['xyz'], atol=1.0e-3))
+        self.assertEqual(len(reader.lines), len(written.lines))
+
+
+if __name__ == "__main__":
+    unittest.main()
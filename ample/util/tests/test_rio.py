@@ -1,7 +1,9 @@
 
 import os
+import sys
 import unittest
 from ample import constants
+from ample.util import ample_util
 from ample.util import rio
 
 class TestContacts( unittest.TestCase ):
@@ -99,5 +101,17 @@ class TestContacts( unittest.TestCase ):
         sequence = c.helixFromContacts( contactData.contacts, dssplog )
         self.assertEqual( "NARLKQEIAALEYEIAAL", sequence )
 
+    def test_parse_stream(self):
+        # Parse the contacts from the output of a command as it is written, without a log
+        logfile = os.path.join( self.testfiles_dir, "ncont1.log" )
+        cmd = [ sys.executable, '-c', "import sys; sys.stdout.write(open(sys.argv[1]).read())", logfile ]
+        c = rio.Rio()
+        contactData = rio.RioData()
+        with ample_util.CommandOutput( cmd ) as output:
+            c._parseNcontLines( contactData, output )
+        self.assertEqual( output.returncode, 0 )
+        self.assertEqual( contactData.numContacts, 26 )
+        self.assertEqual( len( contactData.contacts ), 26 )
+
 if __name__ == "__main__":
     unittest.main()
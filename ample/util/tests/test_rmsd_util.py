@@ -0,0 +1,67 @@
+"""Test functions for util.rmsd_util"""
+
+import numpy
+import unittest
+from ample.util import rmsd_util
+
+
+class Test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        numpy.random.seed(1)
+        cls.coords = numpy.random.uniform(-10.0, 10.0, size=(6, 20, 3))
+
+    def rotate(self, coords, theta):
+        rotation = numpy.array([[numpy.cos(theta), -numpy.sin(theta), 0.0],
+                                [numpy.sin(theta), numpy.cos(theta), 0.0],
+                                [0.0, 0.0, 1.0]])
+        return numpy.dot(coords, rotation.T)
+
+    def reference_rmsd(self, coords1, coords2):
+        # Explicitly rotate coords1 onto coords2
+        a = coords1 - coords1.mean(axis=0)
+        b = coords2 - coords2.mean(axis=0)
+        u, _, vt = numpy.linalg.svd(numpy.dot(a.T, b))
+        d = numpy.sign(numpy.linalg.det(numpy.dot(vt.T, u.T)))
+        rotation = numpy.dot(numpy.dot(vt.T, numpy.diag([1.0, 1.0, d])), u.T)
+        return numpy.sqrt(((numpy.dot(a, rotation.T) - b) ** 2).sum() / len(a))
+
+    def test_kabsch_rmsd_superposed(self):
+        moved = self.rotate(self.coords[0], 1.2) + numpy.array([3.0, -4.0, 5.0])
+        self.assertAlmostEqual(0.0, rmsd_util.kabsch_rmsd(self.coords[0], moved), 5)
+
+    def test_kabsch_rmsd_reflection(self):
+        # A mirror image cannot be superposed by a rotation
+        mirrored = self.coords[0] * numpy.array([1.0, 1.0, -1.0])
+        rmsd = rmsd_util.kabsch_rmsd(self.coords[0], mirrored)
+        self.assertGreater(rmsd, 0.1)
+        self.assertAlmostEqual(self.reference_rmsd(self.coords[0], mirrored), rmsd, 6)
+
+    def test_pairwise_rmsd_matrix(self):
+        matrix = rmsd_util.pairwise_rmsd_matrix(self.coords)
+        self.assertEqual((6, 6), matrix.shape)
+        self.assertTrue(numpy.all(matrix == matrix.T))
+        self.assertTrue(numpy.all(numpy.diag(matrix) == 0.0))
+        for i in range(6):
+            for j in range(6):
+                if i == j: continue
+                self.assertAlmostEqual(self.reference_rmsd(self.coords[i], self.coords[j]), matrix[i, j], 6)
+
+    def test_pairwise_rmsd_matrix_batches(self):
+        max_batch = rmsd_util.MAX_BATCH
+        rmsd_util.MAX_BATCH = 7
+        try:
+            matrix = rmsd_util.pairwise_rmsd_matrix(self.coords)
+        finally:
+            rmsd_util.MAX_BATCH = max_batch
+        self.assertTrue(numpy.allclose(rmsd_util.pairwise_rmsd_matrix(self.coords), matrix))
+
+    def test_rmsd_to_reference(self):
+        rmsds = rmsd_util.rmsd_to_reference(self.coords[0], self.coords)
+        self.assertAlmostEqual(0.0, rmsds[0], 6)
+        self.assertTrue(numpy.allclose(rmsd_util.pairwise_rmsd_matrix(self.coords)[0], rmsds))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,12 +2,14 @@
 import glob
 import os
 import shutil
+import sys
 import tempfile
 import unittest
 
 from ample import constants
 from ample.testing import test_funcs
 from ample.util import ample_util
+from ample.util import coordinate_store
 from ample.util import spicker
 
 @unittest.skip("unreliable test cases")
@@ -43,5 +45,33 @@ class Test(unittest.TestCase):
                          "WARNING: Spicker might run differently on different operating systems")
         shutil.rmtree(work_dir)
 
+
+class TestInputFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_missing_ca(self):
+        nan = (float('nan'),) * 3
+        residues = [[[1, 'GLY', (0.0, 0.0, 0.0), (0.0, 0.0, 0.0)],
+                     [2, 'ALA', nan, nan],
+                     [3, 'SER', (2.0, 2.0, 2.0), (3.0, 3.0, 3.0)]],
+                    [[1, 'GLY', (0.0, 0.0, 1.0), (0.0, 0.0, 1.0)],
+                     [2, 'ALA', (1.0, 0.0, 1.0), (1.0, 0.0, 1.0)],
+                     [3, 'SER', (2.0, 0.0, 2.0), (3.0, 0.0, 3.0)]]]
+        models = [os.path.join(self.work_dir, '1.pdb'), os.path.join(self.work_dir, '2.pdb')]
+        store = coordinate_store.CoordinateStore()
+        store.add_models(models, model_residues=residues)
+        # Spicker isn't run so any executable will do
+        spickerer = spicker.Spickerer(spicker_exe=sys.executable, run_dir=self.work_dir)
+        spickerer.create_input_files(models, coordinate_store=store)
+        with open(os.path.join(self.work_dir, 'rep1.tra1')) as f:
+            self.assertEqual('2', f.readline().split()[0])
+        with open(os.path.join(self.work_dir, 'seq.dat')) as f:
+            self.assertEqual([['1', 'GLY'], ['3', 'SER']], [l.split() for l in f])
+
 if __name__ == "__main__":
     unittest.main()
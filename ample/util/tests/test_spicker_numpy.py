@@ -0,0 +1,106 @@
+"""Test functions for util.spicker_numpy"""
+
+import glob
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+from ample import constants
+from ample.util import coordinate_store
+from ample.util import rmsd_util
+from ample.util import spicker_numpy
+
+
+class Test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.models = sorted(glob.glob(os.path.join(constants.SHARE_DIR, 'testfiles', 'models', '*.pdb')))
+        # Three families of 30, 20 and 10 noisy copies of random structures
+        numpy.random.seed(1)
+        cls.sizes = [30, 20, 10]
+        coords = []
+        for size in cls.sizes:
+            native = numpy.random.uniform(-15.0, 15.0, size=(40, 3))
+            coords.append(native + numpy.random.normal(0.0, 0.6, size=(size, 40, 3)))
+        cls.coords = numpy.concatenate(coords)
+        cls.families = numpy.repeat(numpy.arange(3), cls.sizes)
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def check_families(self, clusters):
+        self.assertEqual(3, len(clusters))
+        for i, (indices, r_cen) in enumerate(clusters):
+            self.assertEqual(self.sizes[i], len(indices))
+            self.assertTrue(numpy.all(self.families[indices] == i))
+            self.assertTrue(numpy.all(numpy.diff(r_cen) >= 0.0))
+
+    def test_rmsd_block(self):
+        coords = rmsd_util.centre(self.coords)
+        self.assertTrue(numpy.allclose(rmsd_util.pairwise_rmsd_matrix(coords[:7]),
+                                       rmsd_util.rmsd_block(coords[:7], coords[:7]), atol=1e-3))
+
+    def test_cluster_rmsd(self):
+        cutoff, clusters = spicker_numpy.cluster_coordinates(self.coords, score_type='rmsd')
+        self.assertTrue(3.5 <= cutoff <= 12.0)
+        self.check_families(clusters)
+
+    def test_cluster_tm(self):
+        cutoff, clusters = spicker_numpy.cluster_coordinates(self.coords, score_type='tm')
+        self.assertTrue(0.35 <= cutoff <= 0.8)
+        self.check_families(clusters)
+
+    def test_tm_score_block(self):
+        coords = rmsd_util.centre(self.coords[:5])
+        scores = spicker_numpy.tm_score_block(coords, coords)
+        self.assertTrue(numpy.allclose(1.0, numpy.diag(scores)))
+        self.assertTrue(numpy.all(scores > 0.0) and numpy.all(scores <= 1.0 + 1e-9))
+
+    def test_cluster_blocks_threads(self):
+        """Clustering in many blocks on several threads gives the same clusters"""
+        max_block_pairs = spicker_numpy.MAX_BLOCK_PAIRS
+        max_in_memory = spicker_numpy.MAX_IN_MEMORY
+        spicker_numpy.MAX_BLOCK_PAIRS = 100
+        spicker_numpy.MAX_IN_MEMORY = 10
+        scratch_file = os.path.join(self.work_dir, 'score_bins.dat')
+        try:
+            cutoff, clusters = spicker_numpy.cluster_coordinates(self.coords, nproc=3, scratch_file=scratch_file)
+        finally:
+            spicker_numpy.MAX_BLOCK_PAIRS = max_block_pairs
+            spicker_numpy.MAX_IN_MEMORY = max_in_memory
+        ref_cutoff, ref_clusters = spicker_numpy.cluster_coordinates(self.coords)
+        self.assertEqual(ref_cutoff, cutoff)
+        for (indices, r_cen), (ref_indices, ref_r_cen) in zip(clusters, ref_clusters):
+            self.assertEqual(list(ref_indices), list(indices))
+        self.assertFalse(os.path.exists(scratch_file))
+
+    def test_numpy_spickerer(self):
+        store = coordinate_store.CoordinateStore.from_models(self.models)
+        spickerer = spicker_numpy.NumpySpickerer()
+        clusters = spickerer.cluster(self.models, num_clusters=3, max_cluster_size=10, run_dir=self.work_dir,
+                                     coordinate_store=store)
+        self.assertEqual(3, len(clusters))
+        self.assertTrue(all(len(c.models) <= 10 for c in clusters))
+        self.assertEqual('spicker_numpy', clusters[0].cluster_method)
+        self.assertEqual(len(spickerer.results), clusters[0].num_clusters)
+        # Every model is in one of the clusters
+        clustered = []
+        for i in range(len(spickerer.results)):
+            with open(os.path.join(self.work_dir, 'spicker_cluster_{0}.list'.format(i + 1))) as f:
+                clustered.extend(l.strip() for l in f)
+        self.assertEqual(self.models, sorted(clustered))
+        self.assertEqual(clusters[0].models, clustered[:len(clusters[0].models)])
+        # The coordinates are read from the models if they are not in the store
+        spickerer = spicker_numpy.NumpySpickerer(run_dir=self.work_dir)
+        self.assertEqual([c.models for c in clusters],
+                         [c.models for c in spickerer.cluster(self.models, num_clusters=3, max_cluster_size=10)])
+
+
+if __name__ == "__main__":
+    unittest.main()
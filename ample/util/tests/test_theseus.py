@@ -8,6 +8,7 @@ import unittest
 
 from ample import constants
 from ample.util import ample_util
+from ample.util import cache_util
 from ample.util import pdb_edit
 from ample.util import theseus
 from ample.testing import test_funcs
@@ -83,5 +84,18 @@ class Test(unittest.TestCase):
         for m in models: os.unlink(m)
         shutil.rmtree(work_dir)
 
+    def test_align_models_cached(self):
+        work_dir = tempfile.mkdtemp()
+        cache = cache_util.ResultCache(os.path.join(work_dir, 'cache'))
+        models = glob.glob(os.path.join(self.testfiles_dir, 'models', '*.pdb'))[:5]
+        rtheseus = theseus.Theseus(work_dir=os.path.join(work_dir, 'run1'), theseus_exe=self.theseus_exe, cache=cache)
+        rtheseus.superpose_models(models)
+        cached = theseus.Theseus(work_dir=os.path.join(work_dir, 'run2'), theseus_exe=self.theseus_exe, cache=cache)
+        cached.superpose_models(models)
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertEqual(rtheseus.var_by_res, cached.var_by_res)
+        self.assertTrue(os.path.isfile(cached.superposed_models))
+        shutil.rmtree(work_dir)
+
 if __name__ == "__main__":
     unittest.main()
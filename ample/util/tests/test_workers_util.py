@@ -2,8 +2,12 @@
 
 import glob
 import os
+import shutil
 import stat
+import sys
 import tempfile
+import threading
+import time
 import unittest
 
 from ample import constants
@@ -46,5 +50,169 @@ sys.exit(0)
         for l in glob.glob("job_*.log"): os.unlink(l)
         pass
     
+
+@unittest.skipIf(sys.platform.startswith("win"), "Unix shell scripts only")
+class TestJobScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.run_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.run_dir)
+
+    def makeJobs(self, njobs, retcode=0, sleep=None):
+        jobs = []
+        for i in range(njobs):
+            script = os.path.join(self.run_dir, "job_{0}.sh".format(i))
+            with open(script, 'w') as f:
+                f.write("#!/bin/bash\necho job_{0}\n".format(i))
+                if sleep and i in sleep: f.write("sleep {0}\n".format(sleep[i]))
+                f.write("exit {0}\n".format(retcode))
+            os.chmod(script, stat.S_IRWXU)
+            jobs.append(script)
+        return jobs
+
+    def test_run_all(self):
+        jobs = self.makeJobs(6)
+        calls = []
+        js = workers_util.JobScheduler()
+        js.setJobs(jobs)
+        self.assertTrue(js.start(nproc=2, monitor=lambda: calls.append(1)))
+        for i in range(6):
+            with open(os.path.join(self.run_dir, "job_{0}.log".format(i))) as f:
+                self.assertEqual(f.read().strip(), "job_{0}".format(i))
+        self.assertEqual(len(calls), 7)
+
+    def test_failed_job(self):
+        jobs = self.makeJobs(2, retcode=1)
+        js = workers_util.JobScheduler()
+        js.setJobs(jobs)
+        self.assertFalse(js.start(nproc=2))
+
+    def test_early_terminate(self):
+        jobs = self.makeJobs(5)
+        js = workers_util.JobScheduler()
+        js.setJobs(jobs)
+        self.assertTrue(js.start(nproc=1, early_terminate=True, check_success=workers_util._check_success_test))
+        logs = sorted(os.path.basename(l) for l in glob.glob(os.path.join(self.run_dir, "job_*.log")))
+        self.assertEqual(logs, ["job_0.log", "job_1.log", "job_2.log"])
+
+    def test_early_terminate_kill(self):
+        jobs = self.makeJobs(4, sleep={0: 60, 1: 60, 3: 60})
+        cleaned = []
+        js = workers_util.JobScheduler(kill_timeout=5)
+        js.setJobs(jobs)
+        self.assertTrue(js.start(nproc=3, early_terminate=True, check_success=workers_util._check_success_test,
+                                 early_terminate_kill=True, cleanup=cleaned.append))
+        self.assertEqual(js.killed, jobs[:2])
+        self.assertEqual(sorted(cleaned), jobs[:2])
+        self.assertFalse(os.path.isfile(os.path.join(self.run_dir, "job_3.log")))
+        self.assertEqual(js.stats['early_terminate_killed'], jobs[:2])
+        self.assertGreaterEqual(js.stats['early_terminate_wallclock_saved'], 0.0)
+        self.assertGreaterEqual(js.stats['early_terminate_cpu_hours_saved'], 0.0)
+
+    def test_prepare(self):
+        jobs = self.makeJobs(3)
+        prepared = []
+
+        def prepare(job):
+            if job == jobs[1]:
+                raise RuntimeError("cannot create files for job")
+            prepared.append(job)
+
+        js = workers_util.JobScheduler()
+        js.setJobs(jobs)
+        self.assertFalse(js.start(nproc=1, prepare=prepare))
+        self.assertEqual(prepared, [jobs[0], jobs[2]])
+        self.assertFalse(os.path.isfile(os.path.join(self.run_dir, "job_1.log")))
+        self.assertTrue(os.path.isfile(os.path.join(self.run_dir, "job_2.log")))
+
+    def test_early_terminate_failed_job(self):
+        # A job that succeeds but exits with an error still stops the remaining jobs
+        jobs = self.makeJobs(5, retcode=1)
+        js = workers_util.JobScheduler()
+        js.setJobs(jobs)
+        self.assertFalse(js.start(nproc=1, early_terminate=True, check_success=workers_util._check_success_test))
+        self.assertTrue(js.terminated.is_set())
+        self.assertEqual(sorted(js._start_times), jobs[:3])
+
+    def test_prepare_parallel(self):
+        jobs = self.makeJobs(4)
+        preparing = []
+        concurrent = []
+        lock = threading.Lock()
+
+        def prepare(job):
+            with lock:
+                preparing.append(job)
+                concurrent.append(len(preparing))
+            time.sleep(1)
+            with lock:
+                preparing.remove(job)
+
+        js = workers_util.JobScheduler()
+        js.open()
+        for job in jobs[:3]:
+            js.add_job(job)
+
+        def add_and_close():
+            # Adding a job is not held up by the jobs being prepared
+            start = time.time()
+            js.add_job(jobs[3])
+            concurrent.append(time.time() - start < 0.5)
+            js.close()
+
+        timer = threading.Timer(0.2, add_and_close)
+        timer.start()
+        self.assertTrue(js.start(nproc=3, prepare=prepare))
+        timer.join()
+        self.assertTrue(concurrent.pop())
+        self.assertEqual(3, max(concurrent))
+        for i in range(4):
+            self.assertTrue(os.path.isfile(os.path.join(self.run_dir, "job_{0}.log".format(i))))
+
+    def test_add_job(self):
+        jobs = self.makeJobs(4, sleep={1: 2})
+        js = workers_util.JobScheduler()
+        js.open()
+        self.assertTrue(js.add_job(jobs[0], priority=2))
+        self.assertTrue(js.add_job(jobs[1], priority=1))
+        self.assertTrue(js.add_job(jobs[2], priority=1))
+
+        def add_and_close():
+            # Added while job_1 is running so should be the next to start
+            js.add_job(jobs[3], priority=0)
+            js.close()
+
+        timer = threading.Timer(0.5, add_and_close)
+        timer.start()
+        self.assertTrue(js.start(nproc=1))
+        timer.join()
+        started = sorted(js._start_times, key=js._start_times.get)
+        self.assertEqual(started, [jobs[1], jobs[3], jobs[2], jobs[0]])
+        self.assertFalse(js.terminated.is_set())
+
+    def test_add_job_early_terminate(self):
+        jobs = self.makeJobs(5)
+        js = workers_util.JobScheduler()
+        js.open()
+        for job in jobs[:4]:
+            js.add_job(job)
+        added = []
+
+        def add_and_close():
+            # No more jobs are accepted once a job has succeeded
+            added.append(js.add_job(jobs[4]))
+            js.close()
+
+        timer = threading.Timer(1.0, add_and_close)
+        timer.start()
+        self.assertTrue(js.start(nproc=1, early_terminate=True, check_success=workers_util._check_success_test))
+        timer.join()
+        self.assertTrue(js.terminated.is_set())
+        self.assertEqual(added, [False])
+        self.assertEqual(sorted(js._start_times), jobs[:3])
+        self.assertRaises(RuntimeError, js.add_job, jobs[4])
+
 if __name__ == "__main__":
     unittest.main()
@@ -9,6 +9,7 @@ import os
 import shutil
 
 from ample.util import ample_util
+from ample.util import cache_util
 from ample.util import sequence_util
 
 # We create this here otherwise it causes problems with pickling
@@ -19,10 +20,13 @@ _logger = logging.getLogger(__name__)
 class Theseus(object):
     """Class to run THESEUS to superpose pdb files and determine the per-residue variances.
     
+    If a :obj:`ResultCache <ample.util.cache_util.ResultCache>` is given, the superposed models and
+    variances of ab initio models are stored in it and reused for models with identical coordinates.
+
     .. _THESEUS website:
         http://www.theseus3d.org/
     """
-    def __init__(self, work_dir=None, theseus_exe=None):
+    def __init__(self, work_dir=None, theseus_exe=None, cache=None):
 
         if theseus_exe is None:
             if 'CCP4' in os.environ: theseus_exe = os.path.join(os.environ['CCP4'], 'bin', 'theseus')
@@ -35,6 +39,7 @@ class Theseus(object):
         self.variance_log_test = None # For mocking up a test
         self.superposed_models = None
         self.aligned_models = None
+        self.cache = cache
         self._set_work_dir(work_dir)
         return
     
@@ -79,6 +84,13 @@ class Theseus(object):
         
         """
         self._set_work_dir(work_dir)
+        cache_key = None
+        if self.cache is not None and not homologs:
+            # Theseus writes the model names into the superposed pdb so they are part of the key
+            cache_key = self.cache.key('theseus', cache_util.program_version(self.theseus_exe),
+                                       [os.path.basename(m) for m in models], cache_util.models_hash(models))
+            if self._from_cache(cache_key, basename):
+                return self.superposed_models
         if homologs:
             # Theseus expects all the models to be in the directory that it is run in as the string given in 
             # the fasta header is used to construct the file names of the aligned pdb files. If a full or 
@@ -122,7 +134,26 @@ class Theseus(object):
             
         # Set the variances
         self.var_by_res = self.parse_variances()
+        if cache_key:
+            self.cache.store(cache_key, self._write_cache_entry)
         return self.superposed_models
+
+    def _from_cache(self, cache_key, basename):
+        """Copy the superposed models and variances from the cache into work_dir if they are there"""
+        entry = self.cache.get(cache_key)
+        if not entry:
+            return False
+        _logger.debug("Using cached theseus superposition from %s", entry)
+        self.variance_log = os.path.join(self.work_dir, '{0}_variances.txt'.format(basename))
+        self.superposed_models = os.path.join(self.work_dir, '{0}_sup.pdb'.format(basename))
+        shutil.copy(os.path.join(entry, 'variances.txt'), self.variance_log)
+        shutil.copy(os.path.join(entry, 'sup.pdb'), self.superposed_models)
+        self.var_by_res = self.parse_variances()
+        return True
+
+    def _write_cache_entry(self, directory):
+        shutil.copy(self.variance_log, os.path.join(directory, 'variances.txt'))
+        shutil.copy(self.superposed_models, os.path.join(directory, 'sup.pdb'))
     
     def parse_variances(self):
         # The variance_log_test variable may be set if we are mocking out the variances for testing  
@@ -14,18 +14,19 @@ import random
 import string
 import sys
 import tempfile
-import warnings
+
+import numpy
 
 from ample.parsers import alignment_parser
 from ample.parsers import tm_parser
 from ample.util import ample_util
 from ample.util import pdb_edit
+from ample.util import pdb_reader
 
 from pyjob import Job
 from pyjob.misc import make_script
 
 try:
-    from Bio import PDB
     from Bio import SeqIO
     BIOPYTHON_AVAILABLE = True
 except ImportError:
@@ -549,35 +550,29 @@ class TMscore(TMapps):
             A list containing per residue information
 
         """
-        if not BIOPYTHON_AVAILABLE: raise RuntimeError("Biopython is not available")
-        with warnings.catch_warnings():
-            logger.debug("Suppressing BIOPYTHON warnings for PDBParser")
-            warnings.simplefilter("ignore")
-            structure = PDB.PDBParser().get_structure("pdb", pdb)
-
-        # Weird problem with get_...() methods if MODEL is not explicitly stated in
-        # PDB file. Thus, just iterate over everything return when top chain completed
-        for model in structure:
-            for i, chain in enumerate(model):
-                if i > 0:
-                    return
-                for residue in chain:
-                    hetero, res_seq, _ = residue.get_id()
-
-                    hetero = hetero.strip().lower()
-                    if hetero == "w":
-                        continue
-                    elif hetero:
-                        msg = "Hetero atom {} detected in {} in residue {} --- please rename to ATOM or remove!"
-                        raise TypeError(msg.format(hetero, pdb, res_seq))
-
-                    resname_three = residue.resname
-                    if resname_three == "MSE":
-                        logger.warning("Treating MSE as MET!")
-                        resname_three = "MET"
-                    resname_one = PDB.Polypeptide.three_to_one(resname_three)
-
-                    yield (res_seq, resname_one)
+        # Only the first chain of the first model
+        atoms = pdb_reader.PdbAtoms.from_file(pdb).model(0)
+        if not len(atoms):
+            return
+        atoms = atoms[atoms['chainID'] == atoms['chainID'][0]]
+        starts, residue = pdb_reader.residue_runs(atoms)
+        hetatm = numpy.zeros(len(starts), dtype=bool)
+        hetatm[residue[atoms['record'] == 'HETATM']] = True
+
+        for res_seq, resname_three, hetero in zip(atoms['resSeq'][starts], atoms['resName'][starts], hetatm):
+            res_seq = int(res_seq)
+            if hetero and resname_three in ("HOH", "WAT"):
+                continue
+            elif hetero:
+                msg = "Hetero atom {} detected in {} in residue {} --- please rename to ATOM or remove!"
+                raise TypeError(msg.format("h_" + resname_three.lower(), pdb, res_seq))
+
+            if resname_three == "MSE":
+                logger.warning("Treating MSE as MET!")
+                resname_three = "MET"
+            resname_one = pdb_edit.three2one[resname_three]
+
+            yield (res_seq, resname_one)
 
     def _residue_one(self, pdb):
         """
@@ -4,12 +4,21 @@ Created on Feb 28, 2013
 @author: jmht
 '''
 
+import heapq
+import itertools
 import logging
 import multiprocessing
 import os
+import signal
+import subprocess
+import threading
 import time
 
-from ample.util import ample_util
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
 from ample.util import clusterize
 from ample.util import worker
 
@@ -103,10 +112,262 @@ class JobServer(object):
         time.sleep(3)        
         return success
 
+class JobScheduler(object):
+    """Run jobs on the local machine, starting the next job as soon as a running one finishes.
+
+    Each job is started with :obj:`subprocess.Popen` and a thread per job waits on it and
+    posts the job onto a queue when it exits, so the scheduler is notified immediately
+    rather than having to poll the running jobs in turn.
+
+    Jobs are started in order of priority (lowest first) and then in the order they were added.
+    After calling :meth:`open`, jobs can be added with :meth:`add_job` from another thread while
+    the scheduler is running; it keeps waiting for new jobs until :meth:`close` is called.
+    The terminated event is set once early termination stops any more jobs from being started.
+
+    """
+    def __init__(self, monitor_interval=60, kill_timeout=30):
+        self.jobs = None
+        self.terminated = threading.Event()
+        self.monitor_interval = monitor_interval
+        self.kill_timeout = kill_timeout
+        self.running = {}
+        self.pids = {}
+        self.killed = []
+        self.stats = {}
+        self._start_times = {}
+        self._durations = {}
+        self._exited = {}
+        self._finished = queue.Queue()
+        self._pending = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._open = False
+        logger.info("Running jobs on a local machine")
+
+    def setJobs(self, jobs):
+        """Add the list of jobs we are to run"""
+        if self.jobs is not None:
+            raise RuntimeError("JobScheduler jobs have already been set")
+        for job in jobs:
+            if not os.path.isfile(job):
+                raise RuntimeError("JobScheduler cannot find job: {0}".format(job))
+        self.jobs = list(jobs)
+        for job in self.jobs:
+            heapq.heappush(self._pending, (0, next(self._order), job))
+        return
+
+    def open(self):
+        """Allow jobs to be added with add_job until close is called"""
+        if self.jobs is None:
+            self.jobs = []
+        self._open = True
+        return
+
+    def add_job(self, job, priority=0):
+        """Add a job to be run, returning False if no more jobs are being started because of early termination"""
+        if not self._open:
+            raise RuntimeError("JobScheduler needs to be opened before adding jobs")
+        if not os.path.isfile(job):
+            raise RuntimeError("JobScheduler cannot find job: {0}".format(job))
+        with self._lock:
+            if self.terminated.is_set():
+                return False
+            self.jobs.append(job)
+            heapq.heappush(self._pending, (priority, next(self._order), job))
+        # Wake up the scheduler
+        self._finished.put(None)
+        return True
+
+    def close(self):
+        """Stop accepting jobs so that start returns once all jobs have finished"""
+        self._open = False
+        self._finished.put(None)
+        return
+
+    def start(self, nproc=None, early_terminate=False, check_success=None, monitor=None,
+              early_terminate_kill=False, cleanup=None, prepare=None):
+        """Run the jobs, keeping nproc jobs running until all are done.
+
+        Parameters
+        ----------
+        nproc : int
+           The number of jobs to run at the same time
+        early_terminate : bool
+           Stop starting new jobs once check_success reports that a job has succeeded
+        check_success : callable
+           A callable that takes the job and returns True if the job succeeded
+        monitor : callable
+           Called when the jobs start, whenever a job finishes and every monitor_interval seconds
+        early_terminate_kill : bool
+           With early_terminate, also kill the process groups of the jobs still running after a success
+        cleanup : callable
+           A callable that takes a killed job and removes any files it left behind
+        prepare : callable
+           A callable that takes a job and creates any files it needs just before it is started.
+           It is run as the first step of the job, on the thread that waits for the job, so jobs
+           are prepared in parallel and the scheduler is not held up. If it raises an exception the
+           job is not run and counts as failed.
+
+        Returns
+        -------
+        success : bool
+           False if any job that wasn't killed returned a non-zero exit code or couldn't be prepared
+
+        """
+        assert nproc != None
+        if early_terminate:
+            assert callable(check_success)
+
+        if monitor: monitor()
+
+        success = True
+        while True:
+            with self._lock:
+                while self._pending and len(self.running) < nproc:
+                    job = heapq.heappop(self._pending)[2]
+                    self._start_job(job, new_group=early_terminate_kill, prepare=prepare)
+                if not (self._pending or self.running or self._open):
+                    break
+            try:
+                finished = self._finished.get(timeout=self.monitor_interval)
+            except queue.Empty:
+                if monitor: monitor()
+                continue
+            if finished is None:
+                # A job has been added or the scheduler closed
+                continue
+            job, retcode = finished
+            with self._lock:
+                del self.running[job]
+            logger.debug("Job {0} finished with exitcode {1}".format(job, retcode))
+            if job in self.killed:
+                if cleanup: cleanup(job)
+            elif retcode is None:
+                # The job could not be prepared or started so was never run
+                success = False
+            else:
+                if retcode != 0:
+                    logger.critical("Job {0} failed with exitcode {1}".format(job, retcode))
+                    success = False
+                # As with the old worker, a job that exits with an error may still have succeeded
+                if early_terminate and check_success(job):
+                    with self._lock:
+                        self.terminated.set()
+                        if self._pending:
+                            logger.info("Job {0} was successful so removing {1} remaining jobs".format(job, len(self._pending)))
+                        self._pending = []
+                    if early_terminate_kill and self.running:
+                        self._kill_running()
+            if monitor: monitor()
+        return success
+
+    def _kill_running(self):
+        """Kill all running jobs and estimate how much time this saved
+
+        The time each killed job would have taken is estimated as the mean run time of
+        the jobs that completed.
+        """
+        now = time.time()
+        mean_duration = sum(self._durations.values()) / len(self._durations) if self._durations else 0.0
+        remaining = []
+        with self._lock:
+            for job in sorted(self.running.keys()):
+                self.killed.append(job)
+                remaining.append(max(0.0, mean_duration - (now - self._start_times[job])))
+                if job in self.pids:
+                    logger.info("Killing job {0} with pid {1}".format(job, self.pids[job]))
+                    self._signal_job(job, signal.SIGTERM)
+                else:
+                    # Still being prepared, so it will not be started
+                    logger.info("Stopping job {0} before it is started".format(job))
+        for job in self.killed:
+            self._exited[job].wait(max(0.0, self.kill_timeout - (time.time() - now)))
+        for job in self.killed:
+            # Kill anything left in the process group even if the main process has exited
+            if job in self.pids:
+                self._signal_job(job, getattr(signal, 'SIGKILL', signal.SIGTERM))
+        self.stats['early_terminate_killed'] = list(self.killed)
+        self.stats['early_terminate_wallclock_saved'] = max(remaining)
+        self.stats['early_terminate_cpu_hours_saved'] = sum(remaining) / 3600.0
+        logger.info("Killing {0} jobs saved an estimated {1:.0f} seconds of wall clock time and {2:.2f} CPU hours".format(
+            len(self.killed), self.stats['early_terminate_wallclock_saved'], self.stats['early_terminate_cpu_hours_saved']))
+        return
+
+    def _signal_job(self, job, sig):
+        try:
+            if hasattr(os, 'killpg'):
+                os.killpg(self.pids[job], sig)
+            elif sig == signal.SIGTERM:
+                self.running[job].terminate()
+        except OSError:
+            # The process group has already exited
+            pass
+        return
+
+    def _start_job(self, job, new_group=False, prepare=None):
+        """Take a slot for job and start a thread to prepare it, run it and wait for it to finish
+
+        Called with the lock held.
+        """
+        self.running[job] = None
+        self._start_times[job] = time.time()
+        self._exited[job] = threading.Event()
+        thread = threading.Thread(target=self._run_job, args=(job, new_group, prepare))
+        thread.daemon = True
+        thread.start()
+        return
+
+    def _run_job(self, job, new_group, prepare):
+        """Prepare job, run it in its own directory and post its exit code (None if it was not run)"""
+        if prepare:
+            try:
+                prepare(job)
+            except Exception as e:
+                logger.critical("Job {0} could not be prepared: {1}".format(job, e))
+                self._exited[job].set()
+                self._finished.put((job, None))
+                return
+        script = os.path.abspath(job)
+        directory, sname = os.path.split(script)
+        logfile = os.path.join(directory, os.path.splitext(sname)[0] + ".log")
+        kwargs = {}
+        if new_group and hasattr(os, 'setsid'):
+            # Run the job in its own process group so we can kill it and all its children
+            kwargs['preexec_fn'] = os.setsid
+        # Processes are started with the lock held so a job is never started after it has been killed
+        with self._lock:
+            if job in self.killed:
+                self._exited[job].set()
+                self._finished.put((job, None))
+                return
+            logger.debug("Starting job {0}".format(script))
+            try:
+                with open(logfile, "w") as logf:
+                    process = subprocess.Popen([script], stdout=logf, stderr=subprocess.STDOUT, cwd=directory,
+                                               **kwargs)
+            except (IOError, OSError) as e:
+                logger.critical("Job {0} could not be started: {1}".format(job, e))
+                self._exited[job].set()
+                self._finished.put((job, None))
+                return
+            self.running[job] = process
+            self.pids[job] = process.pid
+            started = time.time()
+        retcode = process.wait()
+        self._durations[job] = time.time() - started
+        self._exited[job].set()
+        self._finished.put((job, retcode))
+        return
+
+
 def run_scripts(job_scripts,
                 monitor=None,
                 check_success=None,
                 early_terminate=None,
+                early_terminate_kill=None,
+                cleanup=None,
+                prepare=None,
+                job_stats=None,
                 nproc=None,
                 job_time=None,
                 job_name=None,
@@ -118,6 +379,10 @@ def run_scripts(job_scripts,
                 submit_array=None,
                 submit_max_array=None):
     if submit_cluster:
+        # The jobs can't be prepared as they are started on the cluster so prepare them all now
+        if prepare:
+            for script in job_scripts:
+                prepare(script)
         return run_scripts_cluster(job_scripts,
                                    nproc=nproc,
                                    monitor=monitor,
@@ -136,6 +401,10 @@ def run_scripts(job_scripts,
                                   nproc=nproc,
                                   monitor=monitor,
                                   early_terminate=early_terminate,
+                                  early_terminate_kill=early_terminate_kill,
+                                  cleanup=cleanup,
+                                  prepare=prepare,
+                                  job_stats=job_stats,
                                   check_success=check_success,
                                   )
 
@@ -196,26 +465,24 @@ def run_scripts_serial(job_scripts,
                        nproc=None,
                        monitor=None,
                        early_terminate=None,
+                       early_terminate_kill=None,
+                       cleanup=None,
+                       prepare=None,
+                       job_stats=None,
                        check_success=None,
                        ):
-    success=False
-    if len(job_scripts) > 1:
-        # Don't need early terminate - check_success if it exists states what's happening
-        js = JobServer()
-        js.setJobs(job_scripts)
-        success = js.start(nproc=nproc,
-                           early_terminate=bool(early_terminate),
-                           check_success=check_success,
-                           monitor=monitor,
-                           )
-    else:
-        script=job_scripts[0]
-        name=os.path.splitext(os.path.basename(script))[0]
-        logfile="{0}.log".format(name)
-        wdir=os.path.dirname(script)
-        os.chdir(wdir)
-        rtn = ample_util.run_command([script], logfile=logfile)
-        if rtn == 0: success = True
+    if nproc is None: nproc = 1
+    js = JobScheduler()
+    js.setJobs(job_scripts)
+    success = js.start(nproc=nproc,
+                       early_terminate=bool(early_terminate),
+                       early_terminate_kill=bool(early_terminate_kill),
+                       cleanup=cleanup,
+                       prepare=prepare,
+                       check_success=check_success,
+                       monitor=monitor,
+                       )
+    if job_stats is not None: job_stats.update(js.stats)
     return success
 
 # Need this defined outside of the test or it can't be pickled on Windoze